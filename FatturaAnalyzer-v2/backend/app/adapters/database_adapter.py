@@ -25,6 +25,7 @@ import gc
 # Import dal core esistente
 from app.core.database import (
     get_connection, create_tables, get_anagraphics, get_invoices, get_transactions,
+    get_transactions_page,
     add_anagraphics_if_not_exists, add_transactions,
     get_reconciliation_links_for_item, get_item_details,
     update_invoice_reconciliation_state, update_transaction_reconciliation_state,
@@ -819,6 +820,58 @@ class DatabaseAdapterOptimized:
         
         return await loop.run_in_executor(self.executor, _get_transactions)
     
+    @performance_tracked('get_transactions_page')
+    async def get_transactions_page_async(
+        self,
+        page: int = 1,
+        size: int = 50,
+        start_date: str = None,
+        end_date: str = None,
+        status_filter: str = None,
+        search: str = None,
+        min_amount: float = None,
+        max_amount: float = None,
+        anagraphics_id_heuristic_filter: int = None,
+        hide_pos: bool = False,
+        hide_worldline: bool = False,
+        hide_cash: bool = False,
+        hide_commissions: bool = False,
+        include_summary: bool = False
+    ) -> Dict[str, Any]:
+        """Ottiene una pagina di transazioni con totale (filtri e paginazione in SQL) - Thread Safe"""
+        
+        loop = asyncio.get_event_loop()
+        
+        def _get_transactions_page():
+            try:
+                page_result = get_transactions_page(
+                    page=page,
+                    size=size,
+                    start_date=start_date,
+                    end_date=end_date,
+                    status_filter=status_filter,
+                    search=search,
+                    min_amount=min_amount,
+                    max_amount=max_amount,
+                    anagraphics_id_heuristic_filter=anagraphics_id_heuristic_filter,
+                    hide_pos=hide_pos,
+                    hide_worldline=hide_worldline,
+                    hide_cash=hide_cash,
+                    hide_commissions=hide_commissions,
+                    include_summary=include_summary
+                )
+                df = page_result['items']
+                return {
+                    'items': df.to_dict('records') if not df.empty else [],
+                    'total': page_result['total'],
+                    'summary': page_result['summary']
+                }
+            except Exception as e:
+                logger.error(f"Error in get_transactions_page: {e}")
+                raise
+        
+        return await loop.run_in_executor(self.executor, _get_transactions_page)
+    
     # ===== BATCH OPERATIONS OTTIMIZZATE =====
     
     @performance_tracked('batch_anagraphics')
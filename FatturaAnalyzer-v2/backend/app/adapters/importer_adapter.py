@@ -5,11 +5,12 @@ Include tutte le funzionalità necessarie per l'API
 """
 
 import asyncio
+import functools
 import logging
 import tempfile
 import os
 import shutil
-from typing import Dict, Any, Callable, Optional, List, Union
+from typing import Dict, Any, Callable, Optional, List, Union, BinaryIO
 from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from io import StringIO, BytesIO
@@ -33,16 +34,19 @@ class ImporterAdapter:
     
     @staticmethod
     async def import_from_source_async(
-        source_path: str,
-        progress_callback: Optional[Callable] = None
+        source_path: Union[str, BinaryIO],
+        progress_callback: Optional[Callable] = None,
+        source_name: Optional[str] = None,
+        force: bool = False
     ) -> Dict[str, Any]:
-        """Versione async di import_from_source"""
+        """
+        Versione async di import_from_source (source_path può essere uno stream ZIP, es. upload spooled).
+        force=True ignora il manifest dei file già importati.
+        """
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(
             _thread_pool,
-            import_from_source,
-            source_path,
-            progress_callback
+            functools.partial(import_from_source, source_path, progress_callback, source_name=source_name, force=force)
         )
     
     @staticmethod
@@ -8,7 +8,7 @@ import json
 import hashlib
 import pickle
 import warnings
-from typing import List, Dict, Any, Optional, Tuple, Union, Set, Callable
+from typing import List, Dict, Any, Optional, Tuple, Union, Set, Callable, Iterable
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, date, timedelta
 from decimal import Decimal
@@ -32,6 +32,7 @@ try:
         suggest_reconciliation_matches_enhanced,
         suggest_cumulative_matches_v2,
         apply_manual_match_optimized,
+        apply_matches_batch,
         attempt_auto_reconciliation_optimized,
         find_automatic_matches_optimized,
         ignore_transaction,
@@ -68,6 +69,10 @@ except ImportError as e:
     def apply_manual_match_optimized(*args, **kwargs):
         return False, "Core reconciliation not available"
     
+    def apply_matches_batch(*args, **kwargs):
+        return {'success': False, 'applied': 0, 'failed': 0, 'results': [],
+                'error': "Core reconciliation not available"}
+    
     def attempt_auto_reconciliation_optimized(*args, **kwargs):
         return False, "Core reconciliation not available"
     
@@ -870,7 +875,30 @@ class UnifiedCacheManager:
             
             if keys_to_invalidate:
                 logger.debug(f"Invalidated {len(keys_to_invalidate)} related cache entries")
-    
+
+    def invalidate_related_batch(self, invoice_ids: Iterable[int] = (), transaction_ids: Iterable[int] = ()):
+        """Invalidate entries related to many items in a single pass over the cache"""
+        targets = {'invoice_id': set(invoice_ids), 'transaction_id': set(transaction_ids)}
+        with self._lock:
+            keys_to_invalidate = []
+            for key, entry in self._cache.items():
+                params = entry.get('params', {})
+                for param_name, ids in targets.items():
+                    if not ids:
+                        continue
+                    if params.get(param_name) in ids:
+                        keys_to_invalidate.append(key)
+                        break
+                    list_param = params.get(f"{param_name}s")
+                    if isinstance(list_param, list) and not ids.isdisjoint(list_param):
+                        keys_to_invalidate.append(key)
+                        break
+
+            for key in keys_to_invalidate:
+                self._remove_cache_entry(key)
+
+            self._invalidation_stats['related_invalidations'] += len(keys_to_invalidate)
+
     def register_dependency(self, source_key: str, dependent_key: str):
         """Register cache dependency"""
         with self._lock:
@@ -1516,147 +1544,19 @@ class BatchOperationsProcessor:
     async def find_automatic_matches_parallel(self, 
                                             confidence_level: str, 
                                             max_suggestions: int) -> List[Dict]:
-        """Find automatic matches using parallel processing"""
-        
-        # Get candidate transactions in parallel batches
+        """Find automatic matches with the core global assignment engine (single DB pass)"""
         loop = asyncio.get_event_loop()
-        candidates = await loop.run_in_executor(
+        matches = await loop.run_in_executor(
             self.executor,
-            self._get_candidate_transactions_optimized,
-            max_suggestions * 3  # Get more candidates for better filtering
+            find_automatic_matches_optimized,
+            confidence_level,
+            max_suggestions
         )
-        
-        if not candidates:
-            return []
-        
-        # Process candidates in intelligent batches
-        batch_size = max(8, len(candidates) // ReconciliationAdapterConfig.MAX_WORKERS)
-        batches = [candidates[i:i + batch_size] for i in range(0, len(candidates), batch_size)]
-        
-        # Process batches in parallel
-        all_matches = []
-        
-        async def _process_candidate_batch(batch):
-            async with self.semaphore:
-                return await self._process_automatic_candidates(batch, confidence_level)
-        
-        tasks = [_process_candidate_batch(batch) for batch in batches]
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Collect and merge results
-        for batch_result in batch_results:
-            if isinstance(batch_result, Exception):
-                logger.error(f"Batch automatic matching failed: {batch_result}")
-                continue
-            
-            if isinstance(batch_result, list):
-                all_matches.extend(batch_result)
-        
-        # Sort and limit results
-        all_matches.sort(key=lambda x: x.get('confidence_score', 0), reverse=True)
-        return all_matches[:max_suggestions]
-    
-    def _get_candidate_transactions_optimized(self, limit: int) -> List[Dict]:
-        """Get candidate transactions with optimized query"""
-        try:
-            from app.core.database import get_connection
-            
-            with get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Optimized query with better filtering
-                query = """
-                    SELECT 
-                        id as transaction_id,
-                        amount,
-                        reconciled_amount,
-                        description,
-                        transaction_date,
-                        (amount - reconciled_amount) as remaining_amount,
-                        LENGTH(description) as desc_length
-                    FROM BankTransactions
-                    WHERE reconciliation_status IN ('Da Riconciliare', 'Riconciliato Parz.')
-                      AND ABS(amount - reconciled_amount) > 0.01
-                      AND description IS NOT NULL
-                      AND LENGTH(description) > 10
-                    ORDER BY 
-                        ABS(amount - reconciled_amount) DESC,
-                        desc_length DESC
-                    LIMIT ?
-                """
-                
-                cursor.execute(query, (limit,))
-                return [dict(row) for row in cursor.fetchall()]
-                
-        except Exception as e:
-            logger.error(f"Failed to get candidate transactions: {e}")
-            return []
-    
-    async def _process_automatic_candidates(self, candidates: List[Dict], 
-                                          confidence_level: str) -> List[Dict]:
-        """Process automatic matching candidates"""
-        loop = asyncio.get_event_loop()
-        matches = []
-        
-        for candidate in candidates:
-            try:
-                transaction_id = candidate['transaction_id']
-                
-                # Use the enhanced reconciliation function
-                suggestions = await loop.run_in_executor(
-                    self.executor,
-                    suggest_reconciliation_matches_enhanced,
-                    None,  # invoice_id
-                    transaction_id,
-                    None   # anagraphics_id_filter
-                )
-                
-                # Filter by confidence level and quality
-                high_quality_matches = self._filter_high_quality_matches(
-                    suggestions, confidence_level, candidate
-                )
-                
-                matches.extend(high_quality_matches)
-                
-            except Exception as e:
-                logger.debug(f"Automatic candidate processing failed: {e}")
-        
+        for match in matches:
+            match['automatic_match'] = True
+            match['batch_processed'] = True
         return matches
     
-    def _filter_high_quality_matches(self, suggestions: List[Dict], 
-                                   confidence_level: str, candidate: Dict) -> List[Dict]:
-        """Filter high quality matches from suggestions"""
-        filtered_matches = []
-        
-        for suggestion in suggestions:
-            # Check confidence level match
-            if not suggestion.get('confidence', '').startswith(confidence_level):
-                continue
-            
-            # Check confidence score threshold
-            confidence_score = suggestion.get('confidence_score', 0)
-            if confidence_score < ReconciliationAdapterConfig.HIGH_CONFIDENCE_THRESHOLD:
-                continue
-            
-            # Check for exact amount match
-            if 'Importo Esatto' not in suggestion.get('reasons', []):
-                continue
-            
-            # Enhance with candidate context
-            enhanced_match = suggestion.copy()
-            enhanced_match['transaction_id'] = candidate['transaction_id']
-            enhanced_match['transaction_context'] = {
-                'original_amount': candidate['amount'],
-                'remaining_amount': candidate['remaining_amount'],
-                'description': candidate['description']
-            }
-            enhanced_match['automatic_match'] = True
-            enhanced_match['batch_processed'] = True
-            
-            filtered_matches.append(enhanced_match)
-        
-        return filtered_matches
-    
     async def process_reconciliation_operations(self, operations: List[Dict]) -> Dict[str, Any]:
         """Process various reconciliation operations in batch"""
         results = {
@@ -2640,6 +2540,74 @@ class ReconciliationAdapterV4:
             'operation_id': f"manual_{invoice_id}_{transaction_id}_{int(time.time())}"
         }
     
+    async def apply_matches_batch_async(self,
+                                        pairs: List[Dict[str, Any]],
+                                        validate_ai: bool = True,
+                                        enable_learning: bool = True) -> Dict[str, Any]:
+        """Apply many manual matches with one core batch (single snapshot, single commit)"""
+        
+        loop = asyncio.get_event_loop()
+        ai_enabled = validate_ai and self.feature_flags['ai_matching']
+        rejected = {}
+        
+        if ai_enabled:
+            for index, pair in enumerate(pairs):
+                validation_result = await self._ai_validate_manual_match_enhanced(
+                    pair['invoice_id'], pair['transaction_id'], pair['amount']
+                )
+                if not validation_result['valid']:
+                    rejected[index] = validation_result
+        
+        accepted_indexes = [i for i in range(len(pairs)) if i not in rejected]
+        batch_result = await loop.run_in_executor(
+            self.ai_engine.executor,
+            apply_matches_batch,
+            [pairs[i] for i in accepted_indexes]
+        )
+        
+        self.cache_manager.invalidate_related_batch(
+            invoice_ids=batch_result.get('affected_invoices', []),
+            transaction_ids=batch_result.get('affected_transactions', [])
+        )
+        
+        results = [None] * len(pairs)
+        for index, validation_result in rejected.items():
+            results[index] = {
+                'pair_index': index,
+                'success': False,
+                'message': validation_result['message'],
+                'ai_warning': True,
+                'invoice_id': pairs[index]['invoice_id'],
+                'transaction_id': pairs[index]['transaction_id']
+            }
+        for core_result in batch_result.get('results', []):
+            index = accepted_indexes[core_result['pair_index']]
+            results[index] = {**core_result, 'pair_index': index, 'ai_validated': ai_enabled}
+            if core_result['success'] and enable_learning and self.feature_flags['pattern_learning']:
+                await self._learn_from_manual_match_enhanced(
+                    core_result['invoice_id'], core_result['transaction_id'], core_result['amount']
+                )
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = {
+                    'pair_index': index,
+                    'success': False,
+                    'message': batch_result.get('error', 'Batch not applied'),
+                    'invoice_id': pairs[index].get('invoice_id'),
+                    'transaction_id': pairs[index].get('transaction_id')
+                }
+
+        self._increment_operation_count()
+        
+        return {
+            'success': batch_result.get('success', False),
+            'applied': batch_result.get('applied', 0),
+            'failed': len(pairs) - batch_result.get('applied', 0),
+            'results': results,
+            'ai_validated': ai_enabled,
+            'timestamp': datetime.now().isoformat()
+        }
+    
     async def _ai_validate_manual_match_enhanced(self, 
                                                invoice_id: int, 
                                                transaction_id: int, 
@@ -25,13 +25,19 @@ async def get_anagraphics_list(
     type_filter: Optional[str] = Query(None, description="Filter by type: Cliente or Fornitore"),
     search: Optional[str] = Query(None, description="Search in denomination, piva, cf"),
     page: int = Query(1, ge=1, description="Page number"),
-    size: int = Query(50, ge=1, le=1000, description="Page size")
+    size: int = Query(50, ge=1, le=1000, description="Page size"),
+    search_mode: str = Query("standard", regex="^(standard|fulltext)$", description="standard (substring) or fulltext (ranked FTS5 MATCH)")
 ):
     """
     Recupera una lista paginata di anagrafiche.
     Permette di filtrare per tipo e di effettuare una ricerca testuale.
     """
     try:
+        if search and search_mode == "fulltext":
+            fulltext_response = await _search_anagraphics_fulltext(search, type_filter, page, size)
+            if fulltext_response is not None:
+                return fulltext_response
+
         anagraphics_list = await db_adapter.get_anagraphics_async(type_filter=type_filter)
         
         if not anagraphics_list:
@@ -73,6 +79,44 @@ async def get_anagraphics_list(
         logger.error(f"Error getting anagraphics list: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error while retrieving anagraphics: {str(e)}")
 
+async def _search_anagraphics_fulltext(search: str, type_filter: Optional[str], page: int, size: int) -> Optional[AnagraphicsListResponse]:
+    """Ricerca ranked (bm25) su denominazione/P.IVA/CF tramite FTS5. None se l'indice non è disponibile."""
+    from app.core.database import is_fulltext_available, build_fts_match_query
+
+    fts_query = build_fts_match_query(search)
+    if not fts_query or not is_fulltext_available():
+        return None
+
+    where_clause = "WHERE AnagraphicsFTS MATCH ?"
+    params = [fts_query]
+    if type_filter in ('Cliente', 'Fornitore'):
+        where_clause += " AND a.type = ?"
+        params.append(type_filter)
+    from_clause = f"FROM AnagraphicsFTS fts JOIN Anagraphics a ON a.id = fts.rowid {where_clause}"
+
+    count_result = await db_adapter.execute_query_async(f"SELECT COUNT(*) as total {from_clause}", tuple(params))
+    total = count_result[0]['total'] if count_result else 0
+    if total == 0:
+        return AnagraphicsListResponse(items=[], total=0, page=page, size=size, pages=0, success=True, message="No matching anagraphics found")
+
+    items = await db_adapter.execute_query_async(
+        f"""SELECT a.id, a.type, a.denomination, a.piva, a.cf, a.city, a.province, a.score,
+                   a.email, a.phone, a.pec, a.iban, a.address, a.cap, a.codice_destinatario,
+                   a.created_at, a.updated_at
+            {from_clause}
+            ORDER BY fts.rank LIMIT ? OFFSET ?""",
+        tuple(params + [size, (page - 1) * size])
+    )
+    return AnagraphicsListResponse(
+        items=items,
+        total=total,
+        page=page,
+        size=len(items),
+        pages=(total + size - 1) // size,
+        success=True,
+        message="Anagraphics retrieved successfully"
+    )
+
 @router.get("/{anagraphics_id}", response_model=Anagraphics, summary="Get Anagraphics by ID")
 async def get_anagraphics_by_id(anagraphics_id: int = Path(..., gt=0, description="The ID of the anagraphics record to retrieve")):
     """Recupera una singola anagrafica tramite il suo ID."""
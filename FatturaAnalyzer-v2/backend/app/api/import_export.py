@@ -10,7 +10,7 @@ import shutil
 import zipfile
 import csv
 import json
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union, BinaryIO
 from pathlib import Path
 from fastapi import APIRouter, HTTPException, UploadFile, File, Query, Response, Form
 from fastapi.responses import StreamingResponse, FileResponse
@@ -39,7 +39,7 @@ class ZIPValidationResult:
         }
         self.recommendations: List[str] = []
 
-def validate_zip_structure(zip_path: str, expected_types: Optional[List[str]] = None) -> ZIPValidationResult:
+def validate_zip_structure(zip_path: Union[str, BinaryIO], expected_types: Optional[List[str]] = None) -> ZIPValidationResult:
     result = ZIPValidationResult()
     try:
         if not zipfile.is_zipfile(zip_path):
@@ -103,47 +103,41 @@ async def validate_zip_endpoint(file: UploadFile = File(...)):
     if not file.filename or not file.filename.lower().endswith('.zip'):
         raise HTTPException(status_code=400, detail="File must be a ZIP archive")
     
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as temp_zip:
-        shutil.copyfileobj(file.file, temp_zip)
-        temp_zip_path = temp_zip.name
-
-    try:
-        validation_result = validate_zip_structure(temp_zip_path)
-        return APIResponse(
-            success=validation_result.can_import, 
-            message="Validation completed", 
-            data=validation_result.__dict__
-        )
-    finally:
-        os.unlink(temp_zip_path)
+    # Legge l'indice direttamente dall'upload spooled, senza copia su disco
+    validation_result = validate_zip_structure(file.file)
+    return APIResponse(
+        success=validation_result.can_import, 
+        message="Validation completed", 
+        data=validation_result.__dict__
+    )
 
 @router.post("/invoices/zip", response_model=ImportResult)
-async def import_invoices_from_zip(file: UploadFile = File(...)):
+async def import_invoices_from_zip(
+    file: UploadFile = File(...),
+    force: bool = Query(False, description="Reimport files already recorded in the import manifest")
+):
     """Import invoices from a ZIP archive."""
     if not file.filename or not file.filename.lower().endswith('.zip'):
         raise HTTPException(status_code=400, detail="File must be a ZIP archive")
         
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_zip_path = os.path.join(temp_dir, file.filename)
-        try:
-            with open(temp_zip_path, "wb") as temp_file:
-                shutil.copyfileobj(file.file, temp_file)
-            
-            validation_result = validate_zip_structure(temp_zip_path, expected_types=['.xml', '.p7m'])
-            if not validation_result.can_import:
-                raise HTTPException(
-                    status_code=400, 
-                    detail={
-                        "message": "ZIP validation failed", 
-                        "details": validation_result.validation_details
-                    }
-                )
+    try:
+        # L'upload spooled viene letto in streaming: nessuna copia né estrazione su disco
+        validation_result = validate_zip_structure(file.file, expected_types=['.xml', '.p7m'])
+        if not validation_result.can_import:
+            raise HTTPException(
+                status_code=400, 
+                detail={
+                    "message": "ZIP validation failed", 
+                    "details": validation_result.validation_details
+                }
+            )
 
-            result = await importer_adapter.import_from_source_async(temp_zip_path)
-            return ImportResult(**result)
-        except Exception as e:
-            logger.error(f"Error processing ZIP archive in /invoices/zip: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Error processing ZIP archive: {str(e)}")
+        file.file.seek(0)
+        result = await importer_adapter.import_from_source_async(file.file, source_name=file.filename, force=force)
+        return ImportResult(**result)
+    except Exception as e:
+        logger.error(f"Error processing ZIP archive in /invoices/zip: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error processing ZIP archive: {str(e)}")
 
 @router.get("/templates/transactions-csv")
 async def download_transaction_template():
@@ -16,6 +16,9 @@ from app.models import (
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Cursore keyset quando l'ultima fattura della pagina non ha doc_date (NULL in coda nell'ordine DESC)
+_NULL_DOC_DATE_CURSOR = date.min
+
 
 @router.get("/", response_model=InvoiceListResponse)
 async def get_invoices_list(
@@ -28,13 +31,17 @@ async def get_invoices_list(
     min_amount: Optional[float] = Query(None, description="Minimum amount filter"),
     max_amount: Optional[float] = Query(None, description="Maximum amount filter"),
     page: int = Query(1, ge=1, description="Page number"),
-    size: int = Query(50, ge=1, le=1000, description="Page size")
+    size: int = Query(50, ge=1, le=1000, description="Page size"),
+    after_doc_date: Optional[date] = Query(None, description="Keyset cursor: doc_date of the last item of the previous page"),
+    after_id: Optional[int] = Query(None, description="Keyset cursor: id of the last item of the previous page")
 ):
     """Get paginated list of invoices with filters"""
     from app.adapters.database_adapter import db_adapter
+    if (after_doc_date is None) != (after_id is None):
+        raise HTTPException(status_code=422, detail="after_doc_date and after_id must be provided together")
     try:
         # Costruiamo la query SQL in modo dinamico e sicuro
-        base_query = """
+        select_clause = """
             SELECT
                 i.id, i.anagraphics_id, i.type, i.doc_type, i.doc_number, i.doc_date, 
                 i.total_amount, i.due_date, i.payment_status, i.paid_amount, i.payment_method,
@@ -44,54 +51,84 @@ async def get_invoices_list(
                 (i.total_amount - i.paid_amount) as open_amount
             FROM Invoices i
             LEFT JOIN Anagraphics a ON i.anagraphics_id = a.id
-            WHERE 1=1
         """
+        filters = []
         params = []
         
         if type_filter:
-            base_query += " AND i.type = ?"
+            filters.append("i.type = ?")
             params.append(type_filter.value)
         if status_filter:
-            base_query += " AND i.payment_status = ?"
+            filters.append("i.payment_status = ?")
             params.append(status_filter.value)
         if anagraphics_id:
-            base_query += " AND i.anagraphics_id = ?"
+            filters.append("i.anagraphics_id = ?")
             params.append(anagraphics_id)
         if start_date:
-            base_query += " AND i.doc_date >= ?"
+            filters.append("i.doc_date >= ?")
             params.append(start_date.isoformat())
         if end_date:
-            base_query += " AND i.doc_date <= ?"
+            filters.append("i.doc_date <= ?")
             params.append(end_date.isoformat())
         if min_amount is not None:
-            base_query += " AND i.total_amount >= ?"
+            filters.append("i.total_amount >= ?")
             params.append(min_amount)
         if max_amount is not None:
-            base_query += " AND i.total_amount <= ?"
+            filters.append("i.total_amount <= ?")
             params.append(max_amount)
         if search:
             search_lower = f"%{search.lower()}%"
-            base_query += " AND (LOWER(i.doc_number) LIKE ? OR LOWER(a.denomination) LIKE ?)"
+            filters.append("(LOWER(i.doc_number) LIKE ? OR LOWER(a.denomination) LIKE ?)")
             params.extend([search_lower, search_lower])
 
-        # Esegui la query per ottenere tutti i risultati filtrati
-        all_filtered_invoices = await db_adapter.execute_query_async(base_query, tuple(params))
-        
-        total = len(all_filtered_invoices)
-        
-        # Applica la paginazione
-        start_idx = (page - 1) * size
-        end_idx = start_idx + size
-        paginated_items = all_filtered_invoices[start_idx:end_idx]
+        where_clause = (" WHERE " + " AND ".join(filters)) if filters else ""
+
+        # COUNT separato (join con Anagraphics solo se serve alla ricerca): a parità di filtri
+        # la query è identica per ogni pagina e viene servita dalla cache query dell'adapter
+        count_from = "FROM Invoices i LEFT JOIN Anagraphics a ON i.anagraphics_id = a.id" if search else "FROM Invoices i"
+        count_result = await db_adapter.execute_query_async(
+            f"SELECT COUNT(*) as total {count_from}{where_clause}", tuple(params)
+        )
+        total = count_result[0]['total'] if count_result else 0
+
+        # Pagina letta direttamente in SQL: keyset su (doc_date, id) se fornito, altrimenti LIMIT/OFFSET.
+        # In SQLite i NULL vengono per ultimi con DESC: il keyset li include dopo tutte le date
+        page_query = select_clause + where_clause
+        page_params = list(params)
+        if after_doc_date is not None:
+            if after_doc_date == _NULL_DOC_DATE_CURSOR:
+                keyset = "(i.doc_date IS NULL AND i.id < ?)"
+                page_params.append(after_id)
+            else:
+                keyset = "(i.doc_date < ? OR (i.doc_date = ? AND i.id < ?) OR i.doc_date IS NULL)"
+                page_params.extend([after_doc_date.isoformat(), after_doc_date.isoformat(), after_id])
+            page_query += (" AND " if filters else " WHERE ") + keyset
+            page_query += " ORDER BY i.doc_date DESC, i.id DESC LIMIT ?"
+            page_params.append(size)
+        else:
+            page_query += " ORDER BY i.doc_date DESC, i.id DESC LIMIT ? OFFSET ?"
+            page_params.extend([size, (page - 1) * size])
+
+        paginated_items = await db_adapter.execute_query_async(page_query, tuple(page_params))
         
         pages = (total + size - 1) // size if total > 0 else 0
+
+        next_cursor = None
+        if paginated_items and len(paginated_items) == size:
+            last_item = paginated_items[-1]
+            last_doc_date = last_item['doc_date'] or _NULL_DOC_DATE_CURSOR
+            next_cursor = {
+                'after_doc_date': last_doc_date.isoformat() if hasattr(last_doc_date, 'isoformat') else str(last_doc_date)[:10],
+                'after_id': last_item['id']
+            }
         
         return InvoiceListResponse(
             items=paginated_items,
             total=total,
             page=page,
             size=size,
-            pages=pages
+            pages=pages,
+            next_cursor=next_cursor
         )
     except Exception as e:
         logger.error(f"Error getting invoices list: {e}", exc_info=True)
@@ -509,10 +546,56 @@ async def get_invoices_stats():
 async def search_invoices(
     query: str = Path(..., description="Search query"),
     type_filter: Optional[InvoiceType] = Query(None, description="Filter by type"),
-    limit: int = Query(10, ge=1, le=100)
+    limit: int = Query(10, ge=1, le=100),
+    search_mode: str = Query("standard", regex="^(standard|fulltext)$", description="standard (LIKE) or fulltext (ranked FTS5 MATCH)")
 ):
     """Search invoices by document number or counterparty name"""
+    from app.adapters.database_adapter import db_adapter
     try:
+        fts_query = None
+        if search_mode == "fulltext":
+            from app.core.database import is_fulltext_available, build_fts_match_query
+            fts_query = build_fts_match_query(query) if is_fulltext_available() else None
+
+        if fts_query:
+            # Match su numero documento o su denominazione/P.IVA/CF della controparte, ordinati per bm25
+            search_query = """
+                WITH matches AS (
+                    SELECT rowid AS invoice_id, rank FROM InvoicesFTS WHERE InvoicesFTS MATCH ?
+                    UNION ALL
+                    SELECT i.id AS invoice_id, af.rank
+                    FROM AnagraphicsFTS af JOIN Invoices i ON i.anagraphics_id = af.rowid
+                    WHERE AnagraphicsFTS MATCH ?
+                ),
+                best AS (
+                    SELECT invoice_id, MIN(rank) AS fts_rank FROM matches GROUP BY invoice_id
+                )
+                SELECT i.id, i.type, i.doc_number, i.doc_date, i.total_amount,
+                       i.payment_status, a.denomination as counterparty_name,
+                       (i.total_amount - i.paid_amount) as open_amount, best.fts_rank
+                FROM best
+                JOIN Invoices i ON i.id = best.invoice_id
+                JOIN Anagraphics a ON i.anagraphics_id = a.id
+            """
+            params = [fts_query, fts_query]
+            if type_filter:
+                search_query += " WHERE i.type = ?"
+                params.append(type_filter.value)
+            search_query += " ORDER BY best.fts_rank, i.doc_date DESC LIMIT ?"
+            params.append(limit)
+
+            results = await db_adapter.execute_query_async(search_query, tuple(params))
+            return APIResponse(
+                success=True,
+                message=f"Found {len(results)} results",
+                data={
+                    "query": query,
+                    "results": results,
+                    "total": len(results),
+                    "search_mode": "fulltext"
+                }
+            )
+
         search_query = """
             SELECT i.id, i.type, i.doc_number, i.doc_date, i.total_amount,
                    i.payment_status, a.denomination as counterparty_name,
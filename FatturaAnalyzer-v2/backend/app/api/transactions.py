@@ -7,8 +7,7 @@ import json
 from typing import List, Optional, Dict, Any, Union
 from datetime import date, datetime, timedelta
 from decimal import Decimal
-from concurrent.futures import ThreadPoolExecutor
-from functools import lru_cache
+from functools import lru_cache, wraps
 import pandas as pd
 import numpy as np
 from io import StringIO, BytesIO
@@ -223,29 +222,6 @@ class BackgroundTasksManager:
 
 # ================== PERFORMANCE UTILITIES ==================
 
-def apply_dataframe_filters_vectorized(df: pd.DataFrame, filters: TransactionFilters) -> pd.DataFrame:
-    """Applica filtri usando operazioni vettoriali ottimizzate"""
-    if df.empty:
-        return df
-    
-    filtered_df = df.copy()
-    
-    # Filtri numerici vettoriali
-    if filters.min_amount is not None:
-        filtered_df = filtered_df[filtered_df['amount'].abs() >= filters.min_amount]
-    
-    if filters.max_amount is not None:
-        filtered_df = filtered_df[filtered_df['amount'].abs() <= filters.max_amount]
-    
-    # Filtro testo vettoriale
-    if filters.search:
-        search_mask = filtered_df['description'].str.contains(
-            filters.search, case=False, na=False, regex=False
-        )
-        filtered_df = filtered_df[search_mask]
-    
-    return filtered_df
-
 def calculate_enhanced_fields_vectorized(df: pd.DataFrame) -> pd.DataFrame:
     """Calcola campi aggiuntivi usando operazioni vettoriali"""
     if df.empty:
@@ -258,28 +234,12 @@ def calculate_enhanced_fields_vectorized(df: pd.DataFrame) -> pd.DataFrame:
     
     return df
 
-async def process_heavy_operations_async(df: pd.DataFrame, filters: TransactionFilters) -> pd.DataFrame:
-    """Processa operazioni pesanti in thread pool"""
-    loop = asyncio.get_event_loop()
-    
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        # Esegui filtri e calcoli in parallelo
-        filter_task = loop.run_in_executor(executor, apply_dataframe_filters_vectorized, df, filters)
-        filtered_df = await filter_task
-        
-        if not filtered_df.empty:
-            calc_task = loop.run_in_executor(executor, calculate_enhanced_fields_vectorized, filtered_df)
-            result_df = await calc_task
-        else:
-            result_df = filtered_df
-    
-    return result_df
-
 # ================== DECORATORI PERFORMANCE ==================
 
 def transaction_performance_tracked(operation_name: str):
     """Decoratore per tracking performance V4.0"""
     def decorator(func):
+        @wraps(func)
         async def wrapper(*args, **kwargs):
             start_time = time.perf_counter()
             
@@ -453,56 +413,34 @@ async def get_transactions_list_v4(
                 log.info("Returning cached result")
                 return cached_result
         
-        log.info("Fetching transactions from database")
+        log.info("Fetching transactions page from database")
         
-        # Ottieni transazioni dal database
+        # Filtri, COUNT e paginazione eseguiti in SQL: si materializza solo la pagina richiesta
         db_adapter = get_db_adapter()
-        df_transactions = await db_adapter.get_transactions_async(
+        page_result = await db_adapter.get_transactions_page_async(
+            page=page,
+            size=size,
             start_date=start_date.isoformat() if start_date else None,
             end_date=end_date.isoformat() if end_date else None,
             status_filter=status_filter.value if status_filter else None,
-            limit=None,
+            search=filters.search,
+            min_amount=filters.min_amount,
+            max_amount=filters.max_amount,
             anagraphics_id_heuristic_filter=anagraphics_id_heuristic,
             hide_pos=hide_pos,
             hide_worldline=hide_worldline,
             hide_cash=hide_cash,
-            hide_commissions=hide_commissions
+            hide_commissions=hide_commissions,
+            include_summary=enhanced or include_summary
         )
         
-        if df_transactions.empty:
-            base_response = {
-                "items": [],
-                "total": 0,
-                "page": page,
-                "size": size,
-                "pages": 0
-            }
-            
-            if enhanced or include_summary:
-                base_response.update({
-                    "filters_applied": filters.dict(exclude_none=True),
-                    "summary": {"total_amount": 0.0, "total_income": 0.0, "total_expenses": 0.0},
-                    "ai_enhanced": False,
-                    "cache_hit": False
-                })
-            
-            return base_response
-        
-        # Applica filtri aggiuntivi con processing ottimizzato
-        log.debug("Applying additional filters")
-        df_filtered = await process_heavy_operations_async(df_transactions, filters)
-        
-        total = len(df_filtered)
-        
-        # Paginazione
-        start_idx = (page - 1) * size
-        end_idx = start_idx + size
-        df_paginated = df_filtered.iloc[start_idx:end_idx] if not df_filtered.empty else df_filtered
+        total = page_result['total']
         
-        # Conversione ottimizzata
+        # Campi calcolati solo sulle righe della pagina
         items = []
-        if not df_paginated.empty:
-            items_data = df_paginated.to_dict('records')
+        if page_result['items']:
+            df_page = calculate_enhanced_fields_vectorized(pd.DataFrame(page_result['items']))
+            items_data = df_page.to_dict('records')
             
             # AI Insights se richiesto
             if enable_ai_insights and items_data:
@@ -516,7 +454,7 @@ async def get_transactions_list_v4(
             
             items = items_data
         
-        pages = (total + size - 1) // size
+        pages = (total + size - 1) // size if total > 0 else 0
         
         # Prepara risposta
         base_response = {
@@ -529,21 +467,9 @@ async def get_transactions_list_v4(
         
         # Enhanced response se richiesto
         if enhanced or include_summary:
-            summary = {}
-            if not df_filtered.empty:
-                summary = {
-                    "total_amount": float(df_filtered['amount'].sum()),
-                    "total_income": float(df_filtered[df_filtered['amount'] > 0]['amount'].sum()),
-                    "total_expenses": float(abs(df_filtered[df_filtered['amount'] < 0]['amount'].sum())),
-                    "count_by_status": df_filtered['reconciliation_status'].value_counts().to_dict(),
-                    "avg_amount": float(df_filtered['amount'].mean()),
-                    "unreconciled_count": len(df_filtered[df_filtered['reconciliation_status'] == 'Da Riconciliare']),
-                    "reconciliation_rate": (len(df_filtered[df_filtered['reconciliation_status'] == 'Riconciliato Tot.']) / total * 100) if total > 0 else 0
-                }
-            
             base_response.update({
                 "filters_applied": filters.dict(exclude_none=True),
-                "summary": summary,
+                "summary": page_result['summary'] or {"total_amount": 0.0, "total_income": 0.0, "total_expenses": 0.0},
                 "ai_enhanced": enable_ai_insights,
                 "cache_hit": False,
                 "adapter_version": "4.0"
@@ -1338,23 +1264,19 @@ async def _process_batch_reconciliation_v4_background(
     try:
         BackgroundTasksManager.update_task(task_id, {'status': 'processing'})
         
-        results = []
-        
-        # Process in chunks per evitare timeout
-        chunk_size = 20 if enable_parallel_processing else 10
+        # Un solo batch core: validazione su un'unica istantanea, executemany dei link,
+        # ricalcolo stati in una passata e un solo commit
+        batch_result = await adapter_v4.apply_matches_batch_async(
+            reconciliation_pairs,
+            validate_ai=enable_ai_validation,
+            enable_learning=True
+        )
+        results = batch_result['results']
+        for result in results:
+            if result.get('success'):
+                result['amount_matched'] = reconciliation_pairs[result['pair_index']]['amount']
         
-        for i in range(0, len(reconciliation_pairs), chunk_size):
-            chunk = reconciliation_pairs[i:i + chunk_size]
-            
-            chunk_results = await _process_batch_reconciliation_immediate(
-                chunk, enable_ai_validation, enable_parallel_processing, adapter_v4
-            )
-            
-            results.extend(chunk_results['results'])
-            
-            # Update progress
-            progress = min(i + chunk_size, len(reconciliation_pairs))
-            BackgroundTasksManager.update_task(task_id, {'progress': progress})
+        BackgroundTasksManager.update_task(task_id, {'progress': len(reconciliation_pairs)})
         
         # Complete task con statistiche dettagliate
         successful = len([r for r in results if r.get('success', False)])
@@ -1924,7 +1846,7 @@ async def search_transactions_v4(
     query: str = Path(..., min_length=2, max_length=100, description="Search query"),
     limit: int = Query(10, ge=1, le=100),
     include_reconciled: bool = Query(False, description="Include fully reconciled transactions"),
-    search_mode: str = Query("smart", regex="^(smart|exact|fuzzy|ai_enhanced)$", description="Search mode"),
+    search_mode: str = Query("smart", regex="^(smart|exact|fuzzy|ai_enhanced|fulltext)$", description="Search mode"),
     enhanced_results: bool = Query(False, description="Include AI insights in results"),
     enable_client_matching: bool = Query(False, description="Enable client matching in search")
 ):
@@ -1938,68 +1860,102 @@ async def search_transactions_v4(
         
         start_time = time.time()
         
-        # Build search conditions based on mode
-        search_conditions = []
-        search_params = []
-        
-        if search_mode == "exact":
-            search_conditions.append("description = ?")
-            search_params.append(query)
-        elif search_mode == "fuzzy":
-            # Fuzzy search con multiple parole
-            words = query.split()
-            for word in words:
-                if len(word) >= 3:
-                    search_conditions.append("description LIKE ?")
-                    search_params.append(f"%{word}%")
-        elif search_mode == "ai_enhanced":
-            # AI-enhanced search con pattern recognition
-            enhanced_patterns = _generate_ai_search_patterns_v4(query)
-            for pattern in enhanced_patterns:
-                search_conditions.append("description LIKE ?")
-                search_params.append(f"%{pattern}%")
-        else:  # smart mode (default)
-            search_conditions.append("description LIKE ?")
-            search_params.append(f"%{query}%")
-        
-        # Try amount search
+        # Modalità fulltext: MATCH sull'indice FTS5 con ranking bm25 (fallback a smart se non disponibile)
+        fts_query = None
+        if search_mode == "fulltext":
+            from app.core.database import is_fulltext_available, build_fts_match_query
+            fts_query = build_fts_match_query(query) if is_fulltext_available() else None
+
+        # Query numerica: ricerca anche per importo (in OR con le condizioni testuali)
         try:
-            amount_value = float(query.replace(',', '.'))
-            search_conditions.append("ABS(amount) = ?")
-            search_params.append(abs(amount_value))
+            amount_value = abs(float(query.replace(',', '.')))
         except ValueError:
-            pass
-        
-        if not search_conditions:
-            raise HTTPException(status_code=400, detail="No valid search conditions")
-        
-        # Build final query
-        base_query = """
-            SELECT id, transaction_date, amount, description, reconciliation_status,
-                   (amount - reconciled_amount) as remaining_amount,
-                   CASE WHEN amount > 0 THEN 'Income' ELSE 'Expense' END as type,
-                   unique_hash, reconciled_amount
-            FROM BankTransactions
-            WHERE ({})
-        """.format(" OR ".join(search_conditions))
-        
-        if not include_reconciled:
-            base_query += " AND reconciliation_status != 'Riconciliato Tot.'"
-        
-        # Smart ordering
-        if search_mode == "smart" or search_mode == "ai_enhanced":
-            base_query += """
-                ORDER BY 
-                    CASE WHEN description = ? THEN 0 ELSE 1 END,
-                    ABS(amount) DESC,
-                    transaction_date DESC 
-                LIMIT ?
+            amount_value = None
+        
+        if fts_query:
+            # Candidati solo da indici: rowid dall'indice FTS più, per query numeriche, gli id con
+            # quell'importo (idx_transactions_amount, UNION); il rank FTS è riagganciato per l'ordinamento
+            search_conditions = ["BankTransactionsFTS MATCH ?"]
+            search_params = [fts_query]
+            candidates = "SELECT rowid AS id FROM BankTransactionsFTS WHERE BankTransactionsFTS MATCH ?"
+            if amount_value is not None:
+                search_conditions.append("amount IN (?, ?)")
+                search_params.extend([amount_value, -amount_value])
+                candidates += " UNION SELECT id FROM BankTransactions WHERE amount IN (?, ?)"
+            search_params.append(fts_query)
+            base_query = f"""
+                SELECT t.id, t.transaction_date, t.amount, t.description, t.reconciliation_status,
+                       (t.amount - t.reconciled_amount) as remaining_amount,
+                       CASE WHEN t.amount > 0 THEN 'Income' ELSE 'Expense' END as type,
+                       t.unique_hash, t.reconciled_amount, fts.rank as fts_rank
+                FROM ({candidates}) c
+                JOIN BankTransactions t ON t.id = c.id
+                LEFT JOIN (SELECT rowid, rank FROM BankTransactionsFTS WHERE BankTransactionsFTS MATCH ?) fts
+                       ON fts.rowid = c.id
             """
-            search_params.insert(0, query)
+            if not include_reconciled:
+                base_query += " WHERE t.reconciliation_status != 'Riconciliato Tot.'"
+            base_query += " ORDER BY fts.rank IS NULL, fts.rank, t.transaction_date DESC LIMIT ?"
             search_params.append(limit)
         else:
-            base_query += " ORDER BY transaction_date DESC LIMIT ?"
-            search_params.append(limit)
+            # Build search conditions based on mode
+            search_conditions = []
+            search_params = []
+        
+            if search_mode == "exact":
+                search_conditions.append("description = ?")
+                search_params.append(query)
+            elif search_mode == "fuzzy":
+                # Fuzzy search con multiple parole
+                words = query.split()
+                for word in words:
+                    if len(word) >= 3:
+                        search_conditions.append("description LIKE ?")
+                        search_params.append(f"%{word}%")
+            elif search_mode == "ai_enhanced":
+                # AI-enhanced search con pattern recognition
+                enhanced_patterns = _generate_ai_search_patterns_v4(query)
+                for pattern in enhanced_patterns:
+                    search_conditions.append("description LIKE ?")
+                    search_params.append(f"%{pattern}%")
+            else:  # smart mode (default)
+                search_conditions.append("description LIKE ?")
+                search_params.append(f"%{query}%")
+        
+            if amount_value is not None:
+                search_conditions.append("ABS(amount) = ?")
+                search_params.append(amount_value)
+        
+            if not search_conditions:
+                raise HTTPException(status_code=400, detail="No valid search conditions")
+        
+            # Build final query
+            base_query = """
+                SELECT id, transaction_date, amount, description, reconciliation_status,
+                       (amount - reconciled_amount) as remaining_amount,
+                       CASE WHEN amount > 0 THEN 'Income' ELSE 'Expense' END as type,
+                       unique_hash, reconciled_amount
+                FROM BankTransactions
+                WHERE ({})
+            """.format(" OR ".join(search_conditions))
+        
+            if not include_reconciled:
+                base_query += " AND reconciliation_status != 'Riconciliato Tot.'"
+        
+            # Smart ordering
+            if search_mode == "smart" or search_mode == "ai_enhanced":
+                base_query += """
+                    ORDER BY 
+                        CASE WHEN description = ? THEN 0 ELSE 1 END,
+                        ABS(amount) DESC,
+                        transaction_date DESC 
+                    LIMIT ?
+                """
+                search_params.insert(0, query)
+                search_params.append(limit)
+            else:
+                base_query += " ORDER BY transaction_date DESC LIMIT ?"
+                search_params.append(limit)
         
         logger.debug("Executing search query V4.0", conditions_count=len(search_conditions))
         db_adapter = get_db_adapter()
@@ -2059,6 +2015,7 @@ async def search_transactions_v4(
                 "include_reconciled": include_reconciled,
                 "enhanced_results": enhanced_results,
                 "client_matching": enable_client_matching,
+                "fulltext_applied": fts_query is not None,
                 "conditions_used": len(search_conditions),
                 "has_amount_search": any("amount" in condition for condition in search_conditions),
                 "adapter_version": "4.0"
@@ -2527,12 +2484,17 @@ async def create_transaction(transaction_data: BankTransactionCreate):
                 detail=f"Transaction with hash {transaction_data.unique_hash} already exists"
             )
         
+        # Classificazione precalcolata (flag hide_* e categoria)
+        from app.core.transaction_classifier import classify_transaction
+        classification = classify_transaction(transaction_data.description, transaction_data.amount)
+        
         # Crea transazione usando adapter
         insert_query = """
             INSERT INTO BankTransactions 
             (transaction_date, value_date, amount, description, causale_abi, 
-             unique_hash, reconciled_amount, reconciliation_status, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, 0.0, 'Da Riconciliare', datetime('now'))
+             unique_hash, reconciled_amount, reconciliation_status, created_at,
+             is_pos, is_worldline, is_cash_deposit, is_bank_fee, category, classifier_version)
+            VALUES (?, ?, ?, ?, ?, ?, 0.0, 'Da Riconciliare', datetime('now'), ?, ?, ?, ?, ?, ?)
         """
         
         params = (
@@ -2541,7 +2503,13 @@ async def create_transaction(transaction_data: BankTransactionCreate):
             transaction_data.amount,
             transaction_data.description,
             transaction_data.causale_abi,
-            transaction_data.unique_hash
+            transaction_data.unique_hash,
+            int(classification['is_pos']),
+            int(classification['is_worldline']),
+            int(classification['is_cash_deposit']),
+            int(classification['is_bank_fee']),
+            classification['category'],
+            int(classification['classifier_version'])
         )
         
         new_id = await db_adapter.execute_write_async(insert_query, params)
@@ -2599,6 +2567,19 @@ async def update_transaction(
         if not update_fields:
             raise HTTPException(status_code=400, detail="No fields to update")
         
+        # Descrizione o importo cambiati: ricalcola la classificazione precalcolata
+        if transaction_data.description is not None or transaction_data.amount is not None:
+            from app.core.transaction_classifier import classify_transaction
+            classification = classify_transaction(
+                transaction_data.description if transaction_data.description is not None else existing.get('description'),
+                transaction_data.amount if transaction_data.amount is not None else existing.get('amount')
+            )
+            for column in ('is_pos', 'is_worldline', 'is_cash_deposit', 'is_bank_fee', 'classifier_version'):
+                update_fields.append(f"{column} = ?")
+                params.append(int(classification[column]))
+            update_fields.append("category = ?")
+            params.append(classification['category'])
+        
         # Aggiungi timestamp update
         update_fields.append("updated_at = datetime('now')")
         params.append(transaction_id)
@@ -0,0 +1,115 @@
+# core/aho_corasick.py - Automa Aho–Corasick per la ricerca multi-pattern
+
+"""
+Automa Aho–Corasick in puro Python: trova in una sola passata lineare sul testo
+tutte le occorrenze di un insieme di pattern (anche sovrapposte).
+
+Ogni pattern porta un insieme di payload. Aggiungere o togliere payload a un pattern
+già presente non modifica la struttura; i nuovi pattern estendono il trie e i link di
+fallimento vengono ricalcolati (BFS sul trie) alla prima ricerca successiva. I nodi dei
+pattern senza più payload restano nel trie ma non producono match.
+"""
+
+from collections import deque
+from typing import Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+
+class AhoCorasickAutomaton:
+    """Trie con link di fallimento e di output (dictionary suffix link)."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output_link: List[int] = [0] # nodo terminale più vicino lungo i link di fallimento (0 = nessuno)
+        self._node_pattern: List[Optional[str]] = [None]
+        self._payloads: Dict[str, Set[Hashable]] = {}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        """Numero di pattern con almeno un payload."""
+        return sum(1 for payloads in self._payloads.values() if payloads)
+
+    def __contains__(self, pattern: str) -> bool:
+        return bool(self._payloads.get(pattern))
+
+    def payloads(self, pattern: str) -> Set[Hashable]:
+        return self._payloads.get(pattern, set())
+
+    def copy(self) -> 'AhoCorasickAutomaton':
+        """Copia indipendente: add/discard sulla copia non toccano l'automa originale."""
+        clone = AhoCorasickAutomaton.__new__(AhoCorasickAutomaton)
+        clone._goto = [dict(edges) for edges in self._goto]
+        clone._fail = list(self._fail)
+        clone._output_link = list(self._output_link)
+        clone._node_pattern = list(self._node_pattern)
+        clone._payloads = {pattern: set(payloads) for pattern, payloads in self._payloads.items()}
+        clone._dirty = self._dirty
+        return clone
+
+    def add(self, pattern: str, payload: Hashable) -> None:
+        """Associa payload a pattern, inserendo il pattern nel trie se nuovo."""
+        if not pattern:
+            return
+        payloads = self._payloads.get(pattern)
+        if payloads is None:
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output_link.append(0)
+                    self._node_pattern.append(None)
+                node = next_node
+            self._node_pattern[node] = pattern
+            payloads = self._payloads[pattern] = set()
+            self._dirty = True
+        payloads.add(payload)
+
+    def discard(self, pattern: str, payload: Hashable) -> None:
+        """Rimuove payload da pattern (il nodo resta, senza output se non ha più payload)."""
+        payloads = self._payloads.get(pattern)
+        if payloads is not None:
+            payloads.discard(payload)
+
+    def _build(self) -> None:
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._output_link[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                fail_node = self._fail[child]
+                self._output_link[child] = fail_node if self._node_pattern[fail_node] else self._output_link[fail_node]
+                queue.append(child)
+        self._dirty = False
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str]]:
+        """(posizione iniziale, pattern) per ogni occorrenza, in ordine di posizione finale."""
+        if self._dirty:
+            self._build()
+        goto, fail, output_link, node_pattern, payloads = (
+            self._goto, self._fail, self._output_link, self._node_pattern, self._payloads)
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            out = node if node_pattern[node] else output_link[node]
+            while out:
+                pattern = node_pattern[out]
+                if payloads[pattern]:
+                    yield position - len(pattern) + 1, pattern
+                out = output_link[out]
+
+
+__all__ = ['AhoCorasickAutomaton']
@@ -49,6 +49,11 @@ from sklearn.decomposition import PCA
 from sklearn.neural_network import MLPClassifier
 import xgboost as xgb
 
+try:
+    from .ttl_cache import TTLLRUCache
+except ImportError:
+    from ttl_cache import TTLLRUCache
+
 warnings.filterwarnings('ignore')
 
 logger = logging.getLogger(__name__)
@@ -1580,7 +1585,7 @@ class SmartReconciliationIntegrator:
     """Integra funzionalità di smart reconciliation con boost ML reali"""
     
     def __init__(self):
-        self.client_patterns = {}
+        self.client_patterns = TTLLRUCache(maxsize=1000, ttl_seconds=3600, name='client_patterns')
         self.integration_cache = {}
         self._lock = threading.RLock()
         
@@ -1612,14 +1617,12 @@ class SmartReconciliationIntegrator:
     
     def _get_client_pattern(self, anagraphics_id: int) -> Optional[Dict]:
         """Ottiene pattern cliente reale o lo crea"""
-        with self._lock:
-            if anagraphics_id in self.client_patterns:
-                return self.client_patterns[anagraphics_id]
-            
-            # Simula pattern cliente realistico
-            pattern = self._create_realistic_client_pattern(anagraphics_id)
-            self.client_patterns[anagraphics_id] = pattern
-            return pattern
+        def create_pattern():
+            # Simula pattern cliente realistico (seed globale numpy: creazione serializzata)
+            with self._lock:
+                return self._create_realistic_client_pattern(anagraphics_id)
+
+        return self.client_patterns.get_or_compute(anagraphics_id, create_pattern)
     
     def _create_realistic_client_pattern(self, anagraphics_id: int) -> Dict:
         """Crea pattern cliente realistico basato su ID"""
@@ -17,12 +17,12 @@ import warnings
 warnings.filterwarnings('ignore')
 
 try:
-    from .database import get_connection, DB_PATH
+    from .database import get_connection, DB_PATH, OPEN_INVOICE_FILTER
     from .utils import to_decimal, quantize, AMOUNT_TOLERANCE, normalize_product_name
 except ImportError:
     logging.warning("Import relativo fallito in analysis.py, tento import assoluto.")
     try:
-        from database import get_connection, DB_PATH
+        from database import get_connection, DB_PATH, OPEN_INVOICE_FILTER
         from utils import to_decimal, quantize, AMOUNT_TOLERANCE, normalize_product_name
     except ImportError as e:
         logging.critical(f"Impossibile importare dipendenze database/utils in analysis.py: {e}")
@@ -159,12 +159,22 @@ def _apply_categorization_rules(df: pd.DataFrame) -> pd.DataFrame:
     df['has_passive_links'] = df['linked_invoice_types'].astype(str).str.contains('Passiva', na=False)
     df['has_links'] = df['link_ids'].notna()
 
+    # Senza link la categoria precalcolata all'import (transaction_classifier) è già quella finale
+    if 'stored_category' in df.columns:
+        precomputed_mask = df['stored_category'].notna() & ~df['has_links']
+        df.loc[precomputed_mask, 'category'] = df.loc[precomputed_mask, 'stored_category']
+        to_evaluate = ~precomputed_mask
+    else:
+        to_evaluate = pd.Series(True, index=df.index)
+
     # Applica regole in ordine di priorità
     sorted_rules = sorted(TRANSACTION_CATEGORIES, key=lambda x: x['priority'], reverse=True)
 
     for rule in sorted_rules:
+        if not to_evaluate.any():
+            break
         # Crea mask per questa regola
-        mask = pd.Series([True] * len(df), index=df.index)
+        mask = to_evaluate.copy()
         
         # Applica pattern regex se presenti
         if rule['patterns']:
@@ -174,13 +184,14 @@ def _apply_categorization_rules(df: pd.DataFrame) -> pd.DataFrame:
             mask &= pattern_mask
         
         # Applica condizioni funzionali
-        if rule['conditions']:
-            condition_mask = df.apply(rule['conditions'], axis=1)
-            mask &= condition_mask
+        if rule['conditions'] and mask.any():
+            condition_mask = df[mask].apply(rule['conditions'], axis=1)
+            mask.loc[condition_mask.index] = condition_mask.astype(bool)
         
         # Applica categoria solo dove non è già stata assegnata una categoria di priorità più alta
-        final_mask = mask & (df['category'] == 'Altri')
+        final_mask = mask & to_evaluate
         df.loc[final_mask, 'category'] = rule['category']
+        to_evaluate &= ~final_mask
 
     return df
 
@@ -225,6 +236,7 @@ def _categorize_transactions_optimized(start_date_str: str, end_date_str: str) -
                 bt.transaction_date,
                 bt.amount,
                 bt.description,
+                bt.category as stored_category,
                 GROUP_CONCAT(DISTINCT rl.id) as link_ids,
                 GROUP_CONCAT(DISTINCT i.type) as linked_invoice_types,
                 COALESCE(SUM(rl.reconciled_amount), 0) as total_linked_amount,
@@ -234,7 +246,7 @@ def _categorize_transactions_optimized(start_date_str: str, end_date_str: str) -
             LEFT JOIN Invoices i ON rl.invoice_id = i.id
             WHERE bt.transaction_date BETWEEN ? AND ?
               AND bt.reconciliation_status != 'Ignorato'
-            GROUP BY bt.id, bt.transaction_date, bt.amount, bt.description
+            GROUP BY bt.id, bt.transaction_date, bt.amount, bt.description, bt.category
             ORDER BY bt.transaction_date
         """
         
@@ -1874,12 +1886,13 @@ def get_aging_summary_optimized(invoice_type='Attiva'):
         conn = get_connection()
         
         # Query SQL ottimizzata che fa tutto il calcolo aging nel database
-        query = """
+        # Range scan su idx_invoices_open_type_residual: solo le fatture aperte del tipo
+        query = f"""
             WITH aging_buckets AS (
                 SELECT 
                     id, 
                     due_date, 
-                    (total_amount - paid_amount) AS open_amount,
+                    open_residual AS open_amount,
                     CASE 
                         WHEN due_date IS NULL OR due_date >= ? THEN 'Non Scaduto'
                         WHEN julianday(?) - julianday(due_date) <= 7 THEN '1-7 gg'
@@ -1891,8 +1904,8 @@ def get_aging_summary_optimized(invoice_type='Attiva'):
                     END as aging_bucket
                 FROM Invoices
                 WHERE type = ? 
-                  AND payment_status IN ('Aperta', 'Scaduta', 'Pagata Parz.')
-                  AND (total_amount - paid_amount) > 0.01
+                  AND {OPEN_INVOICE_FILTER}
+                  AND open_residual > 0.01
             )
             SELECT 
                 aging_bucket,
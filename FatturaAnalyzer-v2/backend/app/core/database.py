@@ -2,25 +2,31 @@
 
 import sqlite3
 import os
+import json
+import bisect
 from datetime import datetime, date
 import configparser
 import logging
 import pandas as pd
+import numpy as np
 from decimal import Decimal, InvalidOperation
 import re # Importa re per usare regex nel filtro POS avanzato
 from pathlib import Path
 
 # Importa solo le funzioni necessarie da utils per evitare cicli
 try:
-    from .utils import to_decimal, quantize, AMOUNT_TOLERANCE
+    from .utils import (to_decimal, quantize, AMOUNT_TOLERANCE, AMOUNT_TOLERANCE_CENTS,
+                        cents_array_to_decimals, format_cents_array)
 except ImportError:
     logging.warning("Import relativo .utils fallito in database.py, tento import assoluto.")
     try:
-        from utils import to_decimal, quantize, AMOUNT_TOLERANCE
+        from utils import (to_decimal, quantize, AMOUNT_TOLERANCE, AMOUNT_TOLERANCE_CENTS,
+                           cents_array_to_decimals, format_cents_array)
     except ImportError as e_abs:
         logging.critical(f"FATAL: Impossibile importare funzioni necessarie da utils ({e_abs}).")
         # Definisci fallback minimali per permettere avvio, ma con funzionalità ridotte
         AMOUNT_TOLERANCE = Decimal('0.01')
+        AMOUNT_TOLERANCE_CENTS = 1
         def to_decimal(value, default='0.0'): return Decimal(value) if value else Decimal(default)
         def quantize(d): return d.quantize(Decimal('0.01')) if isinstance(d, Decimal) else Decimal('NaN')
 
@@ -28,6 +34,40 @@ except ImportError:
 DATABASE_NAME = 'database.db'
 logger = logging.getLogger(__name__)
 
+# Storage importi: 'real' (default, storico) oppure 'cents' (INTEGER centesimi, opt-in)
+MONEY_STORAGE_MODE = os.getenv('DB_MONEY_STORAGE', 'real').strip().lower()
+
+# Colonne monetarie REAL -> colonna INTEGER in centesimi, per tabella
+MONEY_CENTS_COLUMNS = {
+    'Invoices': (('total_amount', 'total_amount_cents'), ('paid_amount', 'paid_amount_cents')),
+    'BankTransactions': (('amount', 'amount_cents'), ('reconciled_amount', 'reconciled_amount_cents')),
+    'ReconciliationLinks': (('reconciled_amount', 'reconciled_amount_cents'),),
+}
+
+_money_cents_active = None # Cache dello stato (None = non ancora verificato)
+
+# Stato di riconciliazione: 'python' (default, ricalcolo BatchProcessor) oppure 'triggers' (SQLite, opt-in)
+RECON_STATUS_MODE = os.getenv('DB_RECON_STATUS', 'python').strip().lower()
+
+# Fatture aperte: il filtro va usato testualmente identico nelle query perché SQLite
+# possa scegliere gli indici parziali idx_invoices_open_* (che hanno la stessa WHERE)
+OPEN_INVOICE_STATUSES = ('Aperta', 'Scaduta', 'Pagata Parz.')
+OPEN_INVOICE_FILTER = "payment_status IN ('Aperta', 'Scaduta', 'Pagata Parz.')"
+
+RECON_STATUS_TRIGGERS = (
+    'trg_reconlinks_status_ai', 'trg_reconlinks_status_au', 'trg_reconlinks_status_ad',
+    'trg_invoices_paid_guard', 'trg_transactions_reconciled_guard',
+)
+
+# Indici full-text FTS5 (external content) sincronizzati via trigger: tabella FTS -> (tabella sorgente, colonne)
+FTS_TABLES = {
+    'BankTransactionsFTS': ('BankTransactions', ('description',)),
+    'InvoicesFTS': ('Invoices', ('doc_number',)),
+    'AnagraphicsFTS': ('Anagraphics', ('denomination', 'piva', 'cf')),
+}
+
+_fulltext_ready = None # Cache disponibilità FTS5 (None = non ancora verificato)
+
 
 def get_db_path():
     """
@@ -242,6 +282,26 @@ def create_tables():
             cursor.execute("ALTER TABLE BankTransactions ADD COLUMN reconciliation_status TEXT DEFAULT 'Da Riconciliare';")
             logging.info("Colonna 'reconciliation_status' aggiunta a BankTransactions.")
         except sqlite3.OperationalError: pass
+        try:
+            cursor.execute("ALTER TABLE BankTransactions ADD COLUMN updated_at TIMESTAMP;")
+            logging.info("Colonna 'updated_at' aggiunta a BankTransactions.")
+        except sqlite3.OperationalError: pass
+        # Classificazione precalcolata (vedi core/transaction_classifier.py)
+        # Flag NOT NULL DEFAULT 0: i filtri hide_* li confrontano direttamente sull'indice;
+        # classifier_version NULL segnala le righe ancora da classificare
+        for column_def in ("is_pos INTEGER NOT NULL DEFAULT 0", "is_worldline INTEGER NOT NULL DEFAULT 0",
+                           "is_cash_deposit INTEGER NOT NULL DEFAULT 0", "is_bank_fee INTEGER NOT NULL DEFAULT 0",
+                           "category TEXT", "classifier_version INTEGER"):
+            try:
+                cursor.execute(f"ALTER TABLE BankTransactions ADD COLUMN {column_def};")
+                logging.info(f"Colonna '{column_def.split()[0]}' aggiunta a BankTransactions.")
+            except sqlite3.OperationalError: pass
+        # Anagrafica dedotta dalla descrizione (vedi core/transaction_counterparty.py)
+        for column_def in ("inferred_anagraphics_id INTEGER", "inferred_confidence REAL", "inferred_resolver_version INTEGER"):
+            try:
+                cursor.execute(f"ALTER TABLE BankTransactions ADD COLUMN {column_def};")
+                logging.info(f"Colonna '{column_def.split()[0]}' aggiunta a BankTransactions.")
+            except sqlite3.OperationalError: pass
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS ReconciliationLinks (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -270,6 +330,34 @@ def create_tables():
             )
         """)
 
+        # Manifest dei file già importati, per hash del contenuto grezzo (vedi importer.import_from_source)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ImportedFiles (
+                content_hash TEXT PRIMARY KEY,
+                file_name TEXT,
+                file_size INTEGER,
+                status TEXT,
+                imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Profili di formato CSV per banca, per impronta d'intestazione (vedi parser_csv.resolve_bank_csv_profile)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS BankCsvProfiles (
+                fingerprint TEXT PRIMARY KEY,
+                encoding TEXT,
+                delimiter TEXT NOT NULL,
+                decimal_separator TEXT NOT NULL DEFAULT ',',
+                thousands_separator TEXT NOT NULL DEFAULT '.',
+                header_row INTEGER NOT NULL DEFAULT 0,
+                column_mapping TEXT NOT NULL,
+                sample_file TEXT,
+                use_count INTEGER NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
         logging.info("Creazione/Verifica indici...")
         indices = [
             "CREATE INDEX IF NOT EXISTS idx_anagraphics_piva ON Anagraphics(piva) WHERE piva IS NOT NULL;",
@@ -289,6 +377,11 @@ def create_tables():
             "CREATE INDEX IF NOT EXISTS idx_transactions_date ON BankTransactions(transaction_date);",
             "CREATE INDEX IF NOT EXISTS idx_transactions_status ON BankTransactions(reconciliation_status);",
             "CREATE INDEX IF NOT EXISTS idx_transactions_amount ON BankTransactions(amount);",
+            "CREATE INDEX IF NOT EXISTS idx_transactions_flags_date ON BankTransactions(is_pos, is_worldline, is_cash_deposit, is_bank_fee, transaction_date);",
+            "CREATE INDEX IF NOT EXISTS idx_transactions_category ON BankTransactions(category, transaction_date);",
+            "CREATE INDEX IF NOT EXISTS idx_transactions_unclassified ON BankTransactions(id) WHERE classifier_version IS NULL;",
+            "CREATE INDEX IF NOT EXISTS idx_transactions_inferred_anag ON BankTransactions(inferred_anagraphics_id, transaction_date) WHERE inferred_anagraphics_id IS NOT NULL;",
+            "CREATE INDEX IF NOT EXISTS idx_transactions_uninferred ON BankTransactions(id) WHERE inferred_resolver_version IS NULL;",
             "CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_unique_hash ON BankTransactions(unique_hash);",
             "CREATE INDEX IF NOT EXISTS idx_reconlinks_invoice ON ReconciliationLinks(invoice_id);",
             "CREATE INDEX IF NOT EXISTS idx_reconlinks_transaction ON ReconciliationLinks(transaction_id);",
@@ -302,6 +395,38 @@ def create_tables():
                 if "already exists" not in str(e).lower() and "duplicate" not in str(e).lower():
                     logging.warning(f"Errore creazione indice (ignoro se esiste già): {e} SQL: {index_sql}")
 
+        ensure_open_residual_column(conn)
+
+        if MONEY_STORAGE_MODE == 'cents':
+            migrate_money_to_cents(conn)
+
+        if RECON_STATUS_MODE == 'triggers':
+            install_reconciliation_status_triggers(conn)
+            sweep_overdue_invoices(conn)
+        elif is_reconciliation_triggers_active(conn):
+            drop_reconciliation_status_triggers(conn)
+
+        ensure_fulltext_index(conn)
+
+        # Classifica eventuali righe importate prima delle colonne di classificazione
+        cursor.execute("SELECT 1 FROM BankTransactions WHERE classifier_version IS NULL LIMIT 1")
+        if cursor.fetchone():
+            try: from .transaction_classifier import backfill_transaction_classification
+            except ImportError: from transaction_classifier import backfill_transaction_classification
+            backfill_transaction_classification(conn)
+
+        # Anagrafica dedotta: coda modifiche anagrafiche e righe mai risolte
+        ensure_anagraphics_inference_queue(conn)
+        try: from .transaction_counterparty import refresh_inferred_anagraphics
+        except ImportError: from transaction_counterparty import refresh_inferred_anagraphics
+        refresh_inferred_anagraphics(conn)
+
+        # Log modifiche fatture per l'indice in memoria dei residui aperti
+        try: from .invoice_residual_index import ensure_invoice_residual_log, prune_invoice_residual_log
+        except ImportError: from invoice_residual_index import ensure_invoice_residual_log, prune_invoice_residual_log
+        ensure_invoice_residual_log(conn)
+        prune_invoice_residual_log(conn)
+
         conn.commit()
         logging.info("Tabelle e indici DB pronti.")
         
@@ -331,6 +456,405 @@ def create_tables():
             except Exception as close_err:
                 logging.error(f"Errore chiusura connessione in create_tables: {close_err}")
 
+# === STORAGE IMPORTI IN CENTESIMI ===
+
+def _cents_expr(real_col, prefix=''):
+    """Espressione SQL che converte una colonna REAL in centesimi interi."""
+    return f"CAST(ROUND(COALESCE({prefix}{real_col}, 0) * 100) AS INTEGER)"
+
+def migrate_money_to_cents(conn):
+    """
+    Migrazione in-place allo storage INTEGER in centesimi (idempotente).
+
+    Aggiunge le colonne *_cents, le valorizza dai REAL esistenti e installa trigger
+    che le mantengono allineate: le colonne REAL restano come mirror di compatibilità
+    per le query che scrivono direttamente sugli importi.
+    Non esegue commit: è responsabilità del chiamante.
+    """
+    global _money_cents_active
+    cursor = conn.cursor()
+    migrated = {}
+    for table, pairs in MONEY_CENTS_COLUMNS.items():
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing_cols = {row[1] for row in cursor.fetchall()}
+        for real_col, cents_col in pairs:
+            if cents_col not in existing_cols:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {cents_col} INTEGER NOT NULL DEFAULT 0;")
+                logging.info(f"Colonna '{cents_col}' aggiunta a {table}.")
+
+        set_clause = ", ".join(f"{cents_col} = {_cents_expr(real_col)}" for real_col, cents_col in pairs)
+        drift_clause = " OR ".join(f"{cents_col} != {_cents_expr(real_col)}" for real_col, cents_col in pairs)
+        cursor.execute(f"UPDATE {table} SET {set_clause} WHERE {drift_clause}")
+        migrated[table] = cursor.rowcount
+
+        # I trigger aggiornano solo le colonne *_cents: nessuna ricorsione sui REAL
+        new_set_clause = ", ".join(f"{cents_col} = {_cents_expr(real_col, 'NEW.')}" for real_col, cents_col in pairs)
+        real_cols = ", ".join(real_col for real_col, _ in pairs)
+        trigger_base = f"trg_{table.lower()}_money_cents"
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger_base}_ai AFTER INSERT ON {table}
+            BEGIN
+                UPDATE {table} SET {new_set_clause} WHERE id = NEW.id;
+            END;""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger_base}_au AFTER UPDATE OF {real_cols} ON {table}
+            BEGIN
+                UPDATE {table} SET {new_set_clause} WHERE id = NEW.id;
+            END;""")
+
+    cursor.execute("""
+        INSERT INTO Settings (key, value, updated_at) VALUES ('money_storage', 'cents', CURRENT_TIMESTAMP)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+    """)
+    _money_cents_active = True
+    logging.info(f"Storage importi in centesimi attivo (righe riallineate: {migrated}).")
+    return migrated
+
+def is_money_cents_active(conn=None):
+    """
+    True se lo storage in centesimi è abilitato (DB_MONEY_STORAGE=cents) e migrato.
+    L'esito della verifica sullo schema viene memorizzato per processo.
+    """
+    global _money_cents_active
+    if MONEY_STORAGE_MODE != 'cents':
+        return False
+    if _money_cents_active is None:
+        own_conn = conn is None
+        try:
+            if own_conn:
+                conn = get_connection()
+            cols = {row[1] for row in conn.execute("PRAGMA table_info(BankTransactions)").fetchall()}
+            _money_cents_active = 'amount_cents' in cols
+        except sqlite3.Error as e:
+            logger.warning(f"Verifica storage centesimi fallita: {e}")
+            return False
+        finally:
+            if own_conn and conn:
+                conn.close()
+    return _money_cents_active
+
+# === STATO DI RICONCILIAZIONE MANTENUTO DA TRIGGER ===
+
+def _linked_cents_sql(link_col, id_expr):
+    return (f"(SELECT CAST(ROUND(COALESCE(SUM(reconciled_amount), 0) * 100) AS INTEGER) "
+            f"FROM ReconciliationLinks WHERE {link_col} = {id_expr})")
+
+_INVOICE_STATUS_EXPR = f"""CASE
+        WHEN CAST(ROUND(paid_amount * 100) AS INTEGER) <= 0 THEN
+            CASE WHEN due_date < date('now', 'localtime') THEN 'Scaduta' ELSE 'Aperta' END
+        WHEN ABS(CAST(ROUND(paid_amount * 100) AS INTEGER)
+                 - CAST(ROUND(total_amount * 100) AS INTEGER)) <= {AMOUNT_TOLERANCE_CENTS} THEN 'Pagata Tot.'
+        ELSE 'Pagata Parz.' END"""
+
+_TRANSACTION_STATUS_EXPR = f"""CASE
+        WHEN ABS(CAST(ROUND(reconciled_amount * 100) AS INTEGER)) <= 0 THEN 'Da Riconciliare'
+        WHEN ABS(CAST(ROUND(reconciled_amount * 100) AS INTEGER)
+                 - ABS(CAST(ROUND(amount * 100) AS INTEGER))) <= {AMOUNT_TOLERANCE_CENTS} THEN 'Riconciliato Tot.'
+        WHEN CAST(ROUND(reconciled_amount * 100) AS INTEGER)
+             < ABS(CAST(ROUND(amount * 100) AS INTEGER)) THEN 'Riconciliato Parz.'
+        ELSE 'Riconciliato Eccesso' END"""
+
+def _invoice_state_refresh_sql(id_expr):
+    """Ricalcolo di paid_amount (somma dei link) e poi dello stato, stesse regole di BatchProcessor."""
+    return f"""
+        UPDATE Invoices SET paid_amount = {_linked_cents_sql('invoice_id', id_expr)} / 100.0,
+                            updated_at = datetime('now', 'localtime')
+        WHERE id = {id_expr};
+        UPDATE Invoices SET payment_status = {_INVOICE_STATUS_EXPR} WHERE id = {id_expr};"""
+
+def _transaction_state_refresh_sql(id_expr):
+    """Ricalcolo di reconciled_amount e dello stato; le transazioni 'Ignorato' non vengono toccate."""
+    return f"""
+        UPDATE BankTransactions SET reconciled_amount = {_linked_cents_sql('transaction_id', id_expr)} / 100.0,
+                                    updated_at = datetime('now', 'localtime')
+        WHERE id = {id_expr} AND reconciliation_status IS NOT 'Ignorato';
+        UPDATE BankTransactions SET reconciliation_status = {_TRANSACTION_STATUS_EXPR}
+        WHERE id = {id_expr} AND reconciliation_status IS NOT 'Ignorato';"""
+
+def install_reconciliation_status_triggers(conn):
+    """
+    Installa i trigger che mantengono Invoices.paid_amount/payment_status e
+    BankTransactions.reconciled_amount/reconciliation_status a ogni modifica di
+    ReconciliationLinks, ricalcolando solo le righe coinvolte dalla somma dei loro link.
+
+    Trigger di guardia sulle colonne importo riallineano qualsiasi scrittura diretta che
+    non corrisponda ai link, così i valori denormalizzati non possono divergere. Lo stato
+    'Scaduta' senza modifiche ai link è compito di sweep_overdue_invoices.
+    Allinea le righe esistenti e registra la modalità in Settings. Non esegue commit.
+    """
+    cursor = conn.cursor()
+    triggers = [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_reconlinks_status_ai AFTER INSERT ON ReconciliationLinks
+        BEGIN
+            {_invoice_state_refresh_sql('NEW.invoice_id')}
+            {_transaction_state_refresh_sql('NEW.transaction_id')}
+        END;""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_reconlinks_status_au
+        AFTER UPDATE OF reconciled_amount, invoice_id, transaction_id ON ReconciliationLinks
+        BEGIN
+            {_invoice_state_refresh_sql('OLD.invoice_id')}
+            {_invoice_state_refresh_sql('NEW.invoice_id')}
+            {_transaction_state_refresh_sql('OLD.transaction_id')}
+            {_transaction_state_refresh_sql('NEW.transaction_id')}
+        END;""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_reconlinks_status_ad AFTER DELETE ON ReconciliationLinks
+        BEGIN
+            {_invoice_state_refresh_sql('OLD.invoice_id')}
+            {_transaction_state_refresh_sql('OLD.transaction_id')}
+        END;""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_invoices_paid_guard AFTER UPDATE OF paid_amount ON Invoices
+        WHEN CAST(ROUND(COALESCE(NEW.paid_amount, 0) * 100) AS INTEGER) != {_linked_cents_sql('invoice_id', 'NEW.id')}
+        BEGIN
+            {_invoice_state_refresh_sql('NEW.id')}
+        END;""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_transactions_reconciled_guard AFTER UPDATE OF reconciled_amount ON BankTransactions
+        WHEN NEW.reconciliation_status IS NOT 'Ignorato'
+         AND CAST(ROUND(COALESCE(NEW.reconciled_amount, 0) * 100) AS INTEGER) != {_linked_cents_sql('transaction_id', 'NEW.id')}
+        BEGIN
+            {_transaction_state_refresh_sql('NEW.id')}
+        END;""",
+    ]
+    for trigger_sql in triggers:
+        cursor.execute(trigger_sql)
+
+    # Allineamento iniziale delle sole righe divergenti; gli stati manuali ('Insoluta',
+    # 'Riconciliata') restano fino alla prossima modifica dei link, come con BatchProcessor
+    cursor.execute(f"""
+        UPDATE Invoices SET paid_amount = {_linked_cents_sql('invoice_id', 'Invoices.id')} / 100.0,
+                            updated_at = datetime('now', 'localtime')
+        WHERE CAST(ROUND(COALESCE(paid_amount, 0) * 100) AS INTEGER) != {_linked_cents_sql('invoice_id', 'Invoices.id')}
+    """)
+    invoices_fixed = cursor.rowcount
+    cursor.execute(f"""
+        UPDATE Invoices SET payment_status = {_INVOICE_STATUS_EXPR}, updated_at = datetime('now', 'localtime')
+        WHERE payment_status NOT IN ('Insoluta', 'Riconciliata') AND payment_status IS NOT {_INVOICE_STATUS_EXPR}
+    """)
+    invoices_fixed += cursor.rowcount
+    cursor.execute(f"""
+        UPDATE BankTransactions SET reconciled_amount = {_linked_cents_sql('transaction_id', 'BankTransactions.id')} / 100.0,
+                                    updated_at = datetime('now', 'localtime')
+        WHERE reconciliation_status IS NOT 'Ignorato'
+          AND CAST(ROUND(COALESCE(reconciled_amount, 0) * 100) AS INTEGER) != {_linked_cents_sql('transaction_id', 'BankTransactions.id')}
+    """)
+    transactions_fixed = cursor.rowcount
+    cursor.execute(f"""
+        UPDATE BankTransactions SET reconciliation_status = {_TRANSACTION_STATUS_EXPR}, updated_at = datetime('now', 'localtime')
+        WHERE reconciliation_status IS NOT 'Ignorato' AND reconciliation_status IS NOT {_TRANSACTION_STATUS_EXPR}
+    """)
+    transactions_fixed += cursor.rowcount
+    cursor.execute("""
+        INSERT INTO Settings (key, value, updated_at) VALUES ('reconciliation_status_mode', 'triggers', CURRENT_TIMESTAMP)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+    """)
+    logging.info(f"Stato riconciliazione via trigger attivo (riallineate {invoices_fixed} fatture, "
+                 f"{transactions_fixed} transazioni).")
+    return invoices_fixed + transactions_fixed
+
+def drop_reconciliation_status_triggers(conn):
+    """Rimuove i trigger di stato: il ricalcolo torna a BatchProcessor. Non esegue commit."""
+    cursor = conn.cursor()
+    for trigger in RECON_STATUS_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DELETE FROM Settings WHERE key = 'reconciliation_status_mode'")
+
+def is_reconciliation_triggers_active(conn):
+    """True se i trigger di stato sono installati sul database della connessione."""
+    try:
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                           (RECON_STATUS_TRIGGERS[0],)).fetchone()
+        return row is not None
+    except sqlite3.Error as e:
+        logger.warning(f"Verifica trigger stato riconciliazione fallita: {e}")
+        return False
+
+def sweep_overdue_invoices(conn, today=None):
+    """
+    Passata giornaliera degli stati dipendenti dalla data: 'Aperta' -> 'Scaduta' per le
+    fatture senza incassi con scadenza passata, e viceversa se la scadenza è stata spostata.
+    Usa l'indice parziale su due_date. Non esegue commit; restituisce le righe modificate.
+    """
+    today_iso = (today or date.today()).isoformat()
+    now_ts = datetime.now()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE Invoices SET payment_status = 'Scaduta', updated_at = ?
+        WHERE payment_status = 'Aperta' AND due_date IS NOT NULL AND due_date < ?
+    """, (now_ts, today_iso))
+    changed = cursor.rowcount
+    cursor.execute("""
+        UPDATE Invoices SET payment_status = 'Aperta', updated_at = ?
+        WHERE payment_status = 'Scaduta' AND (due_date IS NULL OR due_date >= ?)
+    """, (now_ts, today_iso))
+    changed += cursor.rowcount
+    if changed:
+        logger.info(f"Sweep scadenze: {changed} fatture aggiornate.")
+    return changed
+
+def run_overdue_sweep():
+    """Esegue sweep_overdue_invoices su una connessione dedicata e conferma."""
+    conn = None
+    try:
+        conn = get_connection()
+        changed = sweep_overdue_invoices(conn)
+        conn.commit()
+        return changed
+    except sqlite3.Error as e:
+        logger.error(f"Errore sweep scadenze: {e}")
+        if conn:
+            conn.rollback()
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
+# === RESIDUO APERTO E INDICI PARZIALI SULLE FATTURE APERTE ===
+
+def ensure_open_residual_column(conn):
+    """
+    Aggiunge a Invoices la colonna generata open_residual = ROUND(total_amount - paid_amount, 2)
+    e gli indici parziali sulle sole fatture aperte (OPEN_INVOICE_FILTER):
+    - (type, anagraphics_id, open_residual): candidati per controparte e importo
+    - (type, open_residual): candidati per importo e totali/aging per tipo
+    La colonna è VIRTUAL perché SQLite non consente ALTER TABLE ADD COLUMN di colonne
+    STORED; il valore è comunque materializzato negli indici, che sono ciò che le
+    ricerche per intervallo leggono. Non esegue commit.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("ALTER TABLE Invoices ADD COLUMN open_residual REAL "
+                       "GENERATED ALWAYS AS (ROUND(total_amount - paid_amount, 2)) VIRTUAL;")
+        logging.info("Colonna generata 'open_residual' aggiunta a Invoices.")
+    except sqlite3.OperationalError as e:
+        if "duplicate column" not in str(e).lower():
+            raise
+    cursor.execute(f"""CREATE INDEX IF NOT EXISTS idx_invoices_open_anag_residual
+                      ON Invoices(type, anagraphics_id, open_residual) WHERE {OPEN_INVOICE_FILTER};""")
+    cursor.execute(f"""CREATE INDEX IF NOT EXISTS idx_invoices_open_type_residual
+                      ON Invoices(type, open_residual) WHERE {OPEN_INVOICE_FILTER};""")
+
+# === INDICE FULL-TEXT (FTS5) ===
+
+def ensure_fulltext_index(conn):
+    """
+    Crea (se mancanti) le tabelle FTS5 e i trigger di sincronizzazione, ricostruendo
+    l'indice solo alla prima creazione. Se SQLite non include FTS5 la ricerca
+    resta sul percorso LIKE. Non esegue commit.
+    """
+    global _fulltext_ready
+    cursor = conn.cursor()
+    try:
+        for fts_table, (source_table, columns) in FTS_TABLES.items():
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (fts_table,))
+            is_new = cursor.fetchone() is None
+            cols_sql = ", ".join(columns)
+            cursor.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                    {cols_sql},
+                    content='{source_table}', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                );""")
+
+            new_values = ", ".join(f"new.{c}" for c in columns)
+            old_values = ", ".join(f"old.{c}" for c in columns)
+            trigger_base = f"trg_{source_table.lower()}_fts"
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {trigger_base}_ai AFTER INSERT ON {source_table}
+                BEGIN
+                    INSERT INTO {fts_table}(rowid, {cols_sql}) VALUES (new.id, {new_values});
+                END;""")
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {trigger_base}_ad AFTER DELETE ON {source_table}
+                BEGIN
+                    INSERT INTO {fts_table}({fts_table}, rowid, {cols_sql}) VALUES ('delete', old.id, {old_values});
+                END;""")
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {trigger_base}_au AFTER UPDATE OF {cols_sql} ON {source_table}
+                BEGIN
+                    INSERT INTO {fts_table}({fts_table}, rowid, {cols_sql}) VALUES ('delete', old.id, {old_values});
+                    INSERT INTO {fts_table}(rowid, {cols_sql}) VALUES (new.id, {new_values});
+                END;""")
+
+            if is_new:
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+                logging.info(f"Indice full-text {fts_table} creato e popolato da {source_table}.")
+        _fulltext_ready = True
+    except sqlite3.OperationalError as e:
+        _fulltext_ready = False
+        logging.warning(f"FTS5 non disponibile, la ricerca userà LIKE: {e}")
+    return _fulltext_ready
+
+def is_fulltext_available(conn=None):
+    """True se le tabelle FTS5 esistono nel DB corrente (esito memorizzato per processo)."""
+    global _fulltext_ready
+    if _fulltext_ready is None:
+        own_conn = conn is None
+        try:
+            if own_conn:
+                conn = get_connection()
+            placeholders = ','.join('?' * len(FTS_TABLES))
+            found = conn.execute(f"SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN ({placeholders})",
+                                 tuple(FTS_TABLES)).fetchone()[0]
+            _fulltext_ready = found == len(FTS_TABLES)
+        except sqlite3.Error as e:
+            logger.warning(f"Verifica indice full-text fallita: {e}")
+            return False
+        finally:
+            if own_conn and conn:
+                conn.close()
+    return _fulltext_ready
+
+def build_fts_match_query(text):
+    """
+    Converte il testo libero dell'utente in un'espressione MATCH FTS5 sicura:
+    ogni token diventa una frase quotata con ricerca per prefisso (AND implicito).
+    Ritorna None se non ci sono token utili.
+    """
+    if not text:
+        return None
+    tokens = re.findall(r'\w+', str(text), re.UNICODE)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+# === CODA AGGIORNAMENTO ANAGRAFICA DEDOTTA ===
+
+def ensure_anagraphics_inference_queue(conn):
+    """
+    Crea la coda AnagraphicsInferenceQueue e i trigger che vi accodano le anagrafiche
+    inserite, cancellate o con denominazione/PIVA/CF modificate, più il trigger che
+    invalida l'anagrafica dedotta quando cambia la descrizione di una transazione.
+    La coda è smaltita da transaction_counterparty.refresh_inferred_anagraphics. Non esegue commit.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS AnagraphicsInferenceQueue (
+            anagraphics_id INTEGER PRIMARY KEY,
+            queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );""")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_anagraphics_inference_ai AFTER INSERT ON Anagraphics
+        BEGIN
+            INSERT OR REPLACE INTO AnagraphicsInferenceQueue (anagraphics_id) VALUES (new.id);
+        END;""")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_anagraphics_inference_au AFTER UPDATE OF denomination, piva, cf ON Anagraphics
+        WHEN old.denomination IS NOT new.denomination OR old.piva IS NOT new.piva OR old.cf IS NOT new.cf
+        BEGIN
+            INSERT OR REPLACE INTO AnagraphicsInferenceQueue (anagraphics_id) VALUES (new.id);
+        END;""")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_anagraphics_inference_ad AFTER DELETE ON Anagraphics
+        BEGIN
+            INSERT OR REPLACE INTO AnagraphicsInferenceQueue (anagraphics_id) VALUES (old.id);
+        END;""")
+    # Aggiorna solo inferred_resolver_version: non riattiva trigger su description
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_banktransactions_inference_au AFTER UPDATE OF description ON BankTransactions
+        WHEN old.description IS NOT new.description
+        BEGIN
+            UPDATE BankTransactions SET inferred_resolver_version = NULL WHERE id = new.id;
+        END;""")
+
 def check_entity_duplicate(cursor, table, column, value):
     try:
         cursor.execute(f"SELECT 1 FROM {table} WHERE {column} = ? LIMIT 1", (value,))
@@ -339,6 +863,65 @@ def check_entity_duplicate(cursor, table, column, value):
         logger.error(f"Errore check duplicato {table}.{column} = '{value}': {e}")
         return False
 
+# === MANIFEST FILE IMPORTATI ===
+
+_SQL_IN_CHUNK = 500  # Sotto il limite di variabili SQLite per query
+
+def get_imported_file_hashes(cursor, content_hashes):
+    """Sottoinsieme di content_hashes già presente in ImportedFiles (query IN a blocchi sulla chiave primaria)."""
+    hashes = [h for h in dict.fromkeys(content_hashes) if h]
+    found = set()
+    for start in range(0, len(hashes), _SQL_IN_CHUNK):
+        chunk = hashes[start:start + _SQL_IN_CHUNK]
+        cursor.execute(f"SELECT content_hash FROM ImportedFiles WHERE content_hash IN ({','.join('?' * len(chunk))})", chunk)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+def record_imported_files(cursor, entries):
+    """Registra nel manifest le tuple (content_hash, file_name, file_size, status). Non esegue commit."""
+    if entries:
+        cursor.executemany("INSERT OR REPLACE INTO ImportedFiles (content_hash, file_name, file_size, status) VALUES (?, ?, ?, ?)", entries)
+        entries.clear()
+
+_BANK_CSV_PROFILE_FIELDS = ('fingerprint', 'encoding', 'delimiter', 'decimal_separator', 'thousands_separator',
+                            'header_row', 'column_mapping')
+
+def get_bank_csv_profiles(cursor):
+    """Profili di formato CSV salvati, come dict impronta -> profilo (formato di parser_csv.resolve_bank_csv_profile)."""
+    cursor.execute(f"SELECT {', '.join(_BANK_CSV_PROFILE_FIELDS)} FROM BankCsvProfiles")
+    profiles = {}
+    for row in cursor.fetchall():
+        profile = dict(zip(_BANK_CSV_PROFILE_FIELDS, row))
+        try:
+            profile['column_mapping'] = json.loads(profile['column_mapping'])
+        except (TypeError, ValueError):
+            logger.warning(f"Profilo CSV {profile['fingerprint']} con mappatura colonne non valida, ignorato.")
+            continue
+        profiles[profile['fingerprint']] = profile
+    return profiles
+
+def record_bank_csv_profiles(cursor, entries):
+    """
+    Registra le tuple (profilo, trovato_tra_i_salvati, file_name) dei CSV importati: i profili rilevati
+    sono inseriti o sostituiscono quello con la stessa impronta, per quelli riusati si aggiorna solo
+    l'utilizzo. Non esegue commit.
+    """
+    if not entries:
+        return
+    detected = [tuple(json.dumps(profile[field]) if field == 'column_mapping' else profile[field] for field in _BANK_CSV_PROFILE_FIELDS) + (file_name,)
+                for profile, known, file_name in entries if not known]
+    if detected:
+        updates = ', '.join(f"{field} = excluded.{field}" for field in _BANK_CSV_PROFILE_FIELDS[1:])
+        cursor.executemany(f"""
+            INSERT INTO BankCsvProfiles ({', '.join(_BANK_CSV_PROFILE_FIELDS)}, sample_file) VALUES ({', '.join('?' * (len(_BANK_CSV_PROFILE_FIELDS) + 1))})
+            ON CONFLICT(fingerprint) DO UPDATE SET {updates}, sample_file = excluded.sample_file,
+                use_count = use_count + 1, last_used_at = CURRENT_TIMESTAMP
+        """, detected)
+    reused = [(profile['fingerprint'],) for profile, known, _ in entries if known]
+    if reused:
+        cursor.executemany("UPDATE BankCsvProfiles SET use_count = use_count + 1, last_used_at = CURRENT_TIMESTAMP WHERE fingerprint = ?", reused)
+    entries.clear()
+
 # === FUNZIONI DI PULIZIA E VALIDAZIONE ===
 
 def clean_fiscal_code(code):
@@ -532,6 +1115,25 @@ def find_existing_anagraphics(cursor, anag_type, piva_clean, cf_clean, denominat
     
     return None
 
+def _anagraphics_improvements(current, new_data, piva_clean, cf_clean):
+    """Campi di un'anagrafica esistente (current) migliorabili con i nuovi dati: dict campo -> nuovo valore."""
+    improvements = {}
+
+    # Aggiorna P.IVA se mancante o migliorabile
+    if piva_clean and (not current['piva'] or len(piva_clean) > len(current['piva'] or '')):
+        improvements['piva'] = piva_clean
+
+    # Aggiorna CF se mancante o migliorabile
+    if cf_clean and (not current['cf'] or len(cf_clean) > len(current['cf'] or '')):
+        improvements['cf'] = cf_clean
+
+    # Aggiorna altri campi se mancanti
+    for field in ('address', 'city', 'province', 'email', 'phone'):
+        new_value = str(new_data.get(field) or '').strip()
+        if new_value and not current[field]:
+            improvements[field] = new_value
+    return improvements
+
 def update_anagraphics_if_better_data(cursor, anag_id, new_data, piva_clean, cf_clean):
     """
     Aggiorna un'anagrafica esistente se i nuovi dati sono più completi.
@@ -550,33 +1152,10 @@ def update_anagraphics_if_better_data(cursor, anag_id, new_data, piva_clean, cf_
         if not current:
             return
         
-        updates = []
-        params = []
-        
-        # Aggiorna P.IVA se mancante o migliorabile
-        if piva_clean and (not current['piva'] or len(piva_clean) > len(current['piva'] or '')):
-            updates.append("piva = ?")
-            params.append(piva_clean)
-        
-        # Aggiorna CF se mancante o migliorabile
-        if cf_clean and (not current['cf'] or len(cf_clean) > len(current['cf'] or '')):
-            updates.append("cf = ?")
-            params.append(cf_clean)
-        
-        # Aggiorna altri campi se mancanti
-        fields_to_check = ['address', 'city', 'province', 'email', 'phone']
-        for field in fields_to_check:
-               new_value = new_data.get(field)
-        if new_value:
-           new_value = str(new_value).strip()
-        if new_value and not current[field]:
-            updates.append(f"{field} = ?")
-            params.append(new_value)
-        
-        if updates:
-            updates.append("updated_at = ?")
-            params.append(datetime.now())
-            params.append(anag_id)
+        improvements = _anagraphics_improvements(current, new_data, piva_clean, cf_clean)
+        if improvements:
+            updates = [f"{field} = ?" for field in improvements] + ["updated_at = ?"]
+            params = list(improvements.values()) + [datetime.now(), anag_id]
             
             sql = f"UPDATE Anagraphics SET {', '.join(updates)} WHERE id = ?"
             cursor.execute(sql, params)
@@ -586,6 +1165,65 @@ def update_anagraphics_if_better_data(cursor, anag_id, new_data, piva_clean, cf_
     except Exception as e:
         logger.warning(f"Errore aggiornamento anagrafica ID:{anag_id}: {e}")
 
+def _prepare_anagraphics(anag_data, anag_type):
+    """
+    Validazione e pulizia (validate_anagraphics_data) con fallback P.IVA/CF.
+    Ritorna (cleaned_data, piva_clean, cf_clean, denomination) o None se i dati non sono validi.
+    """
+    is_valid, cleaned_data, warnings = validate_anagraphics_data(anag_data, anag_type)
+    
+    if not is_valid:
+        logger.error(f"Dati anagrafica {anag_type} non validi: {cleaned_data}")
+        return None
+    
+    # Log warnings se presenti
+    for warning in warnings:
+        logger.warning(f"Anagrafica {anag_type}: {warning}")
+    
+    piva_clean = cleaned_data.get('piva', '')
+    cf_clean = cleaned_data.get('cf', '')
+    denomination = cleaned_data.get('denomination', '')
+    
+    logger.debug(f"Tentativo inserimento/ricerca anagrafica {anag_type}: '{denomination}' (P.IVA='{piva_clean}', CF='{cf_clean}')")
+
+    # Logica di fallback P.IVA/CF migliorata
+    if not piva_clean and cf_clean: 
+        piva_clean = cf_clean
+        cleaned_data['piva'] = cf_clean
+        logger.debug(f"P.IVA mancante, uso CF come P.IVA: {cf_clean}")
+    elif piva_clean and not cf_clean and len(piva_clean) == 16: 
+        cf_clean = piva_clean
+        cleaned_data['cf'] = piva_clean
+        logger.debug(f"CF mancante, P.IVA sembra CF: {piva_clean}")
+    return cleaned_data, piva_clean, cf_clean, denomination
+
+_ANAGRAPHICS_INSERT_COLUMNS = ('type', 'piva', 'cf', 'denomination', 'address', 'cap', 'city', 'province', 'country',
+                               'email', 'phone', 'pec', 'codice_destinatario', 'score', 'updated_at')
+_ANAGRAPHICS_INSERT_SQL = f"INSERT INTO Anagraphics ({', '.join(_ANAGRAPHICS_INSERT_COLUMNS)}) VALUES ({', '.join('?' * len(_ANAGRAPHICS_INSERT_COLUMNS))})"
+# Con id esplicito (AnagraphicsIndex assegna gli id prima dell'insert in blocco)
+_ANAGRAPHICS_INSERT_WITH_ID_SQL = f"INSERT INTO Anagraphics (id, {', '.join(_ANAGRAPHICS_INSERT_COLUMNS)}) VALUES (?, {', '.join('?' * len(_ANAGRAPHICS_INSERT_COLUMNS))})"
+
+def _anagraphics_insert_params(anag_type, cleaned_data):
+    """Parametri di _ANAGRAPHICS_INSERT_SQL per dati già puliti da _prepare_anagraphics."""
+    # Usa None per campi vuoti invece di stringhe vuote per mantenere consistenza DB
+    return (
+        anag_type,
+        cleaned_data.get('piva') or None,
+        cleaned_data.get('cf') or None,
+        cleaned_data.get('denomination', ''),
+        cleaned_data.get('address') or None,
+        cleaned_data.get('cap') or None,
+        cleaned_data.get('city') or None,
+        cleaned_data.get('province') or None,
+        cleaned_data.get('country', 'IT'),
+        cleaned_data.get('email') or None,
+        cleaned_data.get('phone') or None,
+        cleaned_data.get('pec') or None,
+        cleaned_data.get('codice_destinatario') or None,
+        100.0,  # Score default
+        datetime.now()
+    )
+
 # === FUNZIONE PRINCIPALE MIGLIORATA ===
 
 def add_anagraphics_if_not_exists(cursor, anag_data, anag_type):
@@ -634,31 +1272,10 @@ def add_anagraphics_if_not_exists(cursor, anag_data, anag_type):
         return None
     
     # Validazione e pulizia dati in ingresso
-    is_valid, cleaned_data, warnings = validate_anagraphics_data(anag_data, anag_type)
-    
-    if not is_valid:
-        logger.error(f"Dati anagrafica {anag_type} non validi: {cleaned_data}")
+    prepared = _prepare_anagraphics(anag_data, anag_type)
+    if prepared is None:
         return None
-    
-    # Log warnings se presenti
-    for warning in warnings:
-        logger.warning(f"Anagrafica {anag_type}: {warning}")
-    
-    piva_clean = cleaned_data.get('piva', '')
-    cf_clean = cleaned_data.get('cf', '')
-    denomination = cleaned_data.get('denomination', '')
-    
-    logger.debug(f"Tentativo inserimento/ricerca anagrafica {anag_type}: '{denomination}' (P.IVA='{piva_clean}', CF='{cf_clean}')")
-
-    # Logica di fallback P.IVA/CF migliorata
-    if not piva_clean and cf_clean: 
-        piva_clean = cf_clean
-        cleaned_data['piva'] = cf_clean
-        logger.debug(f"P.IVA mancante, uso CF come P.IVA: {cf_clean}")
-    elif piva_clean and not cf_clean and len(piva_clean) == 16: 
-        cf_clean = piva_clean
-        cleaned_data['cf'] = piva_clean
-        logger.debug(f"CF mancante, P.IVA sembra CF: {piva_clean}")
+    cleaned_data, piva_clean, cf_clean, denomination = prepared
 
     # Ricerca anagrafica esistente con logica migliorata
     anag_id = find_existing_anagraphics(cursor, anag_type, piva_clean, cf_clean, denomination)
@@ -671,31 +1288,7 @@ def add_anagraphics_if_not_exists(cursor, anag_data, anag_type):
     
     # Inserimento nuova anagrafica con logica robusta
     try:
-        sql = """INSERT INTO Anagraphics (
-            type, piva, cf, denomination, address, cap, city, province, country, 
-            email, phone, pec, codice_destinatario, score, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
-        
-        # Usa None per campi vuoti invece di stringhe vuote per mantenere consistenza DB
-        params = (
-            anag_type,
-            piva_clean if piva_clean else None,
-            cf_clean if cf_clean else None,
-            denomination,
-            cleaned_data.get('address') or None,
-            cleaned_data.get('cap') or None,
-            cleaned_data.get('city') or None,
-            cleaned_data.get('province') or None,
-            cleaned_data.get('country', 'IT'),
-            cleaned_data.get('email') or None,
-            cleaned_data.get('phone') or None,
-            cleaned_data.get('pec') or None,
-            cleaned_data.get('codice_destinatario') or None,
-            100.0,  # Score default
-            datetime.now()
-        )
-        
-        cursor.execute(sql, params)
+        cursor.execute(_ANAGRAPHICS_INSERT_SQL, _anagraphics_insert_params(anag_type, cleaned_data))
         new_id = cursor.lastrowid
         
         # Log dettagliato del successo
@@ -728,6 +1321,150 @@ def add_anagraphics_if_not_exists(cursor, anag_data, anag_type):
         logger.error(f"❌ Errore critico inserimento anagrafica '{denomination}': {e}", exc_info=True)
         return None
 
+# === RISOLUZIONE CONTROPARTI IN BLOCCO (IMPORT) ===
+
+# LOWER() di SQLite converte solo le lettere ASCII
+_SQL_LOWER = {code: code + 32 for code in range(ord('A'), ord('Z') + 1)}
+
+class AnagraphicsIndex:
+    """
+    Indice in memoria delle anagrafiche per P.IVA, CF e denominazione, caricato una volta per import.
+    resolve ha lo stesso esito di add_anagraphics_if_not_exists (stesso ordine di ricerca, a parità
+    l'id più basso come le query su indice) senza query per fattura: le nuove anagrafiche ricevono
+    subito l'id che assegnerebbe AUTOINCREMENT e sono scritte, con i miglioramenti, da flush.
+    """
+    _COLUMNS = ('id', 'type', 'piva', 'cf', 'denomination', 'address', 'city', 'province', 'email', 'phone')
+
+    def __init__(self, cursor):
+        self._records = {}
+        self._by_piva = {}; self._by_cf = {}; self._by_denomination = {}; self._ids_by_type = {}
+        self._pending_new = {}      # id -> (tipo, dati puliti) da inserire
+        self._pending_updates = {}  # id -> {campo: valore}
+        cursor.execute(f"SELECT {', '.join(self._COLUMNS)} FROM Anagraphics ORDER BY id")
+        for row in cursor.fetchall():
+            self._add_record(dict(zip(self._COLUMNS, row)))
+        try:
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Anagraphics'")
+            seq_row = cursor.fetchone()
+        except sqlite3.OperationalError:  # sqlite_sequence non ancora creata
+            seq_row = None
+        self._next_id = max([seq_row[0] if seq_row else 0, *self._records]) + 1
+        logger.debug(f"Indice anagrafiche caricato: {len(self._records)} anagrafiche.")
+
+    @staticmethod
+    def _first(index, key):
+        ids = index.get(key)
+        return ids[0] if ids else None
+
+    def _index_key(self, index, anag_type, value, anag_id, add=True):
+        if not value:
+            return
+        if add: bisect.insort(index.setdefault((anag_type, value), []), anag_id)
+        else: index[(anag_type, value)].remove(anag_id)
+
+    def _add_record(self, record, add=True):
+        anag_id, anag_type = record['id'], record['type']
+        self._index_key(self._by_piva, anag_type, record['piva'], anag_id, add)
+        self._index_key(self._by_cf, anag_type, record['cf'], anag_id, add)
+        self._index_key(self._by_denomination, anag_type, (record['denomination'] or '').translate(_SQL_LOWER), anag_id, add)
+        if add:
+            self._records[anag_id] = record
+            bisect.insort(self._ids_by_type.setdefault(anag_type, []), anag_id)
+        else:
+            del self._records[anag_id]
+            self._ids_by_type[anag_type].remove(anag_id)
+
+    def find(self, anag_type, piva_clean, cf_clean, denomination):
+        """Come find_existing_anagraphics, sull'indice in memoria."""
+        if piva_clean and len(piva_clean) >= 8:
+            found = self._first(self._by_piva, (anag_type, piva_clean))
+            if found: return found
+        if cf_clean and len(cf_clean) >= 11:
+            # CF, poi CF nel campo P.IVA (caso comune in fatture elettroniche)
+            found = self._first(self._by_cf, (anag_type, cf_clean)) or self._first(self._by_piva, (anag_type, cf_clean))
+            if found: return found
+        if not piva_clean and not cf_clean and denomination:
+            found = self._first(self._by_denomination, (anag_type, denomination.translate(_SQL_LOWER)))
+            if found: return found
+            if len(denomination) > 10:
+                search_terms = extract_significant_words(denomination)
+                if search_terms:
+                    # Equivalente di LOWER(denomination) LIKE '%parola1 parola2%'
+                    needle = ' '.join(search_terms[:2])
+                    for anag_id in self._ids_by_type.get(anag_type, ()):
+                        if needle in (self._records[anag_id]['denomination'] or '').translate(_SQL_LOWER):
+                            logger.info(f"Anagrafica trovata per denominazione simile '{denomination}' -> '{self._records[anag_id]['denomination']}': ID {anag_id}")
+                            return anag_id
+        return None
+
+    def _improve(self, anag_id, new_data, piva_clean, cf_clean):
+        """Come update_anagraphics_if_better_data: aggiorna indice e record e accoda la scrittura."""
+        record = self._records[anag_id]
+        improvements = _anagraphics_improvements(record, new_data, piva_clean, cf_clean)
+        if not improvements:
+            return
+        self._add_record(record, add=False)
+        record.update(improvements)
+        self._add_record(record)
+        if anag_id in self._pending_new: self._pending_new[anag_id][1].update(improvements)
+        else: self._pending_updates.setdefault(anag_id, {}).update(improvements)
+
+    def resolve(self, anag_data, anag_type):
+        """Come add_anagraphics_if_not_exists: id dell'anagrafica trovata o di quella nuova accodata, None se i dati non sono validi."""
+        prepared = _prepare_anagraphics(anag_data, anag_type)
+        if prepared is None:
+            return None
+        cleaned_data, piva_clean, cf_clean, denomination = prepared
+        anag_id = self.find(anag_type, piva_clean, cf_clean, denomination)
+        if anag_id:
+            self._improve(anag_id, cleaned_data, piva_clean, cf_clean)
+            return anag_id
+        anag_id = self._next_id; self._next_id += 1
+        record = {'id': anag_id, 'type': anag_type, 'piva': piva_clean or None, 'cf': cf_clean or None, 'denomination': denomination}
+        record.update((field, cleaned_data.get(field) or None) for field in self._COLUMNS[5:])
+        self._add_record(record)
+        self._pending_new[anag_id] = (anag_type, cleaned_data)
+        return anag_id
+
+    def flush(self, cursor):
+        """
+        Scrive le anagrafiche nuove (un executemany, id già assegnati) e i miglioramenti accodati
+        (un executemany per insieme di campi). Se l'insert in blocco fallisce riprova riga per riga:
+        le anagrafiche non inserite escono dall'indice e i loro id sono ritornati. Non esegue commit.
+        """
+        failed = set()
+        if self._pending_new:
+            rows = [(anag_id, *_anagraphics_insert_params(anag_type, data)) for anag_id, (anag_type, data) in self._pending_new.items()]
+            cursor.execute("SAVEPOINT anagraphics_flush")
+            try:
+                cursor.executemany(_ANAGRAPHICS_INSERT_WITH_ID_SQL, rows)
+                cursor.execute("RELEASE SAVEPOINT anagraphics_flush")
+                logger.info(f"✅ Inserite in blocco {len(rows)} nuove anagrafiche.")
+            except sqlite3.Error as batch_err:
+                cursor.execute("ROLLBACK TO SAVEPOINT anagraphics_flush")
+                cursor.execute("RELEASE SAVEPOINT anagraphics_flush")
+                logger.warning(f"Insert in blocco anagrafiche fallito ({batch_err}), ripiego riga per riga.")
+                for row in rows:
+                    try:
+                        cursor.execute(_ANAGRAPHICS_INSERT_WITH_ID_SQL, row)
+                    except sqlite3.Error as row_err:
+                        logger.error(f"❌ Errore DB inserimento anagrafica '{row[4]}': {row_err}")
+                        failed.add(row[0]); self._add_record(self._records[row[0]], add=False)
+            self._pending_new.clear()
+
+        grouped = {}
+        now = datetime.now()
+        for anag_id, improvements in self._pending_updates.items():
+            grouped.setdefault(tuple(improvements), []).append((*improvements.values(), now, anag_id))
+        for fields, params in grouped.items():
+            try:
+                cursor.executemany(f"UPDATE Anagraphics SET {', '.join(f'{field} = ?' for field in fields)}, updated_at = ? WHERE id = ?", params)
+                logger.info(f"Aggiornate {len(params)} anagrafiche con dati migliorati: {', '.join(fields)}")
+            except sqlite3.Error as update_err:
+                logger.warning(f"Errore aggiornamento anagrafiche ({', '.join(fields)}): {update_err}")
+        self._pending_updates.clear()
+        return failed
+
 # === FUNZIONI TRANSAZIONI ===
 
 def get_reconciliation_links_for_item(item_type, item_id):
@@ -813,9 +1550,36 @@ def add_transactions(cursor, transactions_df):
         logging.error(f"Errore imprevisto caricamento hash: {e_gen}")
         hashes_in_db = set()
 
-    # Preparazione dati per inserimento batch
+    data_to_insert, db_duplicate_count, batch_duplicate_count, error_count = _prepare_transaction_rows(transactions_df, hashes_in_db, set())
+
+    # Inserimento batch se ci sono dati
+    if data_to_insert:
+        try:
+            inserted_count = _insert_transaction_rows(cursor, data_to_insert)
+            logging.info(f"Inserimento batch di {inserted_count} nuove transazioni completato.")
+        except sqlite3.IntegrityError as e_int:
+            logger.error(f"Errore UNIQUE constraint durante inserimento batch: {e_int}. Nessuna riga inserita.")
+            error_count += len(data_to_insert)
+            inserted_count = 0
+        except sqlite3.Error as e_db:
+            logger.error(f"Errore DB generico durante inserimento batch transazioni: {e_db}")
+            error_count += len(data_to_insert)
+            inserted_count = 0
+        except Exception as e_generic_insert:
+             logger.error(f"Errore imprevisto durante inserimento batch transazioni: {e_generic_insert}", exc_info=True)
+             error_count += len(data_to_insert)
+             inserted_count = 0
+
+    logging.info(f"Risultato aggiunta transazioni: Nuove:{inserted_count}, Duplicati DB:{db_duplicate_count}, Duplicati File:{batch_duplicate_count}, Errori Prep./Insert:{error_count}.")
+    return inserted_count, db_duplicate_count, batch_duplicate_count, error_count
+
+def _prepare_transaction_rows(transactions_df, hashes_in_db, batch_hashes):
+    """
+    Righe da inserire per un DataFrame di transazioni, saltando i duplicati già nel DB (hashes_in_db)
+    o già visti nel file (batch_hashes, aggiornato con gli hash accodati).
+    Ritorna (righe, duplicati DB, duplicati file, errori di preparazione).
+    """
     data_to_insert = []
-    batch_hashes = set()
     preparation_errors = 0
     skipped_db_duplicates = 0
     skipped_batch_duplicates = 0
@@ -866,33 +1630,78 @@ def add_transactions(cursor, transactions_df):
             preparation_errors += 1
             logging.error(f"Errore preparazione dati transazione (Riga DF {index}, Hash: {trans_hash[:10]}...): {e_prep}")
 
-    # Aggiornamento contatori
-    db_duplicate_count = skipped_db_duplicates
-    batch_duplicate_count = skipped_batch_duplicates
-    error_count = preparation_errors
+    return data_to_insert, skipped_db_duplicates, skipped_batch_duplicates, preparation_errors
+
+def _insert_transaction_rows(cursor, data_to_insert):
+    """Classifica e inserisce in un executemany le righe preparate. Propaga gli errori DB; ritorna le righe inserite."""
+    # Classificazione (flag POS/Worldline/contanti/commissioni e categoria) calcolata una volta per batch
+    try: from .transaction_classifier import classify_transactions_df, classification_values
+    except ImportError: from transaction_classifier import classify_transactions_df, classification_values
+    classified = classify_transactions_df([r[3] for r in data_to_insert], [r[2] for r in data_to_insert])
+    # Anagrafica dedotta risolta in batch sul resolver condiviso (automa allineato in modo incrementale)
+    try: from .transaction_counterparty import get_shared_match_index, inference_values
+    except ImportError: from transaction_counterparty import get_shared_match_index, inference_values
+    inferred = inference_values([r[3] for r in data_to_insert], get_shared_match_index(cursor.connection))
+    data_to_insert = [row + values + inference
+                      for row, values, inference in zip(data_to_insert, classification_values(classified), inferred)]
+
+    insert_sql = """INSERT INTO BankTransactions (transaction_date, value_date, amount, description, causale_abi, unique_hash, reconciled_amount, reconciliation_status,
+                                                 is_pos, is_worldline, is_cash_deposit, is_bank_fee, category, classifier_version,
+                                                 inferred_anagraphics_id, inferred_confidence, inferred_resolver_version)
+                    VALUES (?, ?, ?, ?, ?, ?, 0.0, 'Da Riconciliare', ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+    cursor.executemany(insert_sql, data_to_insert)
+    return len(data_to_insert)
+
+def _select_existing_hashes(cursor, table, hashes):
+    """Hash presenti in table.unique_hash, con query IN a blocchi sull'indice univoco."""
+    found = set()
+    for start in range(0, len(hashes), _SQL_IN_CHUNK):
+        chunk = hashes[start:start + _SQL_IN_CHUNK]
+        cursor.execute(f"SELECT unique_hash FROM {table} WHERE unique_hash IN ({','.join('?' * len(chunk))})", chunk)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+def add_transactions_chunked(cursor, transaction_chunks):
+    """
+    Importazione in streaming di un estratto conto a blocchi (DataFrame da parser_csv.iter_bank_csv_chunks).
+    Ogni blocco è deduplicato con lookup indicizzati sugli hash del solo blocco (nessun caricamento
+    degli hash esistenti) e inserito nel proprio SAVEPOINT: un errore annulla solo quel blocco.
+    Gli hash inseriti durante l'import stanno in una tabella TEMP per riconoscere i duplicati
+    tra blocchi diversi: la memoria resta indipendente dalla dimensione del file. Non esegue commit.
 
-    # Inserimento batch se ci sono dati
-    if data_to_insert:
-        insert_sql = """INSERT INTO BankTransactions (transaction_date, value_date, amount, description, causale_abi, unique_hash, reconciled_amount, reconciliation_status)
-                        VALUES (?, ?, ?, ?, ?, ?, 0.0, 'Da Riconciliare')"""
-        try:
-            cursor.executemany(insert_sql, data_to_insert)
-            inserted_count = len(data_to_insert)
-            logging.info(f"Inserimento batch di {inserted_count} nuove transazioni completato.")
-        except sqlite3.IntegrityError as e_int:
-            logger.error(f"Errore UNIQUE constraint durante inserimento batch: {e_int}. Nessuna riga inserita.")
-            error_count += len(data_to_insert)
-            inserted_count = 0
-        except sqlite3.Error as e_db:
-            logger.error(f"Errore DB generico durante inserimento batch transazioni: {e_db}")
-            error_count += len(data_to_insert)
-            inserted_count = 0
-        except Exception as e_generic_insert:
-             logger.error(f"Errore imprevisto durante inserimento batch transazioni: {e_generic_insert}", exc_info=True)
-             error_count += len(data_to_insert)
-             inserted_count = 0
+    Returns:
+        tuple: (inserted_count, db_duplicate_count, batch_duplicate_count, error_count)
+    """
+    inserted_count, db_duplicate_count, batch_duplicate_count, error_count = 0, 0, 0, 0
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS csv_stream_hashes (unique_hash TEXT PRIMARY KEY)")
+    cursor.execute("DELETE FROM temp.csv_stream_hashes")
+    try:
+        for chunk_number, chunk in enumerate(transaction_chunks, start=1):
+            if chunk is None or chunk.empty:
+                continue
+            hashes = [h for h in dict.fromkeys(chunk['unique_hash'].tolist()) if isinstance(h, str)]
+            seen_in_file = _select_existing_hashes(cursor, "temp.csv_stream_hashes", hashes)
+            hashes_in_db = _select_existing_hashes(cursor, "BankTransactions", hashes) - seen_in_file
+            rows, db_dup, batch_dup, prep_errors = _prepare_transaction_rows(chunk, hashes_in_db, seen_in_file)
+            db_duplicate_count += db_dup; batch_duplicate_count += batch_dup; error_count += prep_errors
+            if not rows:
+                continue
+            cursor.execute("SAVEPOINT csv_stream_chunk")
+            try:
+                inserted = _insert_transaction_rows(cursor, rows)
+                cursor.executemany("INSERT OR IGNORE INTO temp.csv_stream_hashes (unique_hash) VALUES (?)", [(r[5],) for r in rows])
+                cursor.execute("RELEASE SAVEPOINT csv_stream_chunk")
+                inserted_count += inserted
+                logging.debug(f"Blocco CSV {chunk_number}: {inserted} nuove transazioni.")
+            except sqlite3.Error as chunk_err:
+                cursor.execute("ROLLBACK TO SAVEPOINT csv_stream_chunk")
+                cursor.execute("RELEASE SAVEPOINT csv_stream_chunk")
+                error_count += len(rows)
+                logger.error(f"Errore DB nel blocco CSV {chunk_number} ({len(rows)} righe annullate): {chunk_err}")
+    finally:
+        cursor.execute("DELETE FROM temp.csv_stream_hashes")
 
-    logging.info(f"Risultato aggiunta transazioni: Nuove:{inserted_count}, Duplicati DB:{db_duplicate_count}, Duplicati File:{batch_duplicate_count}, Errori Prep./Insert:{error_count}.")
+    logging.info(f"Risultato import CSV a blocchi: Nuove:{inserted_count}, Duplicati DB:{db_duplicate_count}, Duplicati File:{batch_duplicate_count}, Errori Prep./Insert:{error_count}.")
     return inserted_count, db_duplicate_count, batch_duplicate_count, error_count
 
 # === FUNZIONI RECUPERO DATI ===
@@ -936,10 +1745,12 @@ def get_invoices(type_filter=None, status_filter=None, anagraphics_id_filter=Non
     empty_df_out = pd.DataFrame(columns=cols_out_expected)
     try:
         conn = get_connection()
-        query = """SELECT i.id, i.type, i.doc_number, i.doc_date, i.total_amount, i.due_date,
+        use_cents = is_money_cents_active(conn)
+        cents_cols = ", i.total_amount_cents, i.paid_amount_cents" if use_cents else ""
+        query = f"""SELECT i.id, i.type, i.doc_number, i.doc_date, i.total_amount, i.due_date,
                           i.payment_status, i.paid_amount, i.payment_method,
                           a.denomination AS counterparty_name, i.anagraphics_id,
-                          i.xml_filename, i.p7m_source_file
+                          i.xml_filename, i.p7m_source_file{cents_cols}
                    FROM Invoices i JOIN Anagraphics a ON i.anagraphics_id = a.id"""
         filters, params = [], []
 
@@ -988,23 +1799,35 @@ def get_invoices(type_filter=None, status_filter=None, anagraphics_id_filter=Non
              logger.debug("get_invoices: Nessuna fattura trovata con i criteri specificati.")
              return empty_df_out.copy()
 
-        # Conversioni Decimal robuste
-        df['total_amount_dec'] = df['total_amount'].apply(lambda x: to_decimal(x, default='NaN'))
-        df['paid_amount_dec'] = df['paid_amount'].apply(lambda x: to_decimal(x, default='NaN'))
-
-        # Calcola open_amount_dec solo se total e paid sono validi
-        mask_valid = df['total_amount_dec'].apply(lambda d: isinstance(d, Decimal) and d.is_finite()) & \
-                     df['paid_amount_dec'].apply(lambda d: isinstance(d, Decimal) and d.is_finite())
-        df['open_amount_dec'] = pd.NA # Inizializza a NA (pandas)
-        df.loc[mask_valid, 'open_amount_dec'] = (df.loc[mask_valid, 'total_amount_dec'] - df.loc[mask_valid, 'paid_amount_dec']).apply(quantize)
-        # Assicura che la colonna sia di tipo Decimal o object contenente Decimal/NaN
-        df['open_amount_dec'] = df['open_amount_dec'].apply(lambda x: x if isinstance(x, Decimal) else Decimal('NaN'))
-
-        # Formattazione date e importi
+        if use_cents:
+            # Aritmetica esatta su interi (NumPy), Decimal costruiti solo in uscita
+            total_cents = df['total_amount_cents'].to_numpy(dtype=np.int64)
+            paid_cents = df['paid_amount_cents'].to_numpy(dtype=np.int64)
+            open_cents = total_cents - paid_cents
+            df['total_amount_dec'] = cents_array_to_decimals(total_cents)
+            df['paid_amount_dec'] = cents_array_to_decimals(paid_cents)
+            df['open_amount_dec'] = cents_array_to_decimals(open_cents)
+            df['total_amount_fmt'] = format_cents_array(total_cents)
+            df['open_amount_fmt'] = format_cents_array(open_cents)
+        else:
+            # Conversioni Decimal robuste
+            df['total_amount_dec'] = df['total_amount'].apply(lambda x: to_decimal(x, default='NaN'))
+            df['paid_amount_dec'] = df['paid_amount'].apply(lambda x: to_decimal(x, default='NaN'))
+
+            # Calcola open_amount_dec solo se total e paid sono validi
+            mask_valid = df['total_amount_dec'].apply(lambda d: isinstance(d, Decimal) and d.is_finite()) & \
+                         df['paid_amount_dec'].apply(lambda d: isinstance(d, Decimal) and d.is_finite())
+            df['open_amount_dec'] = pd.NA # Inizializza a NA (pandas)
+            df.loc[mask_valid, 'open_amount_dec'] = (df.loc[mask_valid, 'total_amount_dec'] - df.loc[mask_valid, 'paid_amount_dec']).apply(quantize)
+            # Assicura che la colonna sia di tipo Decimal o object contenente Decimal/NaN
+            df['open_amount_dec'] = df['open_amount_dec'].apply(lambda x: x if isinstance(x, Decimal) else Decimal('NaN'))
+
+            df['total_amount_fmt'] = df['total_amount_dec'].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if isinstance(x, Decimal) and x.is_finite() else 'Errore')
+            df['open_amount_fmt'] = df['open_amount_dec'].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if isinstance(x, Decimal) and x.is_finite() else 'Errore')
+
+        # Formattazione date
         df['doc_date_fmt'] = df['doc_date'].dt.strftime('%d/%m/%Y').fillna('N/D')
         df['due_date_fmt'] = df['due_date'].dt.strftime('%d/%m/%Y').fillna('N/D')
-        df['total_amount_fmt'] = df['total_amount_dec'].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if isinstance(x, Decimal) and x.is_finite() else 'Errore')
-        df['open_amount_fmt'] = df['open_amount_dec'].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if isinstance(x, Decimal) and x.is_finite() else 'Errore')
 
         # Assicura che tutte le colonne attese siano presenti
         for col in cols_out_expected:
@@ -1020,6 +1843,139 @@ def get_invoices(type_filter=None, status_filter=None, anagraphics_id_filter=Non
     finally:
         if conn: conn.close()
 
+TRANSACTION_OUTPUT_COLUMNS = [
+    'id', 'transaction_date_fmt', 'value_date_fmt', 'amount_fmt',
+    'remaining_amount_fmt', 'description', 'causale_abi', 'reconciliation_status',
+    'amount_dec', 'reconciled_amount_dec', 'remaining_amount_dec', 'unique_hash', 'amount'
+]
+
+def _build_transactions_filters(start_date=None, end_date=None, status_filter=None,
+                                anagraphics_id_heuristic_filter=None,
+                                hide_pos=False, hide_worldline=False, hide_cash=False, hide_commissions=False,
+                                search=None, min_amount=None, max_amount=None):
+    """
+    Costruisce le condizioni WHERE (e relativi parametri) condivise dai percorsi di lettura transazioni.
+    min_amount/max_amount si applicano al valore assoluto dell'importo.
+    """
+    filters, params = [], []
+
+    if start_date:
+         try:
+             start_dt = pd.to_datetime(start_date).strftime('%Y-%m-%d')
+             filters.append("transaction_date >= date(?)"); params.append(start_dt)
+         except Exception: logging.warning(f"Data inizio non valida ignorata: {start_date}")
+    if end_date:
+         try:
+             end_dt = pd.to_datetime(end_date).strftime('%Y-%m-%d')
+             filters.append("transaction_date <= date(?)"); params.append(end_dt)
+         except Exception: logging.warning(f"Data fine non valida ignorata: {end_date}")
+
+    valid_statuses = ['Da Riconciliare', 'Riconciliato Parz.', 'Riconciliato Tot.', 'Riconciliato Eccesso', 'Ignorato']
+    if status_filter:
+        if isinstance(status_filter, list):
+             valid_list = [s for s in status_filter if s in valid_statuses]
+             if valid_list:
+                 placeholders = ','.join('?' * len(valid_list))
+                 filters.append(f"reconciliation_status IN ({placeholders})")
+                 params.extend(valid_list)
+        elif status_filter in valid_statuses:
+             filters.append("reconciliation_status = ?")
+             params.append(status_filter)
+        else:
+             logging.warning(f"Filtro stato transazione non valido: {status_filter}. Ignorato.")
+    elif anagraphics_id_heuristic_filter is None: # Default: non mostrare Ignorati se non richiesto specificamente
+         filters.append("reconciliation_status != ?")
+         params.append('Ignorato')
+
+    # Anagrafica: controparte dedotta precalcolata (idx_transactions_inferred_anag)
+    # o link parziali verso fatture dell'anagrafica
+    if anagraphics_id_heuristic_filter is not None:
+        try:
+            target_anag_id = int(anagraphics_id_heuristic_filter)
+            filters.append("""(inferred_anagraphics_id = ? OR (reconciliation_status = 'Riconciliato Parz.' AND id IN (
+                                  SELECT rl.transaction_id FROM ReconciliationLinks rl JOIN Invoices i ON rl.invoice_id = i.id
+                                  WHERE i.anagraphics_id = ?)))""")
+            params.extend([target_anag_id, target_anag_id])
+        except (ValueError, TypeError):
+            logger.error(f"ID anagrafica non valido per filtro anagrafica: {anagraphics_id_heuristic_filter}")
+            filters.append("1 = 0")
+
+    if search:
+        # Ricerca per sottostringa letterale: % e _ dell'utente non sono jolly
+        filters.append("description LIKE ? ESCAPE '\\'")
+        params.append(f"%{_escape_like(search)}%")
+
+    # Range su valore assoluto scritto in forma indicizzabile su amount
+    if min_amount is not None:
+        filters.append("(amount >= ? OR amount <= ?)")
+        params.extend([float(min_amount), -float(min_amount)])
+    if max_amount is not None:
+        filters.append("amount BETWEEN ? AND ?")
+        params.extend([-float(max_amount), float(max_amount)])
+
+    # Filtri descrizione avanzati: flag precalcolati all'import (indice idx_transactions_flags_date);
+    # confronto diretto sulle colonne (NOT NULL DEFAULT 0, righe esistenti classificate da create_tables)
+    if hide_pos:
+        filters.append("is_pos = 0")
+    if hide_worldline:
+        filters.append("is_worldline = 0")
+    if hide_cash:
+        filters.append("is_cash_deposit = 0")
+    if hide_commissions:
+        filters.append("is_bank_fee = 0")
+
+    return filters, params
+
+def _escape_like(text):
+    """Escape di \\, % e _ per un pattern LIKE con ESCAPE '\\'."""
+    return str(text).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _refresh_inferred_anagraphics(conn):
+    """Smaltisce le modifiche anagrafiche in coda prima di filtrare per anagrafica dedotta."""
+    # Import qui per evitare ciclo (transaction_counterparty importa database)
+    try: from .transaction_counterparty import refresh_inferred_anagraphics
+    except ImportError: from transaction_counterparty import refresh_inferred_anagraphics
+    try:
+        if refresh_inferred_anagraphics(conn):
+            conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logger.warning(f"Aggiornamento anagrafica dedotta non riuscito, uso i valori presenti: {e}")
+
+def _format_transactions_df(df, use_cents=False):
+    """Colonne calcolate/formattate (date, Decimal, importi in formato italiano) sulle sole righe passate."""
+    if not df.empty:
+        df['transaction_date_fmt'] = df['transaction_date'].dt.strftime('%d/%m/%Y')
+        df['value_date_fmt'] = df['value_date'].dt.strftime('%d/%m/%Y').fillna('N/D')
+        if use_cents:
+            amount_cents = df['amount_cents'].to_numpy(dtype=np.int64)
+            reconciled_cents = df['reconciled_amount_cents'].to_numpy(dtype=np.int64)
+            remaining_cents = amount_cents - reconciled_cents
+            df['amount_dec'] = cents_array_to_decimals(amount_cents)
+            df['reconciled_amount_dec'] = cents_array_to_decimals(reconciled_cents)
+            df['remaining_amount_dec'] = cents_array_to_decimals(remaining_cents)
+            df['amount_fmt'] = format_cents_array(amount_cents)
+            df['remaining_amount_fmt'] = format_cents_array(remaining_cents)
+        else:
+            df['amount_dec'] = df['amount'].apply(lambda x: to_decimal(x, default='NaN'))
+            df['reconciled_amount_dec'] = df['reconciled_amount'].apply(lambda x: to_decimal(x, default='NaN'))
+            mask_valid = df['amount_dec'].apply(lambda d: isinstance(d, Decimal) and d.is_finite()) & \
+                         df['reconciled_amount_dec'].apply(lambda d: isinstance(d, Decimal) and d.is_finite())
+            df['remaining_amount_dec'] = pd.NA
+            df.loc[mask_valid, 'remaining_amount_dec'] = (df.loc[mask_valid, 'amount_dec'] - df.loc[mask_valid, 'reconciled_amount_dec']).apply(quantize)
+            df['remaining_amount_dec'] = df['remaining_amount_dec'].apply(lambda x: x if isinstance(x, Decimal) else Decimal('NaN'))
+
+            df['amount_fmt'] = df['amount_dec'].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if isinstance(x, Decimal) and x.is_finite() else 'Errore')
+            df['remaining_amount_fmt'] = df['remaining_amount_dec'].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if isinstance(x, Decimal) and x.is_finite() else 'Errore')
+        df['causale_abi'] = df['causale_abi'].apply(lambda x: str(int(x)) if pd.notna(x) else '')
+    else:
+         # Se df è vuoto, crea colonne vuote per coerenza
+        cols_to_add_fmt = ['transaction_date_fmt', 'value_date_fmt', 'amount_fmt', 'remaining_amount_fmt', 'causale_abi']
+        cols_to_add_dec = ['amount_dec', 'reconciled_amount_dec', 'remaining_amount_dec']
+        for col in cols_to_add_fmt: df[col] = pd.Series(dtype='object')
+        for col in cols_to_add_dec: df[col] = pd.Series(dtype='object') # object può contenere Decimal o NaN
+    return df
+
 def get_transactions(start_date=None, end_date=None, status_filter=None, limit=None,
                      anagraphics_id_heuristic_filter=None,
                      hide_pos=False, hide_worldline=False, hide_cash=False, hide_commissions=False):
@@ -1028,148 +1984,35 @@ def get_transactions(start_date=None, end_date=None, status_filter=None, limit=N
     """
     conn = None
     try:
-        # Import qui per evitare ciclo se chiamato da altri moduli prima di reconciliation
-        try: from .reconciliation import find_anagraphics_id_from_description
-        except ImportError: from reconciliation import find_anagraphics_id_from_description
-
         conn = get_connection()
-        # Registra funzione REGEXP se non esiste (necessario per alcuni backend SQLite)
-        try:
-            conn.create_function("REGEXP", 2, lambda pattern, item: bool(re.search(pattern, item, re.IGNORECASE)) if item else False)
-        except Exception as e_regexp:
-            logger.warning(f"Impossibile registrare funzione REGEXP, alcuni filtri potrebbero non funzionare correttamente: {e_regexp}")
 
-        query = """SELECT id, transaction_date, value_date, amount, description,
-                          causale_abi, reconciliation_status, reconciled_amount, unique_hash
+        use_cents = is_money_cents_active(conn)
+        cents_cols = ", amount_cents, reconciled_amount_cents" if use_cents else ""
+        query = f"""SELECT id, transaction_date, value_date, amount, description,
+                          causale_abi, reconciliation_status, reconciled_amount, unique_hash{cents_cols}
                    FROM BankTransactions"""
-        filters, params = [], []
+        filters, params = _build_transactions_filters(
+            start_date=start_date, end_date=end_date, status_filter=status_filter,
+            anagraphics_id_heuristic_filter=anagraphics_id_heuristic_filter,
+            hide_pos=hide_pos, hide_worldline=hide_worldline,
+            hide_cash=hide_cash, hide_commissions=hide_commissions
+        )
 
-        if start_date:
-             try:
-                 start_dt = pd.to_datetime(start_date).strftime('%Y-%m-%d')
-                 filters.append("transaction_date >= date(?)"); params.append(start_dt)
-             except Exception: logging.warning(f"Data inizio non valida ignorata: {start_date}")
-        if end_date:
-             try:
-                 end_dt = pd.to_datetime(end_date).strftime('%Y-%m-%d')
-                 filters.append("transaction_date <= date(?)"); params.append(end_dt)
-             except Exception: logging.warning(f"Data fine non valida ignorata: {end_date}")
-
-        valid_statuses = ['Da Riconciliare', 'Riconciliato Parz.', 'Riconciliato Tot.', 'Riconciliato Eccesso', 'Ignorato']
-        if status_filter:
-            if isinstance(status_filter, list):
-                 valid_list = [s for s in status_filter if s in valid_statuses]
-                 if valid_list:
-                     placeholders = ','.join('?' * len(valid_list))
-                     filters.append(f"reconciliation_status IN ({placeholders})")
-                     params.extend(valid_list)
-            elif status_filter in valid_statuses:
-                 filters.append("reconciliation_status = ?")
-                 params.append(status_filter)
-            else:
-                 logging.warning(f"Filtro stato transazione non valido: {status_filter}. Ignorato.")
-        elif anagraphics_id_heuristic_filter is None: # Default: non mostrare Ignorati se non richiesto specificamente
-             filters.append("reconciliation_status != ?")
-             params.append('Ignorato')
-
-        # Applica filtri descrizione avanzati
-        desc_conditions = []
-        if hide_pos:
-            pos_pattern = r'\b(POS|PAGOBANCOMAT|CIRRUS|MAESTRO|VISA|MASTERCARD|AMEX|AMERICAN EXPRESS|CARTA DI CREDITO|CREDIT CARD|ESE COMM)\b'
-            desc_conditions.append(f"description NOT REGEXP '{pos_pattern}'")
-        if hide_worldline:
-            desc_conditions.append("description NOT LIKE '%WORLDLINE%'")
-        if hide_cash:
-            desc_conditions.append("description NOT LIKE '%VERSAMENTO CONTANTE%'")
-        if hide_commissions:
-            desc_conditions.append("description NOT LIKE 'COMMISSIONI%'")
-            desc_conditions.append("description NOT LIKE 'COMPETENZE BANC%'")
-            desc_conditions.append("description NOT LIKE 'SPESE TENUTA CONTO%'")
-            desc_conditions.append("description NOT LIKE 'IMPOSTA DI BOLLO%'")
-
-        if desc_conditions:
-            filters.append(f"(description IS NULL OR ({' AND '.join(desc_conditions)}))")
+        if anagraphics_id_heuristic_filter is not None:
+            _refresh_inferred_anagraphics(conn)
 
         if filters: query += " WHERE " + " AND ".join(filters)
         query += " ORDER BY transaction_date DESC, id DESC"
-        apply_limit_later = (anagraphics_id_heuristic_filter is not None and limit is not None)
-        if limit and not apply_limit_later:
+        if limit:
              try: query += " LIMIT ?"; params.append(int(limit))
              except (ValueError, TypeError): pass
 
         df = pd.read_sql_query(query, conn, params=params if params else None, parse_dates=['transaction_date', 'value_date'])
         if df is None: return pd.DataFrame()
 
-        # Filtro euristico per anagrafica specifica
-        if anagraphics_id_heuristic_filter is not None and not df.empty:
-            try:
-                target_anag_id = int(anagraphics_id_heuristic_filter)
-                logger.info(f"Applicazione filtro euristico transazioni per AnagID: {target_anag_id} su {len(df)} righe...")
-                
-                # Ottimizzazione: usa apply invece di iterrows
-                def check_description_match(desc):
-                    if pd.isna(desc): return False
-                    found_id = find_anagraphics_id_from_description(desc)
-                    return found_id == target_anag_id
-
-                # Maschera booleana per filtro descrizione
-                desc_mask = df['description'].apply(check_description_match)
-
-                # Maschera booleana per link parziali (più complesso, richiede query aggiuntiva)
-                partial_link_mask = pd.Series(False, index=df.index)
-                partial_trans_ids = df.loc[df['reconciliation_status'] == 'Riconciliato Parz.', 'id'].tolist()
-                if partial_trans_ids:
-                    placeholders = ','.join('?' * len(partial_trans_ids))
-                    query_links = f"""SELECT DISTINCT rl.transaction_id
-                                      FROM ReconciliationLinks rl JOIN Invoices i ON rl.invoice_id = i.id
-                                      WHERE rl.transaction_id IN ({placeholders}) AND i.anagraphics_id = ?"""
-                    params_links = partial_trans_ids + [target_anag_id]
-                    df_links = pd.read_sql_query(query_links, conn, params=params_links)
-                    linked_ids_for_anag = set(df_links['transaction_id'])
-                    partial_link_mask = df['id'].isin(linked_ids_for_anag)
-
-                # Combina le maschere
-                final_mask = desc_mask | partial_link_mask
-                df = df[final_mask].copy()
-                logger.info(f"Risultato filtro euristico: {len(df)} transazioni mantenute.")
-            except (ValueError, TypeError):
-                logger.error(f"ID anagrafica non valido per filtro euristico: {anagraphics_id_heuristic_filter}")
-                df = pd.DataFrame()
-            except Exception as e_filter:
-                logger.error(f"Errore durante filtro euristico transazioni: {e_filter}", exc_info=True)
-                df = pd.DataFrame()
-
-        if apply_limit_later and not df.empty:
-            try: df = df.head(int(limit))
-            except (ValueError, TypeError): pass
-
-        # Colonne calcolate/formattate
-        if not df.empty:
-            df['transaction_date_fmt'] = df['transaction_date'].dt.strftime('%d/%m/%Y')
-            df['value_date_fmt'] = df['value_date'].dt.strftime('%d/%m/%Y').fillna('N/D')
-            df['amount_dec'] = df['amount'].apply(lambda x: to_decimal(x, default='NaN'))
-            df['reconciled_amount_dec'] = df['reconciled_amount'].apply(lambda x: to_decimal(x, default='NaN'))
-            mask_valid = df['amount_dec'].apply(lambda d: isinstance(d, Decimal) and d.is_finite()) & \
-                         df['reconciled_amount_dec'].apply(lambda d: isinstance(d, Decimal) and d.is_finite())
-            df['remaining_amount_dec'] = pd.NA
-            df.loc[mask_valid, 'remaining_amount_dec'] = (df.loc[mask_valid, 'amount_dec'] - df.loc[mask_valid, 'reconciled_amount_dec']).apply(quantize)
-            df['remaining_amount_dec'] = df['remaining_amount_dec'].apply(lambda x: x if isinstance(x, Decimal) else Decimal('NaN'))
+        df = _format_transactions_df(df, use_cents)
 
-            df['amount_fmt'] = df['amount_dec'].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if isinstance(x, Decimal) and x.is_finite() else 'Errore')
-            df['remaining_amount_fmt'] = df['remaining_amount_dec'].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if isinstance(x, Decimal) and x.is_finite() else 'Errore')
-            df['causale_abi'] = df['causale_abi'].apply(lambda x: str(int(x)) if pd.notna(x) else '')
-        else:
-             # Se df è vuoto, crea colonne vuote per coerenza
-            cols_to_add_fmt = ['transaction_date_fmt', 'value_date_fmt', 'amount_fmt', 'remaining_amount_fmt', 'causale_abi']
-            cols_to_add_dec = ['amount_dec', 'reconciled_amount_dec', 'remaining_amount_dec']
-            for col in cols_to_add_fmt: df[col] = pd.Series(dtype='object')
-            for col in cols_to_add_dec: df[col] = pd.Series(dtype='object') # object può contenere Decimal o NaN
-
-        cols_to_return = [
-            'id', 'transaction_date_fmt', 'value_date_fmt', 'amount_fmt',
-            'remaining_amount_fmt', 'description', 'causale_abi', 'reconciliation_status',
-            'amount_dec', 'reconciled_amount_dec', 'remaining_amount_dec', 'unique_hash', 'amount'
-        ]
+        cols_to_return = list(TRANSACTION_OUTPUT_COLUMNS)
         # Assicura che tutte le colonne esistano prima di selezionarle
         for col in cols_to_return:
              if col not in df.columns:
@@ -1178,15 +2021,99 @@ def get_transactions(start_date=None, end_date=None, status_filter=None, limit=N
         return df[cols_to_return]
     except Exception as e:
         logger.error(f"Errore recupero transazioni: {e}", exc_info=True)
-        cols_out = [
-            'id', 'transaction_date_fmt', 'value_date_fmt', 'amount_fmt',
-            'remaining_amount_fmt', 'description', 'causale_abi', 'reconciliation_status',
-            'amount_dec', 'reconciled_amount_dec', 'remaining_amount_dec', 'unique_hash', 'amount'
-        ]
-        return pd.DataFrame(columns=cols_out)
+        return pd.DataFrame(columns=TRANSACTION_OUTPUT_COLUMNS)
+    finally:
+        if conn: conn.close()
+
+def get_transactions_page(page=1, size=50, start_date=None, end_date=None, status_filter=None,
+                          search=None, min_amount=None, max_amount=None,
+                          anagraphics_id_heuristic_filter=None,
+                          hide_pos=False, hide_worldline=False, hide_cash=False, hide_commissions=False,
+                          include_summary=False):
+    """
+    Lettura paginata delle transazioni: filtri, COUNT e LIMIT/OFFSET in SQL,
+    colonne formattate calcolate solo per le righe della pagina.
+
+    Ritorna un dict con 'items' (DataFrame con le colonne di get_transactions più
+    reconciled_amount), 'total' e, se richiesto, 'summary' aggregato su tutto il filtro.
+    """
+    cols_out = TRANSACTION_OUTPUT_COLUMNS + ['reconciled_amount']
+    result = {'items': pd.DataFrame(columns=cols_out), 'total': 0, 'summary': None}
+    try:
+        page = max(1, int(page))
+        size = max(1, int(size))
+    except (ValueError, TypeError):
+        page, size = 1, 50
+
+    conn = None
+    try:
+        conn = get_connection()
+
+        filters, params = _build_transactions_filters(
+            start_date=start_date, end_date=end_date, status_filter=status_filter,
+            anagraphics_id_heuristic_filter=anagraphics_id_heuristic_filter,
+            hide_pos=hide_pos, hide_worldline=hide_worldline,
+            hide_cash=hide_cash, hide_commissions=hide_commissions,
+            search=search, min_amount=min_amount, max_amount=max_amount
+        )
+
+        if anagraphics_id_heuristic_filter is not None:
+            _refresh_inferred_anagraphics(conn)
+
+        where_clause = (" WHERE " + " AND ".join(filters)) if filters else ""
+
+        count_row = conn.execute(f"SELECT COUNT(*) FROM BankTransactions{where_clause}", params).fetchone()
+        result['total'] = count_row[0] if count_row else 0
+        if include_summary:
+            result['summary'] = _summarize_transactions(conn, where_clause, params)
+
+        use_cents = is_money_cents_active(conn)
+        cents_cols = ", amount_cents, reconciled_amount_cents" if use_cents else ""
+        page_query = f"""SELECT id, transaction_date, value_date, amount, description,
+                               causale_abi, reconciliation_status, reconciled_amount, unique_hash{cents_cols}
+                        FROM BankTransactions"""
+        page_query += where_clause + " ORDER BY transaction_date DESC, id DESC LIMIT ? OFFSET ?"
+        page_params = params + [size, (page - 1) * size]
+
+        df = pd.read_sql_query(page_query, conn, params=page_params, parse_dates=['transaction_date', 'value_date'])
+        df = _format_transactions_df(df, use_cents)
+        for col in cols_out:
+            if col not in df.columns:
+                df[col] = pd.NA if '_dec' in col else ''
+        result['items'] = df[cols_out]
+        return result
+    except Exception as e:
+        logger.error(f"Errore recupero pagina transazioni: {e}", exc_info=True)
+        return result
     finally:
         if conn: conn.close()
 
+def _summarize_transactions(conn, where_clause, params):
+    """Statistiche aggregate (in SQL) sull'insieme filtrato di transazioni."""
+    row = conn.execute(f"""
+        SELECT COUNT(*) AS cnt,
+               COALESCE(SUM(amount), 0) AS total_amount,
+               COALESCE(SUM(CASE WHEN amount > 0 THEN amount END), 0) AS total_income,
+               COALESCE(SUM(CASE WHEN amount < 0 THEN -amount END), 0) AS total_expenses,
+               AVG(amount) AS avg_amount
+        FROM BankTransactions{where_clause}
+    """, params).fetchone()
+    if not row or not row['cnt']:
+        return {"total_amount": 0.0, "total_income": 0.0, "total_expenses": 0.0}
+    count_by_status = {r[0]: r[1] for r in conn.execute(
+        f"SELECT reconciliation_status, COUNT(*) FROM BankTransactions{where_clause} GROUP BY reconciliation_status",
+        params).fetchall()}
+    total = row['cnt']
+    return {
+        "total_amount": float(row['total_amount']),
+        "total_income": float(row['total_income']),
+        "total_expenses": float(row['total_expenses']),
+        "count_by_status": count_by_status,
+        "avg_amount": float(row['avg_amount'] or 0.0),
+        "unreconciled_count": count_by_status.get('Da Riconciliare', 0),
+        "reconciliation_rate": count_by_status.get('Riconciliato Tot.', 0) / total * 100
+    }
+
 # === FUNZIONI RICONCILIAZIONE ===
 
 def get_item_details(conn, item_type, item_id):
@@ -1896,7 +2823,7 @@ __all__ = [
     
     # CRUD operations  
     'add_anagraphics_if_not_exists', 'get_anagraphics', 'get_invoices', 
-    'get_transactions', 'add_transactions',
+    'get_transactions', 'get_transactions_page', 'add_transactions',
     
     # Reconciliation
     'get_reconciliation_links_for_item', 'add_or_update_reconciliation_link',
@@ -1913,6 +2840,13 @@ __all__ = [
     
     # Schema management
     'get_schema_version', 'set_schema_version', 'update_schema_if_needed',
+    'migrate_money_to_cents', 'is_money_cents_active', 'MONEY_CENTS_COLUMNS',
+    'ensure_open_residual_column', 'OPEN_INVOICE_STATUSES', 'OPEN_INVOICE_FILTER',
+    'install_reconciliation_status_triggers', 'drop_reconciliation_status_triggers',
+    'is_reconciliation_triggers_active', 'sweep_overdue_invoices', 'run_overdue_sweep',
+    'RECON_STATUS_MODE',
+    'ensure_fulltext_index', 'is_fulltext_available', 'build_fts_match_query', 'FTS_TABLES',
+    'ensure_anagraphics_inference_queue',
     
     # Advanced functions
     'analyze_anagraphics_quality', 'cleanup_orphaned_records',
@@ -1,12 +1,17 @@
 # core/importer.py
 
 import os
+import io
 import zipfile
 import logging
-import tempfile
-import shutil
 import sqlite3
 import configparser
+import hashlib
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 # ### MODIFICA: Aggiunti import mancanti ###
 from decimal import Decimal, InvalidOperation
 import pandas as pd
@@ -18,19 +23,23 @@ import re # Importa re per _is_own_company se serve
 # ### MODIFICA: Assicurato import robusto ###
 try:
     from .parser_xml import parse_fattura_xml
-    from .parser_p7m import extract_xml_from_p7m, _cleanup_temp_file
-    from .parser_csv import parse_bank_csv
+    from .parser_p7m import extract_xml_bytes_from_p7m
+    from .parser_csv import parse_bank_csv, iter_bank_csv_chunks, resolve_bank_csv_profile
     from .database import (get_connection, add_anagraphics_if_not_exists,
-                     check_entity_duplicate, add_transactions, create_tables)
+                     check_entity_duplicate, add_transactions, add_transactions_chunked, create_tables,
+                     get_imported_file_hashes, record_imported_files,
+                     get_bank_csv_profiles, record_bank_csv_profiles, AnagraphicsIndex)
     from .utils import to_decimal, quantize
 except ImportError:
     logging.warning("Import relativo fallito in importer.py, tento import assoluto.")
     try:
         from parser_xml import parse_fattura_xml
-        from parser_p7m import extract_xml_from_p7m, _cleanup_temp_file
-        from parser_csv import parse_bank_csv
+        from parser_p7m import extract_xml_bytes_from_p7m
+        from parser_csv import parse_bank_csv, iter_bank_csv_chunks, resolve_bank_csv_profile
         from database import (get_connection, add_anagraphics_if_not_exists,
-                              check_entity_duplicate, add_transactions)
+                              check_entity_duplicate, add_transactions, add_transactions_chunked,
+                              get_imported_file_hashes, record_imported_files,
+                              get_bank_csv_profiles, record_bank_csv_profiles, AnagraphicsIndex)
         from utils import to_decimal, quantize
     except ImportError as e:
         logging.critical(f"Impossibile importare dipendenze in importer.py: {e}")
@@ -46,9 +55,36 @@ def _is_metadata_file(filename):
     return base.startswith('._') or base == '.DS_Store'
 
 
+# --- Import parallelo: configurazione ---
+# Numero di processi per estrazione/parsing (0 = os.cpu_count(), 1 = importazione seriale)
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', '0'))
+# Sotto questa soglia di file il costo di avvio del pool supera il guadagno
+IMPORT_PARALLEL_MIN_FILES = int(os.getenv('IMPORT_PARALLEL_MIN_FILES', '16'))
+# Avvio dei processi del pool: mai fork dal server uvicorn multithread (lock ereditati in stato incoerente)
+IMPORT_MP_START_METHOD = os.getenv('IMPORT_MP_START_METHOD', 'spawn')
+# Numero di file tra due flush delle righe/riepiloghi IVA accodati
+IMPORT_WRITE_BATCH_FILES = int(os.getenv('IMPORT_WRITE_BATCH_FILES', '200'))
+# Profondità massima di espansione degli ZIP annidati (esportazioni SDI)
+IMPORT_ZIP_MAX_DEPTH = int(os.getenv('IMPORT_ZIP_MAX_DEPTH', '3'))
+
+# CSV da questa dimensione in su sono importati in streaming a blocchi (0 = sempre)
+IMPORT_CSV_STREAM_BYTES = int(os.getenv('IMPORT_CSV_STREAM_BYTES', str(32 * 1024 * 1024)))
+
+# Stato dei file saltati perché il loro contenuto è già nel manifest ImportedFiles
+MANIFEST_HIT_STATUS = 'Skipped - Already imported (manifest)'
+_HASH_READ_SIZE = 1024 * 1024
+
+_LINE_SQL = "INSERT INTO InvoiceLines (invoice_id, line_number, description, quantity, unit_measure, unit_price, total_price, vat_rate, item_code, item_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+_VAT_SQL = "INSERT INTO InvoiceVATSummary (invoice_id, vat_rate, taxable_amount, vat_amount) VALUES (?, ?, ?, ?)"
+
+
 # --- Funzione add_invoice_data (MODIFICATA per quantize e robustezza) ---
-def add_invoice_data(cursor, invoice_data, counterparty_anagraphics_id, p7m_source=None):
-    """Aggiunge dati fattura, righe e IVA al DB. Applica quantize prima di salvare."""
+def add_invoice_data(cursor, invoice_data, counterparty_anagraphics_id, p7m_source=None, pending_rows=None):
+    """
+    Aggiunge dati fattura, righe e IVA al DB. Applica quantize prima di salvare.
+    Con pending_rows (PendingInvoiceRows) righe e riepiloghi IVA vengono accodati e
+    scritti in blocco da flush_pending_rows invece che con un executemany per fattura.
+    """
     general_data = invoice_data.get('body', {}).get('general_data', {})
     invoice_type = invoice_data.get('type')
     invoice_hash = invoice_data.get('unique_hash')
@@ -105,10 +141,11 @@ def add_invoice_data(cursor, invoice_data, counterparty_anagraphics_id, p7m_sour
             except Exception as line_generic_err:
                 logger.error(f"Errore generico prep riga {i+1} fattura ID:{invoice_id} ('{doc_number}'): {line_generic_err}", exc_info=True)
 
-        if lines_data:
-            line_sql = "INSERT INTO InvoiceLines (invoice_id, line_number, description, quantity, unit_measure, unit_price, total_price, vat_rate, item_code, item_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        if lines_data and pending_rows is not None:
+            pending_rows.lines.append((invoice_id, doc_number, lines_data))
+        elif lines_data:
             try:
-                cursor.executemany(line_sql, lines_data); logging.debug(f"Inserite {len(lines_data)} righe per fattura ID:{invoice_id}.")
+                cursor.executemany(_LINE_SQL, lines_data); logging.debug(f"Inserite {len(lines_data)} righe per fattura ID:{invoice_id}.")
             except sqlite3.Error as line_err:
                 logger.error(f"Errore DB insert righe ID:{invoice_id} ('{doc_number}'): {line_err}")
 
@@ -124,10 +161,11 @@ def add_invoice_data(cursor, invoice_data, counterparty_anagraphics_id, p7m_sour
              except Exception as vat_prep_err:
                  logger.error(f"Errore prep riepilogo IVA {summary.get('vat_rate')}% ID:{invoice_id} ('{doc_number}'): {vat_prep_err}")
 
-        if vat_summary_data:
-            vat_sql = "INSERT INTO InvoiceVATSummary (invoice_id, vat_rate, taxable_amount, vat_amount) VALUES (?, ?, ?, ?)"
+        if vat_summary_data and pending_rows is not None:
+            pending_rows.vat.append((invoice_id, doc_number, vat_summary_data))
+        elif vat_summary_data:
             try:
-                cursor.executemany(vat_sql, vat_summary_data); logging.debug(f"Inseriti {len(vat_summary_data)} riepiloghi IVA per fattura ID:{invoice_id}.")
+                cursor.executemany(_VAT_SQL, vat_summary_data); logging.debug(f"Inseriti {len(vat_summary_data)} riepiloghi IVA per fattura ID:{invoice_id}.")
             except sqlite3.Error as vat_err:
                 logger.error(f"Errore DB insert IVA ID:{invoice_id} ('{doc_number}'): {vat_err}")
 
@@ -148,126 +186,421 @@ def add_invoice_data(cursor, invoice_data, counterparty_anagraphics_id, p7m_sour
 # ### FINE MODIFICA ###
 
 
-# --- Funzione process_file MODIFICATA (passa my_company_data a parser)---
-def process_file(filepath, conn, my_company_data):
-    """Processa un singolo file (XML, P7M, CSV) e lo importa nel DB."""
-    cursor = conn.cursor()
+class PendingInvoiceRows:
+    """Righe fattura e riepiloghi IVA accodati dallo stadio di scrittura, per fattura."""
+
+    def __init__(self):
+        self.lines = []  # [(invoice_id, doc_number, rows)]
+        self.vat = []
+
+    def __len__(self):
+        return len(self.lines) + len(self.vat)
+
+
+def flush_pending_rows(cursor, pending_rows):
+    """
+    Scrive in blocco righe e riepiloghi IVA accodati (un executemany per tabella).
+    Se il blocco fallisce riprova fattura per fattura, come l'inserimento immediato,
+    così un errore resta confinato alla singola fattura. Non esegue commit.
+    """
+    for sql, queued, label in ((_LINE_SQL, pending_rows.lines, 'righe'), (_VAT_SQL, pending_rows.vat, 'riepiloghi IVA')):
+        if not queued:
+            continue
+        cursor.execute("SAVEPOINT import_rows_flush")
+        try:
+            cursor.executemany(sql, [row for _, _, rows in queued for row in rows])
+            cursor.execute("RELEASE SAVEPOINT import_rows_flush")
+            logger.debug(f"Inserite in blocco {label} di {len(queued)} fatture.")
+        except sqlite3.Error as batch_err:
+            cursor.execute("ROLLBACK TO SAVEPOINT import_rows_flush")
+            cursor.execute("RELEASE SAVEPOINT import_rows_flush")
+            logger.warning(f"Insert in blocco {label} fallito ({batch_err}), ripiego per fattura.")
+            for invoice_id, doc_number, rows in queued:
+                try:
+                    cursor.executemany(sql, rows)
+                except sqlite3.Error as row_err:
+                    logger.error(f"Errore DB insert {label} ID:{invoice_id} ('{doc_number}'): {row_err}")
+        queued.clear()
+
+
+def _resolve_import_workers(workers=None):
+    """Numero effettivo di processi di parsing (None = IMPORT_WORKERS da ambiente)."""
+    if workers is None:
+        workers = IMPORT_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return max(1, workers)
+
+
+def parse_source_file(filepath, my_company_data, content=None, csv_profiles=None):
+    """
+    Stadio di estrazione/parsing di un file (XML, P7M, CSV), senza accesso al DB.
+    Con content (bytes, es. membro di uno ZIP) filepath è solo il nome logico e il file non viene letto da disco.
+    csv_profiles: profili di formato CSV salvati (get_bank_csv_profiles), riusati senza rilevamento.
+    Eseguibile in un processo worker: ritorna un dict picklable con
+    'path', 'file_type', 'status' (None se pronto per la scrittura, altrimenti stato finale),
+    'xml_data' per fatture, 'transactions' (DataFrame) e 'csv_profile' ((profilo, già salvato) o None) per CSV.
+    """
     _, ext = os.path.splitext(filepath); ext = ext.lower()
-    status = 'Error - Initializing'; temp_xml_path = None; xml_data = None
     base_name = os.path.basename(filepath)
-    file_type_processed = None
+    parsed = {'path': filepath, 'file_type': None, 'status': None, 'xml_data': None, 'transactions': None, 'csv_profile': None}
 
     try:
         if ext == '.p7m':
-            file_type_processed = 'P7M'
+            parsed['file_type'] = 'P7M'
             logger.debug(f"Processing P7M: {base_name}")
-            temp_xml_path = extract_xml_from_p7m(filepath)
-            if temp_xml_path:
-                logger.debug(f"P7M estratto in: {temp_xml_path}")
+            # Estrazione in memoria (parser CMS nativo, OpenSSL solo come fallback)
+            xml_bytes = extract_xml_bytes_from_p7m(filepath if content is None else content, source_name=base_name)
+            if xml_bytes:
+                xml_name = base_name[:-len(ext)]  # 'IT0123_ABC.xml.p7m' -> 'IT0123_ABC.xml'
+                if not xml_name.lower().endswith('.xml'): xml_name += '.xml'
                 # Passa my_company_data al parser XML
-                xml_data = parse_fattura_xml(temp_xml_path, my_company_data) # Passa qui
-                if not xml_data: status = 'Error - XML Parse Failed (None from parse_fattura_xml)'; logger.error(f"{status} for {base_name}. XML temp: {temp_xml_path}")
-                elif xml_data.get('error'): status = f"Error - XML Parse: {xml_data['error']}"; logger.error(f"{status} for {base_name}. XML temp: {temp_xml_path}")
-            else: status = 'Error - P7M Extraction Failed'; logger.error(f"{status} for {base_name}")
+                parsed['xml_data'] = parse_fattura_xml(xml_bytes, my_company_data, source_name=xml_name)
+            else: parsed['status'] = 'Error - P7M Extraction Failed'; logger.error(f"{parsed['status']} for {base_name}")
 
         elif ext == '.xml':
-            file_type_processed = 'XML'
+            parsed['file_type'] = 'XML'
             logger.debug(f"Processing XML: {base_name}")
-            # Passa my_company_data al parser XML
-            xml_data = parse_fattura_xml(filepath, my_company_data) # Passa qui
-            if not xml_data: status = 'Error - XML Parse Failed (None from parse_fattura_xml)'; logger.error(f"{status} for {base_name}")
-            elif xml_data.get('error'): status = f"Error - XML Parse: {xml_data['error']}"; logger.error(f"{status} for {base_name}")
+            parsed['xml_data'] = parse_fattura_xml(filepath if content is None else content, my_company_data, source_name=base_name)
 
         elif ext == '.csv':
-            file_type_processed = 'CSV'
+            parsed['file_type'] = 'CSV'
             logger.debug(f"Processing CSV: {base_name}")
-            transactions_df = parse_bank_csv(filepath)
-            if transactions_df is not None:
-                if not transactions_df.empty:
-                    inserted, db_duplicates, batch_duplicates, errors = add_transactions(cursor, transactions_df)
-                    duplicates = db_duplicates + batch_duplicates
-                    if errors > 0: status = f'Error - {errors} DB errors/prep errors during CSV insert'; logger.error(f"{status} for {base_name}")
-                    elif inserted > 0: status = f'Success ({inserted} new)'; logger.info(f"CSV {base_name}: {status}, Duplicates (DB/File): {db_duplicates}/{batch_duplicates}")
-                    elif duplicates > 0: status = f'Duplicate ({duplicates} existing/in file)'; logger.warning(f"CSV {base_name}: {status} (DB: {db_duplicates}, File: {batch_duplicates})")
-                    else: status = 'Success - No new data'; logger.info(f"CSV {base_name}: {status}")
-                else: status = 'Success - Empty/Filtered CSV'; logger.info(f"CSV {base_name}: {status}")
-            else: status = 'Error - CSV Parse Failed'; logger.error(f"{status} for {base_name}")
-            return status
+            csv_source = filepath if content is None else io.BytesIO(content)
+            profile, profile_known = resolve_bank_csv_profile(csv_source, csv_profiles)
+            if profile is not None: parsed['csv_profile'] = (profile, profile_known)
+            parsed['transactions'] = parse_bank_csv(csv_source, profile=profile)
+            if parsed['transactions'] is None: parsed['status'] = 'Error - CSV Parse Failed'; logger.error(f"{parsed['status']} for {base_name}")
+            return parsed
         else:
-            status = 'Unsupported File Type'; logger.warning(f"File non supportato: {base_name} ({ext})"); return status
+            parsed['status'] = 'Unsupported File Type'; logger.warning(f"File non supportato: {base_name} ({ext})"); return parsed
+
+        xml_data = parsed['xml_data']
+        if parsed['status'] is None:
+            if not xml_data: parsed['status'] = 'Error - XML Parse Failed (None from parse_fattura_xml)'; logger.error(f"{parsed['status']} for {base_name}")
+            elif xml_data.get('error'): parsed['status'] = f"Error - XML Parse: {xml_data['error']}"; logger.error(f"{parsed['status']} for {base_name}")
+
+    except ValueError as ve: parsed['status'] = f"Error - Validation: {ve}"; logger.error(f"Errore validazione dati per {base_name}: {ve}", exc_info=True)
+    except Exception as e: parsed['status'] = f'Critical Error: {e}'; logger.error(f"Errore critico parsing per {base_name}: {e}", exc_info=True)
+    return parsed
+
+
+def store_parsed_file(parsed, conn, pending_rows=None, pending_profiles=None):
+    """
+    Stadio di scrittura: inserisce nel DB il risultato di parse_source_file e ritorna lo stato del file.
+    Va eseguito nell'ordine dei file su un'unica connessione (deduplica e anagrafiche dipendono dall'ordine).
+    Con pending_profiles il profilo di formato dei CSV viene accodato per record_bank_csv_profiles.
+    """
+    if parsed['status'] is not None:
+        return parsed['status']
+
+    cursor = conn.cursor()
+    filepath = parsed['path']; base_name = os.path.basename(filepath)
+    file_type_processed = parsed['file_type']
+    status = 'Error - Initializing'
+
+    try:
+        if file_type_processed == 'CSV':
+            transactions_df = parsed['transactions']
+            if pending_profiles is not None and parsed.get('csv_profile'):
+                pending_profiles.append((*parsed['csv_profile'], base_name))
+            if not transactions_df.empty:
+                status = _csv_import_status(base_name, *add_transactions(cursor, transactions_df))
+            else: status = 'Success - Empty/Filtered CSV'; logger.info(f"CSV {base_name}: {status}")
+            return status
 
         # --- Inserimento DB per XML/P7M (Usa tipo da parser) ---
-        if xml_data and not xml_data.get('error'):
-             logger.debug(f"Parsing {file_type_processed} OK for {base_name}. Inserting into DB...")
-             invoice_type = xml_data.get('type') # TIPO DETERMINATO DA PARSER
-
-             if not invoice_type or invoice_type == 'Unknown':
-                 # Errore se il parser non ha potuto determinare il tipo
-                 # (probabilmente a causa di dati config.ini mancanti/errati)
-                 status = 'Error - Invoice type not determined by parser'
-                 logger.error(f"{status} for {base_name}. Verifica P.IVA/CF in config.ini e nel file XML.")
-             elif invoice_type == 'Autofattura':
-                 status = 'Skipped - Autofattura (Not Implemented)'
-                 logger.warning(f"File {base_name} è un'autofattura. Import non gestito.")
-             else:
-                 # Identifica controparte basandosi sul tipo determinato
-                 ced_data = xml_data.get('anagraphics', {}).get('cedente', {})
-                 ces_data = xml_data.get('anagraphics', {}).get('cessionario', {})
-                 counterparty_id = None
-                 counterparty_data = None
-                 anag_type_for_counterparty = None
-
-                 if invoice_type == 'Attiva':
-                     counterparty_data = ces_data; anag_type_for_counterparty = 'Cliente'
-                 elif invoice_type == 'Passiva':
-                     counterparty_data = ced_data; anag_type_for_counterparty = 'Fornitore'
-
-                 if counterparty_data and anag_type_for_counterparty:
-                     # Inserisci/Trova ID controparte
-                     counterparty_id = add_anagraphics_if_not_exists(cursor, counterparty_data, anag_type_for_counterparty)
-                     if not counterparty_id:
-                         status = f'Error - Counterparty ({anag_type_for_counterparty}) Insert/Find Failed'
-                         logger.error(f"{status} for {base_name}")
-                 else:
-                     # Non dovrebbe accadere se type è Attiva/Passiva
-                     status = 'Error - Could not determine Counterparty Data/Type (XML structure issue?)'
-                     logger.error(f"{status} for {base_name}")
-
-                 # Procedi con inserimento fattura solo se abbiamo ID controparte e nessun errore
-                 if counterparty_id and status == 'Error - Initializing':
-                     logger.debug(f"Controparte ID: {counterparty_id}. Inserisco fattura {base_name}...")
-                     p7m_original_source = filepath if file_type_processed == 'P7M' else None
-                     invoice_id, is_duplicate = add_invoice_data(cursor, xml_data, counterparty_id, p7m_source=p7m_original_source)
-                     if is_duplicate: status = 'Duplicate'
-                     elif invoice_id is not None: status = 'Success'
-                     else: status = 'Error - Invoice Insert Failed'
-                 elif status == 'Error - Initializing':
-                      status = 'Error - Counterparty ID Missing/Error'
-                      logger.error(f"{status} for {base_name}. Impossibile inserire fattura.")
-
-        # Gestione errori parsing/estrazione iniziali
-        elif status == 'Error - Initializing':
-             if xml_data and xml_data.get('error'): status = f"Error - XML Parse: {xml_data.get('error', 'Unknown XML Parse Error')}"
-             elif file_type_processed == 'P7M' and not temp_xml_path: status = 'Error - P7M Extraction Failed'
-             elif file_type_processed in ['XML', 'P7M'] and not xml_data: status = 'Error - XML Parse Failed (None returned)'
-             else: status = 'Error - Unknown Processing Failure'; logger.error(f"{status} for {base_name}")
+        xml_data = parsed['xml_data']
+        logger.debug(f"Parsing {file_type_processed} OK for {base_name}. Inserting into DB...")
+        invoice_type = xml_data.get('type') # TIPO DETERMINATO DA PARSER
+
+        if not invoice_type or invoice_type == 'Unknown':
+            # Errore se il parser non ha potuto determinare il tipo
+            # (probabilmente a causa di dati config.ini mancanti/errati)
+            status = 'Error - Invoice type not determined by parser'
+            logger.error(f"{status} for {base_name}. Verifica P.IVA/CF in config.ini e nel file XML.")
+        elif invoice_type == 'Autofattura':
+            status = 'Skipped - Autofattura (Not Implemented)'
+            logger.warning(f"File {base_name} è un'autofattura. Import non gestito.")
+        else:
+            # Identifica controparte basandosi sul tipo determinato
+            counterparty_id = None
+            counterparty_data, anag_type_for_counterparty = _counterparty_of(xml_data)
+
+            if counterparty_data and anag_type_for_counterparty:
+                # Inserisci/Trova ID controparte (già risolto in blocco da _iter_with_counterparties durante l'import)
+                if 'counterparty_id' in parsed: counterparty_id = parsed['counterparty_id']
+                else: counterparty_id = add_anagraphics_if_not_exists(cursor, counterparty_data, anag_type_for_counterparty)
+                if not counterparty_id:
+                    status = f'Error - Counterparty ({anag_type_for_counterparty}) Insert/Find Failed'
+                    logger.error(f"{status} for {base_name}")
+            else:
+                # Non dovrebbe accadere se type è Attiva/Passiva
+                status = 'Error - Could not determine Counterparty Data/Type (XML structure issue?)'
+                logger.error(f"{status} for {base_name}")
+
+            # Procedi con inserimento fattura solo se abbiamo ID controparte e nessun errore
+            if counterparty_id and status == 'Error - Initializing':
+                logger.debug(f"Controparte ID: {counterparty_id}. Inserisco fattura {base_name}...")
+                p7m_original_source = filepath if file_type_processed == 'P7M' else None
+                invoice_id, is_duplicate = add_invoice_data(cursor, xml_data, counterparty_id, p7m_source=p7m_original_source,
+                                                            pending_rows=pending_rows)
+                if is_duplicate: status = 'Duplicate'
+                elif invoice_id is not None: status = 'Success'
+                else: status = 'Error - Invoice Insert Failed'
+            elif status == 'Error - Initializing':
+                 status = 'Error - Counterparty ID Missing/Error'
+                 logger.error(f"{status} for {base_name}. Impossibile inserire fattura.")
 
     except sqlite3.Error as db_err: status = f'Critical DB Error: {db_err}'; logger.error(f"Errore DB non catturato per {base_name}: {db_err}", exc_info=True)
     except ValueError as ve: status = f"Error - Validation: {ve}"; logger.error(f"Errore validazione dati per {base_name}: {ve}", exc_info=True)
     except Exception as e: status = f'Critical Error: {e}'; logger.error(f"Errore critico process_file per {base_name}: {e}", exc_info=True)
+    return status
+
+
+def _counterparty_of(xml_data):
+    """(dati anagrafici, tipo anagrafica) della controparte di una fattura Attiva/Passiva, altrimenti (None, None)."""
+    invoice_type = xml_data.get('type')
+    if invoice_type == 'Attiva':
+        return xml_data.get('anagraphics', {}).get('cessionario', {}), 'Cliente'
+    if invoice_type == 'Passiva':
+        return xml_data.get('anagraphics', {}).get('cedente', {}), 'Fornitore'
+    return None, None
+
+
+def _iter_with_counterparties(parsed_files, cursor, window=None, barriers=()):
+    """
+    Risoluzione in blocco delle controparti dei file parsati (nell'ordine, con lettura anticipata):
+    accumula fino a window fatture (default IMPORT_WRITE_BATCH_FILES), le risolve sull'AnagraphicsIndex
+    caricato una volta per import e scrive le nuove anagrafiche con un unico executemany prima di
+    restituirle con 'counterparty_id'. Nessuna query sulle anagrafiche per fattura in store_parsed_file.
+    Il blocco si chiude prima di un CSV (non se ne trattiene il DataFrame e la sua deduzione delle
+    controparti vede solo le anagrafiche dei file precedenti) e prima delle posizioni in barriers
+    (file preceduti da un CSV importato in streaming).
+    """
+    window = window or IMPORT_WRITE_BATCH_FILES
+    index = None; buffered = []
+
+    def resolve_buffered():
+        nonlocal index
+        resolved = []
+        for parsed in buffered:
+            if parsed['status'] is not None or parsed['file_type'] not in ('XML', 'P7M'):
+                continue
+            counterparty_data, anag_type = _counterparty_of(parsed['xml_data'])
+            if not counterparty_data:
+                continue
+            if index is None:
+                index = AnagraphicsIndex(cursor)
+            try:
+                parsed['counterparty_id'] = index.resolve(counterparty_data, anag_type)
+            except Exception as resolve_err:
+                logger.error(f"Errore risoluzione controparte per {os.path.basename(parsed['path'])}: {resolve_err}", exc_info=True)
+                parsed['counterparty_id'] = None
+            resolved.append(parsed)
+        if index is not None:
+            failed = index.flush(cursor)
+            for parsed in resolved:
+                if parsed['counterparty_id'] in failed: parsed['counterparty_id'] = None
+        ready = buffered[:]; buffered.clear()
+        return ready
+
+    try:
+        for position, parsed in enumerate(parsed_files):
+            if position in barriers:
+                yield from resolve_buffered()
+            if parsed['file_type'] == 'CSV':
+                yield from resolve_buffered()
+                yield parsed
+                continue
+            buffered.append(parsed)
+            if len(buffered) >= window:
+                yield from resolve_buffered()
+        yield from resolve_buffered()
     finally:
-         if temp_xml_path: _cleanup_temp_file(temp_xml_path)
+        parsed_files.close()
+
+
+def _csv_import_status(base_name, inserted, db_duplicates, batch_duplicates, errors):
+    """Stato di un file CSV a partire dai contatori di add_transactions/add_transactions_chunked."""
+    duplicates = db_duplicates + batch_duplicates
+    if errors > 0: status = f'Error - {errors} DB errors/prep errors during CSV insert'; logger.error(f"{status} for {base_name}")
+    elif inserted > 0: status = f'Success ({inserted} new)'; logger.info(f"CSV {base_name}: {status}, Duplicates (DB/File): {db_duplicates}/{batch_duplicates}")
+    elif duplicates > 0: status = f'Duplicate ({duplicates} existing/in file)'; logger.warning(f"CSV {base_name}: {status} (DB: {db_duplicates}, File: {batch_duplicates})")
+    else: status = 'Success - No new data'; logger.info(f"CSV {base_name}: {status}")
+    return status
+
+
+def _is_streamed_csv(source):
+    """CSV abbastanza grande da essere importato in streaming invece che parsato per intero."""
+    if not _source_name(source).lower().endswith('.csv'):
+        return False
+    try:
+        size = source.info.file_size if isinstance(source, ArchiveMember) else os.path.getsize(source)
+    except OSError:
+        return False
+    return size >= IMPORT_CSV_STREAM_BYTES
+
+
+def store_streamed_csv(source, conn, csv_profiles=None, pending_profiles=None):
+    """
+    Import in streaming di un CSV (file su disco o membro ZIP letto senza estrarlo): blocchi da
+    iter_bank_csv_chunks inseriti da add_transactions_chunked, ciascuno nel proprio savepoint.
+    Eseguito nello stadio di scrittura, senza passare dal pool di parsing. Ritorna lo stato del file.
+    """
+    base_name = os.path.basename(_source_name(source))
+    logger.info(f"CSV {base_name}: import in streaming a blocchi.")
+    try:
+        with (source.archive.open(source.info) if isinstance(source, ArchiveMember) else open(source, 'rb')) as stream:
+            profile, profile_known = resolve_bank_csv_profile(stream, csv_profiles)
+            counts = add_transactions_chunked(conn.cursor(), iter_bank_csv_chunks(stream, profile=profile))
+        if profile is not None and pending_profiles is not None:
+            pending_profiles.append((profile, profile_known, base_name))
+        return _csv_import_status(base_name, *counts)
+    except ValueError as ve: status = f"Error - CSV Parse Failed: {ve}"; logger.error(f"{status} for {base_name}")
+    except sqlite3.Error as db_err: status = f'Critical DB Error: {db_err}'; logger.error(f"Errore DB import CSV in streaming {base_name}: {db_err}", exc_info=True)
+    except Exception as e: status = f'Critical Error: {e}'; logger.error(f"Errore critico import CSV in streaming {base_name}: {e}", exc_info=True)
     return status
 
 
+def process_file(filepath, conn, my_company_data):
+    """Processa un singolo file (XML, P7M, CSV) e lo importa nel DB."""
+    return store_parsed_file(parse_source_file(filepath, my_company_data), conn)
+
+
+class ArchiveMember:
+    """Membro di un archivio ZIP (anche annidato), letto in memoria solo quando viene parsato."""
+    __slots__ = ('name', 'archive', 'info')
+
+    def __init__(self, name, archive, info):
+        self.name = name; self.archive = archive; self.info = info
+
+    def read(self):
+        return self.archive.read(self.info)
+
+
+def _source_name(source):
+    return source.name if isinstance(source, ArchiveMember) else source
+
+
+def _collect_zip_members(zip_ref, open_archives, prefix='', depth=0):
+    """
+    Elenca i membri di uno ZIP senza estrarli; gli ZIP annidati vengono aperti in memoria
+    (registrati in open_archives per la chiusura) ed espansi con nome 'esterno.zip/membro'.
+    Ritorna (membri, file metadati saltati).
+    """
+    members = []; skipped_meta = 0
+    for info in zip_ref.infolist():
+        if info.is_dir():
+            continue
+        if _is_metadata_file(info.filename):
+            skipped_meta += 1; continue
+        name = prefix + info.filename
+        if info.filename.lower().endswith('.zip') and depth < IMPORT_ZIP_MAX_DEPTH:
+            try:
+                nested = zipfile.ZipFile(io.BytesIO(zip_ref.read(info)))
+            except zipfile.BadZipFile:
+                logger.warning(f"ZIP annidato non valido: {name}"); members.append(ArchiveMember(name, zip_ref, info)); continue
+            open_archives.append(nested)
+            nested_members, nested_skipped = _collect_zip_members(nested, open_archives, f"{name}/", depth + 1)
+            members.extend(nested_members); skipped_meta += nested_skipped
+        else:
+            members.append(ArchiveMember(name, zip_ref, info))
+    return members, skipped_meta
+
+
+def file_content_hash(source):
+    """
+    Hash BLAKE2b (128 bit) dei byte grezzi di un file su disco o membro ZIP, letto a blocchi.
+    None se il file non è leggibile (l'errore emerge poi dal parsing).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with (source.archive.open(source.info) if isinstance(source, ArchiveMember) else open(source, 'rb')) as stream:
+            for block in iter(lambda: stream.read(_HASH_READ_SIZE), b''):
+                digest.update(block)
+    except (OSError, zipfile.BadZipFile, RuntimeError) as hash_err:
+        logger.warning(f"Hash contenuto non calcolabile per {_source_name(source)}: {hash_err}")
+        return None
+    return digest.hexdigest()
+
+
+def _is_manifest_status(status):
+    """Esiti definitivi da registrare nel manifest: reimportare lo stesso contenuto non cambierebbe nulla."""
+    return status.startswith('Success') or status.startswith('Duplicate')
+
+
+def _load_source(source):
+    """(nome, contenuto) per lo stadio di parsing: contenuto None per i file su disco."""
+    if isinstance(source, ArchiveMember):
+        return source.name, source.read()
+    return source, None
+
+
+def _parse_source_batch(batch, my_company_data, csv_profiles=None):
+    """Task del pool: parsing di un blocco di (nome, contenuto)."""
+    return [parse_source_file(name, my_company_data, content, csv_profiles) for name, content in batch]
+
+
+def _iter_parsed_files(files_to_process, my_company_data, workers, csv_profiles=None):
+    """
+    Generatore dei file parsati nell'ordine di files_to_process (path o ArchiveMember).
+    Con workers > 1 il parsing avviene in un pool di processi, a blocchi, con un numero
+    limitato di blocchi in volo: i membri ZIP vengono letti in memoria solo poco prima del parsing.
+    Se il pool si rompe, i file rimanenti vengono parsati in modo seriale.
+    """
+    next_index = 0
+    if workers > 1 and len(files_to_process) >= IMPORT_PARALLEL_MIN_FILES:
+        chunksize = max(1, min(32, len(files_to_process) // (workers * 4)))
+        pool = None
+        try:
+            pool = ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=multiprocessing.get_context(IMPORT_MP_START_METHOD))
+            logger.info(f"Parsing parallelo con {workers} processi (blocchi da {chunksize}).")
+            sources = iter(files_to_process)
+            in_flight = deque()
+            while True:
+                while len(in_flight) < workers * 2:
+                    batch = [_load_source(source) for source in itertools.islice(sources, chunksize)]
+                    if not batch:
+                        break
+                    in_flight.append(pool.submit(_parse_source_batch, batch, my_company_data, csv_profiles))
+                if not in_flight:
+                    break
+                for parsed in in_flight.popleft().result():
+                    next_index += 1
+                    yield parsed
+        except (BrokenProcessPool, OSError) as pool_err:
+            logger.warning(f"Pool di parsing non disponibile ({pool_err}), proseguo in modo seriale "
+                           f"da file {next_index + 1}/{len(files_to_process)}.")
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+    for source in files_to_process[next_index:]:
+        name, content = _load_source(source)
+        yield parse_source_file(name, my_company_data, content, csv_profiles)
+
+
 # --- Funzione import_from_source (MODIFICATA per leggere config e passare my_company_data) ---
-def import_from_source(source_path, progress_callback=None):
+def import_from_source(source_path, progress_callback=None, workers=None, source_name=None, force=False):
     """
     Importa dati da un file singolo (XML, P7M, CSV) o da un file ZIP/directory.
+    source_path può essere anche uno stream ZIP già aperto (es. upload spooled), con source_name per i messaggi.
+    Gli ZIP (anche annidati) non vengono estratti su disco: i membri passano ai parser come buffer in memoria.
+    Estrazione e parsing possono girare in un pool di processi (workers, default IMPORT_WORKERS);
+    la scrittura resta un unico stadio ordinato sulla stessa transazione, con esito identico all'import seriale.
+    Prima di ogni estrazione/parsing i file vengono confrontati per hash del contenuto con il manifest
+    ImportedFiles: quelli già importati sono saltati (MANIFEST_HIT_STATUS, contati in 'manifest_hits').
+    Con force=True il manifest viene ignorato e ogni file è riparsato (es. dopo aver cancellato fatture).
+    I profili di formato CSV per banca (BankCsvProfiles) sono caricati una volta per import: i CSV con
+    intestazione nota saltano il rilevamento di encoding, delimitatore e colonne, i nuovi profili sono salvati.
     Ritorna un dizionario con i risultati dell'importazione.
     """
-    results = {'processed': 0, 'success': 0, 'duplicates': 0, 'errors': 0, 'unsupported': 0, 'files': []}
-    conn = None; temp_dir = None; files_to_process = []; processed_paths = set(); skipped_meta_files_count = 0; files_passed_to_process_file = 0
+    results = {'processed': 0, 'success': 0, 'duplicates': 0, 'errors': 0, 'unsupported': 0, 'manifest_hits': 0, 'files': []}
+    conn = None; open_archives = []; files_to_process = []; processed_paths = set(); skipped_meta_files_count = 0; files_passed_to_process_file = 0
+    is_stream = hasattr(source_path, 'read')
+    source_label = source_name or (getattr(source_path, 'name', None) if is_stream else source_path)
+    if not isinstance(source_label, str): source_label = 'ZIP in memoria'
 
     # Lettura dati azienda dal config
     my_company_data = {'piva': None, 'cf': None}
@@ -296,23 +629,19 @@ def import_from_source(source_path, progress_callback=None):
 
     # Blocca import se manca config o dati essenziali
     if missing_config:
-         results['errors'] = 1; results['files'].append({'name': source_path, 'status': 'Error - Config.ini mancante, illeggibile o senza P.IVA/CF azienda'}); return results
+         results['errors'] = 1; results['files'].append({'name': source_label, 'status': 'Error - Config.ini mancante, illeggibile o senza P.IVA/CF azienda'}); return results
 
     try:
         # Identifica e raccogli file da processare
-        if os.path.isfile(source_path):
+        if is_stream or os.path.isfile(source_path):
             if zipfile.is_zipfile(source_path):
-                logger.info(f"Input ZIP: {source_path}. Estraggo..."); temp_dir = tempfile.mkdtemp(prefix="fattura_import_")
+                logger.info(f"Input ZIP: {source_label}. Leggo i membri senza estrarre...")
                 try:
-                    with zipfile.ZipFile(source_path, 'r') as zip_ref: zip_ref.extractall(temp_dir)
-                    logger.info(f"ZIP estratto in: {temp_dir}. Raccolgo file...");
-                    for root, _, files in os.walk(temp_dir):
-                        for filename in files:
-                            full_path = os.path.join(root, filename)
-                            if not _is_metadata_file(filename) and full_path not in processed_paths: files_to_process.append(full_path); processed_paths.add(full_path)
-                            elif _is_metadata_file(filename): skipped_meta_files_count += 1
+                    zip_ref = zipfile.ZipFile(source_path, 'r'); open_archives.append(zip_ref)
+                    files_to_process, skipped_meta_files_count = _collect_zip_members(zip_ref, open_archives)
                 except zipfile.BadZipFile: raise ValueError("File ZIP non valido o corrotto.")
-                except Exception as zip_err: raise IOError(f"Errore estrazione ZIP: {zip_err}") from zip_err
+                except Exception as zip_err: raise IOError(f"Errore lettura ZIP: {zip_err}") from zip_err
+            elif is_stream: raise ValueError("Lo stream fornito non è un archivio ZIP valido.")
             else:
                 if not _is_metadata_file(source_path): files_to_process = [source_path]
                 else: skipped_meta_files_count += 1
@@ -325,10 +654,10 @@ def import_from_source(source_path, progress_callback=None):
                      elif _is_metadata_file(filename): skipped_meta_files_count += 1
         else: raise FileNotFoundError(f"Percorso non valido: {source_path}")
 
-        files_to_process.sort(); total_files_to_process = len(files_to_process)
+        files_to_process.sort(key=_source_name); total_files_to_process = len(files_to_process)
         results['unsupported'] = skipped_meta_files_count
         if total_files_to_process == 0:
-            logger.warning(f"Nessun file valido trovato in '{source_path}' (esclusi {skipped_meta_files_count} file metadati).")
+            logger.warning(f"Nessun file valido trovato in '{source_label}' (esclusi {skipped_meta_files_count} file metadati).")
             results['processed'] = skipped_meta_files_count
             return results
 
@@ -346,32 +675,71 @@ def import_from_source(source_path, progress_callback=None):
         except Exception as db_init_err:
             logger.error(f"ERRORE CRITICO: Impossibile inizializzare database: {db_init_err}")
             results['errors'] = 1
-            results['files'].append({'name': source_path, 'status': f'Error - Database init failed: {db_init_err}'})
+            results['files'].append({'name': source_label, 'status': f'Error - Database init failed: {db_init_err}'})
             return results
         # === FINE VERIFICA DATABASE ===
         
         conn = get_connection(); conn.execute('BEGIN TRANSACTION')
+        pending_rows = PendingInvoiceRows(); write_cursor = conn.cursor()
+
+        # Manifest: i file con contenuto già importato non vengono né estratti né parsati
+        content_hashes = [file_content_hash(source) for source in files_to_process]
+        manifest_hits = set() if force else get_imported_file_hashes(write_cursor, content_hashes)
+        if manifest_hits:
+            logger.info(f"Manifest: {sum(h in manifest_hits for h in content_hashes)} file già importati, salto il parsing.")
+        pending_manifest = []; pending_profiles = []
+        has_csv = any(_source_name(source).lower().endswith('.csv') for source in files_to_process)
+        csv_profiles = get_bank_csv_profiles(write_cursor) if has_csv else {}
+        # I CSV grandi non passano dal pool: sono letti a blocchi direttamente nello stadio di scrittura
+        streamed_csv = {i for i, source in enumerate(files_to_process) if content_hashes[i] not in manifest_hits and _is_streamed_csv(source)}
+        files_to_parse = []; counterparty_barriers = set()
+        for i, (source, content_hash) in enumerate(zip(files_to_process, content_hashes)):
+            if i in streamed_csv: counterparty_barriers.add(len(files_to_parse))
+            elif content_hash not in manifest_hits: files_to_parse.append(source)
+        # Controparti risolte in blocco sull'indice in memoria delle anagrafiche
+        parsed_files = _iter_with_counterparties(
+            _iter_parsed_files(files_to_parse, my_company_data, _resolve_import_workers(workers), csv_profiles),
+            write_cursor, barriers=counterparty_barriers)
 
-        for i, fpath in enumerate(files_to_process):
-             files_passed_to_process_file += 1; base_name = os.path.basename(fpath)
-             rel_path_for_log = os.path.relpath(fpath, start=temp_dir if temp_dir else source_path)
-             logger.info(f"Processo file {files_passed_to_process_file}/{total_files_to_process}: '{rel_path_for_log}'")
-             if progress_callback:
-                 try: progress_callback(files_passed_to_process_file, total_files_to_process)
-                 except InterruptedError: raise # Propaga interruzione
-                 except Exception as cb_err: logger.warning(f"Errore callback progresso: {cb_err}")
-
-             # Passa dati azienda a process_file
-             file_status = process_file(fpath, conn, my_company_data)
-             results['files'].append({'name': base_name, 'status': file_status})
-
-             # Aggiorna contatori
-             if file_status.startswith('Success'): results['success'] += 1
-             elif file_status == 'Duplicate': results['duplicates'] += 1 # Solo duplicati fattura
-             elif file_status.startswith('Error'): results['errors'] += 1
-             elif file_status == 'Unsupported File Type' or file_status.startswith('Skipped'): results['unsupported'] += 1
-             else: logger.warning(f"Stato file '{file_status}' non riconosciuto per {base_name}. Contato come errore."); results['errors'] += 1
-
+        try:
+            for i, source in enumerate(files_to_process):
+                 files_passed_to_process_file += 1; base_name = os.path.basename(_source_name(source))
+                 rel_path_for_log = source.name if isinstance(source, ArchiveMember) else os.path.relpath(source, start=source_path)
+                 logger.info(f"Processo file {files_passed_to_process_file}/{total_files_to_process}: '{rel_path_for_log}'")
+                 if progress_callback:
+                     try: progress_callback(files_passed_to_process_file, total_files_to_process)
+                     except InterruptedError: raise # Propaga interruzione
+                     except Exception as cb_err: logger.warning(f"Errore callback progresso: {cb_err}")
+
+                 content_hash = content_hashes[i]
+                 if content_hash in manifest_hits:
+                     file_status = MANIFEST_HIT_STATUS
+                 else:
+                     if i in streamed_csv: file_status = store_streamed_csv(source, conn, csv_profiles, pending_profiles)
+                     # Scrittura ordinata del file parsato (dal pool o in seriale)
+                     else: file_status = store_parsed_file(next(parsed_files), conn, pending_rows, pending_profiles)
+                     if content_hash and _is_manifest_status(file_status):
+                         size = source.info.file_size if isinstance(source, ArchiveMember) else os.path.getsize(source)
+                         pending_manifest.append((content_hash, _source_name(source), size, file_status))
+                 results['files'].append({'name': base_name, 'status': file_status})
+                 if files_passed_to_process_file % IMPORT_WRITE_BATCH_FILES == 0:
+                     flush_pending_rows(write_cursor, pending_rows)
+                     record_imported_files(write_cursor, pending_manifest)
+                     record_bank_csv_profiles(write_cursor, pending_profiles)
+
+                 # Aggiorna contatori
+                 if file_status == MANIFEST_HIT_STATUS: results['manifest_hits'] += 1
+                 elif file_status.startswith('Success'): results['success'] += 1
+                 elif file_status == 'Duplicate': results['duplicates'] += 1 # Solo duplicati fattura
+                 elif file_status.startswith('Error'): results['errors'] += 1
+                 elif file_status == 'Unsupported File Type' or file_status.startswith('Skipped'): results['unsupported'] += 1
+                 else: logger.warning(f"Stato file '{file_status}' non riconosciuto per {base_name}. Contato come errore."); results['errors'] += 1
+        finally:
+            parsed_files.close() # Chiude il pool anche su annullamento/errore
+
+        flush_pending_rows(write_cursor, pending_rows)
+        record_imported_files(write_cursor, pending_manifest)
+        record_bank_csv_profiles(write_cursor, pending_profiles)
         conn.commit(); logger.info(f"Transazione DB completata con successo.")
 
     except (ValueError, IOError, FileNotFoundError, InterruptedError) as user_err:
@@ -385,10 +753,10 @@ def import_from_source(source_path, progress_callback=None):
             # ### CORREZIONE: Indentazione except ### END
         # Calcola errori residui
         # Assicurati che results['errors'] non diventi negativo
-        processed_count = results['success'] + results['duplicates'] + results['unsupported']
+        processed_count = results['success'] + results['duplicates'] + results['unsupported'] + results['manifest_hits']
         results['errors'] = max(0, files_passed_to_process_file - processed_count) + 1 # Aggiungi 1 per l'errore corrente
-        if isinstance(user_err, InterruptedError): results['files'].append({'name':source_path, 'status': 'Error - Import Annullato'})
-        else: results['files'].append({'name':source_path, 'status': f'Error: {user_err}'})
+        if isinstance(user_err, InterruptedError): results['files'].append({'name':source_label, 'status': 'Error - Import Annullato'})
+        else: results['files'].append({'name':source_label, 'status': f'Error: {user_err}'})
         # Nota: non è necessario aggiornare results['processed'] qui, lo facciamo alla fine
 
     except sqlite3.Error as db_err:
@@ -400,7 +768,7 @@ def import_from_source(source_path, progress_callback=None):
             except Exception as rb_err:
                 logger.error(f"Errore durante il rollback (db_err): {rb_err}")
             # ### CORREZIONE: Indentazione except ### END
-        processed_count = results['success'] + results['duplicates'] + results['unsupported']
+        processed_count = results['success'] + results['duplicates'] + results['unsupported'] + results['manifest_hits']
         results['errors'] = max(0, files_passed_to_process_file - processed_count) + 1
         results['files'].append({'name':'DATABASE ERROR', 'status': f'Critical DB Error: {db_err}'})
 
@@ -413,7 +781,7 @@ def import_from_source(source_path, progress_callback=None):
             except Exception as rb_err:
                 logger.error(f"Errore durante il rollback (generic_err): {rb_err}")
             # ### CORREZIONE: Indentazione except ### END
-        processed_count = results['success'] + results['duplicates'] + results['unsupported']
+        processed_count = results['success'] + results['duplicates'] + results['unsupported'] + results['manifest_hits']
         results['errors'] = max(0, files_passed_to_process_file - processed_count) + 1
         results['files'].append({'name':'CRITICAL PYTHON ERROR', 'status': f'Critical Error: {e}'})
     finally:
@@ -423,16 +791,13 @@ def import_from_source(source_path, progress_callback=None):
                 logger.debug("Connessione DB chiusa.")
             except Exception as close_err:
                 logger.error(f"Errore chiusura connessione DB: {close_err}")
-        if temp_dir and os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-                logger.info(f"Directory temporanea {temp_dir} rimossa.")
-            except Exception as e_clean:
-                logger.warning(f"Impossibile rimuovere directory temporanea {temp_dir}: {e_clean}")
+        for archive in reversed(open_archives):
+            try: archive.close()
+            except Exception as close_zip_err: logger.warning(f"Errore chiusura archivio ZIP: {close_zip_err}")
 
     # Ricalcola 'processed' alla fine
     # 'duplicates' include solo duplicati fattura hash
-    results['processed'] = results['success'] + results['duplicates'] + results['errors'] + results['unsupported']
+    results['processed'] = results['success'] + results['duplicates'] + results['errors'] + results['unsupported'] + results['manifest_hits']
     logger.debug(f"Conteggio finale ricalcolato: Processed={results['processed']}")
-    logger.info(f"Importazione completata. Risultati: Success={results['success']}, Dup.Fatt={results['duplicates']}, Errors={results['errors']}, Unsupp/Skip={results['unsupported']} / Total Processed={results['processed']}")
+    logger.info(f"Importazione completata. Risultati: Success={results['success']}, Dup.Fatt={results['duplicates']}, Errors={results['errors']}, Unsupp/Skip={results['unsupported']}, Manifest={results['manifest_hits']} / Total Processed={results['processed']}")
     return results
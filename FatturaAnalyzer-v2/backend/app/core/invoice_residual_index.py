@@ -0,0 +1,299 @@
+# core/invoice_residual_index.py - Indice in memoria dei residui delle fatture aperte
+
+"""
+Indice in-process dei residui (total_amount - paid_amount) delle fatture aperte,
+in centesimi interi, per la ricerca dei candidati 1:1 per importo più vicino.
+
+Ogni partizione è una lista ordinata di (residuo_abs_centesimi, invoice_id):
+- (type, anagraphics_id): fatture aperte di un tipo per una controparte
+- (type, None): tutte le fatture aperte di quel tipo
+
+La ricerca del candidato più vicino è un bisect (O(log n)) seguito da una scansione
+a due puntatori verso l'esterno. L'indice resta allineato al DB leggendo
+InvoiceResidualLog, alimentata da trigger su Invoices (insert/delete e modifiche di
+tipo, anagrafica, importi, stato): ad ogni sync vengono ricaricate solo le fatture
+cambiate dall'ultima sequenza letta, comprese quelle toccate dai link di riconciliazione.
+Il log viene potato dopo la sync dell'indice condiviso quando supera 2 * LOG_RETENTION righe.
+Dentro una transazione aperta l'indice condiviso non viene toccato: si usa una copia
+privata con le sole fatture cambiate dopo la sua ultima sequenza (modifiche non confermate incluse).
+"""
+
+import logging
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple, Iterable
+
+try:
+    from .utils import AMOUNT_TOLERANCE_CENTS, amounts_to_cents_array
+except ImportError:
+    logging.warning("Import relativo fallito in invoice_residual_index.py, tento import assoluto.")
+    from utils import AMOUNT_TOLERANCE_CENTS, amounts_to_cents_array
+
+logger = logging.getLogger(__name__)
+
+OPEN_PAYMENT_STATUSES = ('Aperta', 'Scaduta', 'Pagata Parz.')
+
+# Righe di InvoiceResidualLog conservate dalla pulizia (gli indici più indietro vengono ricostruiti)
+LOG_RETENTION = 50000
+
+_RELOAD_CHUNK_SIZE = 500
+
+_indexes: Dict[str, 'InvoiceResidualIndex'] = {}
+_indexes_lock = threading.Lock()
+
+
+class InvoiceResidualIndex:
+    """Residui delle fatture aperte partizionati per tipo e anagrafica, ordinati per importo."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries: Dict[int, Tuple[str, Optional[int], int]] = {} # id -> (type, anagraphics_id, residuo con segno)
+        self._partitions: Dict[Tuple[str, Optional[int]], List[Tuple[int, int]]] = {}
+        self._last_seq: Optional[int] = None # None = indice da (ri)costruire
+        self._log_rows = 0 # righe presenti in InvoiceResidualLog all'ultima sync (stima per la potatura)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --- Manutenzione ---
+
+    def sync(self, conn: sqlite3.Connection) -> None:
+        """Allinea l'indice al DB: ricostruzione completa al primo uso, poi solo le fatture cambiate."""
+        with self._lock:
+            try:
+                if self._last_seq is None:
+                    self._build(conn)
+                    return
+                min_seq, max_seq = self._log_bounds(conn)
+                self._log_rows = max_seq - min_seq + 1 if min_seq is not None else 0
+                if max_seq <= self._last_seq:
+                    return
+                if min_seq is None or min_seq > self._last_seq + 1:
+                    # Righe di log già eliminate dalla pulizia: delta non ricostruibile
+                    self._build(conn)
+                    return
+                cursor = conn.execute("SELECT DISTINCT invoice_id FROM InvoiceResidualLog WHERE seq > ? AND seq <= ?",
+                                      (self._last_seq, max_seq))
+                changed_ids = [row[0] for row in cursor.fetchall()]
+                self._reload(conn, changed_ids)
+                self._last_seq = max_seq
+                logger.debug(f"Indice residui: {len(changed_ids)} fatture aggiornate (seq {max_seq})")
+            except sqlite3.OperationalError as e:
+                # Log assente (DB non migrato): nessun delta disponibile, ricostruzione ad ogni sync
+                logger.debug(f"Indice residui senza InvoiceResidualLog ({e}), ricostruzione completa")
+                self._build(conn, track_log=False)
+
+    def _build(self, conn: sqlite3.Connection, track_log: bool = True) -> None:
+        # La sequenza è letta prima delle righe: una modifica concorrente viene al più riapplicata
+        last_seq = self._log_bounds(conn)[1] if track_log else None
+        self._entries.clear()
+        self._partitions.clear()
+        placeholders = ','.join('?' * len(OPEN_PAYMENT_STATUSES))
+        cursor = conn.execute(f"""
+            SELECT id, type, anagraphics_id, total_amount, paid_amount
+            FROM Invoices WHERE payment_status IN ({placeholders})
+        """, OPEN_PAYMENT_STATUSES)
+        self._apply_rows(cursor.fetchall())
+        for partition in self._partitions.values():
+            partition.sort()
+        self._last_seq = last_seq
+        logger.info(f"Indice residui fatture aperte costruito: {len(self._entries)} fatture, {len(self._partitions)} partizioni")
+
+    def overlay(self, conn: sqlite3.Connection) -> Optional['InvoiceResidualIndex']:
+        """
+        Vista dell'indice per una connessione con transazione aperta: l'indice stesso se dopo
+        la sua ultima sequenza non ci sono modifiche, altrimenti una copia privata con le sole
+        fatture cambiate ricaricate da conn. None se l'indice non è ancora costruito.
+        """
+        with self._lock:
+            if self._last_seq is None:
+                return None
+            try:
+                if self._log_bounds(conn)[1] <= self._last_seq:
+                    return self
+            except sqlite3.OperationalError:
+                return None
+            private = InvoiceResidualIndex()
+            private._entries = dict(self._entries)
+            private._partitions = {key: list(partition) for key, partition in self._partitions.items()}
+            private._last_seq = self._last_seq
+        private.sync(conn)
+        return private
+
+    @staticmethod
+    def _log_bounds(conn: sqlite3.Connection) -> Tuple[Optional[int], int]:
+        min_seq = conn.execute("SELECT MIN(seq) FROM InvoiceResidualLog").fetchone()[0]
+        # sqlite_sequence conserva il massimo anche dopo la pulizia del log (AUTOINCREMENT)
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'InvoiceResidualLog'").fetchone()
+        return min_seq, (row[0] if row else 0)
+
+    def _reload(self, conn: sqlite3.Connection, invoice_ids: List[int]) -> None:
+        for invoice_id in invoice_ids:
+            self._remove(invoice_id)
+        placeholders_status = ','.join('?' * len(OPEN_PAYMENT_STATUSES))
+        for start in range(0, len(invoice_ids), _RELOAD_CHUNK_SIZE):
+            chunk = invoice_ids[start:start + _RELOAD_CHUNK_SIZE]
+            cursor = conn.execute(f"""
+                SELECT id, type, anagraphics_id, total_amount, paid_amount
+                FROM Invoices WHERE id IN ({','.join('?' * len(chunk))}) AND payment_status IN ({placeholders_status})
+            """, (*chunk, *OPEN_PAYMENT_STATUSES))
+            self._apply_rows(cursor.fetchall(), keep_sorted=True)
+
+    def _apply_rows(self, rows: Iterable, keep_sorted: bool = False) -> None:
+        rows = list(rows)
+        if not rows:
+            return
+        residuals = (amounts_to_cents_array([row[3] for row in rows])
+                     - amounts_to_cents_array([row[4] for row in rows])).tolist()
+        add = insort if keep_sorted else list.append
+        for row, residual_cents in zip(rows, residuals):
+            invoice_id, invoice_type, anagraphics_id = row[0], row[1], row[2]
+            if abs(residual_cents) * 2 <= AMOUNT_TOLERANCE_CENTS:
+                continue
+            self._entries[invoice_id] = (invoice_type, anagraphics_id, residual_cents)
+            key = (abs(residual_cents), invoice_id)
+            add(self._partitions.setdefault((invoice_type, None), []), key)
+            if anagraphics_id is not None:
+                add(self._partitions.setdefault((invoice_type, anagraphics_id), []), key)
+
+    def _remove(self, invoice_id: int) -> None:
+        entry = self._entries.pop(invoice_id, None)
+        if entry is None:
+            return
+        invoice_type, anagraphics_id, residual_cents = entry
+        key = (abs(residual_cents), invoice_id)
+        for partition_key in ((invoice_type, None), (invoice_type, anagraphics_id)):
+            partition = self._partitions.get(partition_key)
+            if partition is None:
+                continue
+            pos = bisect_left(partition, key)
+            if pos < len(partition) and partition[pos] == key:
+                del partition[pos]
+            if not partition:
+                del self._partitions[partition_key]
+
+    # --- Ricerca ---
+
+    def nearest(self, invoice_type: str, target_cents: int, anagraphics_id: Optional[int] = None,
+                limit: int = 50, min_cents: Optional[int] = None, max_cents: Optional[int] = None,
+                positive_only: bool = False) -> List[Tuple[int, int]]:
+        """
+        Fatture aperte col residuo assoluto più vicino a target_cents, dalla più vicina.
+        min_cents/max_cents limitano il residuo assoluto (estremi inclusi), positive_only
+        esclude le fatture con residuo negativo. Ritorna [(invoice_id, residuo_con_segno_centesimi)].
+        """
+        with self._lock:
+            partition = self._partitions.get((invoice_type, anagraphics_id))
+            if not partition or limit <= 0:
+                return []
+            lo = bisect_left(partition, (min_cents,)) if min_cents is not None else 0
+            hi = bisect_right(partition, (max_cents, float('inf'))) if max_cents is not None else len(partition)
+            pos = min(max(bisect_left(partition, (target_cents,)), lo), hi)
+            left, right = pos - 1, pos
+            results = []
+            while len(results) < limit and (left >= lo or right < hi):
+                take_left = right >= hi or (left >= lo and
+                                            target_cents - partition[left][0] <= partition[right][0] - target_cents)
+                if take_left:
+                    invoice_id = partition[left][1]
+                    left -= 1
+                else:
+                    invoice_id = partition[right][1]
+                    right += 1
+                residual_cents = self._entries[invoice_id][2]
+                if positive_only and residual_cents < 0:
+                    continue
+                results.append((invoice_id, residual_cents))
+            return results
+
+
+def ensure_invoice_residual_log(conn: sqlite3.Connection) -> None:
+    """
+    Crea InvoiceResidualLog e i trigger che vi registrano le fatture inserite, cancellate
+    o con tipo/anagrafica/importi/stato modificati. Non esegue commit.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS InvoiceResidualLog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id INTEGER NOT NULL
+        );""")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_invoice_residual_ai AFTER INSERT ON Invoices
+        BEGIN
+            INSERT INTO InvoiceResidualLog (invoice_id) VALUES (new.id);
+        END;""")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_invoice_residual_au
+        AFTER UPDATE OF type, anagraphics_id, total_amount, paid_amount, payment_status ON Invoices
+        WHEN old.type IS NOT new.type OR old.anagraphics_id IS NOT new.anagraphics_id
+          OR old.total_amount IS NOT new.total_amount OR old.paid_amount IS NOT new.paid_amount
+          OR old.payment_status IS NOT new.payment_status
+        BEGIN
+            INSERT INTO InvoiceResidualLog (invoice_id) VALUES (new.id);
+        END;""")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_invoice_residual_ad AFTER DELETE ON Invoices
+        BEGIN
+            INSERT INTO InvoiceResidualLog (invoice_id) VALUES (old.id);
+        END;""")
+
+
+def prune_invoice_residual_log(conn: sqlite3.Connection, retention: int = LOG_RETENTION) -> int:
+    """Elimina le righe di log più vecchie delle ultime `retention`. Non esegue commit."""
+    cursor = conn.execute("DELETE FROM InvoiceResidualLog WHERE seq <= (SELECT MAX(seq) FROM InvoiceResidualLog) - ?",
+                          (retention,))
+    return cursor.rowcount
+
+
+def get_invoice_residual_index(conn: sqlite3.Connection) -> InvoiceResidualIndex:
+    """
+    Indice del DB della connessione, allineato prima di restituirlo. Un indice per file
+    di database; per connessioni con transazione aperta (modifiche non ancora confermate)
+    la vista privata di InvoiceResidualIndex.overlay, per DB in memoria un indice nuovo.
+    """
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not db_file:
+        index = InvoiceResidualIndex()
+        index.sync(conn)
+        return index
+    with _indexes_lock:
+        index = _indexes.get(db_file)
+        if index is None:
+            index = _indexes[db_file] = InvoiceResidualIndex()
+    if conn.in_transaction:
+        view = index.overlay(conn)
+        if view is None:
+            # Indice condiviso mai costruito: non lo si costruisce su dati non confermati
+            view = InvoiceResidualIndex()
+            view.sync(conn)
+        return view
+    index.sync(conn)
+    if index._log_rows > 2 * LOG_RETENTION:
+        try:
+            pruned = prune_invoice_residual_log(conn, LOG_RETENTION)
+            conn.commit()
+            index._log_rows -= pruned
+            logger.debug(f"InvoiceResidualLog potato: {pruned} righe eliminate")
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.warning(f"Potatura InvoiceResidualLog non riuscita: {e}")
+    return index
+
+
+def clear_invoice_residual_indexes() -> None:
+    """Scarta gli indici in memoria (ricostruiti al prossimo uso)."""
+    with _indexes_lock:
+        _indexes.clear()
+
+
+__all__ = [
+    'InvoiceResidualIndex',
+    'OPEN_PAYMENT_STATUSES',
+    'LOG_RETENTION',
+    'ensure_invoice_residual_log',
+    'prune_invoice_residual_log',
+    'get_invoice_residual_index',
+    'clear_invoice_residual_indexes',
+]
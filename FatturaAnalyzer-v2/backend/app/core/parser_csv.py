@@ -1,9 +1,13 @@
 import pandas as pd
+import numpy as np
 import io
+import os
 import logging
+import hashlib
 import chardet
 import re
-from .utils import calculate_transaction_hash, to_decimal, quantize # Assicurati che utils sia importato
+from functools import lru_cache
+from .utils import calculate_transaction_hash, calculate_transaction_hashes, to_decimal, quantize # Assicurati che utils sia importato
 
 logger = logging.getLogger(__name__)
 
@@ -75,146 +79,447 @@ def find_column_names(df_columns):
          return None
     return column_mapping
 
-# ### FUNZIONE parse_bank_csv (INVARIATO rispetto all'ultima versione - low_memory era già stato rimosso) ###
-def parse_bank_csv(csv_filepath_or_stringio):
-    # ... (Tutto il codice di questa funzione rimane come nella risposta precedente,
-    #      assicurandosi che 'low_memory=False' sia stato rimosso dalla chiamata a pd.read_csv)
+# --- Percorso veloce: un solo sniff di encoding/delimitatore, engine C, importi in centesimi vettoriali ---
+CSV_FAST_PATH = os.getenv('CSV_FAST_PATH', '1') != '0'
+# Righe per blocco nell'import in streaming (iter_bank_csv_chunks)
+CSV_STREAM_CHUNK_ROWS = int(os.getenv('CSV_STREAM_CHUNK_ROWS', '50000'))
+_CSV_SNIFF_BYTES = 64 * 1024
+_CSV_DELIMITERS = [';', ',', '\t']  # Stesso ordine di prova del percorso tradizionale
+# Righe iniziali in cui cercare l'intestazione (alcune banche esportano righe di preambolo)
+_CSV_HEADER_SCAN_LINES = 20
+# Separatori degli importi del percorso tradizionale (decimal=',', thousands='.'), default dei profili rilevati
+_DEFAULT_DECIMAL_SEPARATOR = ','
+_DEFAULT_THOUSANDS_SEPARATOR = '.'
+# Colonne che il percorso tradizionale convertirebbe in numero (es. date '01.02.2024' lette come 1022024)
+_NUMERIC_LIKE_RE = re.compile(r'[+-]?\d[\d.]*(?:,\d*)?')
+
+
+class _FastPathUnavailable(Exception):
+    """Il file esce dai formati del percorso veloce: si usa il parsing tradizionale."""
+
+
+@lru_cache(maxsize=None)
+def _fast_amount_invalid_line_re(decimal_sep, thousands_sep):
+    """
+    Regex (multiriga) delle righe che non sono un importo nel formato dei separatori dati.
+    Con i default ',' e '.' accetta solo importi non ambigui tra lettura numerica del percorso
+    tradizionale (decimal=',', thousands='.') e to_decimal su stringa.
+    """
+    decimal = re.escape(decimal_sep)
+    amount = rf'\d+(?:{decimal}\d{{1,2}})?'
+    if thousands_sep:
+        amount += rf'|\d{{1,3}}(?:{re.escape(thousands_sep)}\d{{3}})+{decimal}\d{{1,2}}'
+    return re.compile(rf'^(?![+-]?(?:{amount})$|$).*$', re.MULTILINE)
+
+
+def _read_sample(csv_source):
+    """Primi _CSV_SNIFF_BYTES del file/stream (bytes, o str per StringIO) senza spostare la posizione."""
+    if isinstance(csv_source, str):
+        with open(csv_source, 'rb') as f:
+            return f.read(_CSV_SNIFF_BYTES)
+    original_pos = csv_source.tell()
+    csv_source.seek(0)
+    sample = csv_source.read(_CSV_SNIFF_BYTES)
+    csv_source.seek(original_pos)
+    return sample
+
+
+def _locate_header(sample):
+    """
+    Intestazione del CSV: la prima tra le prime _CSV_HEADER_SCAN_LINES righe divisa da un delimitatore
+    noto in almeno 3 colonne (le righe precedenti sono preambolo o vuote). Lavora sul campione grezzo
+    (bytes) senza decodificarlo, o su testo. Ritorna (indice riga, riga, delimitatore) o None.
+    """
+    delimiters = [delim.encode('ascii') for delim in _CSV_DELIMITERS] if isinstance(sample, bytes) else _CSV_DELIMITERS
+    for index, line in enumerate(sample.splitlines()[:_CSV_HEADER_SCAN_LINES]):
+        for delim, delim_str in zip(delimiters, _CSV_DELIMITERS):
+            if line.count(delim) >= 2:
+                return index, line, delim_str
+    return None
+
+
+def _sniff_encoding(sample, csv_source):
+    """UTF-8 se il campione è UTF-8 valido (utf-8-sig con BOM), altrimenti chardet; None per stream testuali."""
+    if not isinstance(sample, bytes):
+        return None
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as utf_err:
+        if utf_err.start < len(sample) - 3:  # Non è solo un carattere multibyte troncato dal campione
+            return (detect_encoding(csv_source) or 'latin-1').lower()
+    return 'utf-8-sig' if sample.startswith(b'\xef\xbb\xbf') else 'utf-8'
+
+
+def _sample_decodes(sample, encoding):
+    """Il campione si decodifica con encoding (tollerando un carattere multibyte troncato in coda)."""
+    if not isinstance(sample, bytes) or encoding is None:
+        return not isinstance(sample, bytes) and encoding is None
+    try:
+        sample.decode(encoding)
+    except UnicodeDecodeError as decode_err:
+        return decode_err.start >= len(sample) - 3
+    except LookupError:
+        return False
+    return True
+
+
+def sniff_csv_format(csv_source):
+    """
+    Rileva una sola volta encoding e delimitatore da un campione del file.
+    Encoding: UTF-8 se il campione è UTF-8 valido, altrimenti chardet (None per stream testuali).
+    Delimitatore: il primo tra ';', ',', TAB che divide l'intestazione in almeno 3 colonne.
+    Ritorna (encoding, delimitatore) o solleva _FastPathUnavailable.
+    """
+    sample = _read_sample(csv_source)
+    if not sample.strip():
+        raise _FastPathUnavailable("campione vuoto")
+    located = _locate_header(sample)
+    if located is None:
+        raise _FastPathUnavailable("delimitatore non riconosciuto")
+    return _sniff_encoding(sample, csv_source), located[2]
+
+
+def _header_fingerprint(header_row, header_line):
+    """Impronta BLAKE2b (128 bit) della riga d'intestazione grezza e della sua posizione."""
+    if not isinstance(header_line, bytes):
+        header_line = header_line.encode('utf-8')
+    return hashlib.blake2b(b'%d\n%s' % (header_row, header_line.strip()), digest_size=16).hexdigest()
+
+
+def resolve_bank_csv_profile(csv_source, profiles=None):
+    """
+    Profilo di formato dell'estratto conto: dict con fingerprint, encoding, delimiter,
+    decimal_separator, thousands_separator, header_row e column_mapping (nome standard -> colonna).
+    Se l'impronta dell'intestazione è tra i profiles noti (es. database.get_bank_csv_profiles) e il
+    campione si decodifica con il suo encoding, il profilo è riusato senza alcun rilevamento;
+    altrimenti encoding, delimitatore e mappatura colonne sono rilevati come nel percorso veloce.
+    Ritorna (profilo, trovato_in_profiles); (None, False) se il formato non è riconosciuto
+    o il percorso veloce è disattivato (CSV_FAST_PATH): il parsing usa allora il percorso tradizionale.
+    """
+    if not CSV_FAST_PATH:
+        return None, False
+    return _detect_bank_csv_profile(csv_source, profiles)
+
+
+def _detect_bank_csv_profile(csv_source, profiles=None):
+    """resolve_bank_csv_profile indipendente da CSV_FAST_PATH (l'import a blocchi usa sempre l'engine C)."""
+    try:
+        sample = _read_sample(csv_source)
+        located = _locate_header(sample)
+        if located is None:
+            return None, False
+        header_row, header_line, delimiter = located
+        fingerprint = _header_fingerprint(header_row, header_line)
+        known = (profiles or {}).get(fingerprint)
+        if known is not None and _sample_decodes(sample, known['encoding']):
+            return known, True
+
+        encoding = _sniff_encoding(sample, csv_source)
+        columns = _read_csv_fast(csv_source, encoding, delimiter, header_row=header_row, nrows=0).columns
+    except (OSError, ValueError, LookupError, pd.errors.ParserError) as detect_err:
+        logger.info(f"Rilevamento formato CSV non riuscito ({detect_err}).")
+        return None, False
+    column_mapping = find_column_names(columns)
+    if column_mapping is None:
+        return None, False
+    return {
+        'fingerprint': fingerprint, 'encoding': encoding, 'delimiter': delimiter,
+        'decimal_separator': _DEFAULT_DECIMAL_SEPARATOR, 'thousands_separator': _DEFAULT_THOUSANDS_SEPARATOR,
+        'header_row': header_row, 'column_mapping': column_mapping,
+    }, False
+
+
+def _read_csv_fast(csv_source, encoding, delimiter, chunksize=None, header_row=0, nrows=None):
+    """
+    Lettura con engine C, tutte le colonne come stringhe (conversioni fatte dopo, in blocco),
+    saltando le header_row righe di preambolo. Con chunksize ritorna un lettore a blocchi.
+    """
+    if hasattr(csv_source, 'seek'):
+        csv_source.seek(0)
+    return pd.read_csv(
+        csv_source,
+        delimiter=delimiter,
+        dtype=str,
+        skipinitialspace=True,
+        on_bad_lines='warn',
+        encoding=encoding,
+        engine='c',
+        skip_blank_lines=True,
+        skiprows=header_row or None,
+        nrows=nrows,
+        chunksize=chunksize
+    )
+
+
+def _check_fast_columns(df, column_mapping):
+    """Rifiuta i file in cui il percorso tradizionale tratterebbe date o descrizioni come numeri."""
+    for standard_name in ('DataContabile', 'DataValuta', 'Descrizione'):
+        column = column_mapping.get(standard_name)
+        if column is None:
+            continue
+        values = df[column].dropna().tolist()
+        # Basta un valore non numerico (di solito il primo) perché la colonna resti testuale
+        if values and all(_NUMERIC_LIKE_RE.fullmatch(value.strip()) for value in values):
+            raise _FastPathUnavailable(f"colonna '{column}' interpretabile come numerica")
+
+
+def _amount_cents_fast(values, decimal_sep=_DEFAULT_DECIMAL_SEPARATOR, thousands_sep=_DEFAULT_THOUSANDS_SEPARATOR):
+    """
+    Importi di una colonna Dare/Avere ('1.234,56', '-12,5', vuoto = 0; separatori del profilo) in centesimi int64.
+    Validazione e conversione lavorano sulla colonna unita in un'unica stringa (regex e parsing in C).
+    Solleva _FastPathUnavailable se un valore è in un formato ambiguo o non numerico.
+    """
+    joined = '\n'.join(values.fillna('').astype(str).str.strip().tolist())
+    if _fast_amount_invalid_line_re(decimal_sep, thousands_sep).search(joined):
+        raise _FastPathUnavailable(f"importi fuori formato nella colonna '{values.name}'")
+    if thousands_sep:
+        joined = joined.replace(thousands_sep, '')
+    numbers = pd.to_numeric(pd.Series(joined.replace(decimal_sep, '.').split('\n')), errors='coerce')
+    if len(numbers) != len(values):  # A capo dentro un campo tra virgolette
+        raise _FastPathUnavailable(f"importi su più righe nella colonna '{values.name}'")
+    # Al massimo due decimali: l'arrotondamento di x*100 all'intero è esatto
+    return np.rint(numbers.fillna(0).to_numpy(dtype=np.float64) * 100).astype(np.int64)
+
+
+def _parse_dates(values, fast):
+    """Date gg/mm/aaaa come il percorso tradizionale; nel percorso veloce ogni data distinta è parsata una volta."""
+    if not fast:
+        return pd.to_datetime(values, dayfirst=True, errors='coerce')
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), dayfirst=True, errors='coerce').to_numpy()
+    parsed = np.append(parsed, np.datetime64('NaT', 'ns'))  # codice -1 (valore mancante) -> NaT
+    return pd.Series(parsed[codes], index=values.index)
+
+
+def _read_csv_legacy(csv_filepath_or_stringio, source_name):
+    """Percorso tradizionale: prova combinazioni encoding/delimitatore con engine python."""
     df = None
-    used_encoding = None
     file_obj = None
-    source_name = csv_filepath_or_stringio if isinstance(csv_filepath_or_stringio, str) else "StringIO"
+    detected_encoding = detect_encoding(csv_filepath_or_stringio)
+    encodings_to_try = [detected_encoding] if detected_encoding else []
+    encodings_to_try.extend(['utf-8', 'latin-1', 'cp1252'])
+    encodings_to_try = [enc.lower() for enc in list(dict.fromkeys(encodings_to_try)) if enc]
 
-    try:
-        detected_encoding = detect_encoding(csv_filepath_or_stringio)
-        encodings_to_try = [detected_encoding] if detected_encoding else []
-        encodings_to_try.extend(['utf-8', 'latin-1', 'cp1252'])
-        encodings_to_try = [enc.lower() for enc in list(dict.fromkeys(encodings_to_try)) if enc]
-
-        logger.info(f"Tentativo lettura CSV '{source_name}' con encodings: {encodings_to_try}")
-        common_delimiters = [';', ',', '\t']
-
-        for enc in encodings_to_try:
-            for delim in common_delimiters:
-                try:
-                    logger.debug(f"Provo a leggere CSV con encoding='{enc}', delimiter='{delim}'")
-                    if isinstance(csv_filepath_or_stringio, str):
-                        file_obj = open(csv_filepath_or_stringio, 'r', encoding=enc, errors='replace')
-                    elif hasattr(csv_filepath_or_stringio, 'seek'):
-                        csv_filepath_or_stringio.seek(0)
-                        file_obj = csv_filepath_or_stringio
-                    else:
-                        raise TypeError("Input deve essere un percorso file (str) o uno stream leggibile.")
-
-                    df = pd.read_csv(
-                        file_obj,
-                        delimiter=delim,
-                        decimal=',',
-                        thousands='.',
-                        parse_dates=False,
-                        skipinitialspace=True,
-                        on_bad_lines='warn',
-                        encoding=enc,
-                        # low_memory=False,  # Assicurati sia Rimosso/Commentato
-                        engine='python',
-                        skip_blank_lines=True
-                    )
-                    used_encoding = enc
-                    logger.info(f"CSV '{source_name}' letto con successo usando encoding='{enc}' e delimiter='{delim}'.")
-
-                    if df.shape[1] < 3:
-                         logger.warning(f"CSV letto con {enc}/{delim} ha solo {df.shape[1]} colonne. Provo prossima combinazione.")
-                         df = None; continue
-                    break
-                except (UnicodeDecodeError, pd.errors.ParserError) as e:
-                    logger.warning(f"Errore lettura/parsing ({enc}/{delim}): {e}")
-                    df = None
-                except Exception as read_e:
-                    logger.error(f"Errore imprevisto lettura CSV '{source_name}' ({enc}/{delim}): {read_e}", exc_info=True)
-                    df = None
-                    if isinstance(read_e, FileNotFoundError): raise read_e
-                finally:
-                    if isinstance(csv_filepath_or_stringio, str) and 'file_obj' in locals() and file_obj and not file_obj.closed:
-                        try: file_obj.close()
-                        except Exception: pass
-            if df is not None: break
+    logger.info(f"Tentativo lettura CSV '{source_name}' con encodings: {encodings_to_try}")
+    common_delimiters = _CSV_DELIMITERS
 
-        if df is None:
-            logger.error(f"Impossibile leggere o parsare CSV '{source_name}'."); return None
+    for enc in encodings_to_try:
+        for delim in common_delimiters:
+            try:
+                logger.debug(f"Provo a leggere CSV con encoding='{enc}', delimiter='{delim}'")
+                if isinstance(csv_filepath_or_stringio, str):
+                    file_obj = open(csv_filepath_or_stringio, 'r', encoding=enc, errors='replace')
+                elif hasattr(csv_filepath_or_stringio, 'seek'):
+                    csv_filepath_or_stringio.seek(0)
+                    file_obj = csv_filepath_or_stringio
+                else:
+                    raise TypeError("Input deve essere un percorso file (str) o uno stream leggibile.")
 
-        initial_rows = len(df)
-        logger.info(f"CSV letto ({initial_rows} righe). Mappatura e pulizia...")
+                df = pd.read_csv(
+                    file_obj,
+                    delimiter=delim,
+                    decimal=',',
+                    thousands='.',
+                    parse_dates=False,
+                    skipinitialspace=True,
+                    on_bad_lines='warn',
+                    encoding=enc,
+                    engine='python',
+                    skip_blank_lines=True
+                )
+                logger.info(f"CSV '{source_name}' letto con successo usando encoding='{enc}' e delimiter='{delim}'.")
+
+                if df.shape[1] < 3:
+                     logger.warning(f"CSV letto con {enc}/{delim} ha solo {df.shape[1]} colonne. Provo prossima combinazione.")
+                     df = None; continue
+                break
+            except (UnicodeDecodeError, pd.errors.ParserError) as e:
+                logger.warning(f"Errore lettura/parsing ({enc}/{delim}): {e}")
+                df = None
+            except Exception as read_e:
+                logger.error(f"Errore imprevisto lettura CSV '{source_name}' ({enc}/{delim}): {read_e}", exc_info=True)
+                df = None
+                if isinstance(read_e, FileNotFoundError): raise read_e
+            finally:
+                if isinstance(csv_filepath_or_stringio, str) and file_obj and not file_obj.closed:
+                    try: file_obj.close()
+                    except Exception: pass
+        if df is not None: break
+    return df
 
-        column_mapping = find_column_names(df.columns)
-        if column_mapping is None: logger.error(f"Mappatura fallita per '{source_name}'."); return None
 
-        df.rename(columns={v: k for k, v in column_mapping.items()}, inplace=True)
-        standard_cols_present = list(column_mapping.keys())
-        df = df[standard_cols_present].copy()
-
-        if 'DataContabile' in df.columns:
-             df['DataContabileParsed'] = pd.to_datetime(df['DataContabile'], dayfirst=True, errors='coerce')
-             original_rows_date = len(df)
-             df = df[df['DataContabileParsed'].notna()].copy()
-             rows_after_date_filter = len(df)
-             if original_rows_date > rows_after_date_filter: logger.warning(f"Rimosse {original_rows_date - rows_after_date_filter} righe con DataContabile non valida.")
-             df = df[~df['DataContabile'].astype(str).str.lower().str.fullmatch(r'(?:data|date)')] # Usa fullmatch per evitare match parziali
-             df['DataContabile'] = df['DataContabileParsed']
-             df.drop(columns=['DataContabileParsed'], inplace=True)
-        else: logger.error("Colonna 'DataContabile' mancante."); return None
-
-        filter_keywords = ['Saldo iniziale', 'Saldo contabile', 'Saldo liquido', 'Disponibilità al',
-                           'Giroconto', 'Canone mensile', 'Imposta di bollo', 'Competenze']
-        if 'Descrizione' in df.columns:
-            desc_col = 'Descrizione'
-            df[desc_col] = df[desc_col].astype(str).str.strip()
-            # Filtra per keyword O righe con solo 'EUR' O vuote
-            extended_filter_pattern = f"({'|'.join(filter_keywords)})|^\\s*EUR\\s*$|^\\s*$"
-            original_rows = len(df)
+def _clean_bank_dataframe(df, column_mapping, source_name, fast, separators=None):
+    """
+    Mappatura colonne, filtri righe non operative, importi, date e hash.
+    Con fast=True importi in centesimi e hash calcolati in blocco (stesso risultato del percorso tradizionale),
+    con i separatori (decimale, migliaia) del profilo se indicati.
+    """
+    initial_rows = len(df)
+    df = df.rename(columns={v: k for k, v in column_mapping.items()})
+    standard_cols_present = list(column_mapping.keys())
+    df = df[standard_cols_present].copy()
+
+    if 'DataContabile' in df.columns:
+         df['DataContabileParsed'] = _parse_dates(df['DataContabile'], fast)
+         original_rows_date = len(df)
+         df = df[df['DataContabileParsed'].notna()].copy()
+         rows_after_date_filter = len(df)
+         if original_rows_date > rows_after_date_filter: logger.warning(f"Rimosse {original_rows_date - rows_after_date_filter} righe con DataContabile non valida.")
+         df = df[~df['DataContabile'].astype(str).str.lower().str.fullmatch(r'(?:data|date)')] # Usa fullmatch per evitare match parziali
+         df['DataContabile'] = df['DataContabileParsed']
+         df.drop(columns=['DataContabileParsed'], inplace=True)
+    else: logger.error("Colonna 'DataContabile' mancante."); return None
+
+    filter_keywords = ['Saldo iniziale', 'Saldo contabile', 'Saldo liquido', 'Disponibilità al',
+                       'Giroconto', 'Canone mensile', 'Imposta di bollo', 'Competenze']
+    if 'Descrizione' in df.columns:
+        desc_col = 'Descrizione'
+        df[desc_col] = df[desc_col].astype(str).str.strip()
+        # Filtra per keyword O righe con solo 'EUR' O vuote
+        extended_filter_pattern = f"({'|'.join(filter_keywords)})|^\\s*EUR\\s*$|^\\s*$"
+        original_rows = len(df)
+        if fast:  # Filtro valutato una volta per descrizione distinta
+            desc_codes, desc_uniques = pd.factorize(df[desc_col])
+            filtered = pd.Series(desc_uniques, dtype=object).str.contains(extended_filter_pattern, na=False, case=False, regex=True)
+            df = df[~filtered.to_numpy()[desc_codes]].copy()
+        else:
             df = df[~df[desc_col].str.contains(extended_filter_pattern, na=False, case=False, regex=True)].copy()
-            rows_after_filter = len(df)
-            if original_rows > rows_after_filter: logger.info(f"Filtrate {original_rows - rows_after_filter} righe non operative.")
-        else: logger.warning("Colonna 'Descrizione' non trovata. Impossibile filtrare.")
+        rows_after_filter = len(df)
+        if original_rows > rows_after_filter: logger.info(f"Filtrate {original_rows - rows_after_filter} righe non operative.")
+    else: logger.warning("Colonna 'Descrizione' non trovata. Impossibile filtrare.")
 
-        if 'ImportoDare' not in df.columns: df['ImportoDare'] = 0.0
-        if 'ImportoAvere' not in df.columns: df['ImportoAvere'] = 0.0
+    if 'ImportoDare' not in df.columns: df['ImportoDare'] = 0.0
+    if 'ImportoAvere' not in df.columns: df['ImportoAvere'] = 0.0
+    if fast:
+        separators = separators or (_DEFAULT_DECIMAL_SEPARATOR, _DEFAULT_THOUSANDS_SEPARATOR)
+        amount_cents = _amount_cents_fast(df['ImportoAvere'], *separators) - _amount_cents_fast(df['ImportoDare'], *separators)
+        df['Importo'] = amount_cents / 100
+    else:
         df['ImportoDareDec'] = df['ImportoDare'].apply(lambda x: to_decimal(x, default='0.0'))
         df['ImportoAvereDec'] = df['ImportoAvere'].apply(lambda x: to_decimal(x, default='0.0'))
         df['amount_dec'] = (df['ImportoAvereDec'] - df['ImportoDareDec']).apply(quantize)
         df['Importo'] = df['amount_dec'].astype(float) # Converti in float per DB (o TEXT?)
 
-        if 'DataValuta' in df.columns: df['DataValuta'] = pd.to_datetime(df['DataValuta'], dayfirst=True, errors='coerce')
-        else: df['DataValuta'] = pd.NaT
-        if 'CausaleABI' in df.columns: df['CausaleABI'] = pd.to_numeric(df['CausaleABI'].astype(str).str.strip(), errors='coerce').astype('Int64')
-        else: df['CausaleABI'] = pd.NA
-        if 'Descrizione' not in df.columns: df['Descrizione'] = ''
+    if 'DataValuta' in df.columns: df['DataValuta'] = _parse_dates(df['DataValuta'], fast)
+    else: df['DataValuta'] = pd.NaT
+    if 'CausaleABI' in df.columns: df['CausaleABI'] = pd.to_numeric(df['CausaleABI'].astype(str).str.strip(), errors='coerce').astype('Int64')
+    else: df['CausaleABI'] = pd.NA
+    if 'Descrizione' not in df.columns: df['Descrizione'] = ''
 
+    if fast:
+        df['unique_hash'] = calculate_transaction_hashes(df['DataContabile'], amount_cents, df['Descrizione'])
+    else:
         # Rimuovi eventuali righe dove l'importo non è valido (risulta NaN dopo to_decimal)
         rows_before_nan_drop = len(df)
         df.dropna(subset=['amount_dec'], inplace=True)
         if len(df) < rows_before_nan_drop:
              logger.warning(f"Rimosse {rows_before_nan_drop - len(df)} righe con importo non valido (NaN).")
 
-
         df['unique_hash'] = df.apply(lambda row: calculate_transaction_hash(
             row['DataContabile'], row['amount_dec'], row['Descrizione']
         ), axis=1)
 
-        final_columns = ['DataContabile', 'DataValuta', 'Importo', 'Descrizione', 'CausaleABI', 'unique_hash']
-        cols_to_select = [col for col in final_columns if col in df.columns]
-        df_final = df[cols_to_select].copy()
+    final_columns = ['DataContabile', 'DataValuta', 'Importo', 'Descrizione', 'CausaleABI', 'unique_hash']
+    cols_to_select = [col for col in final_columns if col in df.columns]
+    df_final = df[cols_to_select].copy()
+
+    final_rows = len(df_final)
+    logger.info(f"Parsing CSV '{source_name}' completato: {initial_rows} righe -> {final_rows} movimenti.")
+    if initial_rows > 0 and final_rows == 0: logger.warning(f"Nessuna riga valida trovata dopo pulizia CSV '{source_name}'.")
+    elif initial_rows > 0 and final_rows < initial_rows * 0.7: logger.warning(f"Oltre 30% righe scartate ({initial_rows - final_rows}) pulizia CSV '{source_name}'.")
+    return df_final
 
-        final_rows = len(df_final)
-        logger.info(f"Parsing CSV '{source_name}' completato: {initial_rows} righe -> {final_rows} movimenti.")
-        if initial_rows > 0 and final_rows == 0: logger.warning(f"Nessuna riga valida trovata dopo pulizia CSV '{source_name}'.")
-        elif initial_rows > 0 and final_rows < initial_rows * 0.7: logger.warning(f"Oltre 30% righe scartate ({initial_rows - final_rows}) pulizia CSV '{source_name}'.")
 
-        return df_final
+def _profile_separators(profile):
+    return profile['decimal_separator'], profile['thousands_separator']
+
+
+def _parse_bank_csv_fast(csv_source, source_name, profile=None):
+    """
+    Percorso veloce con il profilo di formato (rilevato qui se non indicato); solleva
+    _FastPathUnavailable se il file va letto con il percorso tradizionale.
+    """
+    if profile is None:
+        profile = resolve_bank_csv_profile(csv_source)[0]
+        if profile is None:
+            raise _FastPathUnavailable("formato non riconosciuto")
+    encoding, delimiter = profile['encoding'], profile['delimiter']
+    try:
+        df = _read_csv_fast(csv_source, encoding, delimiter, header_row=profile['header_row'])
+    except (UnicodeDecodeError, pd.errors.ParserError) as read_err:
+        raise _FastPathUnavailable(f"lettura engine C fallita ({read_err})") from read_err
+    logger.info(f"CSV '{source_name}' letto (percorso veloce) con encoding='{encoding}', delimiter='{delimiter}': {len(df)} righe.")
+    column_mapping = profile['column_mapping']
+    missing = [column for column in column_mapping.values() if column not in df.columns]
+    if missing:
+        raise _FastPathUnavailable(f"colonne del profilo assenti: {missing}")
+    _check_fast_columns(df, column_mapping)
+    return _clean_bank_dataframe(df, column_mapping, source_name, fast=True, separators=_profile_separators(profile))
+
+
+def parse_bank_csv(csv_filepath_or_stringio, profile=None):
+    """
+    Legge un estratto conto CSV e ritorna il DataFrame normalizzato dei movimenti
+    (DataContabile, DataValuta, Importo, Descrizione, CausaleABI, unique_hash).
+    Prima prova il percorso veloce (CSV_FAST_PATH): engine C con encoding, delimitatore, riga
+    d'intestazione e mappatura colonne del profilo (da resolve_bank_csv_profile, rilevato qui se
+    non indicato), importi Dare/Avere in centesimi e hash calcolati in blocco. Per i file fuori
+    dai formati riconosciuti ripiega sul percorso tradizionale, che dà lo stesso risultato.
+    """
+    source_name = csv_filepath_or_stringio if isinstance(csv_filepath_or_stringio, str) else "StringIO"
+
+    try:
+        if CSV_FAST_PATH:
+            try:
+                return _parse_bank_csv_fast(csv_filepath_or_stringio, source_name, profile)
+            except _FastPathUnavailable as fallback_reason:
+                logger.info(f"CSV '{source_name}': percorso veloce non applicabile ({fallback_reason}), uso il parsing tradizionale.")
+
+        df = _read_csv_legacy(csv_filepath_or_stringio, source_name)
+        if df is None:
+            logger.error(f"Impossibile leggere o parsare CSV '{source_name}'."); return None
+
+        logger.info(f"CSV letto ({len(df)} righe). Mappatura e pulizia...")
+        column_mapping = find_column_names(df.columns)
+        if column_mapping is None: logger.error(f"Mappatura fallita per '{source_name}'."); return None
+        return _clean_bank_dataframe(df, column_mapping, source_name, fast=False)
 
     except FileNotFoundError: logger.error(f"File CSV non trovato: {csv_filepath_or_stringio}"); return None
     except pd.errors.EmptyDataError: logger.warning(f"CSV '{source_name}' vuoto."); return pd.DataFrame()
     except KeyError as ke: logger.error(f"Colonna essenziale '{ke}' mancante in CSV '{source_name}'.", exc_info=True); return None
     except Exception as e: logger.error(f"Errore generico parsing CSV '{source_name}': {e}", exc_info=True); return None
-    finally:
-        if isinstance(csv_filepath_or_stringio, str) and 'file_obj' in locals() and file_obj and hasattr(file_obj, 'closed') and not file_obj.closed:
-            try: file_obj.close()
-            except Exception: pass
\ No newline at end of file
+
+
+def iter_bank_csv_chunks(csv_source, chunk_rows=None, profile=None):
+    """
+    Lettura in streaming di un estratto conto: genera DataFrame normalizzati (stesse colonne di
+    parse_bank_csv) di al più chunk_rows righe lette (default CSV_STREAM_CHUNK_ROWS), con memoria
+    indipendente dalla dimensione del file. Encoding, delimitatore, riga d'intestazione e mappatura
+    colonne vengono dal profilo (rilevato una volta sola se non indicato); ogni blocco usa il percorso
+    veloce e, se ha importi fuori formato, la conversione tradizionale con to_decimal.
+    Solleva ValueError se il formato non è riconosciuto.
+    """
+    source_name = csv_source if isinstance(csv_source, str) else getattr(csv_source, 'name', 'stream')
+    if profile is None:
+        profile = _detect_bank_csv_profile(csv_source)[0]
+        if profile is None:
+            raise ValueError(f"Formato CSV non riconosciuto per l'import a blocchi: '{source_name}'.")
+    column_mapping = profile['column_mapping']
+
+    first_chunk = True
+    with _read_csv_fast(csv_source, profile['encoding'], profile['delimiter'], header_row=profile['header_row'],
+                        chunksize=chunk_rows or CSV_STREAM_CHUNK_ROWS) as reader:
+        for chunk in reader:
+            if first_chunk:
+                missing = [column for column in column_mapping.values() if column not in chunk.columns]
+                if missing:
+                    raise ValueError(f"Colonne del profilo assenti in '{source_name}': {missing}")
+                first_chunk = False
+            try:
+                cleaned = _clean_bank_dataframe(chunk, column_mapping, source_name, fast=True,
+                                                separators=_profile_separators(profile))
+            except _FastPathUnavailable as chunk_reason:
+                logger.info(f"Blocco CSV '{source_name}' (righe da {chunk.index[0]}): {chunk_reason}, conversione tradizionale.")
+                cleaned = _clean_bank_dataframe(chunk, column_mapping, source_name, fast=False)
+            if cleaned is not None and not cleaned.empty:
+                yield cleaned
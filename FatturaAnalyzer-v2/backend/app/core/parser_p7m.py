@@ -6,6 +6,9 @@ import os
 import logging
 import re
 import shutil
+import base64
+import binascii
+from collections import namedtuple
 from lxml import etree
 import sys
 
@@ -145,6 +148,155 @@ def _validate_extracted_xml(xml_path, base_name):
         logger.error(f"Errore validazione XML estratto da {base_name}: {validate_err}")
         return False
 
+# --- Estrazione nativa CMS/PKCS#7 (SignedData) senza processi esterni ---
+# OID 1.2.840.113549.1.7.2 (signedData) codificato DER, senza tag/lunghezza
+_OID_SIGNED_DATA = bytes.fromhex('2a864886f70d010702')
+# Buste annidate (fattura firmata più volte) oltre questo livello sono considerate corrotte
+_MAX_P7M_NESTING = 4
+_BASE64_STRIP_RE = re.compile(rb'-----(BEGIN|END)[^-]*-----|\s+')
+
+_Tlv = namedtuple('_Tlv', 'cls constructed tag start end next')
+
+
+def _read_tlv(buf, pos, limit):
+    """
+    Legge un elemento BER/DER a partire da pos.
+    Ritorna _Tlv con inizio/fine del contenuto e posizione dell'elemento successivo
+    (per lunghezza indefinita la fine è il marcatore 00 00, individuato leggendo i figli).
+    """
+    if pos + 2 > limit:
+        raise ValueError("Elemento ASN.1 troncato")
+    first = buf[pos]; pos += 1
+    tag = first & 0x1F
+    if tag == 0x1F:  # tag a più byte
+        tag = 0
+        while True:
+            if pos >= limit:
+                raise ValueError("Tag ASN.1 troncato")
+            byte = buf[pos]; pos += 1
+            tag = (tag << 7) | (byte & 0x7F)
+            if not byte & 0x80:
+                break
+    cls = first >> 6
+    constructed = bool(first & 0x20)
+
+    if pos >= limit:
+        raise ValueError("Lunghezza ASN.1 mancante")
+    length_byte = buf[pos]; pos += 1
+    if length_byte == 0x80:
+        if not constructed:
+            raise ValueError("Lunghezza indefinita su elemento primitivo")
+        child_pos = pos
+        while buf[child_pos:child_pos + 2] != b'\x00\x00':
+            child_pos = _read_tlv(buf, child_pos, limit).next
+        return _Tlv(cls, constructed, tag, pos, child_pos, child_pos + 2)
+    if length_byte & 0x80:
+        num_bytes = length_byte & 0x7F
+        if num_bytes > 8 or pos + num_bytes > limit:
+            raise ValueError("Lunghezza ASN.1 non valida")
+        length = int.from_bytes(buf[pos:pos + num_bytes], 'big'); pos += num_bytes
+    else:
+        length = length_byte
+    if pos + length > limit:
+        raise ValueError("Contenuto ASN.1 oltre la fine del buffer")
+    return _Tlv(cls, constructed, tag, pos, pos + length, pos + length)
+
+
+def _tlv_children(buf, parent):
+    """Itera gli elementi figli di un elemento costruito."""
+    pos = parent.start
+    while pos < parent.end:
+        child = _read_tlv(buf, pos, parent.end)
+        yield child
+        pos = child.next
+
+
+def _octet_string_value(buf, tlv):
+    """Valore di un OCTET STRING, concatenando i segmenti della forma costruita BER."""
+    if not tlv.constructed:
+        return bytes(buf[tlv.start:tlv.end])
+    return b''.join(_octet_string_value(buf, child) for child in _tlv_children(buf, tlv))
+
+
+def _next_child(children, expected_cls, expected_tag, what):
+    child = next(children, None)
+    if child is None or child.cls != expected_cls or child.tag != expected_tag:
+        raise ValueError(f"Struttura CMS inattesa: {what} mancante")
+    return child
+
+
+def _signed_data_content(buf):
+    """
+    Estrae eContent da ContentInfo{signedData, [0] SignedData{version, digestAlgorithms,
+    encapContentInfo{eContentType, [0] OCTET STRING}, ...}}. None se il contenuto è detached.
+    """
+    content_info = _read_tlv(buf, 0, len(buf))
+    if content_info.cls != 0 or content_info.tag != 16:
+        raise ValueError("ContentInfo non è una SEQUENCE")
+    ci_children = _tlv_children(buf, content_info)
+    content_type = _next_child(ci_children, 0, 6, "contentType")
+    if buf[content_type.start:content_type.end] != _OID_SIGNED_DATA:
+        raise ValueError("ContentInfo non è di tipo signedData")
+    explicit = _next_child(ci_children, 2, 0, "content [0]")
+    signed_data = _next_child(_tlv_children(buf, explicit), 0, 16, "SignedData")
+
+    sd_children = _tlv_children(buf, signed_data)
+    _next_child(sd_children, 0, 2, "version")
+    _next_child(sd_children, 0, 17, "digestAlgorithms")
+    encap = _next_child(sd_children, 0, 16, "encapContentInfo")
+
+    encap_children = _tlv_children(buf, encap)
+    _next_child(encap_children, 0, 6, "eContentType")
+    econtent_wrapper = next(encap_children, None)
+    if econtent_wrapper is None:
+        return None  # firma detached: nessun contenuto incorporato
+    if econtent_wrapper.cls != 2 or econtent_wrapper.tag != 0:
+        raise ValueError("eContent [0] non valido")
+    econtent = _next_child(_tlv_children(buf, econtent_wrapper), 0, 4, "eContent OCTET STRING")
+    return _octet_string_value(buf, econtent)
+
+
+def _decode_p7m_envelope(data):
+    """Ritorna i byte DER/BER della busta, decodificando se necessario PEM/base64."""
+    if data[:1] == b'\x30':
+        return data
+    try:
+        decoded = base64.b64decode(_BASE64_STRIP_RE.sub(b'', data), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return decoded if decoded[:1] == b'\x30' else None
+
+
+def _looks_like_xml(content):
+    stripped = content.lstrip(b'\xef\xbb\xbf \t\r\n')
+    return stripped[:1] == b'<'
+
+
+def extract_p7m_content(p7m_data):
+    """
+    Estrazione nativa in-process del contenuto XML di una busta CMS/PKCS#7 SignedData
+    (DER, BER a lunghezza indefinita, PEM o base64). Gestisce buste annidate
+    (file firmati più volte). Non verifica la firma, come 'openssl smime -noverify'.
+    Ritorna i byte XML o None se la struttura non è riconosciuta.
+    """
+    content = p7m_data
+    for _ in range(_MAX_P7M_NESTING):
+        envelope = _decode_p7m_envelope(content)
+        if envelope is None:
+            return None
+        try:
+            content = _signed_data_content(memoryview(envelope))
+        except (ValueError, IndexError) as asn1_err:
+            logger.debug(f"Parsing CMS nativo fallito: {asn1_err}")
+            return None
+        if not content:
+            return None
+        if _looks_like_xml(content):
+            return content
+    logger.debug("Parsing CMS nativo: troppi livelli di busta annidati")
+    return None
+
+
 def extract_xml_from_p7m_smime_robust(openssl_path, p7m_filepath, base_name):
     """
     Estrazione P7M più robusta con multiple strategie di estrazione.
@@ -338,21 +490,11 @@ def detect_p7m_structure(p7m_filepath):
         logger.warning(f"Errore analisi struttura P7M: {e}")
         return {'size': 0, 'pkcs7_structure': 'Unknown'}
 
-def extract_xml_from_p7m(p7m_filepath):
+def _extract_xml_from_p7m_external(p7m_filepath, base_name, structure_info):
     """
-    Funzione principale migliorata per estrazione XML da P7M.
-    Usa multiple strategie per massimizzare il successo.
+    Estrazione con OpenSSL (subprocess) e metodi alternativi: percorso di fallback
+    quando il parser CMS nativo non riconosce la busta. Ritorna il path di un file XML temporaneo.
     """
-    if not os.path.exists(p7m_filepath):
-        logger.error(f"File P7M non trovato: {p7m_filepath}")
-        return None
-    
-    base_name = os.path.basename(p7m_filepath)
-    logger.info(f"Inizio estrazione XML da P7M: {base_name}")
-    
-    # Analizza struttura file
-    structure_info = detect_p7m_structure(p7m_filepath)
-    
     # Trova OpenSSL
     openssl_path = find_openssl()
     
@@ -375,8 +517,6 @@ def extract_xml_from_p7m(p7m_filepath):
         extracted_path = try_external_libraries_extraction(p7m_filepath, base_name)
     
     if extracted_path:
-        logger.info(f"Estrazione XML completata con successo: {base_name} -> {extracted_path}")
-        
         # Log dimensioni per verifica
         try:
             xml_size = os.path.getsize(extracted_path)
@@ -384,7 +524,85 @@ def extract_xml_from_p7m(p7m_filepath):
             logger.debug(f"Dimensioni: P7M={p7m_size} bytes, XML estratto={xml_size} bytes")
         except:
             pass
-            
+    return extracted_path
+
+def extract_xml_bytes_from_p7m(p7m_source, source_name=None):
+    """
+    Estrae l'XML di una fattura firmata e lo ritorna come bytes, senza file temporanei
+    nel caso normale. p7m_source può essere un path o il contenuto (bytes) del file P7M.
+    Prima prova il parser CMS nativo; se fallisce ripiega su OpenSSL/metodi alternativi.
+    """
+    is_path = isinstance(p7m_source, (str, os.PathLike))
+    base_name = source_name or (os.path.basename(p7m_source) if is_path else 'p7m_in_memoria')
+    try:
+        if is_path:
+            with open(p7m_source, 'rb') as f:
+                p7m_data = f.read()
+        else:
+            p7m_data = bytes(p7m_source)
+    except OSError as read_err:
+        logger.error(f"File P7M non leggibile: {p7m_source} ({read_err})")
+        return None
+
+    xml_bytes = extract_p7m_content(p7m_data)
+    if xml_bytes is not None:
+        logger.debug(f"Estrazione CMS nativa riuscita per {base_name} ({len(xml_bytes)} bytes)")
+        return xml_bytes
+
+    logger.info(f"Parser CMS nativo non applicabile a {base_name}, ripiego su estrazione esterna")
+    temp_p7m_path = None
+    extracted_path = None
+    try:
+        p7m_filepath = p7m_source if is_path else None
+        if p7m_filepath is None:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".p7m", prefix="p7m_src_") as tf:
+                tf.write(p7m_data)
+                temp_p7m_path = p7m_filepath = tf.name
+        extracted_path = _extract_xml_from_p7m_external(p7m_filepath, base_name, {'size': len(p7m_data)})
+        if not extracted_path:
+            logger.error(f"Tutte le strategie di estrazione fallite per {base_name}")
+            return None
+        with open(extracted_path, 'rb') as f:
+            return f.read()
+    except OSError as io_err:
+        logger.error(f"Errore I/O estrazione P7M per {base_name}: {io_err}")
+        return None
+    finally:
+        _cleanup_temp_file(extracted_path)
+        _cleanup_temp_file(temp_p7m_path)
+
+def extract_xml_from_p7m(p7m_filepath):
+    """
+    Funzione principale migliorata per estrazione XML da P7M.
+    Usa multiple strategie per massimizzare il successo: parser CMS nativo,
+    poi OpenSSL e metodi alternativi. Ritorna il path di un file XML temporaneo
+    (il chiamante lo rimuove); per ottenere direttamente i bytes usare extract_xml_bytes_from_p7m.
+    """
+    if not os.path.exists(p7m_filepath):
+        logger.error(f"File P7M non trovato: {p7m_filepath}")
+        return None
+    
+    base_name = os.path.basename(p7m_filepath)
+    logger.info(f"Inizio estrazione XML da P7M: {base_name}")
+
+    try:
+        with open(p7m_filepath, 'rb') as f:
+            xml_bytes = extract_p7m_content(f.read())
+        if xml_bytes is not None:
+            with tempfile.NamedTemporaryFile(delete=False, mode='wb', suffix=".xml",
+                                             prefix=f"{base_name}_extract_") as tf:
+                tf.write(xml_bytes)
+            logger.info(f"Estrazione XML nativa completata: {base_name} -> {tf.name}")
+            return tf.name
+    except OSError as io_err:
+        logger.warning(f"Estrazione nativa non riuscita per {base_name}: {io_err}")
+    
+    # Analizza struttura file
+    structure_info = detect_p7m_structure(p7m_filepath)
+    extracted_path = _extract_xml_from_p7m_external(p7m_filepath, base_name, structure_info)
+    
+    if extracted_path:
+        logger.info(f"Estrazione XML completata con successo: {base_name} -> {extracted_path}")
         return extracted_path
     else:
         logger.error(f"Tutte le strategie di estrazione fallite per {base_name}")
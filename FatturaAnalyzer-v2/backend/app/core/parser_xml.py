@@ -1,9 +1,11 @@
 # core/parser_xml.py - Versione corretta per gestire meglio le variazioni XML
 
 from lxml import etree
+import io
 import logging
 import os
 import re
+from collections import namedtuple
 from decimal import Decimal
 from datetime import datetime
 
@@ -15,6 +17,103 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# === PIANO QUERY PRECOMPILATO ===
+# Le query usate dal parser sono quasi tutte percorsi di soli local-name() ("./*[local-name()='A']/*[local-name()='B']/text()"):
+# vengono tradotte una volta in passi per tag con namespace jolly ('{*}A', '{*}B') e risolte senza motore XPath.
+# Le altre sono compilate una sola volta con etree.XPath. Le catene di fallback restano invariate (percorso lento).
+XPATH_FAST_PATH = os.getenv('XML_PARSER_FAST_PATH', '1') != '0'
+
+_LOCAL_NAME_STEP_RE = re.compile(r"\*\[local-name\(\)='([A-Za-z_][\w.-]*)'\]")
+_DATE_LIKE_RE = re.compile(r'^(\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{8})$')
+_DATE_SEPARATOR_RE = re.compile(r'[-/]')
+_AMOUNT_STRIP_RE = re.compile(r'[^\d.,-]')
+# Formato canonico FatturaPA (es. '1234.50'): convertibile direttamente, senza la pulizia generica
+_PLAIN_DECIMAL_RE = re.compile(r'\d+(\.\d+)?')
+
+# steps: tag con namespace jolly ('{*}A', '{*}B') se la query è un percorso di soli local-name(), altrimenti None;
+# descendant: primo passo './/' invece di './'; text: query su text();
+# first_only: predicato [1] finale (equivalente solo per la ricerca del primo nodo)
+_QueryPlan = namedtuple('_QueryPlan', 'steps descendant text first_only xpath')
+_query_plans = {}
+
+
+def _build_query_plan(query):
+    try:
+        compiled = etree.XPath(query)
+    except etree.XPathSyntaxError as e:
+        logger.debug(f"Query XPath non valida '{query}': {e}")
+        compiled = None
+
+    body = query
+    text = body.endswith('/text()')
+    if text:
+        body = body[:-len('/text()')]
+    first_only = body.endswith('[1]')
+    if first_only:
+        body = body[:-len('[1]')]
+
+    steps = None; descendant = False
+    for prefix in ('.//', './'):
+        if body.startswith(prefix):
+            matches = [_LOCAL_NAME_STEP_RE.fullmatch(step) for step in body[len(prefix):].split('/')]
+            if all(matches):
+                steps = tuple('{*}' + m.group(1) for m in matches)
+                descendant = prefix == './/'
+            break
+    return _QueryPlan(steps, descendant, text, first_only, compiled)
+
+
+def _query_plan(query):
+    """Piano (memorizzato per stringa di query) con passi per tag e XPath precompilato."""
+    plan = _query_plans.get(query)
+    if plan is None:
+        plan = _query_plans[query] = _build_query_plan(query)
+    return plan
+
+
+def _iter_plan_nodes(element, steps, descendant):
+    """Nodi selezionati da un percorso di tag, in ordine di documento (filtri per tag eseguiti da lxml in C)."""
+    first = element.iterdescendants(steps[0]) if descendant else element.iterchildren(steps[0])
+    if len(steps) == 1:
+        yield from first
+        return
+    for node in first:
+        yield from _iter_plan_nodes(node, steps[1:], False)
+
+
+def _evaluate_query(element, query):
+    """Risultato della query come lista (stessa semantica di element.xpath(query))."""
+    if not XPATH_FAST_PATH:
+        return element.xpath(query)
+    plan = _query_plan(query)
+    if plan.steps is not None and not plan.text and not plan.first_only:
+        return list(_iter_plan_nodes(element, plan.steps, plan.descendant))
+    if plan.xpath is None:
+        raise ValueError(f"Query XPath non valida: {query}")
+    return plan.xpath(element)
+
+
+def _query_text(element, query):
+    """Primo testo restituito dalla query (come result[0] di ".../text()" o result[0].text), None se assente."""
+    plan = _query_plan(query) if XPATH_FAST_PATH else None
+    if plan is not None and plan.steps is not None:
+        # Caso più frequente (figlio diretto): nessun generatore annidato
+        nodes = (element.iterchildren(plan.steps[0]) if len(plan.steps) == 1 and not plan.descendant
+                 else _iter_plan_nodes(element, plan.steps, plan.descendant))
+        for node in nodes:
+            if node.text is not None or not plan.text:
+                return node.text  # text() restituisce i nodi testo dei soli elementi che ne hanno uno
+        return None
+
+    result = _evaluate_query(element, query)
+    if result:
+        if hasattr(result[0], 'text') and result[0].text is not None:
+            return result[0].text
+        elif isinstance(result[0], str):
+            return result[0]
+    return None
+
+
 # === FUNZIONI HELPER XPATH MIGLIORATE ===
 def xpath_get_text_robust(element, queries, default="", normalize_space=True, log_attempts=False):
     """
@@ -27,22 +126,16 @@ def xpath_get_text_robust(element, queries, default="", normalize_space=True, lo
     # Se queries è una stringa, convertila in lista
     if isinstance(queries, str):
         queries = [queries]
+    log_attempts = log_attempts and logger.isEnabledFor(logging.DEBUG)
     
     for i, query in enumerate(queries):
         try:
-            result = element.xpath(query)
-            if result:
-                text_content = None
-                if hasattr(result[0], 'text') and result[0].text is not None:
-                    text_content = result[0].text
-                elif isinstance(result[0], str):
-                    text_content = result[0]
-                
-                if text_content is not None and text_content.strip():
-                    final_text = ' '.join(text_content.split()) if normalize_space else text_content.strip()
-                    if log_attempts:
-                        logger.debug(f"XPath query {i+1}/{len(queries)} successo: '{query}' -> '{final_text}'")
-                    return final_text
+            text_content = _query_text(element, query)
+            if text_content is not None and text_content.strip():
+                final_text = ' '.join(text_content.split()) if normalize_space else text_content.strip()
+                if log_attempts:
+                    logger.debug(f"XPath query {i+1}/{len(queries)} successo: '{query}' -> '{final_text}'")
+                return final_text
         except Exception as e:
             if log_attempts:
                 logger.debug(f"XPath query {i+1}/{len(queries)} fallita: '{query}' -> {e}")
@@ -61,7 +154,10 @@ def xpath_find_first(element, query):
     if element is None: 
         return None
     try: 
-        result = element.xpath(query)
+        plan = _query_plan(query) if XPATH_FAST_PATH else None
+        if plan is not None and plan.steps is not None and not plan.text:
+            return next(_iter_plan_nodes(element, plan.steps, plan.descendant), None)
+        result = _evaluate_query(element, query)
         return result[0] if result else None
     except Exception as e: 
         logger.debug(f"Err xpath '{query}': {e}")
@@ -71,7 +167,7 @@ def xpath_find_all(element, query):
     if element is None: 
         return []
     try: 
-        return element.xpath(query)
+        return _evaluate_query(element, query)
     except Exception as e: 
         logger.debug(f"Err xpath '{query}': {e}")
         return []
@@ -85,11 +181,12 @@ def xpath_get_decimal_robust(element, queries, default_str='0.0', log_attempts=F
     
     if not cleaned_text:
         return to_decimal(default_str)
+    if XPATH_FAST_PATH and _PLAIN_DECIMAL_RE.fullmatch(cleaned_text):
+        return Decimal(cleaned_text)
     
     # Controllo pattern data per evitare conversioni errate
-    date_pattern = r'^(\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{8})$'
-    if re.match(date_pattern, cleaned_text):
-        if re.search(r'[-/]', cleaned_text) or ('.' in cleaned_text and not cleaned_text.replace('.','').isdigit()):
+    if _DATE_LIKE_RE.match(cleaned_text):
+        if _DATE_SEPARATOR_RE.search(cleaned_text) or ('.' in cleaned_text and not cleaned_text.replace('.','').isdigit()):
             logger.warning(f"Campo numerico contiene pattern data: '{text}'. Uso default '{default_str}'.")
             return to_decimal(default_str)
     
@@ -110,7 +207,7 @@ def clean_amount_string(amount_str):
         return "0.0"
     
     # Rimuovi spazi e caratteri non numerici eccetto . , + -
-    cleaned = re.sub(r'[^\d.,-]', '', amount_str.strip())
+    cleaned = _AMOUNT_STRIP_RE.sub('', amount_str.strip())
     
     # Gestisci formato italiano (1.234,56) vs americano (1,234.56)
     if ',' in cleaned and '.' in cleaned:
@@ -568,7 +665,7 @@ def extract_vat_summary_robust(dati_beni_servizi_node, base_filename):
     return vat_summary_data
 
 # === FUNZIONE PRINCIPALE PARSE_FATTURA_XML CORRETTA ===
-def parse_fattura_xml(xml_filepath, my_company_data=None):
+def parse_fattura_xml(xml_filepath, my_company_data=None, source_name=None):
     """
     Parser XML corretto per gestire meglio le variazioni strutturali.
     CORREZIONI PRINCIPALI:
@@ -576,7 +673,14 @@ def parse_fattura_xml(xml_filepath, my_company_data=None):
     2. Gestione NumeroCivico separato
     3. Migliore gestione namespace
     4. Debug più dettagliato
+    xml_filepath può essere anche il documento in memoria (bytes o file-like, es. XML
+    estratto da un P7M): in quel caso source_name ne indica il nome per log e 'source_file'.
     """
+    xml_source = xml_filepath
+    if not isinstance(xml_filepath, (str, os.PathLike)):
+        if isinstance(xml_filepath, (bytes, bytearray, memoryview)):
+            xml_source = io.BytesIO(xml_filepath)
+        xml_filepath = source_name or getattr(xml_filepath, 'name', None) or 'xml_in_memoria.xml'
     base_filename = os.path.basename(xml_filepath)
     logger.info(f"Parsing XML corretto: {base_filename}")
     
@@ -596,7 +700,7 @@ def parse_fattura_xml(xml_filepath, my_company_data=None):
             encoding='utf-8'
         )
         
-        tree = etree.parse(xml_filepath, parser)
+        tree = etree.parse(xml_source, parser)
         root = tree.getroot()
         
         if root is None:
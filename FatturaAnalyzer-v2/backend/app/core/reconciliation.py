@@ -9,17 +9,14 @@ from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime, date, timedelta
 import re
 from dateutil.relativedelta import relativedelta
-from typing import List, Dict, Set, Tuple, Optional, Any, Union
-import concurrent.futures
+from typing import List, Dict, Set, FrozenSet, Tuple, Optional, Any, Union, Iterable
 from dataclasses import dataclass, field
-from collections import defaultdict, OrderedDict
+from collections import defaultdict
 import numpy as np
-from functools import lru_cache, wraps
+from functools import wraps
 from contextlib import contextmanager
 import threading
 from queue import Queue, Empty
-import hashlib
-import pickle
 import gc
 import asyncio
 from enum import Enum
@@ -31,8 +28,16 @@ try:
                           update_invoice_reconciliation_state,
                           update_transaction_reconciliation_state,
                           add_or_update_reconciliation_link,
-                          remove_reconciliation_links)
-    from .utils import to_decimal, quantize, extract_invoice_number, AMOUNT_TOLERANCE
+                          remove_reconciliation_links, is_money_cents_active,
+                          is_reconciliation_triggers_active, OPEN_INVOICE_STATUSES,
+                          OPEN_INVOICE_FILTER)
+    from .utils import (to_decimal, quantize, extract_invoice_number, AMOUNT_TOLERANCE,
+                        AMOUNT_TOLERANCE_CENTS)
+    from .utils import to_cents, amounts_to_cents_array, cents_to_decimal
+    from .transaction_counterparty import AnagraphicsMatchIndex
+    from .subset_sum import find_subset_sums, find_subset_sums_parallel, find_subset_sums_up_to
+    from .invoice_residual_index import get_invoice_residual_index
+    from .ttl_cache import ttl_lru_cache
     from .smart_client_reconciliation import (suggest_client_based_reconciliation,
                                             enhance_cumulative_matches_with_client_patterns)
 except ImportError:
@@ -42,8 +47,16 @@ except ImportError:
                               update_invoice_reconciliation_state,
                               update_transaction_reconciliation_state,
                               add_or_update_reconciliation_link,
-                              remove_reconciliation_links)
-        from utils import to_decimal, quantize, extract_invoice_number, AMOUNT_TOLERANCE
+                              remove_reconciliation_links, is_money_cents_active,
+                              is_reconciliation_triggers_active, OPEN_INVOICE_STATUSES,
+                              OPEN_INVOICE_FILTER)
+        from utils import (to_decimal, quantize, extract_invoice_number, AMOUNT_TOLERANCE,
+                           AMOUNT_TOLERANCE_CENTS)
+        from utils import to_cents, amounts_to_cents_array, cents_to_decimal
+        from transaction_counterparty import AnagraphicsMatchIndex
+        from subset_sum import find_subset_sums, find_subset_sums_parallel, find_subset_sums_up_to
+        from invoice_residual_index import get_invoice_residual_index
+        from ttl_cache import ttl_lru_cache
         try:
             from smart_client_reconciliation import (suggest_client_based_reconciliation,
                                                    enhance_cumulative_matches_with_client_patterns)
@@ -55,6 +68,11 @@ except ImportError:
         logging.critical(f"Impossibile importare dipendenze (database/utils) in reconciliation.py: {e}")
         raise ImportError(f"Impossibile importare dipendenze (database/utils) in reconciliation.py: {e}") from e
 
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
 logger = logging.getLogger(__name__)
 
 # ================== CONFIGURAZIONE AVANZATA ==================
@@ -65,10 +83,13 @@ class Config:
     CACHE_TTL_MINUTES = int(os.getenv('RECON_CACHE_TTL', '15'))
     CACHE_MAX_SIZE = int(os.getenv('RECON_CACHE_MAX_SIZE', '10000'))
     CACHE_EVICTION_PERCENT = float(os.getenv('RECON_CACHE_EVICTION_PCT', '0.2'))
+    # Margine sul watermark del delta: gli scrittori usano orari locali e UTC (CURRENT_TIMESTAMP)
+    CACHE_DELTA_LOOKBACK_MINUTES = int(os.getenv('RECON_CACHE_DELTA_LOOKBACK_MIN', '1440'))
 
     # Performance settings
     MAX_COMBINATION_SIZE = int(os.getenv('RECON_MAX_COMBO_SIZE', '5'))
     MAX_SEARCH_TIME_MS = int(os.getenv('RECON_MAX_SEARCH_MS', '30000'))
+    MAX_COMBINATION_RESULTS = int(os.getenv('RECON_MAX_COMBO_RESULTS', '500'))
     BATCH_SIZE = int(os.getenv('RECON_BATCH_SIZE', '100'))
 
     # Matching thresholds
@@ -77,6 +98,7 @@ class Config:
 
     # Threading
     MAX_WORKERS = int(os.getenv('RECON_MAX_WORKERS', '4'))
+    PARALLEL_MIN_CANDIDATES = int(os.getenv('RECON_PARALLEL_MIN_CANDIDATES', '60'))
 
     # Memory management
     MEMORY_LIMIT_MB = int(os.getenv('RECON_MEMORY_LIMIT_MB', '500'))
@@ -85,16 +107,33 @@ class Config:
 
 @dataclass
 class AnagraphicsCacheV2:
-    """Cache thread-safe con eviction policy e memory management"""
-    _data: OrderedDict = field(default_factory=OrderedDict)
+    """
+    Cache thread-safe delle anagrafiche con refresh incrementale e snapshot copy-on-write.
+
+    Alla scadenza del TTL vengono lette solo le righe con updated_at recente (watermark meno
+    un margine per gli orari misti locale/UTC, più quelle senza updated_at); se numero e somma
+    degli id in Anagraphics non tornano col delta (cancellazioni o inserimenti fuori margine)
+    si ricarica tutto. Indici PIVA/CF, parole e resolver vengono aggiornati su copie e
+    pubblicati con un solo scambio di riferimenti.
+    Il lock di lettura protegge solo lo scambio e il tracking accessi: durante il refresh
+    i lettori continuano sullo snapshot precedente.
+    """
+    _data: Dict[int, Dict] = field(default_factory=dict)
     _timestamp: Optional[datetime] = None
     _ttl_minutes: int = Config.CACHE_TTL_MINUTES
     _max_size: int = Config.CACHE_MAX_SIZE
-    _search_index: Dict[str, Set[int]] = field(default_factory=dict)
+    _search_index: Dict[str, FrozenSet[int]] = field(default_factory=dict)
     _piva_cf_index: Dict[str, int] = field(default_factory=dict)
     _lock: threading.RLock = field(default_factory=threading.RLock)
+    _refresh_lock: threading.Lock = field(default_factory=threading.Lock)
     _access_count: Dict[int, int] = field(default_factory=dict)
     _last_access: Dict[int, datetime] = field(default_factory=dict)
+    _matcher: AnagraphicsMatchIndex = field(default_factory=AnagraphicsMatchIndex)
+    _watermark: Optional[str] = None # MAX(updated_at) delle righe caricate
+    _table_signature: Optional[Tuple[int, int, int]] = None # (COUNT, TOTAL(id), MAX(id)) all'ultimo allineamento
+    _delta_refreshes: int = 0
+
+    _STOP_WORDS = frozenset({'spa', 'srl', 'snc', 'sas', 'coop', 'societa', 'group', 'holding', 'soc'})
 
     def is_expired(self) -> bool:
         """Verifica se la cache è scaduta"""
@@ -103,157 +142,237 @@ class AnagraphicsCacheV2:
                 return True
             return (datetime.now() - self._timestamp).total_seconds() > self._ttl_minutes * 60
 
-    def _evict_lru(self):
-        """Evict least recently used items quando la cache è piena"""
-        if len(self._data) < self._max_size:
+    def _ensure_fresh(self):
+        """Primo caricamento bloccante; poi un solo thread esegue il delta, gli altri leggono lo snapshot corrente"""
+        if not self.is_expired():
             return
-        
-        items_to_remove = int(self._max_size * Config.CACHE_EVICTION_PERCENT)
-        
-        sorted_items = sorted(
-            self._data.items(),
-            key=lambda x: self._last_access.get(x[0], datetime.min)
-        )
-        
-        for anag_id, _ in sorted_items[:items_to_remove]:
-            self._remove_item(anag_id)
-            
-        logger.debug(f"Cache eviction: rimossi {items_to_remove} elementi LRU")
-
-    def _remove_item(self, anag_id: int):
-        """Rimuove un elemento dalla cache e dai suoi indici"""
-        if anag_id not in self._data:
+        if self._timestamp is None:
+            self.refresh()
             return
-            
-        anag_data = self._data[anag_id]
-        
-        if anag_data['piva']:
-            self._piva_cf_index.pop(anag_data['piva'], None)
-        if anag_data['cf']:
-            self._piva_cf_index.pop(anag_data['cf'], None)
-            
-        for word in anag_data.get('search_words', set()):
-            if word in self._search_index:
-                self._search_index[word].discard(anag_id)
-                if not self._search_index[word]:
-                    del self._search_index[word]
-        
-        del self._data[anag_id]
-        self._access_count.pop(anag_id, None)
-        self._last_access.pop(anag_id, None)
+        if self._refresh_lock.acquire(blocking=False):
+            try:
+                if self.is_expired():
+                    self._do_refresh(full=False)
+            finally:
+                self._refresh_lock.release()
+
+    @classmethod
+    def _make_entry(cls, denomination, piva, cf) -> Dict[str, Any]:
+        denomination = (denomination or '').strip()
+        return {
+            'denomination': denomination,
+            'piva': (piva or '').strip().upper(),
+            'cf': (cf or '').strip().upper(),
+            'search_words': set(re.findall(r'\b\w{3,}\b', denomination.lower())) - cls._STOP_WORDS,
+            'full_text': denomination.lower()
+        }
+
+    @staticmethod
+    def _index_entry(anag_id: int, entry: Dict, search_index: Dict[str, FrozenSet[int]], piva_cf_index: Dict[str, int]):
+        if entry['piva']:
+            piva_cf_index[entry['piva']] = anag_id
+        if entry['cf']:
+            piva_cf_index[entry['cf']] = anag_id
+        for word in entry['search_words']:
+            search_index[word] = search_index.get(word, frozenset()) | {anag_id}
+
+    @staticmethod
+    def _unindex_entry(anag_id: int, entry: Dict, search_index: Dict[str, FrozenSet[int]], piva_cf_index: Dict[str, int]):
+        for code in (entry['piva'], entry['cf']):
+            if code and piva_cf_index.get(code) == anag_id:
+                del piva_cf_index[code]
+        for word in entry['search_words']:
+            remaining = search_index.get(word, frozenset()) - {anag_id}
+            if remaining:
+                search_index[word] = remaining
+            else:
+                search_index.pop(word, None)
+
+    def _lru_victims(self, data: Dict[int, Dict]) -> List[int]:
+        """Id da scartare (meno usati di recente) quando lo snapshot supera la dimensione massima"""
+        if len(data) <= self._max_size:
+            return []
+        to_remove = max(len(data) - self._max_size, int(self._max_size * Config.CACHE_EVICTION_PERCENT))
+        with self._lock:
+            last_access = dict(self._last_access)
+        return sorted(data, key=lambda anag_id: last_access.get(anag_id, datetime.min))[:to_remove]
 
     def clear(self):
         """Pulisce la cache in modo thread-safe"""
         with self._lock:
-            self._data.clear()
-            self._search_index.clear()
-            self._piva_cf_index.clear()
+            self._data = {}
+            self._search_index = {}
+            self._piva_cf_index = {}
             self._access_count.clear()
             self._last_access.clear()
+            self._matcher = AnagraphicsMatchIndex()
+            self._watermark = None
+            self._table_signature = None
             self._timestamp = None
 
-    def refresh(self):
-        """Aggiorna la cache con gestione memoria ottimizzata"""
+    def refresh(self, full: bool = False):
+        """Aggiorna la cache: delta dall'ultimo watermark, ricaricamento completo al primo uso o con full=True"""
+        with self._refresh_lock:
+            self._do_refresh(full)
+
+    def _do_refresh(self, full: bool):
+        if full or self._timestamp is None or self._watermark is None or self._table_signature is None:
+            self._full_reload()
+        else:
+            self._delta_refresh()
+
+    def _full_reload(self):
+        logger.debug("Caricamento completo cache anagrafiche V2...")
+        memory_mb = psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+        if memory_mb > Config.MEMORY_LIMIT_MB:
+            logger.warning(f"Memoria utilizzata ({memory_mb:.1f}MB) supera il limite. Skip refresh cache.")
+            return
+
+        with get_db_connection() as conn:
+            rows = conn.execute("""
+                SELECT id, denomination, piva, cf, updated_at
+                FROM Anagraphics
+                WHERE LENGTH(TRIM(COALESCE(denomination, ''))) >= 3
+                ORDER BY updated_at DESC
+                LIMIT ?
+            """, (self._max_size,)).fetchall()
+            table_signature = self._read_table_signature(conn)
+
+        data, search_index, piva_cf_index = {}, {}, {}
+        for row in reversed(rows): # dal meno recente: a parità di PIVA/CF vince la riga aggiornata per ultima
+            entry = self._make_entry(row['denomination'], row['piva'], row['cf'])
+            data[row['id']] = entry
+            self._index_entry(row['id'], entry, search_index, piva_cf_index)
+        matcher = AnagraphicsMatchIndex((anag_id, entry['denomination'], entry['piva'], entry['cf'])
+                                        for anag_id, entry in data.items())
+        watermark = max((row['updated_at'] for row in rows if row['updated_at']), default=None)
+
+        now = datetime.now()
         with self._lock:
-            logger.debug("Aggiornamento cache anagrafiche V2...")
-            self.clear()
-            
-            process = psutil.Process(os.getpid())
-            memory_mb = process.memory_info().rss / 1024 / 1024
-            
-            if memory_mb > Config.MEMORY_LIMIT_MB:
-                logger.warning(f"Memoria utilizzata ({memory_mb:.1f}MB) supera il limite. Skip refresh cache.")
-                return
-            
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT id, denomination, piva, cf 
-                    FROM Anagraphics 
-                    WHERE LENGTH(TRIM(COALESCE(denomination, ''))) >= 3
-                    ORDER BY updated_at DESC
-                    LIMIT ?
-                """, (self._max_size,))
-                
-                stop_words = {'spa', 'srl', 'snc', 'sas', 'coop', 'societa', 'group', 'holding', 'soc'}
-                
-                for row in cursor.fetchall():
-                    anag_id = row['id']
-                    denomination = (row['denomination'] or '').strip()
-                    piva = (row['piva'] or '').strip().upper()
-                    cf = (row['cf'] or '').strip().upper()
-                    
-                    denom_words = set(re.findall(r'\b\w{3,}\b', denomination.lower())) - stop_words
-                    
-                    anag_data = {
-                        'denomination': denomination,
-                        'piva': piva,
-                        'cf': cf,
-                        'search_words': denom_words,
-                        'full_text': denomination.lower()
-                    }
-                    
-                    self._data[anag_id] = anag_data
-                    self._access_count[anag_id] = 0
-                    self._last_access[anag_id] = datetime.now()
-                    
-                    if piva:
-                        self._piva_cf_index[piva] = anag_id
-                    if cf:
-                        self._piva_cf_index[cf] = anag_id
-                    
-                    for word in denom_words:
-                        if word not in self._search_index:
-                            self._search_index[word] = set()
-                        self._search_index[word].add(anag_id)
-                
+            self._data, self._search_index, self._piva_cf_index, self._matcher = data, search_index, piva_cf_index, matcher
+            self._access_count = {anag_id: self._access_count.get(anag_id, 0) for anag_id in data}
+            self._last_access = {anag_id: self._last_access.get(anag_id, now) for anag_id in data}
+            self._watermark = watermark
+            self._table_signature = table_signature
+            self._timestamp = now
+        logger.debug(f"Cache anagrafiche V2 caricata: {len(data)} record, {len(search_index)} parole indicizzate")
+
+    @staticmethod
+    def _read_table_signature(conn) -> Tuple[int, int, int]:
+        row = conn.execute("SELECT COUNT(*), TOTAL(id), COALESCE(MAX(id), 0) FROM Anagraphics").fetchone()
+        return int(row[0]), int(row[1]), int(row[2])
+
+    def _delta_refresh(self):
+        with get_db_connection() as conn:
+            changed = conn.execute("""
+                SELECT id, denomination, piva, cf, updated_at FROM Anagraphics
+                WHERE updated_at >= COALESCE(datetime(?, ?), ?) OR updated_at IS NULL
+            """, (self._watermark, f"-{Config.CACHE_DELTA_LOOKBACK_MINUTES} minutes", self._watermark)).fetchall()
+            table_signature = self._read_table_signature(conn)
+
+        # Inseriti = id del delta oltre il MAX(id) precedente; se numero o somma degli id non tornano
+        # ci sono cancellazioni o inserimenti fuori margine: il delta non basta
+        count, id_total, max_id = self._table_signature
+        inserted_ids = {row['id'] for row in changed if row['id'] > max_id}
+        if table_signature[:2] != (count + len(inserted_ids), id_total + sum(inserted_ids)):
+            logger.debug("Delta anagrafiche incompleto, ricaricamento completo")
+            self._full_reload()
+            return
+
+        with self._lock:
+            current_data, current_matcher = self._data, self._matcher
+        valid_rows = [row for row in changed if len((row['denomination'] or '').strip()) >= 3]
+        # Righe con denominazione non più significativa: escono dall'indice
+        dropped_ids = {row['id'] for row in changed if row['id'] in current_data} - {row['id'] for row in valid_rows}
+        watermark = max([self._watermark] + [row['updated_at'] for row in changed if row['updated_at']])
+
+        unchanged = all(row['id'] in current_data and current_data[row['id']] == self._make_entry(
+            row['denomination'], row['piva'], row['cf']) for row in valid_rows)
+        if unchanged and not dropped_ids:
+            with self._lock:
+                self._watermark = watermark
+                self._table_signature = table_signature
                 self._timestamp = datetime.now()
-                logger.debug(f"Cache anagrafiche V2 aggiornata: {len(self._data)} record, {len(self._search_index)} parole indicizzate")
+            return
+
+        # Copy-on-write: i lettori continuano a usare dizionari e resolver correnti fino allo scambio
+        data, search_index, piva_cf_index = dict(current_data), dict(self._search_index), dict(self._piva_cf_index)
+        for anag_id in dropped_ids | {row['id'] for row in valid_rows}:
+            entry = data.pop(anag_id, None)
+            if entry is not None:
+                self._unindex_entry(anag_id, entry, search_index, piva_cf_index)
+        for row in valid_rows:
+            entry = self._make_entry(row['denomination'], row['piva'], row['cf'])
+            data[row['id']] = entry
+            self._index_entry(row['id'], entry, search_index, piva_cf_index)
+        evicted = self._lru_victims(data)
+        for anag_id in evicted:
+            self._unindex_entry(anag_id, data.pop(anag_id), search_index, piva_cf_index)
+
+        matcher = current_matcher.copy()
+        matcher.upsert((row['id'], row['denomination'], row['piva'], row['cf']) for row in valid_rows)
+        matcher.remove(dropped_ids | set(evicted))
+
+        now = datetime.now()
+        with self._lock:
+            self._data, self._search_index, self._piva_cf_index, self._matcher = data, search_index, piva_cf_index, matcher
+            for anag_id in dropped_ids | set(evicted):
+                self._access_count.pop(anag_id, None)
+                self._last_access.pop(anag_id, None)
+            for row in valid_rows:
+                self._last_access.setdefault(row['id'], now)
+            self._watermark = watermark
+            self._table_signature = table_signature
+            self._timestamp = now
+            self._delta_refreshes += 1
+        logger.debug(f"Cache anagrafiche V2 delta: {len(valid_rows)} aggiornate, {len(dropped_ids)} rimosse, {len(evicted)} evict LRU")
 
     def get_data(self) -> Dict[int, Dict]:
         """Ottiene i dati aggiornati della cache"""
+        self._ensure_fresh()
         with self._lock:
-            if self.is_expired():
-                self.refresh()
             return dict(self._data)
 
+    def _track_access(self, anag_ids: Iterable[int]):
+        now = datetime.now()
+        with self._lock:
+            for anag_id in anag_ids:
+                self._access_count[anag_id] = self._access_count.get(anag_id, 0) + 1
+                self._last_access[anag_id] = now
+
     def find_by_piva_cf(self, code: str) -> Optional[int]:
         """Ricerca veloce per PIVA/CF con tracking accessi"""
+        self._ensure_fresh()
         with self._lock:
-            if self.is_expired():
-                self.refresh()
-            
-            anag_id = self._piva_cf_index.get(code.upper())
-            if anag_id:
-                self._access_count[anag_id] = self._access_count.get(anag_id, 0) + 1
-                self._last_access[anag_id] = datetime.now()
-            
-            return anag_id
+            piva_cf_index = self._piva_cf_index
+        anag_id = piva_cf_index.get(code.upper())
+        if anag_id:
+            self._track_access((anag_id,))
+        return anag_id
+
+    def resolve(self, description: str) -> Tuple[Optional[int], Optional[float]]:
+        """Controparte citata nella descrizione (automa su denominazioni, PIVA e CF): (id, score)"""
+        self._ensure_fresh()
+        with self._lock:
+            matcher = self._matcher
+        anag_id, score = matcher.resolve(description)
+        if anag_id:
+            self._track_access((anag_id,))
+        return anag_id, score
 
     def search_by_words(self, words: Set[str]) -> Set[int]:
         """Ricerca veloce per parole chiave con tracking"""
+        if not words:
+            return set()
+        self._ensure_fresh()
         with self._lock:
-            if self.is_expired():
-                self.refresh()
-            
-            if not words:
-                return set()
-            
-            result_sets = [self._search_index.get(word, set()) for word in words]
-            result_sets = [s for s in result_sets if s]
-            
-            if not result_sets:
-                return set()
-            
-            result_ids = set.intersection(*result_sets) if len(result_sets) > 1 else result_sets[0]
-            
-            now = datetime.now()
-            for anag_id in result_ids:
-                self._access_count[anag_id] = self._access_count.get(anag_id, 0) + 1
-                self._last_access[anag_id] = now
-            
-            return result_ids
+            search_index = self._search_index
+        result_sets = [search_index[word] for word in words if word in search_index]
+        if not result_sets:
+            return set()
+        result_ids = set(result_sets[0]).intersection(*result_sets[1:])
+        self._track_access(result_ids)
+        return result_ids
 
     def get_stats(self) -> Dict[str, Any]:
         """Ottiene statistiche della cache"""
@@ -265,6 +384,8 @@ class AnagraphicsCacheV2:
                 'piva_cf_indexed': len(self._piva_cf_index),
                 'expired': self.is_expired(),
                 'age_minutes': (datetime.now() - self._timestamp).total_seconds() / 60 if self._timestamp else 0,
+                'watermark': self._watermark,
+                'delta_refreshes': self._delta_refreshes,
                 'total_accesses': sum(self._access_count.values()),
                 'memory_mb': psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
             }
@@ -302,42 +423,6 @@ def with_performance_logging(func):
 
     return wrapper
 
-def memoize_with_timeout(timeout_seconds=300):
-    """Decoratore per cache con timeout"""
-    def decorator(func):
-        cache = {}
-        cache_time = {}
-        lock = threading.Lock()
-
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            key = hashlib.md5(
-                pickle.dumps((args, tuple(sorted(kwargs.items()))))
-            ).hexdigest()
-            
-            with lock:
-                if key in cache and (time.time() - cache_time[key]) < timeout_seconds:
-                    return cache[key]
-                
-                result = func(*args, **kwargs)
-                
-                cache[key] = result
-                cache_time[key] = time.time()
-                
-                current_time = time.time()
-                expired_keys = [k for k, t in cache_time.items() 
-                               if current_time - t > timeout_seconds]
-                for k in expired_keys:
-                    del cache[k]
-                    del cache_time[k]
-                
-                return result
-        
-        wrapper.clear_cache = lambda: cache.clear() or cache_time.clear()
-        return wrapper
-
-    return decorator
-
 # ================== MATCH ANALYZER MIGLIORATO ==================
 
 class MatchAnalyzerV2:
@@ -364,8 +449,9 @@ class MatchAnalyzerV2:
         self.desc_words = set(re.findall(r'\b\w{3,}\b', self.description))
         self.desc_numbers = set(re.findall(r'\d+', self.description))
 
-    @lru_cache(maxsize=1024)
-    def _calculate_string_similarity(self, str1: str, str2: str) -> float:
+    @staticmethod
+    @ttl_lru_cache(maxsize=4096)
+    def _calculate_string_similarity(str1: str, str2: str) -> float:
         """Calcola similarità tra stringhe con algoritmo ottimizzato"""
         if not str1 or not str2:
             return 0.0
@@ -397,7 +483,7 @@ class MatchAnalyzerV2:
         match_details = defaultdict(bool)
         
         amount_diff = abs(invoice_amount - self.target_amount)
-        amount_ratio = amount_diff / self.target_amount if self.target_amount else 0
+        amount_ratio = float(amount_diff / self.target_amount) if self.target_amount else 0.0
         
         if amount_diff <= AMOUNT_TOLERANCE:
             scores['amount'] = self.WEIGHTS['amount_exact']
@@ -532,7 +618,7 @@ class MatchAnalyzerV2:
         base_confidence = 0.6
         
         total = sum(inv['amount_decimal'] for inv in combination)
-        amount_precision = 1.0 - min(1.0, abs(total - target_amount) / target_amount)
+        amount_precision = 1.0 - min(1.0, float(abs(total - target_amount) / target_amount))
         
         date_bonus = _calculate_temporal_coherence(combination)
         sequence_bonus = _calculate_numeric_sequence_bonus(combination)
@@ -549,153 +635,47 @@ class MatchAnalyzerV2:
 # ================== COMBINATION GENERATOR OTTIMIZZATO ==================
 
 class CombinationGeneratorV2:
-    """Generatore combinazioni con algoritmi avanzati e parallelizzazione"""
+    """Generatore combinazioni su motore subset-sum in centesimi interi (core/subset_sum.py)"""
 
     def __init__(self, candidates: List[Dict], target_amount: Decimal):
         self.candidates = sorted(candidates, key=lambda x: x['amount_decimal'])
         self.target_amount = target_amount
         self.tolerance = AMOUNT_TOLERANCE
-        
-        self._precompute_optimization_structures()
 
-    def _precompute_optimization_structures(self):
-        """Precomputa strutture per pruning e ottimizzazione"""
-        n = len(self.candidates)
-        
-        self.prefix_sums = [Decimal('0')] * (n + 1)
-        for i in range(n):
-            self.prefix_sums[i + 1] = self.prefix_sums[i] + self.candidates[i]['amount_decimal']
-        
-        self.suffix_sums = [Decimal('0')] * (n + 1)
-        for i in range(n - 1, -1, -1):
-            self.suffix_sums[i] = self.suffix_sums[i + 1] + self.candidates[i]['amount_decimal']
-        
-        self.min_k_sum = {}
-        self.max_k_sum = {}
-        for k in range(1, min(6, n + 1)):
-            self.min_k_sum[k] = sum(c['amount_decimal'] for c in self.candidates[:k])
-            self.max_k_sum[k] = sum(c['amount_decimal'] for c in self.candidates[-k:])
-
-    def can_reach_target(self, current_sum: Decimal, start_idx: int, 
-                        remaining_size: int) -> Tuple[bool, bool]:
-        """Verifica veloce se è possibile raggiungere il target"""
-        if remaining_size == 0:
-            return (abs(current_sum - self.target_amount) <= self.tolerance,
-                   abs(current_sum - self.target_amount) <= self.tolerance)
-        
-        if start_idx >= len(self.candidates):
-            return False, False
-        
-        min_possible = current_sum + self.min_k_sum.get(
-            remaining_size, 
-            sum(c['amount_decimal'] for c in self.candidates[start_idx:start_idx+remaining_size])
-        )
-        max_possible = current_sum + self.max_k_sum.get(
-            remaining_size,
-            sum(c['amount_decimal'] for c in self.candidates[max(0, len(self.candidates)-remaining_size):])
-        )
-        
-        can_be_exact = (min_possible <= self.target_amount + self.tolerance and 
-                       max_possible >= self.target_amount - self.tolerance)
-        can_be_close = (min_possible <= self.target_amount + self.tolerance * 3 and
-                       max_possible >= self.target_amount - self.tolerance * 3)
-        
-        return can_be_exact, can_be_close
-
-    def generate_combinations_parallel(self, size: int, max_iterations: int = 50000) -> List[List[Dict]]:
-        """Genera combinazioni in parallelo per size grandi"""
-        if size < 3 or len(self.candidates) < 10:
-            return list(self.generate_combinations(size, max_iterations))
-        
-        num_workers = min(Config.MAX_WORKERS, len(self.candidates) // size)
-        if num_workers < 2:
-            return list(self.generate_combinations(size, max_iterations))
-        
-        results = []
-        chunk_size = len(self.candidates) // num_workers
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = []
-            
-            for i in range(num_workers):
-                start_idx = i * chunk_size
-                end_idx = (i + 1) * chunk_size if i < num_workers - 1 else len(self.candidates)
-                
-                worker_candidates = self.candidates[start_idx:end_idx]
-                if len(worker_candidates) >= size:
-                    future = executor.submit(
-                        self._generate_combinations_subset,
-                        worker_candidates, size, max_iterations // num_workers
-                    )
-                    futures.append(future)
-            
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    worker_results = future.result()
-                    results.extend(worker_results)
-                except Exception as e:
-                    logger.error(f"Errore in worker combinazioni: {e}")
-        
-        return results
-
-    def _generate_combinations_subset(self, subset: List[Dict], size: int, 
-                                    max_iterations: int) -> List[List[Dict]]:
-        """Genera combinazioni per un subset di candidati"""
-        generator = CombinationGeneratorV2(subset, self.target_amount)
-        return list(generator.generate_combinations(size, max_iterations))
-
-    def generate_combinations(self, size: int, max_iterations: int = 10000):
-        """Genera combinazioni con algoritmo ottimizzato e pruning avanzato"""
-        iterations = 0
-        seen_amounts = set()
-        
-        def _recursive_generate(start_idx: int, current: List[Dict], 
-                              current_sum: Decimal, remaining_size: int):
-            nonlocal iterations
-            iterations += 1
-            
-            if iterations > max_iterations:
-                return
-            
-            if remaining_size == 0:
-                amount_key = str(current_sum.quantize(Decimal('0.01')))
-                if amount_key in seen_amounts:
-                    return
-                
-                if abs(current_sum - self.target_amount) <= self.tolerance:
-                    seen_amounts.add(amount_key)
-                    yield current.copy()
-                return
-            
-            can_exact, can_close = self.can_reach_target(current_sum, start_idx, remaining_size)
-            if not can_close:
-                return
-            
-            valid_start = start_idx
-            valid_end = len(self.candidates) - remaining_size + 1
-            
-            left, right = start_idx, valid_end
-            while left < right:
-                mid = (left + right) // 2
-                test_sum = current_sum + self.candidates[mid]['amount_decimal']
-                if test_sum > self.target_amount + self.tolerance * remaining_size:
-                    right = mid
-                else:
-                    left = mid + 1
-            valid_end = min(valid_end, left + remaining_size)
-            
-            for i in range(valid_start, valid_end):
-                item = self.candidates[i]
-                new_sum = current_sum + item['amount_decimal']
-                
-                if new_sum > self.target_amount + self.tolerance * remaining_size:
-                    break
-                
-                current.append(item)
-                yield from _recursive_generate(i + 1, current, new_sum, remaining_size - 1)
-                current.pop()
-        
-        yield from _recursive_generate(0, [], Decimal('0'), size)
+        self.amounts_cents = [to_cents(c['amount_decimal']) for c in self.candidates]
+        self.target_cents = to_cents(target_amount)
+
+    def generate_combinations_parallel(self, size: int, max_iterations: Optional[int] = None,
+                                       deadline: Optional[float] = None) -> List[List[Dict]]:
+        """
+        Come generate_combinations (stesso risultato), con la ricerca partizionata per
+        primo elemento su un pool di processi (Config.MAX_WORKERS).
+        """
+        combos = find_subset_sums_parallel(self.amounts_cents, self.target_cents, size,
+                                           AMOUNT_TOLERANCE_CENTS, deadline, Config.MAX_WORKERS)
+        return [[self.candidates[i] for i in combo] for combo in combos]
+
+    def generate_combinations(self, size: int, max_iterations: Optional[int] = None,
+                              deadline: Optional[float] = None):
+        """
+        Genera tutte le combinazioni di `size` candidati entro AMOUNT_TOLERANCE dal target,
+        in ordine deterministico. max_iterations è mantenuto per compatibilità ed è ignorato:
+        la ricerca è completa, limitata solo dalla deadline (SubsetSumTimeout).
+        """
+        for combo in find_subset_sums(self.amounts_cents, self.target_cents, size,
+                                      AMOUNT_TOLERANCE_CENTS, deadline):
+            yield [self.candidates[i] for i in combo]
+
+    def find_all_combinations(self, min_size: int, max_size: int, deadline: Optional[float] = None,
+                              parallel: bool = False) -> Tuple[List[List[Dict]], bool]:
+        """
+        Combinazioni per dimensioni min_size..max_size; il bool indica se la ricerca è completa.
+        Con parallel=True le dimensioni da 3 in su usano il pool di processi.
+        """
+        combos, complete = find_subset_sums_up_to(self.amounts_cents, self.target_cents, min_size, max_size,
+                                                  AMOUNT_TOLERANCE_CENTS, deadline,
+                                                  Config.MAX_WORKERS if parallel else 0)
+        return [[self.candidates[i] for i in combo] for combo in combos], complete
 
 # ================== ASYNC RECONCILIATION ENGINE ==================
 
@@ -918,7 +898,7 @@ def suggest_cumulative_matches_v2(transaction_id, anagraphics_id_filter=None,
                 target_invoice_type,
                 anagraphics_id_filter,
                 float(AMOUNT_TOLERANCE / 2),
-                float(target_amount_abs * 1.5),
+                float(target_amount_abs) * 1.5,
                 float(target_amount_abs)
             ]
             
@@ -931,15 +911,15 @@ def suggest_cumulative_matches_v2(transaction_id, anagraphics_id_filter=None,
                 WITH RankedInvoices AS (
                     SELECT 
                         i.id, i.doc_number, i.doc_date, i.total_amount, i.paid_amount,
-                        CAST(i.total_amount - i.paid_amount AS REAL) as open_amount,
-                        ABS(CAST(i.total_amount - i.paid_amount AS REAL) - ?) as amount_diff,
-                        ROW_NUMBER() OVER (ORDER BY ABS(CAST(i.total_amount - i.paid_amount AS REAL) - ?)) as rn
+                        i.open_residual as open_amount,
+                        ABS(i.open_residual - ?) as amount_diff,
+                        ROW_NUMBER() OVER (ORDER BY ABS(i.open_residual - ?)) as rn
                     FROM Invoices i
                     WHERE i.type = ?
                       AND i.anagraphics_id = ?
-                      AND i.payment_status IN ('Aperta', 'Scaduta', 'Pagata Parz.')
-                      AND (i.total_amount - i.paid_amount) > ?
-                      AND (i.total_amount - i.paid_amount) <= ?
+                      AND i.{OPEN_INVOICE_FILTER}
+                      AND i.open_residual > ?
+                      AND i.open_residual <= ?
                       {date_filter}
                 )
                 SELECT * FROM RankedInvoices
@@ -987,48 +967,27 @@ def suggest_cumulative_matches_v2(transaction_id, anagraphics_id_filter=None,
             logger.info(f"{log_prefix}: Analisi {len(candidate_invoices)} fatture candidate (V2)")
             
             generator = CombinationGeneratorV2(candidate_invoices, target_amount_abs)
+            deadline = start_time + max_search_time_ms / 1000
+            combinations, complete = generator.find_all_combinations(
+                2, max_combination_size, deadline,
+                parallel=len(candidate_invoices) >= Config.PARALLEL_MIN_CANDIDATES
+            )
+            if not complete:
+                logger.warning(f"{log_prefix}: Tempo massimo ({max_search_time_ms}ms) raggiunto, "
+                               f"ricerca combinazioni parziale ({len(combinations)} trovate)")
+            if len(combinations) > Config.MAX_COMBINATION_RESULTS:
+                logger.warning(f"{log_prefix}: {len(combinations)} combinazioni esatte, valutate le prime "
+                               f"{Config.MAX_COMBINATION_RESULTS} (per dimensione crescente)")
+                combinations = combinations[:Config.MAX_COMBINATION_RESULTS]
+
             suggestions = []
-            
-            for size in range(2, min(4, len(candidate_invoices) + 1)):
-                elapsed_ms = (time.monotonic() - start_time) * 1000
-                if elapsed_ms > max_search_time_ms * 0.5:
-                    break
-                
-                max_iter = max(5000, int((max_search_time_ms * 0.5 - elapsed_ms) / size))
-                
-                if size >= 3 and len(candidate_invoices) > 10:
-                    combinations = generator.generate_combinations_parallel(size, max_iter)
-                else:
-                    combinations = generator.generate_combinations(size, max_iter)
-                
-                for combination in combinations:
-                    if isinstance(combination, list):
-                        suggestion = _create_suggestion_from_combination(
-                            combination, target_amount_abs, anagraphics_id_filter
-                        )
-                        if suggestion:
-                            suggestions.append(suggestion)
-                
-                if len(suggestions) >= 10:
-                    break
-            
-            if len(suggestions) < 5 and (time.monotonic() - start_time) * 1000 < max_search_time_ms * 0.7:
-                for size in range(4, min(max_combination_size + 1, len(candidate_invoices) + 1)):
-                    elapsed_ms = (time.monotonic() - start_time) * 1000
-                    if elapsed_ms > max_search_time_ms * 0.9:
-                        break
-                    
-                    max_iter = max(1000, int((max_search_time_ms * 0.9 - elapsed_ms) / (size * 2)))
-                    
-                    for combination in generator.generate_combinations(size, max_iter):
-                        suggestion = _create_suggestion_from_combination(
-                            combination, target_amount_abs, anagraphics_id_filter
-                        )
-                        if suggestion:
-                            suggestions.append(suggestion)
-                            if len(suggestions) >= 15:
-                                break
-            
+            for combination in combinations:
+                suggestion = _create_suggestion_from_combination(
+                    combination, target_amount_abs, anagraphics_id_filter
+                )
+                if suggestion:
+                    suggestions.append(suggestion)
+
             optimizer = ReconciliationOptimizer()
             optimized_suggestions = optimizer.optimize_suggestions(suggestions)
             
@@ -1135,6 +1094,7 @@ def _calculate_date_range(combination):
 
 # ================== FUNZIONI ORIGINALI MANTENUTE ==================
 
+@ttl_lru_cache(maxsize=128)
 def _extract_piva_cf_from_description(description: str) -> Tuple[str, ...]:
     """Estrae codici PIVA/CF dalla descrizione con cache"""
     if not description:
@@ -1144,13 +1104,11 @@ def _extract_piva_cf_from_description(description: str) -> Tuple[str, ...]:
     matches = re.findall(piva_cf_pattern, description, re.IGNORECASE)
     return tuple(code.upper() for piva, cf in matches if (code := piva or cf))
 
-_extract_piva_cf_from_description = lru_cache(maxsize=128)(_extract_piva_cf_from_description)
-
 def find_anagraphics_id_from_description(description: str) -> Optional[int]:
     """Versione originale con cache V2"""
     return find_anagraphics_id_from_description_v2(description)
 
-@memoize_with_timeout(300)
+@ttl_lru_cache(maxsize=Config.CACHE_MAX_SIZE, ttl_seconds=300)
 def find_anagraphics_id_from_description_v2(description: str) -> Optional[int]:
     """Versione V2 ottimizzata con cache temporizzata"""
     if not description:
@@ -1159,55 +1117,11 @@ def find_anagraphics_id_from_description_v2(description: str) -> Optional[int]:
     log_prefix = "find_anag_id_v2"
     logger.debug(f"{log_prefix}: Descrizione='{description[:100]}...'")
 
-    codes = _extract_piva_cf_from_description(description)
-    for code in codes:
-        anag_id = _anagraphics_cache.find_by_piva_cf(code)
-        if anag_id:
-            logger.info(f"{log_prefix}: Match PIVA/CF veloce -> ID:{anag_id}")
-            return anag_id
-
-    desc_lower = description.lower()
-    desc_words = set(re.findall(r'\b\w{3,}\b', desc_lower))
-
-    if not desc_words:
-        return None
-
-    candidate_ids = _anagraphics_cache.search_by_words(desc_words)
-    if not candidate_ids:
-        return None
-
-    anagraphics_data = _anagraphics_cache.get_data()
-    best_score = 0.0
-    best_match_id = None
-
-    for anag_id in candidate_ids:
-        if anag_id not in anagraphics_data:
-            continue
-            
-        anag_data = anagraphics_data[anag_id]
-        
-        if anag_data['full_text'] in desc_lower:
-            score = 0.8 + (len(anag_data['full_text']) / len(desc_lower)) * 0.2
-            if score > best_score:
-                best_score = score
-                best_match_id = anag_id
-                continue
-        
-        common_words = desc_words.intersection(anag_data['search_words'])
-        if common_words:
-            jaccard = len(common_words) / len(desc_words.union(anag_data['search_words']))
-            word_coverage = len(common_words) / len(anag_data['search_words']) if anag_data['search_words'] else 0
-            score = (jaccard * 0.4) + (word_coverage * 0.6)
-            
-            if score > best_score:
-                best_score = score
-                best_match_id = anag_id
-
-    if best_match_id and best_score >= 0.3:
-        logger.info(f"{log_prefix}: Match nome indicizzato -> ID:{best_match_id}, Score: {best_score:.3f}")
-        return best_match_id
-
-    return None
+    # Una sola passata sull'automa: PIVA/CF (confidenza 1.0) prima del match sul nome
+    anag_id, score = _anagraphics_cache.resolve(description)
+    if anag_id:
+        logger.info(f"{log_prefix}: Match controparte -> ID:{anag_id}, Score: {score:.3f}")
+    return anag_id
 
 class BatchProcessor:
     """Processore batch ottimizzato per aggiornamenti di stato"""
@@ -1215,11 +1129,16 @@ class BatchProcessor:
     def __init__(self, conn):
         self.conn = conn
         self.cursor = conn.cursor()
+        # Con i trigger di stato attivi (DB_RECON_STATUS=triggers) SQLite aggiorna già
+        # importi e stati a ogni modifica dei link: nessun ricalcolo lato Python
+        self.status_triggers = is_reconciliation_triggers_active(conn)
         
     def update_invoice_statuses_batch(self, invoice_ids: List[int]) -> int:
         """Aggiornamento batch ottimizzato per fatture"""
-        if not invoice_ids:
+        if not invoice_ids or self.status_triggers:
             return 0
+        if is_money_cents_active(self.conn):
+            return self._update_invoice_statuses_batch_cents(invoice_ids)
         
         placeholders = ','.join('?' * len(invoice_ids))
         self.cursor.execute(f"""
@@ -1271,8 +1190,10 @@ class BatchProcessor:
     
     def update_transaction_statuses_batch(self, transaction_ids: List[int]) -> int:
         """Aggiornamento batch ottimizzato per transazioni"""
-        if not transaction_ids:
+        if not transaction_ids or self.status_triggers:
             return 0
+        if is_money_cents_active(self.conn):
+            return self._update_transaction_statuses_batch_cents(transaction_ids)
         
         placeholders = ','.join('?' * len(transaction_ids))
         self.cursor.execute(f"""
@@ -1317,6 +1238,104 @@ class BatchProcessor:
         
         return len(updates)
 
+    def _update_invoice_statuses_batch_cents(self, invoice_ids: List[int]) -> int:
+        """Variante su centesimi interi: stati calcolati in modo vettoriale con NumPy"""
+        placeholders = ','.join('?' * len(invoice_ids))
+        self.cursor.execute(f"""
+            SELECT 
+                i.id,
+                i.total_amount_cents,
+                i.paid_amount_cents,
+                i.due_date,
+                i.payment_status,
+                COALESCE(SUM(rl.reconciled_amount_cents), 0) as total_linked_cents
+            FROM Invoices i
+            LEFT JOIN ReconciliationLinks rl ON i.id = rl.invoice_id
+            WHERE i.id IN ({placeholders})
+            GROUP BY i.id, i.total_amount_cents, i.paid_amount_cents, i.due_date, i.payment_status
+        """, invoice_ids)
+        rows = self.cursor.fetchall()
+        if not rows:
+            return 0
+        
+        ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        total = np.array([row['total_amount_cents'] for row in rows], dtype=np.int64)
+        paid = np.array([row['paid_amount_cents'] for row in rows], dtype=np.int64)
+        linked = np.array([row['total_linked_cents'] for row in rows], dtype=np.int64)
+        current = np.array([row['payment_status'] for row in rows], dtype=object)
+        due_dates = pd.to_datetime(pd.Series([row['due_date'] for row in rows]), errors='coerce')
+        overdue = (due_dates.dt.date < date.today()).fillna(False).to_numpy(dtype=bool)
+        
+        new_status = np.select(
+            [linked <= AMOUNT_TOLERANCE_CENTS / 2, np.abs(linked - total) <= AMOUNT_TOLERANCE_CENTS],
+            [np.where(overdue, 'Scaduta', 'Aperta'), 'Pagata Tot.'],
+            default='Pagata Parz.'
+        ).astype(object)
+        
+        changed = (new_status != current) | (linked != paid)
+        now = datetime.now()
+        updates = [(status, linked_cents / 100, now, invoice_id)
+                   for status, linked_cents, invoice_id
+                   in zip(new_status[changed].tolist(), linked[changed].tolist(), ids[changed].tolist())]
+        
+        if updates:
+            # paid_amount_cents viene riallineato dal trigger sulla colonna REAL
+            self.cursor.executemany("""
+                UPDATE Invoices 
+                SET payment_status = ?, paid_amount = ?, updated_at = ?
+                WHERE id = ?
+            """, updates)
+        
+        return len(updates)
+    
+    def _update_transaction_statuses_batch_cents(self, transaction_ids: List[int]) -> int:
+        """Variante su centesimi interi: stati calcolati in modo vettoriale con NumPy"""
+        placeholders = ','.join('?' * len(transaction_ids))
+        self.cursor.execute(f"""
+            SELECT 
+                t.id,
+                t.amount_cents,
+                t.reconciled_amount_cents,
+                t.reconciliation_status,
+                COALESCE(SUM(rl.reconciled_amount_cents), 0) as total_linked_cents
+            FROM BankTransactions t
+            LEFT JOIN ReconciliationLinks rl ON t.id = rl.transaction_id
+            WHERE t.id IN ({placeholders}) AND t.reconciliation_status != 'Ignorato'
+            GROUP BY t.id, t.amount_cents, t.reconciled_amount_cents, t.reconciliation_status
+        """, transaction_ids)
+        rows = self.cursor.fetchall()
+        if not rows:
+            return 0
+        
+        ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        amount_abs = np.abs(np.array([row['amount_cents'] for row in rows], dtype=np.int64))
+        reconciled = np.array([row['reconciled_amount_cents'] for row in rows], dtype=np.int64)
+        linked = np.array([row['total_linked_cents'] for row in rows], dtype=np.int64)
+        current = np.array([row['reconciliation_status'] for row in rows], dtype=object)
+        
+        new_status = np.select(
+            [np.abs(linked) <= AMOUNT_TOLERANCE_CENTS / 2,
+             np.abs(linked - amount_abs) <= AMOUNT_TOLERANCE_CENTS,
+             linked < amount_abs],
+            ['Da Riconciliare', 'Riconciliato Tot.', 'Riconciliato Parz.'],
+            default='Riconciliato Eccesso'
+        ).astype(object)
+        
+        changed = (new_status != current) | (linked != reconciled)
+        now = datetime.now()
+        updates = [(status, linked_cents / 100, now, transaction_id)
+                   for status, linked_cents, transaction_id
+                   in zip(new_status[changed].tolist(), linked[changed].tolist(), ids[changed].tolist())]
+        
+        if updates:
+            self.cursor.executemany("""
+                UPDATE BankTransactions 
+                SET reconciliation_status = ?, reconciled_amount = ?, updated_at = ?
+                WHERE id = ?
+            """, updates)
+        
+        return len(updates)
+
 def calculate_and_update_item_status(conn, item_type, item_id):
     """Versione ottimizzata del calcolo stato con batch processor"""
     processor = BatchProcessor(conn)
@@ -1384,28 +1403,21 @@ def suggest_reconciliation_matches_enhanced(invoice_id=None, transaction_id=None
             else:
                 logger.info(f"{log_prefix}: Utilizzo filtro Anagrafica da UI: {effective_anag_id_filter}")
 
-            base_query = """
-                SELECT i.id, i.doc_number, i.total_amount, i.paid_amount,
-                       ABS(i.total_amount - i.paid_amount) as open_amount_abs_calc,
-                       a.denomination, i.anagraphics_id, i.doc_date
-                FROM Invoices i
-                JOIN Anagraphics a ON i.anagraphics_id = a.id
-                WHERE i.type = ?
-                  AND i.payment_status IN ('Aperta', 'Scaduta', 'Pagata Parz.')
-                  AND ABS(i.total_amount - i.paid_amount) > ?
-            """
-            
-            params = [target_invoice_type, float(AMOUNT_TOLERANCE / 2)]
-            
-            if effective_anag_id_filter is not None:
-                base_query += " AND i.anagraphics_id = ?"
-                params.append(effective_anag_id_filter)
-            
-            base_query += " ORDER BY ABS(ABS(i.total_amount - i.paid_amount) - ?) ASC LIMIT 50"
-            params.append(float(target_amount_abs))
-            
-            cursor.execute(base_query, params)
-            open_invoices = cursor.fetchall()
+            # Candidati per residuo più vicino dall'indice in memoria (bisect), dettagli per id
+            candidates = get_invoice_residual_index(conn).nearest(
+                target_invoice_type, to_cents(target_amount_abs), effective_anag_id_filter, limit=50
+            )
+            open_invoices = []
+            if candidates:
+                cursor.execute(f"""
+                    SELECT i.id, i.doc_number, i.total_amount, i.paid_amount, i.open_residual,
+                           a.denomination, i.anagraphics_id, i.doc_date
+                    FROM Invoices i
+                    JOIN Anagraphics a ON i.anagraphics_id = a.id
+                    WHERE i.id IN ({','.join('?' * len(candidates))})
+                """, [invoice_id for invoice_id, _ in candidates])
+                rows_by_id = {row['id']: row for row in cursor.fetchall()}
+                open_invoices = [rows_by_id[invoice_id] for invoice_id, _ in candidates if invoice_id in rows_by_id]
             
             logger.info(f"{log_prefix}: Trovate {len(open_invoices)} fatture candidate per analisi 1:1")
             
@@ -1419,7 +1431,7 @@ def suggest_reconciliation_matches_enhanced(invoice_id=None, transaction_id=None
                 inv_number = inv['doc_number'] or ""
                 inv_denomination = inv['denomination'] or ""
                 
-                invoice_remaining = quantize(to_decimal(inv['total_amount']) - to_decimal(inv['paid_amount']))
+                invoice_remaining = quantize(to_decimal(inv['open_residual']))
                 invoice_remaining_abs = invoice_remaining.copy_abs()
 
                 if invoice_remaining_abs <= AMOUNT_TOLERANCE / 2:
@@ -1451,7 +1463,7 @@ def suggest_reconciliation_matches_enhanced(invoice_id=None, transaction_id=None
 
         elif search_direction == 'invoice_to_transaction':
             cursor.execute("""
-                SELECT i.id, i.type, i.doc_number, i.total_amount, i.paid_amount,
+                SELECT i.id, i.type, i.doc_number, i.total_amount, i.paid_amount, i.open_residual,
                        i.payment_status, a.denomination, i.anagraphics_id, i.doc_date
                 FROM Invoices i 
                 JOIN Anagraphics a ON i.anagraphics_id = a.id
@@ -1463,11 +1475,11 @@ def suggest_reconciliation_matches_enhanced(invoice_id=None, transaction_id=None
                 logger.warning(f"{log_prefix}: Fattura I:{invoice_id} non trovata.")
                 return suggestions
                 
-            if inv['payment_status'] not in ('Aperta', 'Scaduta', 'Pagata Parz.'):
+            if inv['payment_status'] not in OPEN_INVOICE_STATUSES:
                 logger.debug(f"{log_prefix}: Fattura I:{invoice_id} non idonea.")
                 return suggestions
 
-            invoice_remaining = quantize(to_decimal(inv['total_amount']) - to_decimal(inv['paid_amount']))
+            invoice_remaining = quantize(to_decimal(inv['open_residual']))
             if invoice_remaining.copy_abs() <= AMOUNT_TOLERANCE / 2:
                 logger.debug(f"{log_prefix}: Residuo fattura I:{invoice_id} trascurabile.")
                 return suggestions
@@ -1585,8 +1597,9 @@ class MatchValidator:
         invoice_remaining = quantize(
             to_decimal(self.result['total_amount']) - to_decimal(self.result['paid_amount'])
         )
+        # reconciled_amount è sempre positivo (somma dei link): il residuo va calcolato sul valore assoluto
         transaction_remaining = quantize(
-            to_decimal(self.result['amount']) - to_decimal(self.result['reconciled_amount'])
+            to_decimal(self.result['amount']).copy_abs() - to_decimal(self.result['reconciled_amount'])
         )
 
         if self.amount > invoice_remaining.copy_abs() + AMOUNT_TOLERANCE:
@@ -1649,6 +1662,136 @@ def apply_manual_match_optimized(invoice_id, transaction_id, amount_to_match_inp
         logger.error(f"Errore abb. manuale ottimizzato (I:{invoice_id}, T:{transaction_id}): {e}", exc_info=True)
         return False, f"Errore: {e}"
 
+_SQL_IN_CHUNK = 500  # id per clausola IN (sotto il limite di variabili dei vecchi SQLite)
+
+def _id_chunks(ids: List[int]) -> Iterable[List[int]]:
+    for start in range(0, len(ids), _SQL_IN_CHUNK):
+        yield ids[start:start + _SQL_IN_CHUNK]
+
+def _normalize_match_pair(pair) -> Tuple[int, int, Decimal]:
+    """(invoice_id, transaction_id, importo) da dict (amount/amount_to_match) o tupla"""
+    if isinstance(pair, dict):
+        amount = pair.get('amount', pair.get('amount_to_match'))
+        invoice_id, transaction_id = pair['invoice_id'], pair['transaction_id']
+    else:
+        invoice_id, transaction_id, amount = pair
+    return int(invoice_id), int(transaction_id), quantize(to_decimal(amount))
+
+def apply_matches_batch(pairs: Iterable) -> Dict[str, Any]:
+    """
+    Applica in blocco abbinamenti manuali fattura/transazione.
+
+    Tutte le coppie sono validate (MatchValidator) sulla stessa istantanea, letta dentro
+    BEGIN IMMEDIATE; i residui vengono scalati in memoria man mano che le coppie sono
+    accettate, quindi più coppie sulla stessa fattura o transazione non possono superarne
+    il residuo. I link sono scritti con un solo executemany (upsert sulla coppia), gli stati
+    ricalcolati in una passata BatchProcessor e il tutto confermato con un unico commit.
+
+    Le coppie non valide sono scartate e riportate singolarmente in 'results'; un errore
+    di scrittura annulla l'intero blocco.
+    """
+    pairs = list(pairs)
+    results: List[Dict[str, Any]] = []
+    normalized = []
+    for index, pair in enumerate(pairs):
+        try:
+            invoice_id, transaction_id, amount = _normalize_match_pair(pair)
+        except (KeyError, TypeError, ValueError) as e:
+            results.append({'pair_index': index, 'success': False, 'message': f"Coppia non valida: {e}"})
+            continue
+        entry = {'pair_index': index, 'invoice_id': invoice_id, 'transaction_id': transaction_id,
+                 'amount': float(amount), 'success': False, 'message': None}
+        results.append(entry)
+        if amount <= Decimal('0.0'):
+            entry['message'] = "Importo deve essere positivo."
+        else:
+            normalized.append((entry, invoice_id, transaction_id, amount))
+
+    summary = {'success': False, 'applied': 0, 'failed': len(results), 'results': results,
+               'affected_invoices': [], 'affected_transactions': []}
+    if not normalized:
+        summary['success'] = not pairs
+        return summary
+
+    try:
+        with get_db_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.cursor()
+
+            invoices: Dict[int, Dict[str, Any]] = {}
+            for chunk in _id_chunks(sorted({inv_id for _, inv_id, _, _ in normalized})):
+                cursor.execute(f"""
+                    SELECT id, total_amount, paid_amount, payment_status, doc_number
+                    FROM Invoices WHERE id IN ({','.join('?' * len(chunk))})
+                """, chunk)
+                for row in cursor.fetchall():
+                    invoices[row['id']] = dict(row)
+            transactions: Dict[int, Dict[str, Any]] = {}
+            for chunk in _id_chunks(sorted({trans_id for _, _, trans_id, _ in normalized})):
+                cursor.execute(f"""
+                    SELECT id, amount, reconciled_amount, reconciliation_status
+                    FROM BankTransactions WHERE id IN ({','.join('?' * len(chunk))})
+                """, chunk)
+                for row in cursor.fetchall():
+                    transactions[row['id']] = dict(row)
+
+            links: Dict[Tuple[int, int], Decimal] = {}
+            accepted = []
+            for entry, invoice_id, transaction_id, amount in normalized:
+                invoice = invoices.get(invoice_id)
+                transaction = transactions.get(transaction_id)
+                if invoice is None or transaction is None:
+                    entry['message'] = "Fattura o transazione non trovata."
+                    continue
+                validation = MatchValidator({**invoice, **transaction}, amount).validate()
+                if not validation['valid']:
+                    entry['message'] = validation['error']
+                    continue
+                invoice['paid_amount'] = quantize(to_decimal(invoice['paid_amount']) + amount)
+                transaction['reconciled_amount'] = quantize(to_decimal(transaction['reconciled_amount']) + amount)
+                links[(invoice_id, transaction_id)] = links.get((invoice_id, transaction_id), Decimal('0')) + amount
+                accepted.append(entry)
+
+            if accepted:
+                now_ts = datetime.now()
+                cursor.executemany("""
+                    INSERT INTO ReconciliationLinks (invoice_id, transaction_id, reconciled_amount, reconciliation_date)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(transaction_id, invoice_id) DO UPDATE SET
+                        reconciled_amount = ROUND(reconciled_amount + excluded.reconciled_amount, 2),
+                        reconciliation_date = excluded.reconciliation_date
+                """, [(invoice_id, transaction_id, float(quantize(amount)), now_ts)
+                      for (invoice_id, transaction_id), amount in links.items()])
+
+                affected_invoices = sorted({invoice_id for invoice_id, _ in links})
+                affected_transactions = sorted({transaction_id for _, transaction_id in links})
+                processor = BatchProcessor(conn)
+                for chunk in _id_chunks(affected_invoices):
+                    processor.update_invoice_statuses_batch(chunk)
+                for chunk in _id_chunks(affected_transactions):
+                    processor.update_transaction_statuses_batch(chunk)
+                summary['affected_invoices'] = affected_invoices
+                summary['affected_transactions'] = affected_transactions
+
+            conn.commit()
+
+        for entry in accepted:
+            entry['success'] = True
+            entry['message'] = "Abbinamento manuale applicato."
+        summary['applied'] = len(accepted)
+        summary['failed'] = len(results) - len(accepted)
+        summary['success'] = True
+        logger.info(f"Abb. manuali in blocco: {len(accepted)}/{len(results)} applicati, "
+                    f"{len(summary['affected_invoices'])} fatture e "
+                    f"{len(summary['affected_transactions'])} transazioni aggiornate.")
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Errore abb. manuali in blocco ({len(normalized)} coppie): {e}", exc_info=True)
+        for entry, _, _, _ in normalized:
+            if entry['message'] is None:
+                entry['message'] = f"Errore: {e}"
+        summary['affected_invoices'] = summary['affected_transactions'] = []
+    return summary
+
 class AutoReconciler:
     """Riconciliatore automatico ottimizzato"""
     
@@ -1692,7 +1835,7 @@ class AutoReconciler:
                 if remaining.copy_abs() > AMOUNT_TOLERANCE / 2:
                     transactions_data[item_id] = {'remaining': remaining}
             else:
-                if row['status'] not in ('Aperta', 'Scaduta', 'Pagata Parz.'):
+                if row['status'] not in OPEN_INVOICE_STATUSES:
                     return {
                         'valid': False,
                         'error': f"I:{item_id} (Stato: {row['status']}) non utilizzabile."
@@ -1826,135 +1969,218 @@ def attempt_auto_reconciliation_optimized(transaction_ids, invoice_ids):
         logger.error(f"Errore critico auto-rec ottimizzata: {e_generic}", exc_info=True)
         return False, f"Errore imprevisto: {e_generic}"
 
-class AutoMatchBatchProcessor:
-    """Processore batch ottimizzato per match automatici"""
-    
-    def __init__(self, cursor):
-        self.cursor = cursor
-        
-    def process_transactions(self, transactions: List[Dict]) -> List[Dict]:
-        """Processa transazioni in batch per trovare match automatici"""
-        candidate_matches = []
-        batch_size = 25
-        
-        for i in range(0, len(transactions), batch_size):
-            batch = transactions[i:i + batch_size]
-            
-            for trans_row in batch:
-                trans_id = trans_row['transaction_id']
-                trans_remaining = quantize(to_decimal(trans_row['trans_remaining']))
-                
-                if trans_remaining.copy_abs() <= AMOUNT_TOLERANCE / 2:
-                    continue
-                
-                trans_suggestions = suggest_reconciliation_matches_enhanced(
-                    transaction_id=trans_id, 
-                    anagraphics_id_ui_filter=None
-                )
-
-                exact_matches = self._filter_exact_matches(trans_suggestions)
-
-                if len(exact_matches) == 1:
-                    match = exact_matches[0]
-                    match_data = self._prepare_match_data(match, trans_row, trans_remaining)
-                    
-                    if match_data:
-                        candidate_matches.append(match_data)
-                        logger.info(f"AutoMatchFinder -> Candidato ottimo: T:{trans_id} <-> I:{match_data['invoice_id']} per {match_data['amount']:.2f} (Score: {match.get('confidence_score', 0):.3f})")
-        
-        candidate_matches.sort(key=lambda x: x.get('confidence_score', 0), reverse=True)
-        return candidate_matches
-    
-    def _filter_exact_matches(self, suggestions: List[Dict]) -> List[Dict]:
-        """Filtra solo match esatti ad alta confidenza"""
-        exact_matches = []
-        for sugg in suggestions:
-            if (sugg.get('confidence') == 'Alta' and 
-                'Importo Esatto' in sugg.get('reasons', []) and
-                sugg.get('confidence_score', 0) >= Config.HIGH_CONFIDENCE_THRESHOLD):
-                exact_matches.append(sugg)
-        return exact_matches
-    
-    def _prepare_match_data(self, match: Dict, trans_row: Dict, trans_remaining: Decimal) -> Optional[Dict]:
-        """Prepara i dati del match per il risultato finale"""
-        inv_id = match['invoice_ids'][0]
-        match_amount = trans_remaining.copy_abs()
+class GlobalAutoMatcher:
+    """
+    Auto-riconciliazione 1:1 globale: transazioni e fatture aperte caricate una volta,
+    grafo sparso dei candidati (stesso importo in centesimi e stessa controparte dedotta),
+    assegnamento uno-a-uno a punteggio massimo risolto per componente connessa.
+    """
 
-        self.cursor.execute("""
-            SELECT doc_number, doc_date 
-            FROM Invoices 
-            WHERE id = ?
-        """, (inv_id,))
-        
-        inv_details_row = self.cursor.fetchone()
-        if not inv_details_row:
-            return None
-            
-        inv_details = dict(inv_details_row)
+    SCORE_EPSILON = 1e-9
+    # Score minimo per livello richiesto (stesse soglie di trigger_auto_reconciliation)
+    MIN_SCORE_BY_LEVEL = {'Exact': 0.9, 'High': 0.7, 'Medium': Config.HIGH_CONFIDENCE_THRESHOLD}
 
-        trans_date = self._format_date(trans_row.get('transaction_date'))
-        inv_date = self._format_date(inv_details.get('doc_date'))
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
 
-        return {
-            'transaction_id': trans_row['transaction_id'],
-            'invoice_id': inv_id,
-            'amount': match_amount,
-            'trans_date': trans_date,
-            'trans_amount_orig': quantize(to_decimal(trans_row['amount'])),
-            'inv_number': inv_details.get('doc_number', 'N/D'),
-            'inv_date': inv_date,
-            'confidence_score': match.get('confidence_score', 0),
-            'match_reasons': match.get('reasons', [])
-        }
-    
-    def _format_date(self, date_value) -> str:
-        """Formatta una data in modo sicuro"""
-        if not date_value:
-            return 'N/D'
-        
-        try:
-            return pd.to_datetime(date_value).strftime('%d/%m/%Y')
-        except:
-            return 'N/D'
+    def _load_open_transactions(self) -> pd.DataFrame:
+        df = pd.read_sql_query("""
+            SELECT id, amount, reconciled_amount, description, transaction_date, inferred_anagraphics_id
+            FROM BankTransactions
+            WHERE reconciliation_status IN ('Da Riconciliare', 'Riconciliato Parz.')
+        """, self.conn)
+        # reconciled_amount è sempre positivo (somma dei link): residuo con il segno dell'importo
+        amount_cents = amounts_to_cents_array(df['amount'])
+        df['remaining_cents'] = np.sign(amount_cents) * (np.abs(amount_cents) - amounts_to_cents_array(df['reconciled_amount']))
+        df = df[df['remaining_cents'].abs() > AMOUNT_TOLERANCE_CENTS // 2].reset_index(drop=True)
+        return self._parse_dates(df, 'transaction_date')
+
+    def _load_open_invoices(self) -> pd.DataFrame:
+        df = pd.read_sql_query(f"""
+            SELECT i.id, i.type, i.anagraphics_id, i.doc_number, i.doc_date,
+                   i.total_amount, i.paid_amount, i.open_residual, a.denomination
+            FROM Invoices i
+            JOIN Anagraphics a ON i.anagraphics_id = a.id
+            WHERE i.{OPEN_INVOICE_FILTER}
+        """, self.conn)
+        df['remaining_cents'] = np.abs(amounts_to_cents_array(df['open_residual']))
+        df = df[df['remaining_cents'] > AMOUNT_TOLERANCE_CENTS // 2].reset_index(drop=True)
+        return self._parse_dates(df, 'doc_date')
+
+    @staticmethod
+    def _parse_dates(df: pd.DataFrame, column: str) -> pd.DataFrame:
+        """Date convertite una volta per colonna: Timestamp (o None) per lo scoring e stringa dd/mm/YYYY."""
+        parsed = pd.to_datetime(df[column], errors='coerce')
+        df[f'{column}_fmt'] = parsed.dt.strftime('%d/%m/%Y').fillna('N/D')
+        df[f'{column}_ts'] = parsed.astype(object).where(parsed.notna(), None)
+        return df
+
+    def build_candidate_edges(self, transactions: pd.DataFrame, invoices: pd.DataFrame) -> List[Tuple[int, int, float, List[str]]]:
+        """Archi (indice transazione, indice fattura, score, motivi) dei soli match esatti ad alta confidenza."""
+        buckets: Dict[Tuple[str, Optional[int], int], List[int]] = defaultdict(list)
+        any_anag_buckets: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+        inv_types = invoices['type'].tolist()
+        inv_anags = invoices['anagraphics_id'].tolist()
+        inv_cents = invoices['remaining_cents'].tolist()
+        inv_numbers = invoices['doc_number'].fillna('').tolist()
+        inv_denominations = invoices['denomination'].fillna('').tolist()
+        inv_dates = invoices['doc_date_ts'].tolist()
+        for inv_idx in range(len(invoices)):
+            buckets[(inv_types[inv_idx], inv_anags[inv_idx], inv_cents[inv_idx])].append(inv_idx)
+            any_anag_buckets[(inv_types[inv_idx], inv_cents[inv_idx])].append(inv_idx)
+
+        edges = []
+        for t_idx, trans in enumerate(transactions.itertuples(index=False)):
+            remaining = int(trans.remaining_cents)
+            inv_type = 'Attiva' if remaining > 0 else 'Passiva'
+            anag_id = None if pd.isna(trans.inferred_anagraphics_id) else int(trans.inferred_anagraphics_id)
+            candidate_idx = []
+            for cents in range(abs(remaining) - AMOUNT_TOLERANCE_CENTS, abs(remaining) + AMOUNT_TOLERANCE_CENTS + 1):
+                if anag_id is not None:
+                    candidate_idx.extend(buckets.get((inv_type, anag_id, cents), ()))
+                else:
+                    candidate_idx.extend(any_anag_buckets.get((inv_type, cents), ()))
+            if not candidate_idx:
+                continue
 
-def find_automatic_matches_optimized(confidence_level='Exact'):
-    """Versione ottimizzata per trovare match automatici"""
-    candidate_matches = []
+            description = trans.description or ""
+            analyzer = MatchAnalyzerV2(cents_to_decimal(abs(remaining)), description,
+                                       extract_invoice_number(description), trans.transaction_date_ts)
+            for inv_idx in candidate_idx:
+                result = analyzer.analyze_invoice_match(
+                    cents_to_decimal(inv_cents[inv_idx]), inv_numbers[inv_idx],
+                    inv_denominations[inv_idx], inv_dates[inv_idx]
+                )
+                if (result['confidence_level'] == 'Alta' and 'Importo Esatto' in result['reasons'] and
+                        result['confidence_score'] >= Config.HIGH_CONFIDENCE_THRESHOLD):
+                    edges.append((t_idx, inv_idx, result['confidence_score'], result['reasons']))
+        return edges
+
+    @staticmethod
+    def _connected_components(edges: List[Tuple[int, int, float, List[str]]]) -> List[List[int]]:
+        """Componenti connesse del grafo bipartito (liste di indici di archi)."""
+        parent: Dict[Tuple[str, int], Tuple[str, int]] = {}
+
+        def find(node):
+            parent.setdefault(node, node)
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for t_idx, inv_idx, _, _ in edges:
+            root_t, root_i = find(('T', t_idx)), find(('I', inv_idx))
+            if root_t != root_i:
+                parent[max(root_t, root_i)] = min(root_t, root_i)
+
+        components: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+        for edge_idx, (t_idx, _, _, _) in enumerate(edges):
+            components[find(('T', t_idx))].append(edge_idx)
+        return [components[root] for root in sorted(components)]
+
+    def _solve_component(self, edges: List[Tuple[int, int, float, List[str]]], edge_ids: List[int]) -> List[int]:
+        """Assegnamento uno-a-uno a score massimo; ritorna gli indici degli archi scelti."""
+        if len(edge_ids) == 1:
+            return edge_ids
+        t_nodes = sorted({edges[e][0] for e in edge_ids})
+        i_nodes = sorted({edges[e][1] for e in edge_ids})
+        t_pos = {t: k for k, t in enumerate(t_nodes)}
+        i_pos = {i: k for k, i in enumerate(i_nodes)}
+        edge_at = {(t_pos[edges[e][0]], i_pos[edges[e][1]]): e for e in edge_ids}
+
+        if linear_sum_assignment is not None:
+            scores = np.full((len(t_nodes), len(i_nodes)), -1e6)
+            for (row, col), e in edge_at.items():
+                scores[row, col] = edges[e][2]
+            rows, cols = linear_sum_assignment(scores, maximize=True)
+            chosen = [edge_at[(r, c)] for r, c in zip(rows.tolist(), cols.tolist()) if (r, c) in edge_at]
+        else:
+            # Senza SciPy: greedy deterministico per score decrescente (non è un assegnamento ottimo globale)
+            logger.warning("[AutoMatchFinder] SciPy non disponibile: assegnamento greedy su componente di "
+                           f"{len(edge_ids)} archi, il risultato può non essere ottimo")
+            chosen, used_t, used_i = [], set(), set()
+            for e in sorted(edge_ids, key=lambda e: (-edges[e][2], edges[e][0], edges[e][1])):
+                if edges[e][0] not in used_t and edges[e][1] not in used_i:
+                    chosen.append(e)
+                    used_t.add(edges[e][0])
+                    used_i.add(edges[e][1])
+
+        # Scarta le coppie ambigue: a parità di score poteva essere scelto un nodo rimasto libero
+        assigned_t = {edges[e][0] for e in chosen}
+        assigned_i = {edges[e][1] for e in chosen}
+        best_free_inv: Dict[int, float] = {}
+        best_free_trans: Dict[int, float] = {}
+        for e in edge_ids:
+            t_idx, inv_idx, score, _ = edges[e]
+            if inv_idx not in assigned_i:
+                best_free_inv[t_idx] = max(best_free_inv.get(t_idx, -1.0), score)
+            if t_idx not in assigned_t:
+                best_free_trans[inv_idx] = max(best_free_trans.get(inv_idx, -1.0), score)
+        return [e for e in chosen
+                if best_free_inv.get(edges[e][0], -1.0) < edges[e][2] - self.SCORE_EPSILON
+                and best_free_trans.get(edges[e][1], -1.0) < edges[e][2] - self.SCORE_EPSILON]
+
+    def find_matches(self, confidence_level: Optional[str] = None) -> List[Dict]:
+        """
+        Match automatici 1:1 ordinati per confidenza decrescente. Con confidence_level
+        ('Exact', 'High', 'Medium') restano solo gli assegnamenti con score sufficiente.
+        """
+        transactions = self._load_open_transactions()
+        invoices = self._load_open_invoices()
+        logger.info(f"[AutoMatchFinder] {len(transactions)} transazioni e {len(invoices)} fatture aperte caricate")
+        if transactions.empty or invoices.empty:
+            return []
+
+        edges = self.build_candidate_edges(transactions, invoices)
+        chosen = []
+        for edge_ids in self._connected_components(edges):
+            chosen.extend(self._solve_component(edges, edge_ids))
+        if confidence_level is not None:
+            # Filtro dopo l'assegnamento: escludere archi prima libererebbe alternative ambigue
+            min_score = self.MIN_SCORE_BY_LEVEL.get(confidence_level, Config.HIGH_CONFIDENCE_THRESHOLD)
+            chosen = [e for e in chosen if edges[e][2] >= min_score]
+
+        matches = []
+        for e in chosen:
+            t_idx, inv_idx, score, reasons = edges[e]
+            trans = transactions.iloc[t_idx]
+            inv = invoices.iloc[inv_idx]
+            matches.append({
+                'transaction_id': int(trans['id']),
+                'invoice_id': int(inv['id']),
+                'amount': cents_to_decimal(abs(int(trans['remaining_cents']))),
+                'trans_date': trans['transaction_date_fmt'],
+                'trans_amount_orig': quantize(to_decimal(trans['amount'])),
+                'inv_number': inv['doc_number'] or 'N/D',
+                'inv_date': inv['doc_date_fmt'],
+                'confidence_score': score,
+                'match_reasons': reasons
+            })
+        matches.sort(key=lambda x: (-x['confidence_score'], x['transaction_id']))
+        logger.info(f"[AutoMatchFinder] {len(edges)} archi candidati, {len(matches)} assegnamenti univoci")
+        return matches
+
+def find_automatic_matches_optimized(confidence_level='Exact', max_results: Optional[int] = 50):
+    """
+    Match automatici 1:1 con assegnamento globale (GlobalAutoMatcher) su tutte le
+    transazioni e fatture aperte, filtrati per confidence_level ('Exact', 'High',
+    'Medium'). max_results=None ritorna tutti gli assegnamenti.
+    """
     log_prefix = "[AutoMatchFinder Optimized]"
-    logger.info(f"{log_prefix} Avvio ricerca match automatici ottimizzata...")
+    logger.info(f"{log_prefix} Avvio ricerca match automatici globale...")
 
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
+        # Controparte dedotta aggiornata prima di costruire il grafo
+        try: from .transaction_counterparty import refresh_inferred_anagraphics
+        except ImportError: from transaction_counterparty import refresh_inferred_anagraphics
 
-            query_candidates = """
-                SELECT 
-                    t.id as transaction_id,
-                    t.amount,
-                    t.reconciled_amount,
-                    t.description,
-                    t.transaction_date,
-                    (t.amount - t.reconciled_amount) as trans_remaining
-                FROM BankTransactions t
-                WHERE t.reconciliation_status IN ('Da Riconciliare', 'Riconciliato Parz.')
-                  AND ABS(t.amount - t.reconciled_amount) > ?
-                ORDER BY ABS(t.amount - t.reconciled_amount) DESC
-                LIMIT 200
-            """
-            
-            cursor.execute(query_candidates, (float(AMOUNT_TOLERANCE / 2),))
-            eligible_transactions = cursor.fetchall()
-            
-            logger.info(f"{log_prefix} Analisi {len(eligible_transactions)} transazioni candidate")
-
-            if not eligible_transactions:
-                return []
-
-            batch_processor = AutoMatchBatchProcessor(cursor)
-            candidate_matches = batch_processor.process_transactions(eligible_transactions)
+        with get_db_connection() as conn:
+            if refresh_inferred_anagraphics(conn):
+                conn.commit()
+            candidate_matches = GlobalAutoMatcher(conn).find_matches(confidence_level)
 
         logger.info(f"{log_prefix} Ricerca completata. Trovati {len(candidate_matches)} candidati ottimi per auto-riconciliazione.")
-        return candidate_matches[:50]
+        return candidate_matches if max_results is None else candidate_matches[:max_results]
 
     except sqlite3.Error as db_e:
         logger.error(f"{log_prefix} Errore DB: {db_e}", exc_info=True)
@@ -2058,7 +2284,7 @@ def get_reconciliation_statistics() -> Dict[str, Any]:
 def clear_caches():
     """Pulisce tutte le cache"""
     _anagraphics_cache.clear()
-    memoize_with_timeout.clear_cache()
+    find_anagraphics_id_from_description_v2.cache_clear()
     _extract_piva_cf_from_description.cache_clear()
     MatchAnalyzerV2._calculate_string_similarity.cache_clear()
     logger.info("Cache pulite con successo")
@@ -2086,8 +2312,9 @@ def get_performance_metrics() -> Dict[str, Any]:
     return {
         'anagraphics_cache_stats': _anagraphics_cache.get_stats(),
         'lru_cache_info': {
-            'extract_piva_cf': _extract_piva_cf_from_description.cache_info()._asdict(),
-            'string_similarity': MatchAnalyzerV2._calculate_string_similarity.cache_info()._asdict()
+            'find_anagraphics_v2': find_anagraphics_id_from_description_v2.cache.stats(),
+            'extract_piva_cf': _extract_piva_cf_from_description.cache.stats(),
+            'string_similarity': MatchAnalyzerV2._calculate_string_similarity.cache.stats()
         }
     }
 
@@ -14,7 +14,7 @@ from typing import List, Dict, Set, Tuple, Optional, Any, Callable
 import re
 import pandas as pd
 from dataclasses import dataclass, field
-from functools import lru_cache, wraps
+from functools import wraps
 from contextlib import contextmanager
 import numpy as np
 from enum import Enum
@@ -42,12 +42,16 @@ warnings.filterwarnings('ignore')
 
 try:
     from .database import get_connection
-    from .utils import to_decimal, quantize, AMOUNT_TOLERANCE
+    from .utils import to_decimal, quantize, to_cents, AMOUNT_TOLERANCE, AMOUNT_TOLERANCE_CENTS
+    from .invoice_residual_index import get_invoice_residual_index
+    from .ttl_cache import TTLLRUCache
 except ImportError:
     logging.warning("Import relativo fallito in smart_client_reconciliation_v2.py, tento import assoluto.")
     try:
         from database import get_connection
-        from utils import to_decimal, quantize, AMOUNT_TOLERANCE
+        from utils import to_decimal, quantize, to_cents, AMOUNT_TOLERANCE, AMOUNT_TOLERANCE_CENTS
+        from invoice_residual_index import get_invoice_residual_index
+        from ttl_cache import TTLLRUCache
     except ImportError as e:
         logging.critical(f"Impossibile importare dipendenze in smart_client_reconciliation_v2.py: {e}")
         raise ImportError(f"Impossibile importare dipendenze in smart_client_reconciliation_v2.py: {e}") from e
@@ -119,7 +123,6 @@ class PaymentRecordV2:
                 pass
         return None
 
-    @lru_cache(maxsize=1024)
     def _generate_description_embedding(self) -> Optional[np.ndarray]:
         """Generate text embedding for description using enhanced features"""
         if not self.description:
@@ -192,6 +195,8 @@ class ClientPaymentPatternV2:
     # Performance cache
     _stats_cache: Dict[str, Any] = field(default_factory=dict, init=False)
     _ml_cache: Dict[str, Any] = field(default_factory=dict, init=False)
+    _prediction_cache: TTLLRUCache = field(
+        default_factory=lambda: TTLLRUCache(maxsize=256, ttl_seconds=Config.CACHE_TTL_HOURS * 3600), init=False)
     _cache_lock: threading.RLock = field(default_factory=threading.RLock, init=False)
 
     def add_payment_record(self, record: PaymentRecordV2):
@@ -211,6 +216,7 @@ class ClientPaymentPatternV2:
             # Invalidate caches
             self._stats_cache.clear()
             self._ml_cache.clear()
+            self._prediction_cache.clear()
             self.last_updated = datetime.now()
 
     def _extract_advanced_patterns(self, description: str):
@@ -266,6 +272,7 @@ class ClientPaymentPatternV2:
                 # Update ML cache
                 self._ml_cache['trained'] = True
                 self._ml_cache['train_date'] = datetime.now()
+                self._prediction_cache.clear()
                 
             except Exception as e:
                 logger.error(f"Error training ML models for client {self.anagraphics_id}: {e}")
@@ -447,12 +454,12 @@ class ClientPaymentPatternV2:
     def get_ml_predictions(self, target_amount: Decimal, 
                           target_date: datetime) -> Dict[str, Any]:
         """Get ML-based predictions for payment likelihood"""
+        cache_key = (float(target_amount), target_date.timestamp())
+        return self._prediction_cache.get_or_compute(
+            cache_key, lambda: self._compute_ml_predictions(target_amount, target_date))
+
+    def _compute_ml_predictions(self, target_amount: Decimal, target_date: datetime) -> Dict[str, Any]:
         with self._cache_lock:
-            # Check cache
-            cache_key = f"pred_{float(target_amount)}_{target_date.timestamp()}"
-            if cache_key in self._ml_cache:
-                return self._ml_cache[cache_key]
-            
             predictions = {
                 'amount_cluster_match': 0.0,
                 'temporal_likelihood': 0.5,
@@ -479,9 +486,6 @@ class ClientPaymentPatternV2:
             # Generate recommendations
             predictions['recommendations'] = self._generate_ml_recommendations(predictions)
             
-            # Cache result
-            self._ml_cache[cache_key] = predictions
-            
             return predictions
 
     def _predict_amount_cluster(self, amount: float) -> float:
@@ -884,27 +888,23 @@ class SmartClientReconciliationV2:
             return []
 
     def _get_candidate_invoices(self, cursor, anagraphics_id: int, trans_details: Dict) -> List[Dict]:
-        """Recupera fatture candidate con filtri intelligenti."""
-        target_amount_abs = trans_details['target_amount'].copy_abs()
-        query = """
+        """Recupera fatture candidate con filtri intelligenti (residuo più vicino dall'indice in memoria)."""
+        target_cents = to_cents(trans_details['target_amount'].copy_abs())
+        target_type = 'Attiva' if trans_details['target_amount'] > 0 else 'Passiva'
+        candidates = get_invoice_residual_index(cursor.connection).nearest(
+            target_type, target_cents, anagraphics_id, limit=Config.MAX_CANDIDATES,
+            min_cents=AMOUNT_TOLERANCE_CENTS // 2 + 1, max_cents=target_cents * 3 // 2, positive_only=True
+        )
+        if not candidates:
+            return []
+        cursor.execute(f"""
             SELECT id, doc_number, doc_date, total_amount, paid_amount,
-                   (total_amount - paid_amount) as open_amount
+                   open_residual as open_amount
             FROM Invoices
-            WHERE anagraphics_id = ?
-              AND payment_status IN ('Aperta', 'Scaduta', 'Pagata Parz.')
-              AND (total_amount - paid_amount) > ? AND (total_amount - paid_amount) <= ?
-            ORDER BY ABS((total_amount - paid_amount) - ?) ASC
-            LIMIT ?
-        """
-        params = (
-            anagraphics_id,
-            float(AMOUNT_TOLERANCE / 2),
-            float(target_amount_abs * 1.5),
-            float(target_amount_abs),
-            Config.MAX_CANDIDATES
-        )
-        cursor.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+            WHERE id IN ({','.join('?' * len(candidates))})
+        """, [invoice_id for invoice_id, _ in candidates])
+        rows_by_id = {row['id']: dict(row) for row in cursor.fetchall()}
+        return [rows_by_id[invoice_id] for invoice_id, _ in candidates if invoice_id in rows_by_id]
 
 # ================== ML-ENHANCED SUGGESTION ENGINE ==================
 
@@ -0,0 +1,386 @@
+# core/subset_sum.py - Motore subset-sum in centesimi interi per match N:M
+
+"""
+Ricerca esatta delle combinazioni di k importi (in centesimi interi) la cui somma
+cade entro la tolleranza dal target:
+
+- k <= MITM_MAX_SIZE: meet-in-the-middle, con somme di coppie/terne generate in NumPy
+  e accoppiamento delle due metà tramite searchsorted
+- k > MITM_MAX_SIZE: programmazione dinamica limitata al target (bitset su int Python)
+  usata come oracolo per enumerare solo i rami che portano a una soluzione
+- find_subset_sums_parallel: stesso risultato, con l'albero di ricerca partizionato per
+  indice del primo elemento su un pool di processi che leggono i candidati da memoria condivisa
+
+Il risultato è completo (nessun taglio per numero di iterazioni) e deterministico:
+tuple di indici dell'input, crescenti, ordinate lessicograficamente.
+"""
+
+import atexit
+import concurrent.futures
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .utils import AMOUNT_TOLERANCE_CENTS
+except ImportError:
+    logging.warning("Import relativo fallito in subset_sum.py, tento import assoluto.")
+    from utils import AMOUNT_TOLERANCE_CENTS
+
+logger = logging.getLogger(__name__)
+
+# Dimensione massima gestita con meet-in-the-middle (metà da al più 3 elementi)
+MITM_MAX_SIZE = 6
+
+# Limite (bit) per la tabella DP: n_candidati * (k + 1) * (target + tolleranza + 1)
+DP_MAX_BITS = 400_000_000
+
+
+class SubsetSumTimeout(Exception):
+    """Ricerca interrotta per superamento della deadline."""
+
+
+def _check_deadline(deadline: Optional[float]):
+    if deadline is not None and time.monotonic() > deadline:
+        raise SubsetSumTimeout()
+
+
+def _k_combinations(values: np.ndarray, k: int, remaining: int = 0,
+                    low: Optional[int] = None, high: Optional[int] = None,
+                    deadline: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tutte le combinazioni di k posizioni (crescenti, ordine lessicografico) di values
+    ordinato, con le relative somme. Se low/high sono indicati, scarta i prefissi che
+    non possono chiudere in [low, high] aggiungendo altri `remaining` elementi successivi.
+    """
+    n = len(values)
+    prefix = np.concatenate(([0], np.cumsum(values)))
+    # Somma massima di r elementi qualsiasi: gli ultimi r del vettore ordinato
+    max_tail = [int(prefix[n] - prefix[max(0, n - r)]) for r in range(k + remaining + 1)]
+
+    def _prune(idx, sums, still_needed):
+        if low is None or still_needed == 0:
+            return idx, sums
+        last = idx[:, -1]
+        end = np.minimum(last + 1 + still_needed, n)
+        feasible = (last + still_needed) < n
+        min_continuation = prefix[end] - prefix[np.minimum(last + 1, n)]
+        keep = feasible & (sums + min_continuation <= high) & (sums + max_tail[still_needed] >= low)
+        return idx[keep], sums[keep]
+
+    idx = np.arange(n, dtype=np.int64)[:, None]
+    sums = values.astype(np.int64).copy()
+    idx, sums = _prune(idx, sums, k - 1 + remaining)
+    for step in range(1, k):
+        _check_deadline(deadline)
+        last = idx[:, -1]
+        counts = n - 1 - last
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty((0, k), dtype=np.int64), np.empty(0, dtype=np.int64)
+        rows = np.repeat(np.arange(len(idx)), counts)
+        starts = np.cumsum(counts) - counts
+        new_pos = last[rows] + 1 + (np.arange(total) - np.repeat(starts, counts))
+        idx = np.hstack([idx[rows], new_pos[:, None]])
+        sums = sums[rows] + values[new_pos]
+        idx, sums = _prune(idx, sums, k - 1 - step + remaining)
+    return idx, sums
+
+
+def _meet_in_the_middle(values: np.ndarray, target: int, size: int, tolerance: int,
+                        deadline: Optional[float]) -> np.ndarray:
+    """Combinazioni (posizioni sul vettore ordinato) di `size` elementi entro tolleranza."""
+    low, high = target - tolerance, target + tolerance
+    if size == 1:
+        return np.nonzero((values >= low) & (values <= high))[0][:, None]
+
+    left_size = size // 2
+    right_size = size - left_size
+    left_idx, left_sums = _k_combinations(values, left_size, right_size, low, high, deadline)
+    right_idx, right_sums = _k_combinations(values, right_size, deadline=deadline)
+    if len(left_idx) == 0 or len(right_idx) == 0:
+        return np.empty((0, size), dtype=np.int64)
+
+    order = np.argsort(right_sums, kind='stable')
+    right_idx, right_sums = right_idx[order], right_sums[order]
+
+    _check_deadline(deadline)
+    lo = np.searchsorted(right_sums, low - left_sums, side='left')
+    hi = np.searchsorted(right_sums, high - left_sums, side='right')
+    counts = hi - lo
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty((0, size), dtype=np.int64)
+
+    left_rows = np.repeat(np.arange(len(left_idx)), counts)
+    starts = np.cumsum(counts) - counts
+    right_rows = np.repeat(lo, counts) + (np.arange(total) - np.repeat(starts, counts))
+    # Metà disgiunte e ordinate: ultimo indice della sinistra < primo della destra
+    valid = left_idx[left_rows, -1] < right_idx[right_rows, 0]
+    return np.hstack([left_idx[left_rows[valid]], right_idx[right_rows[valid]]])
+
+
+def _bounded_dp(values: np.ndarray, target: int, size: int, tolerance: int,
+                deadline: Optional[float]) -> Optional[List[Tuple[int, ...]]]:
+    """
+    DP sulle somme raggiungibili (0..target+tolleranza) usando r elementi da values[i:],
+    poi enumerazione guidata dalla tabella. Ritorna None se non applicabile
+    (importi negativi o tabella oltre DP_MAX_BITS).
+    """
+    n = len(values)
+    high = target + tolerance
+    low = max(0, target - tolerance)
+    if high < 0 or (n and int(values[0]) < 0):
+        return None
+    width = high + 1
+    if n * (size + 1) * width > DP_MAX_BITS:
+        return None
+
+    mask = (1 << width) - 1
+    ints = [int(v) for v in values]
+    reach = [[0] * (size + 1) for _ in range(n + 1)]
+    reach[n][0] = 1
+    for i in range(n - 1, -1, -1):
+        _check_deadline(deadline)
+        nxt, cur, v = reach[i + 1], reach[i], ints[i]
+        cur[0] = 1
+        for r in range(1, min(size, n - i) + 1):
+            cur[r] = nxt[r] | ((nxt[r - 1] << v) & mask)
+
+    def _reachable(i, r, lo, hi):
+        if hi < 0:
+            return False
+        lo = max(lo, 0)
+        return ((reach[i][r] >> lo) & ((1 << (hi - lo + 1)) - 1)) != 0
+
+    results: List[Tuple[int, ...]] = []
+    current: List[int] = []
+
+    def _enumerate(i, r, lo, hi):
+        if r == 0:
+            if lo <= 0 <= hi:
+                results.append(tuple(current))
+            return
+        if n - i < r or not _reachable(i, r, lo, hi):
+            return
+        _check_deadline(deadline)
+        v = ints[i]
+        if v <= hi:
+            current.append(i)
+            _enumerate(i + 1, r - 1, lo - v, hi - v)
+            current.pop()
+        _enumerate(i + 1, r, lo, hi)
+
+    _enumerate(0, size, low, high)
+    return results
+
+
+def _depth_first(values: np.ndarray, target: int, size: int, tolerance: int,
+                 deadline: Optional[float]) -> List[Tuple[int, ...]]:
+    """Enumerazione esatta con pruning su somme minime/massime (fallback per importi negativi o target enormi)."""
+    n = len(values)
+    ints = [int(v) for v in values]
+    prefix = [0]
+    for v in ints:
+        prefix.append(prefix[-1] + v)
+    low, high = target - tolerance, target + tolerance
+    results: List[Tuple[int, ...]] = []
+    current: List[int] = []
+
+    def _search(start, r, partial):
+        if r == 0:
+            if low <= partial <= high:
+                results.append(tuple(current))
+            return
+        _check_deadline(deadline)
+        for i in range(start, n - r + 1):
+            min_sum = partial + prefix[i + r] - prefix[i]
+            if min_sum > high:
+                break
+            if partial + prefix[n] - prefix[n - r] < low:
+                return
+            current.append(i)
+            _search(i + 1, r - 1, partial + ints[i])
+            current.pop()
+
+    _search(0, size, 0)
+    return results
+
+
+def _search_sorted(sorted_values: np.ndarray, target: int, size: int, tolerance: int,
+                   deadline: Optional[float]) -> List[Tuple[int, ...]]:
+    """Combinazioni come posizioni crescenti su un vettore già ordinato."""
+    if size <= MITM_MAX_SIZE:
+        return [tuple(row) for row in _meet_in_the_middle(sorted_values, target, size, tolerance, deadline).tolist()]
+    positions = _bounded_dp(sorted_values, target, size, tolerance, deadline)
+    if positions is None:
+        positions = _depth_first(sorted_values, target, size, tolerance, deadline)
+    return positions
+
+
+def find_subset_sums(amounts_cents: Sequence[int], target_cents: int, size: int,
+                     tolerance_cents: int = AMOUNT_TOLERANCE_CENTS,
+                     deadline: Optional[float] = None) -> List[Tuple[int, ...]]:
+    """
+    Tutte le combinazioni di esattamente `size` elementi di amounts_cents con
+    |somma - target_cents| <= tolerance_cents.
+
+    Ritorna tuple di indici crescenti riferiti all'input, in ordine lessicografico.
+    `deadline` (valore di time.monotonic) interrompe la ricerca con SubsetSumTimeout.
+    """
+    values = np.asarray(amounts_cents, dtype=np.int64)
+    n = len(values)
+    if size <= 0 or size > n:
+        return []
+
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    positions = _search_sorted(sorted_values, int(target_cents), size, int(tolerance_cents), deadline)
+    original = order.tolist()
+    return sorted(tuple(sorted(original[p] for p in combo)) for combo in positions)
+
+
+# --- Ricerca parallela (pool di processi) ---
+
+# Sotto questa soglia di candidati il costo del pool supera il guadagno
+PARALLEL_MIN_CANDIDATES = 30
+# Avvio dei worker: niente fork dal processo del server (thread e lock ereditati)
+PROCESS_START_METHOD = 'spawn'
+
+_process_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_process_pool_workers = 0
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool(max_workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    """Pool di processi condiviso, ricreato solo se cambia il numero di worker."""
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_workers != max_workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context(PROCESS_START_METHOD))
+            _process_pool_workers = max_workers
+        return _process_pool
+
+
+def shutdown_process_pool():
+    """Chiude il pool di processi (registrata anche con atexit)."""
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+        _process_pool_workers = 0
+
+
+atexit.register(shutdown_process_pool)
+
+
+def _search_first_indices(shm_name: str, n: int, target: int, size: int, tolerance: int,
+                          first_indices: List[int], time_budget: Optional[float]) -> List[Tuple[int, ...]]:
+    """
+    Worker: combinazioni (posizioni sul vettore ordinato in memoria condivisa) il cui
+    primo elemento è in first_indices. Il sottoalbero di f è la ricerca di size-1
+    elementi in values[f+1:] con target ridotto di values[f].
+    """
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        values = np.ndarray((n,), dtype=np.int64, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+    results: List[Tuple[int, ...]] = []
+    for f in first_indices:
+        _check_deadline(deadline)
+        offset = f + 1
+        for combo in _search_sorted(values[offset:], target - int(values[f]), size - 1, tolerance, deadline):
+            results.append((f,) + tuple(offset + p for p in combo))
+    return results
+
+
+def find_subset_sums_parallel(amounts_cents: Sequence[int], target_cents: int, size: int,
+                              tolerance_cents: int = AMOUNT_TOLERANCE_CENTS,
+                              deadline: Optional[float] = None,
+                              max_workers: int = 2) -> List[Tuple[int, ...]]:
+    """
+    Come find_subset_sums (risultato identico), partizionando la ricerca per indice del
+    primo elemento su un pool di processi. I candidati ordinati sono condivisi in sola
+    lettura tramite shared memory; allo scadere della deadline i task in coda vengono
+    annullati, quelli in corso si interrompono da soli, e viene sollevata SubsetSumTimeout.
+    """
+    values = np.asarray(amounts_cents, dtype=np.int64)
+    n = len(values)
+    if size < 2 or size > n or max_workers < 2 or n < PARALLEL_MIN_CANDIDATES:
+        return find_subset_sums(amounts_cents, target_cents, size, tolerance_cents, deadline)
+
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+
+    # Round-robin dei primi indici: i sottoalberi dei primi indici sono i più grandi
+    n_tasks = min(n - size + 1, max_workers * 4)
+    partitions = [list(range(t, n - size + 1, n_tasks)) for t in range(n_tasks)]
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sorted_values.nbytes))
+    try:
+        np.ndarray((n,), dtype=np.int64, buffer=shm.buf)[:] = sorted_values
+        pool = _get_process_pool(max_workers)
+        time_budget = (deadline - time.monotonic()) if deadline is not None else None
+        if time_budget is not None and time_budget <= 0:
+            raise SubsetSumTimeout()
+        futures = [pool.submit(_search_first_indices, shm.name, n, int(target_cents), size,
+                               int(tolerance_cents), part, time_budget) for part in partitions]
+        done, pending = concurrent.futures.wait(futures, timeout=time_budget)
+        if pending:
+            for future in pending:
+                future.cancel()
+            raise SubsetSumTimeout()
+        positions = [combo for future in futures for combo in future.result()]
+    except BrokenProcessPool as e:
+        logger.warning(f"Pool di processi non disponibile ({e}), ricerca combinazioni seriale.")
+        shutdown_process_pool()
+        return find_subset_sums(amounts_cents, target_cents, size, tolerance_cents, deadline)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    original = order.tolist()
+    return sorted(tuple(sorted(original[p] for p in combo)) for combo in positions)
+
+
+def find_subset_sums_up_to(amounts_cents: Sequence[int], target_cents: int, min_size: int, max_size: int,
+                           tolerance_cents: int = AMOUNT_TOLERANCE_CENTS,
+                           deadline: Optional[float] = None,
+                           max_workers: int = 0) -> Tuple[List[Tuple[int, ...]], bool]:
+    """
+    Combinazioni per tutte le dimensioni da min_size a max_size (in ordine di dimensione).
+    Ritorna (combinazioni, completa): completa=False se la deadline ha interrotto la ricerca,
+    nel qual caso sono incluse solo le dimensioni esplorate per intero.
+    Con max_workers >= 2 le dimensioni da 3 in su usano find_subset_sums_parallel.
+    """
+    results: List[Tuple[int, ...]] = []
+    for size in range(min_size, min(max_size, len(amounts_cents)) + 1):
+        try:
+            if max_workers >= 2 and size >= 3:
+                results.extend(find_subset_sums_parallel(amounts_cents, target_cents, size, tolerance_cents,
+                                                          deadline, max_workers))
+            else:
+                results.extend(find_subset_sums(amounts_cents, target_cents, size, tolerance_cents, deadline))
+        except SubsetSumTimeout:
+            logger.warning(f"Ricerca combinazioni interrotta per timeout alla dimensione {size}: "
+                           f"risultati completi fino a {size - 1} elementi.")
+            return results, False
+    return results, True
+
+
+__all__ = [
+    'MITM_MAX_SIZE', 'DP_MAX_BITS', 'PARALLEL_MIN_CANDIDATES', 'SubsetSumTimeout',
+    'find_subset_sums', 'find_subset_sums_parallel', 'find_subset_sums_up_to', 'shutdown_process_pool'
+]
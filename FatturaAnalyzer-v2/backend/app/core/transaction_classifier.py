@@ -0,0 +1,147 @@
+# core/transaction_classifier.py - Classificazione transazioni precalcolata
+
+"""
+Classificazione delle transazioni bancarie calcolata una volta (import o backfill)
+e salvata in colonne indicizzate di BankTransactions:
+
+- is_pos, is_worldline, is_cash_deposit, is_bank_fee: flag 0/1 usati dai filtri hide_*
+- category: categoria da analysis.TRANSACTION_CATEGORIES valutata su descrizione e importo
+  (le regole basate sui link di riconciliazione restano calcolate a runtime)
+- classifier_version: versione delle regole, NULL = riga da classificare
+"""
+
+import logging
+import sqlite3
+from typing import Dict, Any, Optional, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .database import get_connection
+    from .analysis import TRANSACTION_CATEGORIES
+except ImportError:
+    logging.warning("Import relativo fallito in transaction_classifier.py, tento import assoluto.")
+    from database import get_connection
+    from analysis import TRANSACTION_CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+# Incrementare quando cambiano pattern o regole: il backfill riclassifica le righe con versione diversa
+CLASSIFIER_VERSION = 1
+
+# Flag -> pattern (case-insensitive), equivalenti ai vecchi filtri REGEXP/LIKE di get_transactions
+CLASSIFICATION_FLAG_PATTERNS = {
+    'is_pos': r'\b(?:POS|PAGOBANCOMAT|CIRRUS|MAESTRO|VISA|MASTERCARD|AMEX|AMERICAN EXPRESS|CARTA DI CREDITO|CREDIT CARD|ESE COMM)\b',
+    'is_worldline': r'WORLDLINE',
+    'is_cash_deposit': r'VERSAMENTO CONTANTE',
+    'is_bank_fee': r'^(?:COMMISSIONI|COMPETENZE BANC|SPESE TENUTA CONTO|IMPOSTA DI BOLLO)',
+}
+
+CLASSIFICATION_COLUMNS = list(CLASSIFICATION_FLAG_PATTERNS) + ['category', 'classifier_version']
+
+# Regole di categoria applicabili senza informazioni sui link (ordinate per priorità)
+_LINK_FREE_ROW = {'has_active_links': False, 'has_passive_links': False}
+_SORTED_RULES = sorted(TRANSACTION_CATEGORIES, key=lambda x: x['priority'], reverse=True)
+
+
+def classify_transactions_df(descriptions: Any, amounts: Any) -> pd.DataFrame:
+    """
+    Classificazione vettoriale: ritorna un DataFrame (stesso ordine dell'input) con
+    le colonne di CLASSIFICATION_COLUMNS.
+    """
+    desc = pd.Series(descriptions, dtype='object').reset_index(drop=True)
+    amount_values = pd.to_numeric(pd.Series(amounts, dtype='object'), errors='coerce').fillna(0.0).reset_index(drop=True)
+    desc_str = desc.where(desc.notna(), '').astype(str)
+
+    result = pd.DataFrame(index=desc.index)
+    for flag, pattern in CLASSIFICATION_FLAG_PATTERNS.items():
+        result[flag] = desc_str.str.contains(pattern, case=False, regex=True, na=False).astype(np.int64)
+
+    # Stessa logica di analysis._apply_categorization_rules, senza le regole sui link
+    desc_upper = desc_str.str.upper()
+    category = pd.Series('Altri', index=desc.index, dtype='object')
+    unassigned = pd.Series(True, index=desc.index)
+    amount_list = amount_values.tolist()
+    for rule in _SORTED_RULES:
+        mask = unassigned.copy()
+        if rule['patterns']:
+            pattern_mask = pd.Series(False, index=desc.index)
+            for pattern in rule['patterns']:
+                pattern_mask |= desc_upper.str.contains(pattern, regex=True, na=False)
+            mask &= pattern_mask
+        if rule['conditions'] and mask.any():
+            candidate_idx = mask[mask].index
+            condition_values = [bool(rule['conditions']({**_LINK_FREE_ROW, 'amount': amount_list[i]}))
+                                for i in candidate_idx]
+            mask.loc[candidate_idx] = condition_values
+        category[mask] = rule['category']
+        unassigned &= ~mask
+
+    result['category'] = category
+    result['classifier_version'] = CLASSIFIER_VERSION
+    return result
+
+
+def classify_transaction(description: Optional[str], amount: Any) -> Dict[str, Any]:
+    """Classificazione di una singola transazione (per inserimenti/aggiornamenti puntuali)."""
+    return classify_transactions_df([description], [amount]).iloc[0].to_dict()
+
+
+def classification_values(classified: pd.DataFrame) -> List[Tuple]:
+    """Tuple (is_pos, is_worldline, is_cash_deposit, is_bank_fee, category, classifier_version) per executemany."""
+    return list(classified[CLASSIFICATION_COLUMNS].itertuples(index=False, name=None))
+
+
+def backfill_transaction_classification(conn: Optional[sqlite3.Connection] = None,
+                                        force: bool = False, batch_size: int = 5000) -> int:
+    """
+    Classifica le transazioni senza classificazione (o con versione regole diversa).
+    Con force=True riclassifica tutte le righe. Ritorna il numero di righe aggiornate.
+    """
+    own_conn = conn is None
+    updated = 0
+    try:
+        if own_conn:
+            conn = get_connection()
+        cursor = conn.cursor()
+        where = "" if force else " WHERE classifier_version IS NULL OR classifier_version != ?"
+        params = () if force else (CLASSIFIER_VERSION,)
+        last_id = 0
+        while True:
+            id_clause = f"{' AND' if where else ' WHERE'} id > ?"
+            cursor.execute(f"SELECT id, description, amount FROM BankTransactions{where}{id_clause} ORDER BY id LIMIT ?",
+                           params + (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            classified = classify_transactions_df([row[1] for row in rows], [row[2] for row in rows])
+            cursor.executemany("""
+                UPDATE BankTransactions
+                SET is_pos = ?, is_worldline = ?, is_cash_deposit = ?, is_bank_fee = ?,
+                    category = ?, classifier_version = ?
+                WHERE id = ?
+            """, [values + (trans_id,) for values, trans_id in zip(classification_values(classified), ids)])
+            updated += len(ids)
+            last_id = ids[-1]
+        if own_conn:
+            conn.commit()
+        if updated:
+            logger.info(f"Classificazione transazioni aggiornata per {updated} righe (versione regole {CLASSIFIER_VERSION}).")
+        return updated
+    except sqlite3.Error as e:
+        logger.error(f"Errore backfill classificazione transazioni: {e}")
+        if own_conn and conn:
+            conn.rollback()
+        raise
+    finally:
+        if own_conn and conn:
+            conn.close()
+
+
+__all__ = [
+    'CLASSIFIER_VERSION', 'CLASSIFICATION_FLAG_PATTERNS', 'CLASSIFICATION_COLUMNS',
+    'classify_transactions_df', 'classify_transaction', 'classification_values',
+    'backfill_transaction_classification'
+]
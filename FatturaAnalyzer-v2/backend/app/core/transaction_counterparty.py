@@ -0,0 +1,416 @@
+# core/transaction_counterparty.py - Controparte dedotta delle transazioni, precalcolata
+
+"""
+Anagrafica dedotta dalla descrizione delle transazioni bancarie, calcolata in batch
+(import o backfill) e salvata in colonne indicizzate di BankTransactions:
+
+- inferred_anagraphics_id: anagrafica riconosciuta (NULL = nessun match)
+- inferred_confidence: 1.0 per match PIVA/CF, altrimenti score del match sul nome
+- inferred_resolver_version: versione del resolver, NULL = riga da (ri)calcolare
+
+Le modifiche alle anagrafiche (insert/update di denominazione, PIVA, CF/delete) vengono
+accodate da trigger in AnagraphicsInferenceQueue e smaltite da refresh_inferred_anagraphics,
+che ricalcola solo le transazioni che possono essere interessate.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, List, Tuple, Set, Iterable
+
+try:
+    from .database import get_connection, is_fulltext_available
+    from .aho_corasick import AhoCorasickAutomaton
+except ImportError:
+    logging.warning("Import relativo fallito in transaction_counterparty.py, tento import assoluto.")
+    from database import get_connection, is_fulltext_available
+    from aho_corasick import AhoCorasickAutomaton
+
+logger = logging.getLogger(__name__)
+
+# Incrementare quando cambia la logica di match: le righe con versione diversa vengono ricalcolate
+# (2: resolver su automa, riconosce le denominazioni citate anche accanto ad altre parole)
+RESOLVER_VERSION = 2
+
+# Score minimo per accettare un match sul nome (come find_anagraphics_id_from_description_v2)
+MIN_NAME_SCORE = 0.3
+
+DENOMINATION_STOP_WORDS = {'spa', 'srl', 'snc', 'sas', 'coop', 'societa', 'group', 'holding', 'soc'}
+
+_PIVA_CF_PATTERN = re.compile(r'\b(\d{11})\b|\b([A-Z]{6}\d{2}[A-Z]\d{2}[A-Z]\d{3}[A-Z])\b', re.IGNORECASE)
+_WORD_PATTERN = re.compile(r'\b\w{3,}\b')
+
+
+def extract_piva_cf_codes(description: Optional[str]) -> Tuple[str, ...]:
+    """Codici PIVA/CF presenti nella descrizione (maiuscoli, in ordine di apparizione)."""
+    if not description:
+        return tuple()
+    return tuple(code.upper() for piva, cf in _PIVA_CF_PATTERN.findall(description) if (code := piva or cf))
+
+
+def denomination_search_words(denomination: Optional[str]) -> Set[str]:
+    """Parole indicizzate di una denominazione (>= 3 caratteri, senza forme societarie)."""
+    return set(_WORD_PATTERN.findall((denomination or '').lower())) - DENOMINATION_STOP_WORDS
+
+
+def score_name_candidates(desc_lower: str, desc_words: Set[str], candidate_ids: Iterable[int],
+                          anagraphics_data: Dict[int, Dict[str, Any]]) -> Tuple[Optional[int], float]:
+    """
+    Miglior candidato per nome: denominazione contenuta nella descrizione oppure
+    combinazione Jaccard/copertura delle parole. Ritorna (id, score), id None se nessun candidato.
+    """
+    best_score = 0.0
+    best_match_id = None
+
+    for anag_id in candidate_ids:
+        anag_data = anagraphics_data.get(anag_id)
+        if anag_data is None:
+            continue
+
+        if anag_data['full_text'] and anag_data['full_text'] in desc_lower:
+            score = 0.8 + (len(anag_data['full_text']) / len(desc_lower)) * 0.2
+            if score > best_score:
+                best_score = score
+                best_match_id = anag_id
+                continue
+
+        common_words = desc_words.intersection(anag_data['search_words'])
+        if common_words:
+            jaccard = len(common_words) / len(desc_words.union(anag_data['search_words']))
+            word_coverage = len(common_words) / len(anag_data['search_words']) if anag_data['search_words'] else 0
+            score = (jaccard * 0.4) + (word_coverage * 0.6)
+
+            if score > best_score:
+                best_score = score
+                best_match_id = anag_id
+
+    return best_match_id, best_score
+
+
+def _is_word_bounded(text: str, start: int, end: int) -> bool:
+    """Occorrenza delimitata da caratteri non-parola (stessa semantica di \\b nelle regex)."""
+    if start > 0 and (text[start - 1].isalnum() or text[start - 1] == '_'):
+        return False
+    return end >= len(text) or not (text[end].isalnum() or text[end] == '_')
+
+
+class AnagraphicsMatchIndex:
+    """
+    Resolver delle anagrafiche su automa Aho–Corasick compilato da denominazioni,
+    parole delle denominazioni, PIVA e CF: una sola passata lineare per descrizione
+    trova tutte le controparti citate. Aggiornabile in place con upsert/remove.
+    """
+
+    _CODE, _NAME, _WORD = 'code', 'name', 'word'
+
+    def __init__(self, rows: Iterable[Tuple[int, Optional[str], Optional[str], Optional[str]]] = ()):
+        self.data: Dict[int, Dict[str, Any]] = {}
+        self._patterns: Dict[int, List[Tuple[str, str]]] = {} # id -> (tipo, pattern) registrati
+        # tipo -> pattern -> id anagrafiche; il payload nell'automa è solo il tipo
+        self._ids: Dict[str, Dict[str, Set[int]]] = {self._CODE: {}, self._NAME: {}, self._WORD: {}}
+        self._automaton = AhoCorasickAutomaton()
+        self._lock = threading.RLock()
+        self.signature: Optional[Tuple] = None # stato di Anagraphics a cui l'indice è allineato
+        self.upsert(rows)
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    @property
+    def id_total(self) -> int:
+        return sum(self._patterns)
+
+    @classmethod
+    def from_connection(cls, conn: sqlite3.Connection) -> 'AnagraphicsMatchIndex':
+        """Carica l'indice con una sola query su Anagraphics."""
+        rows = conn.execute("SELECT id, denomination, piva, cf FROM Anagraphics").fetchall()
+        return cls(tuple(row) for row in rows)
+
+    def copy(self) -> 'AnagraphicsMatchIndex':
+        """Copia indipendente (copy-on-write): upsert/remove sulla copia non toccano l'indice originale."""
+        clone = AnagraphicsMatchIndex()
+        with self._lock:
+            clone.data = dict(self.data)
+            clone._patterns = dict(self._patterns)
+            clone._ids = {kind: {pattern: set(ids) for pattern, ids in patterns.items()}
+                          for kind, patterns in self._ids.items()}
+            clone._automaton = self._automaton.copy()
+            clone.signature = self.signature
+        return clone
+
+    def upsert(self, rows: Iterable[Tuple[int, Optional[str], Optional[str], Optional[str]]]) -> None:
+        """Inserisce o sostituisce le anagrafiche indicate."""
+        with self._lock:
+            self._upsert(rows)
+
+    def _upsert(self, rows: Iterable[Tuple[int, Optional[str], Optional[str], Optional[str]]]) -> None:
+        for anag_id, denomination, piva, cf in rows:
+            self.remove((anag_id,))
+            registered = []
+            for code in {(piva or '').strip().upper(), (cf or '').strip().upper()} - {''}:
+                registered.append((self._CODE, code.lower()))
+            denomination = (denomination or '').strip()
+            # Match sul nome solo per denominazioni significative (come la cache di reconciliation)
+            if len(denomination) >= 3:
+                words = denomination_search_words(denomination)
+                self.data[anag_id] = {'full_text': denomination.lower(), 'search_words': words}
+                registered.append((self._NAME, denomination.lower()))
+                registered.extend((self._WORD, word) for word in words)
+            for kind, pattern in registered:
+                self._ids[kind].setdefault(pattern, set()).add(anag_id)
+                self._automaton.add(pattern, kind)
+            self._patterns[anag_id] = registered
+
+    def remove(self, anag_ids: Iterable[int]) -> None:
+        """Rimuove le anagrafiche indicate (id sconosciuti ignorati)."""
+        with self._lock:
+            for anag_id in anag_ids:
+                for kind, pattern in self._patterns.pop(anag_id, ()):
+                    ids = self._ids[kind].get(pattern)
+                    if ids is None:
+                        continue
+                    ids.discard(anag_id)
+                    if not ids:
+                        del self._ids[kind][pattern]
+                        self._automaton.discard(pattern, kind)
+                self.data.pop(anag_id, None)
+
+    def refresh_rows(self, conn: sqlite3.Connection, anag_ids: Iterable[int]) -> None:
+        """Ricarica dal DB le anagrafiche indicate: aggiornate se presenti, rimosse se cancellate."""
+        anag_ids = list(anag_ids)
+        for start in range(0, len(anag_ids), 500):
+            chunk = anag_ids[start:start + 500]
+            rows = [tuple(row) for row in conn.execute(
+                f"SELECT id, denomination, piva, cf FROM Anagraphics WHERE id IN ({','.join('?' * len(chunk))})", chunk)]
+            # Un solo lock per blocco: resolve() concorrenti non vedono anagrafiche a metà aggiornamento
+            with self._lock:
+                self.remove(set(chunk) - {row[0] for row in rows})
+                self._upsert(rows)
+
+    def resolve(self, description: Optional[str]) -> Tuple[Optional[int], Optional[float]]:
+        """(anagraphics_id, confidence) per una descrizione; (None, None) se nessun match."""
+        if not description:
+            return None, None
+
+        desc_lower = description.lower()
+        with self._lock:
+            code_match: Optional[Tuple[int, int]] = None # (posizione, id)
+            candidate_ids: Set[int] = set()
+            word_sets: List[Set[int]] = []
+            for start, pattern in self._automaton.iter_matches(desc_lower):
+                kinds = self._automaton.payloads(pattern)
+                if self._NAME in kinds:
+                    candidate_ids |= self._ids[self._NAME][pattern]
+                if not (kinds - {self._NAME}) or not _is_word_bounded(desc_lower, start, start + len(pattern)):
+                    continue
+                if self._CODE in kinds and (code_match is None or start < code_match[0]):
+                    # Primo codice in ordine di apparizione; a parità di codice vince l'id più alto
+                    code_match = (start, max(self._ids[self._CODE][pattern]))
+                if self._WORD in kinds:
+                    word_sets.append(self._ids[self._WORD][pattern])
+
+            if code_match is not None:
+                return code_match[1], 1.0
+            # Candidati: denominazioni citate per intero e anagrafiche che contengono tutte le parole trovate
+            if word_sets:
+                candidate_ids |= set.intersection(*word_sets)
+            if not candidate_ids:
+                return None, None
+            desc_words = set(_WORD_PATTERN.findall(desc_lower))
+            best_match_id, best_score = score_name_candidates(desc_lower, desc_words, candidate_ids, self.data)
+        if best_match_id and best_score >= MIN_NAME_SCORE:
+            return best_match_id, round(best_score, 4)
+        return None, None
+
+    def resolve_many(self, descriptions: Iterable[Optional[str]]) -> List[Tuple[Optional[int], Optional[float]]]:
+        """Risoluzione batch, stesso ordine dell'input (descrizioni ripetute risolte una volta)."""
+        resolved: Dict[Optional[str], Tuple[Optional[int], Optional[float]]] = {}
+        results = []
+        for desc in descriptions:
+            if desc not in resolved:
+                resolved[desc] = self.resolve(desc)
+            results.append(resolved[desc])
+        return results
+
+
+_shared_indexes: Dict[str, AnagraphicsMatchIndex] = {}
+_shared_indexes_lock = threading.Lock()
+
+
+def _anagraphics_signature(conn: sqlite3.Connection) -> Tuple:
+    row = conn.execute("SELECT COUNT(*), TOTAL(id), MAX(updated_at) FROM Anagraphics").fetchone()
+    return int(row[0]), int(row[1]), row[2]
+
+
+def get_shared_match_index(conn: sqlite3.Connection, changed_ids: Iterable[int] = ()) -> AnagraphicsMatchIndex:
+    """
+    Resolver condiviso per il file di database della connessione, allineato in modo
+    incrementale: ricarica le anagrafiche in changed_ids e quelle con updated_at più
+    recente dell'ultimo allineamento; se numero o somma degli id non tornano (cancellazioni
+    non notificate) ricostruisce tutto. Per DB in memoria ritorna un indice nuovo.
+    """
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not db_file:
+        return AnagraphicsMatchIndex.from_connection(conn)
+    changed_ids = set(changed_ids)
+    with _shared_indexes_lock:
+        index = _shared_indexes.get(db_file)
+        signature = _anagraphics_signature(conn)
+        if index is None:
+            index = _shared_indexes[db_file] = AnagraphicsMatchIndex.from_connection(conn)
+        elif index.signature != signature or changed_ids:
+            watermark = index.signature[2] if index.signature else None
+            if watermark is not None:
+                changed_ids.update(row[0] for row in conn.execute(
+                    "SELECT id FROM Anagraphics WHERE updated_at >= ?", (watermark,)))
+            index.refresh_rows(conn, sorted(changed_ids))
+            if (len(index), index.id_total) != signature[:2]:
+                logger.debug("Resolver anagrafiche non allineato, ricostruzione completa")
+                index = _shared_indexes[db_file] = AnagraphicsMatchIndex.from_connection(conn)
+        index.signature = signature
+        return index
+
+
+def inference_values(descriptions: Iterable[Optional[str]],
+                     index: AnagraphicsMatchIndex) -> List[Tuple[Optional[int], Optional[float], int]]:
+    """Tuple (inferred_anagraphics_id, inferred_confidence, inferred_resolver_version) per executemany."""
+    return [(anag_id, confidence, RESOLVER_VERSION) for anag_id, confidence in index.resolve_many(descriptions)]
+
+
+def _update_inferred(cursor: sqlite3.Cursor, rows: List[Tuple[int, Optional[str]]],
+                     index: AnagraphicsMatchIndex) -> int:
+    values = inference_values([row[1] for row in rows], index)
+    cursor.executemany("""
+        UPDATE BankTransactions
+        SET inferred_anagraphics_id = ?, inferred_confidence = ?, inferred_resolver_version = ?
+        WHERE id = ?
+    """, [value + (row[0],) for value, row in zip(values, rows)])
+    return len(rows)
+
+
+def backfill_inferred_anagraphics(conn: Optional[sqlite3.Connection] = None, force: bool = False,
+                                  batch_size: int = 5000,
+                                  index: Optional[AnagraphicsMatchIndex] = None) -> int:
+    """
+    Calcola l'anagrafica dedotta per le transazioni mai risolte (o con versione resolver diversa).
+    Con force=True ricalcola tutte le righe. Ritorna il numero di righe aggiornate.
+    """
+    own_conn = conn is None
+    updated = 0
+    try:
+        if own_conn:
+            conn = get_connection()
+        cursor = conn.cursor()
+        where = "" if force else " WHERE inferred_resolver_version IS NULL OR inferred_resolver_version != ?"
+        params = () if force else (RESOLVER_VERSION,)
+        last_id = 0
+        while True:
+            id_clause = f"{' AND' if where else ' WHERE'} id > ?"
+            cursor.execute(f"SELECT id, description FROM BankTransactions{where}{id_clause} ORDER BY id LIMIT ?",
+                           params + (last_id, batch_size))
+            rows = [tuple(row) for row in cursor.fetchall()]
+            if not rows:
+                break
+            if index is None:
+                index = get_shared_match_index(conn)
+            updated += _update_inferred(cursor, rows, index)
+            last_id = rows[-1][0]
+        if own_conn:
+            conn.commit()
+        if updated:
+            logger.info(f"Anagrafica dedotta calcolata per {updated} transazioni (resolver versione {RESOLVER_VERSION}).")
+        return updated
+    except sqlite3.Error as e:
+        logger.error(f"Errore backfill anagrafica dedotta transazioni: {e}")
+        if own_conn and conn:
+            conn.rollback()
+        raise
+    finally:
+        if own_conn and conn:
+            conn.close()
+
+
+def _candidate_transaction_ids(conn: sqlite3.Connection, anag_ids: List[int]) -> Set[int]:
+    """
+    Transazioni che possono cambiare anagrafica dedotta dopo la modifica delle anagrafiche
+    indicate: quelle già attribuite a loro e quelle che ne contengono PIVA/CF o parole.
+    """
+    placeholders = ','.join('?' * len(anag_ids))
+    candidate_ids = {row[0] for row in conn.execute(
+        f"SELECT id FROM BankTransactions WHERE inferred_anagraphics_id IN ({placeholders})", anag_ids)}
+
+    tokens: Set[str] = set()
+    for denomination, piva, cf in conn.execute(
+            f"SELECT denomination, piva, cf FROM Anagraphics WHERE id IN ({placeholders})", anag_ids):
+        tokens.update(code.strip().upper() for code in (piva, cf) if code and code.strip())
+        if len((denomination or '').strip()) >= 3:
+            tokens.update(denomination_search_words(denomination))
+    if not tokens:
+        return candidate_ids
+
+    if is_fulltext_available(conn):
+        match_query = " OR ".join('"{}"'.format(token.replace('"', '')) for token in sorted(tokens))
+        rows = conn.execute("SELECT rowid FROM BankTransactionsFTS WHERE BankTransactionsFTS MATCH ?", (match_query,))
+    else:
+        like_clause = " OR ".join("description LIKE ?" for _ in tokens)
+        rows = conn.execute(f"SELECT id FROM BankTransactions WHERE {like_clause}",
+                            [f"%{token}%" for token in sorted(tokens)])
+    candidate_ids.update(row[0] for row in rows)
+    return candidate_ids
+
+
+def refresh_inferred_anagraphics(conn: Optional[sqlite3.Connection] = None, batch_size: int = 5000) -> int:
+    """
+    Aggiornamento incrementale: smaltisce la coda delle anagrafiche modificate ricalcolando
+    solo le transazioni candidate, poi risolve le righe nuove o con descrizione cambiata.
+    Ritorna il numero di transazioni ricalcolate.
+    """
+    own_conn = conn is None
+    updated = 0
+    try:
+        if own_conn:
+            conn = get_connection()
+        cursor = conn.cursor()
+        queued_ids = [row[0] for row in cursor.execute("SELECT anagraphics_id FROM AnagraphicsInferenceQueue")]
+        cursor.execute("""SELECT 1 FROM BankTransactions
+                          WHERE inferred_resolver_version IS NULL OR inferred_resolver_version != ? LIMIT 1""",
+                       (RESOLVER_VERSION,))
+        has_unresolved = cursor.fetchone() is not None
+        if not queued_ids and not has_unresolved:
+            return 0
+
+        index = get_shared_match_index(conn, queued_ids)
+        if queued_ids:
+            candidate_ids = sorted(_candidate_transaction_ids(conn, queued_ids))
+            for start in range(0, len(candidate_ids), batch_size):
+                chunk = candidate_ids[start:start + batch_size]
+                placeholders = ','.join('?' * len(chunk))
+                rows = [tuple(row) for row in cursor.execute(
+                    f"SELECT id, description FROM BankTransactions WHERE id IN ({placeholders})", chunk)]
+                updated += _update_inferred(cursor, rows, index)
+            cursor.executemany("DELETE FROM AnagraphicsInferenceQueue WHERE anagraphics_id = ?",
+                               [(anag_id,) for anag_id in queued_ids])
+            logger.info(f"Anagrafica dedotta: {len(queued_ids)} anagrafiche modificate, "
+                        f"{len(candidate_ids)} transazioni ricalcolate.")
+        if has_unresolved:
+            updated += backfill_inferred_anagraphics(conn, batch_size=batch_size, index=index)
+        if own_conn:
+            conn.commit()
+        return updated
+    except sqlite3.Error as e:
+        logger.error(f"Errore aggiornamento incrementale anagrafica dedotta: {e}")
+        if own_conn and conn:
+            conn.rollback()
+        raise
+    finally:
+        if own_conn and conn:
+            conn.close()
+
+
+__all__ = [
+    'RESOLVER_VERSION', 'MIN_NAME_SCORE', 'DENOMINATION_STOP_WORDS',
+    'extract_piva_cf_codes', 'denomination_search_words', 'score_name_candidates',
+    'AnagraphicsMatchIndex', 'get_shared_match_index', 'inference_values',
+    'backfill_inferred_anagraphics', 'refresh_inferred_anagraphics'
+]
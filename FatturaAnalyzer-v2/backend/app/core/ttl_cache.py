@@ -0,0 +1,184 @@
+# core/ttl_cache.py - Cache LRU con scadenza, concorrente
+
+"""
+Primitiva di cache per il progetto:
+
+- LRU con limite di dimensione: eviction O(1) (OrderedDict, move_to_end/popitem)
+- scadenza (TTL) pigra: una voce scaduta viene scartata solo quando viene letta
+  o quando raggiunge la coda LRU, senza scansioni periodiche
+- lock globale tenuto solo per le operazioni sul dizionario, mai durante il calcolo
+- lock per chiave in get_or_compute: richieste concorrenti per la stessa chiave
+  mancante eseguono il calcolo una sola volta, chiavi diverse procedono in parallelo
+- statistiche di hit/miss/eviction/scadenze
+
+Il decoratore ttl_lru_cache espone cache_clear() e cache_info() come functools.lru_cache.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+_MISSING = object()
+_KWARGS_MARK = object()
+
+
+class TTLLRUCache:
+    """Cache thread-safe con limite LRU e scadenza opzionale delle voci."""
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: Optional[float] = None, name: Optional[str] = None):
+        if maxsize <= 0:
+            raise ValueError("maxsize deve essere positivo")
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self._data: 'OrderedDict[Hashable, Tuple[Any, Optional[float]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, List] = {} # chiave -> [lock, richieste in attesa]
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not _MISSING
+
+    def _lookup(self, key: Hashable) -> Any:
+        """Valore (spostato in testa LRU) o _MISSING; scarta la voce se scaduta. Non aggiorna hit/miss."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self._expirations += 1
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._lookup(key)
+        with self._lock:
+            if value is _MISSING:
+                self._misses += 1
+                return default
+            self._hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                _, (_, oldest_expiry) = self._data.popitem(last=False)
+                if oldest_expiry is not None and oldest_expiry <= time.monotonic():
+                    self._expirations += 1
+                else:
+                    self._evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Valore in cache o risultato di compute() (memorizzato). Le chiamate concorrenti per
+        la stessa chiave attendono il primo calcolo; le eccezioni non vengono memorizzate.
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            with self._lock:
+                self._hits += 1
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = [threading.Lock(), 0]
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                # Un'altra richiesta può aver completato il calcolo mentre attendevamo
+                value = self._lookup(key)
+                if value is not _MISSING:
+                    with self._lock:
+                        self._hits += 1
+                    return value
+                with self._lock:
+                    self._misses += 1
+                value = compute()
+                self.set(key, value)
+                return value
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if key_lock[1] == 0:
+                    self._key_locks.pop(key, None)
+
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._data.pop(key, _MISSING) is not _MISSING
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._hits = self._misses = self._evictions = self._expirations = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self.maxsize, len(self._data))
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiche complete (hit ratio, eviction LRU, voci scadute)."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'name': self.name,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 4) if total else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl_seconds,
+            }
+
+
+def _make_key(args: tuple, kwargs: dict) -> Hashable:
+    if not kwargs:
+        return args
+    return args + (_KWARGS_MARK,) + tuple(sorted(kwargs.items()))
+
+
+def ttl_lru_cache(maxsize: int = 1024, ttl_seconds: Optional[float] = None):
+    """
+    Decoratore di memoizzazione su TTLLRUCache. Argomenti non hashable: chiamata diretta,
+    senza cache. Espone .cache, .cache_clear() e .cache_info().
+    """
+    def decorator(func):
+        cache = TTLLRUCache(maxsize=maxsize, ttl_seconds=ttl_seconds, name=func.__qualname__)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = _make_key(args, kwargs)
+            try:
+                hash(key)
+            except TypeError:
+                return func(*args, **kwargs)
+            return cache.get_or_compute(key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        wrapper.cache_info = cache.info
+        return wrapper
+
+    return decorator
+
+
+__all__ = ['TTLLRUCache', 'CacheInfo', 'ttl_lru_cache']
@@ -5,6 +5,7 @@ logger = logging.getLogger(__name__)
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from datetime import datetime, date
 import pandas as pd # Necessario per pd.isna e pd.to_datetime in alcune funzioni
+import numpy as np # Aritmetica vettoriale sugli importi in centesimi
 import os
 import configparser
 import base64 # Per serializzare lo stato della UI se non si usa QByteArray direttamente qui
@@ -26,6 +27,7 @@ except ImportError:
 # --- Costanti ---
 AMOUNT_TOLERANCE = Decimal('0.01')
 DECIMAL_PRECISION = Decimal('0.01') # Usato da quantize se non specificato diversamente
+AMOUNT_TOLERANCE_CENTS = 1 # AMOUNT_TOLERANCE espressa in centesimi interi
 
 # Cache per pattern regex compilati
 _COMPILED_PATTERNS = {
@@ -172,6 +174,41 @@ def quantize(decimal_value: Any, precision: Optional[Decimal] = None) -> Decimal
     except (InvalidOperation, OverflowError):
         return Decimal('0.00')
 
+# --- Importi in Centesimi Interi ---
+def to_cents(value: Any, default: int = 0) -> int:
+    """Converte un importo (Decimal, float, str) in centesimi interi (ROUND_HALF_UP)."""
+    decimal_value = to_decimal(value, default='NaN')
+    if not decimal_value.is_finite():
+        return default
+    return int(quantize(decimal_value).scaleb(2))
+
+def cents_to_decimal(cents: Any) -> Decimal:
+    """Converte centesimi interi in Decimal a 2 decimali. NaN se il valore manca."""
+    if cents is None or pd.isna(cents):
+        return Decimal('NaN')
+    return Decimal(int(cents)).scaleb(-2)
+
+def amounts_to_cents_array(values: Any) -> np.ndarray:
+    """Conversione vettoriale di importi REAL in centesimi int64 (NaN -> 0)."""
+    arr = pd.to_numeric(pd.Series(values, dtype='object'), errors='coerce').to_numpy(dtype=np.float64)
+    arr = np.nan_to_num(arr, nan=0.0)
+    # ROUND_HALF_UP come quantize(): l'epsilon assorbe l'errore di rappresentazione (es. 1.005)
+    return (np.sign(arr) * np.floor(np.abs(arr) * 100 + 0.5 + 1e-9)).astype(np.int64)
+
+def cents_array_to_decimals(cents_array: Any) -> List[Decimal]:
+    """Costruisce i Decimal solo al bordo: un Decimal per elemento a partire da interi."""
+    return [Decimal(c).scaleb(-2) for c in np.asarray(cents_array, dtype=np.int64).tolist()]
+
+def format_cents_array(cents_array: Any) -> List[str]:
+    """Formattazione italiana (1.234,56) di un array di centesimi, senza passare da Decimal."""
+    arr = np.asarray(cents_array, dtype=np.int64)
+    abs_arr = np.abs(arr)
+    units = (abs_arr // 100).tolist()
+    fractions = (abs_arr % 100).tolist()
+    signs = np.where(arr < 0, '-', '').tolist()
+    return [f"{sign}{unit:,}".replace(",", ".") + f",{frac:02d}"
+            for sign, unit, frac in zip(signs, units, fractions)]
+
 # --- Normalizzazione Date e Stringhe per Hashing ---
 @lru_cache(maxsize=1024)
 def _normalize_date_string_for_hash(date_input: Any) -> str:
@@ -242,6 +279,24 @@ def calculate_transaction_hash(transaction_date: Any, amount: Any, description:
         logger.error(f"Errore calcolo hash transazione: {e}, Dati: D:{transaction_date}, Imp:{amount}, Desc:'{str(description)[:30]}...'", exc_info=True)
         return hashlib.sha256(f"ERROR_TRX_{datetime.now().isoformat()}".encode('utf-8')).hexdigest()
 
+def calculate_transaction_hashes(dates: Any, amounts_cents: Any, descriptions: Any) -> List[str]:
+    """
+    Versione in blocco di calculate_transaction_hash per un intero estratto conto:
+    date (Timestamp), importi in centesimi interi e descrizioni. Stessi hash riga per riga.
+    Le descrizioni (spesso ripetute: commissioni, POS, ...) vengono normalizzate una volta per valore distinto.
+    """
+    date_part = pd.Series(dates).dt.strftime('%Y-%m-%d').fillna('').tolist()
+    desc_codes, desc_uniques = pd.factorize(pd.Series(descriptions, dtype=object).fillna(''))
+    separators_re = _COMPILED_PATTERNS['non_alphanumeric_except_common_separators']
+    whitespace_re = _COMPILED_PATTERNS['multiple_whitespace']
+    desc_clean = [whitespace_re.sub(' ', separators_re.sub(' ', str(desc).strip().upper())).strip()[:200]
+                  for desc in desc_uniques]
+    hashes = []
+    for date_str, cents, desc_code in zip(date_part, np.asarray(amounts_cents, dtype=np.int64).tolist(), desc_codes.tolist()):
+        amount_str = f"{'-' if cents < 0 else ''}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+        hashes.append(hashlib.sha256(f"TRX|{date_str}|{amount_str}|{desc_clean[desc_code]}".encode('utf-8')).hexdigest())
+    return hashes
+
 # --- Utility per Anagrafiche e Prodotti ---
 def _dict_to_cache_key(d: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
     """Converte un dizionario in una tupla ordinata per renderlo cache-abile."""
@@ -918,8 +973,12 @@ __all__ = [
     # Conversioni numeriche
     'to_decimal', 'quantize', 'DECIMAL_PRECISION', 'AMOUNT_TOLERANCE',
     
+    # Importi in centesimi
+    'AMOUNT_TOLERANCE_CENTS', 'to_cents', 'cents_to_decimal', 'amounts_to_cents_array',
+    'cents_array_to_decimals', 'format_cents_array',
+    
     # Hashing
-    'calculate_invoice_hash', 'calculate_transaction_hash',
+    'calculate_invoice_hash', 'calculate_transaction_hash', 'calculate_transaction_hashes',
     
     # Anagrafiche e prodotti
     '_is_own_company', 'normalize_product_name', 'extract_invoice_number',
@@ -2,10 +2,12 @@
 FatturaAnalyzer v2 - FastAPI Backend
 Main application entry point - VERSIONE ENTERPRISE STABILE E COMPLETA
 """
+import asyncio
 import logging
 import os
 import sys
 from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -37,6 +39,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def _overdue_sweep_loop():
+    """Sweep giornaliero degli stati 'Scaduta' quando lo stato è mantenuto dai trigger SQLite."""
+    from app.core.database import run_overdue_sweep
+    loop = asyncio.get_running_loop()
+    while True:
+        await loop.run_in_executor(None, run_overdue_sweep)
+        now = datetime.now()
+        next_run = datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) + timedelta(minutes=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Gestisce gli eventi di avvio e spegnimento dell'applicazione."""
@@ -44,7 +56,11 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 Starting FatturaAnalyzer API v2 - Enterprise Edition")
     logger.info(f"Running in {settings.ENVIRONMENT.upper()} mode")
     logger.info("==================================================")
+    from app.core.database import RECON_STATUS_MODE
+    sweep_task = asyncio.create_task(_overdue_sweep_loop()) if RECON_STATUS_MODE == 'triggers' else None
     yield
+    if sweep_task:
+        sweep_task.cancel()
     logger.info("==================================================")
     logger.info("👋 Shutting down FatturaAnalyzer API...")
     logger.info("==================================================")
@@ -352,6 +352,7 @@ class ImportResult(BaseModel, BaseConfig):
     duplicates: int
     errors: int
     unsupported: int
+    manifest_hits: int = 0
     files: List[Dict[str, str]]
 
 
@@ -457,6 +458,7 @@ class InvoiceListResponse(BaseModel, BaseConfig):
     page: int
     size: int
     pages: int
+    next_cursor: Optional[Dict[str, Any]] = None  # Keyset (doc_date, id) per la pagina successiva
 
 
 class TransactionListResponse(BaseModel, BaseConfig):
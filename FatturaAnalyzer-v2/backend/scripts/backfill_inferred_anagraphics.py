@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Script per (ri)calcolare l'anagrafica dedotta dalla descrizione delle transazioni
+(inferred_anagraphics_id / inferred_confidence) sulle righe esistenti
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add path per importare moduli da 'app'
+# Lo script è in backend/scripts/, quindi dobbiamo aggiungere backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.database import create_tables
+from app.core.transaction_counterparty import backfill_inferred_anagraphics, RESOLVER_VERSION
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Backfill anagrafica dedotta delle transazioni")
+    parser.add_argument("--force", action="store_true",
+                        help="Ricalcola tutte le transazioni, non solo quelle mancanti o con resolver obsoleto")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Righe per batch di aggiornamento")
+    args = parser.parse_args()
+
+    try:
+        # Assicura che colonne, coda e trigger esistano (e smaltisce le righe mancanti)
+        create_tables()
+        print(f"🔎 Anagrafica dedotta transazioni (resolver versione {RESOLVER_VERSION})...")
+        start = time.time()
+        updated = backfill_inferred_anagraphics(force=args.force, batch_size=args.batch_size)
+        print(f"✅ {updated} transazioni aggiornate in {time.time() - start:.1f}s")
+    except Exception as e:
+        print(f"❌ Error during backfill: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Script per (ri)calcolare la classificazione precalcolata delle transazioni
+(flag POS/Worldline/contanti/commissioni e categoria) sulle righe esistenti
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add path per importare moduli da 'app'
+# Lo script è in backend/scripts/, quindi dobbiamo aggiungere backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.database import create_tables
+from app.core.transaction_classifier import backfill_transaction_classification, CLASSIFIER_VERSION
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Backfill classificazione transazioni")
+    parser.add_argument("--force", action="store_true",
+                        help="Riclassifica tutte le transazioni, non solo quelle mancanti o con regole obsolete")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Righe per batch di aggiornamento")
+    args = parser.parse_args()
+
+    try:
+        # Assicura che le colonne di classificazione esistano
+        create_tables()
+        print(f"🏷️ Classificazione transazioni (versione regole {CLASSIFIER_VERSION})...")
+        start = time.time()
+        updated = backfill_transaction_classification(force=args.force, batch_size=args.batch_size)
+        print(f"✅ {updated} transazioni classificate in {time.time() - start:.1f}s")
+    except Exception as e:
+        print(f"❌ Error during backfill: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
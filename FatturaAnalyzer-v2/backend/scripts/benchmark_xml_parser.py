@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del parser FatturaPA (parse_fattura_xml) su una fattura sintetica
+con N righe, confrontando il piano XPath precompilato con il percorso lento (solo query XPath)
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add path per importare moduli da 'app'
+# Lo script è in backend/scripts/, quindi dobbiamo aggiungere backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import logging
+logging.disable(logging.WARNING)  # Il parser logga a livello INFO/WARNING per ogni fattura
+
+from app.core import parser_xml
+
+MY_COMPANY = {'piva': '01234567890', 'cf': None}
+
+LINE_TEMPLATE = """
+      <DettaglioLinee>
+        <NumeroLinea>{n}</NumeroLinea>
+        <CodiceArticolo><CodiceTipo>INTERNO</CodiceTipo><CodiceValore>ART{n:05d}</CodiceValore></CodiceArticolo>
+        <Descrizione>Articolo di prova numero {n}</Descrizione>
+        <Quantita>2.00</Quantita><UnitaMisura>PZ</UnitaMisura>
+        <PrezzoUnitario>10.00</PrezzoUnitario><PrezzoTotale>20.00</PrezzoTotale><AliquotaIVA>22.00</AliquotaIVA>
+      </DettaglioLinee>"""
+
+
+def build_invoice(lines):
+    """Fattura FPR12 con namespace e 'lines' righe di dettaglio."""
+    taxable = 20 * lines
+    vat = round(taxable * 0.22, 2)
+    body_lines = "".join(LINE_TEMPLATE.format(n=n) for n in range(1, lines + 1))
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<p:FatturaElettronica versione="FPR12" xmlns:p="http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2">
+  <FatturaElettronicaHeader>
+    <DatiTrasmissione><CodiceDestinatario>0000000</CodiceDestinatario></DatiTrasmissione>
+    <CedentePrestatore>
+      <DatiAnagrafici>
+        <IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>{MY_COMPANY['piva']}</IdCodice></IdFiscaleIVA>
+        <Anagrafica><Denominazione>Azienda Benchmark SRL</Denominazione></Anagrafica>
+        <RegimeFiscale>RF01</RegimeFiscale>
+      </DatiAnagrafici>
+      <Sede><Indirizzo>Via Roma</Indirizzo><NumeroCivico>1</NumeroCivico><CAP>00100</CAP><Comune>Roma</Comune><Provincia>RM</Provincia><Nazione>IT</Nazione></Sede>
+    </CedentePrestatore>
+    <CessionarioCommittente>
+      <DatiAnagrafici>
+        <IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>09876543210</IdCodice></IdFiscaleIVA>
+        <Anagrafica><Denominazione>Cliente Benchmark SPA</Denominazione></Anagrafica>
+      </DatiAnagrafici>
+      <Sede><Indirizzo>Via Milano 2</Indirizzo><CAP>20100</CAP><Comune>Milano</Comune><Provincia>MI</Provincia><Nazione>IT</Nazione></Sede>
+    </CessionarioCommittente>
+  </FatturaElettronicaHeader>
+  <FatturaElettronicaBody>
+    <DatiGenerali><DatiGeneraliDocumento>
+      <TipoDocumento>TD01</TipoDocumento><Divisa>EUR</Divisa><Data>2024-03-01</Data><Numero>BENCH-1</Numero>
+      <ImportoTotaleDocumento>{taxable + vat:.2f}</ImportoTotaleDocumento>
+    </DatiGeneraliDocumento></DatiGenerali>
+    <DatiBeniServizi>{body_lines}
+      <DatiRiepilogo><AliquotaIVA>22.00</AliquotaIVA><ImponibileImporto>{taxable:.2f}</ImponibileImporto><Imposta>{vat:.2f}</Imposta><EsigibilitaIVA>I</EsigibilitaIVA></DatiRiepilogo>
+    </DatiBeniServizi>
+    <DatiPagamento><CondizioniPagamento>TP02</CondizioniPagamento>
+      <DettaglioPagamento><ModalitaPagamento>MP05</ModalitaPagamento><DataScadenzaPagamento>2024-03-31</DataScadenzaPagamento><ImportoPagamento>{taxable + vat:.2f}</ImportoPagamento></DettaglioPagamento>
+    </DatiPagamento>
+  </FatturaElettronicaBody>
+</p:FatturaElettronica>""".encode("utf-8")
+
+
+def time_parse(xml_bytes, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parser_xml.parse_fattura_xml(xml_bytes, MY_COMPANY, source_name="benchmark.xml")
+        timings.append(time.perf_counter() - start)
+    if result.get('error'):
+        raise RuntimeError(result['error'])
+    return statistics.median(timings), result
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Micro-benchmark parser FatturaPA")
+    parser.add_argument("--lines", type=int, default=500, help="Righe di dettaglio della fattura sintetica")
+    parser.add_argument("--repeat", type=int, default=20, help="Ripetizioni per misura (si riporta la mediana)")
+    args = parser.parse_args()
+
+    xml_bytes = build_invoice(args.lines)
+    print(f"📄 Fattura sintetica: {args.lines} righe, {len(xml_bytes) / 1024:.0f} KB")
+
+    fast_time, fast_result = time_parse(xml_bytes, args.repeat)
+    parser_xml.XPATH_FAST_PATH = False
+    try:
+        slow_time, slow_result = time_parse(xml_bytes, args.repeat)
+    finally:
+        parser_xml.XPATH_FAST_PATH = True
+
+    if fast_result != slow_result:
+        print("❌ Piano precompilato e percorso lento producono risultati diversi")
+        sys.exit(1)
+    print(f"⚡ Piano precompilato: {fast_time * 1000:.1f} ms/fattura")
+    print(f"🐢 Percorso lento (query XPath): {slow_time * 1000:.1f} ms/fattura")
+    print(f"✅ Speedup: {slow_time / fast_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
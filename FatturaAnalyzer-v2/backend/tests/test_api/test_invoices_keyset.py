@@ -0,0 +1,57 @@
+# tests/test_api/test_invoices_keyset.py
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.adapters import database_adapter
+from app.api import invoices
+from app.core import database
+
+DOC_DATES = ['2024-03-01', '2024-03-01', '2024-03-01', '2024-02-15', '2024-02-15', '2024-01-10', '2024-01-09']
+
+
+@pytest.fixture
+def invoices_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "invoices.db"))
+    # Pool e cache query nuovi: quelli globali possono puntare al DB dei test precedenti
+    monkeypatch.setattr(database_adapter, "_connection_pool", database_adapter.ThreadSafeConnectionPool())
+    monkeypatch.setattr(database_adapter, "_query_cache", database_adapter.IntelligentQueryCache())
+    database.create_tables()
+    conn = database.get_connection()
+    anag_id = conn.execute("INSERT INTO Anagraphics (type, piva, denomination) VALUES ('Cliente', '01234567890', 'Rossi Srl')").lastrowid
+    conn.executemany("""
+        INSERT INTO Invoices (anagraphics_id, type, doc_type, doc_number, doc_date, total_amount, unique_hash,
+                              created_at, updated_at)
+        VALUES (?, 'Attiva', 'TD01', ?, ?, 100.0, ?, datetime('now'), datetime('now'))
+    """, [(anag_id, f"FT{n}", doc_date, f"kh{n}") for n, doc_date in enumerate(DOC_DATES)])
+    conn.commit()
+    conn.close()
+
+    app = FastAPI()
+    app.include_router(invoices.router, prefix="/api/invoices")
+    return TestClient(app)
+
+
+def test_keyset_pages_cover_every_invoice_once(invoices_client):
+    """Cursori (doc_date, id) successivi: ogni fattura una sola volta, stesso ordine e totale dell'OFFSET"""
+    by_offset = invoices_client.get("/api/invoices/", params={"size": 100}).json()
+    seen, params = [], {"size": 2}
+    while True:
+        data = invoices_client.get("/api/invoices/", params=params).json()
+        assert data["total"] == len(DOC_DATES)
+        seen.extend(item["id"] for item in data["items"])
+        if not data["next_cursor"]:
+            break
+        params = {"size": 2, **data["next_cursor"]}
+
+    assert seen == [item["id"] for item in by_offset["items"]]
+    assert len(set(seen)) == len(DOC_DATES)
+    # Cursore oltre l'ultima data: restano solo eventuali fatture senza doc_date (qui nessuna)
+    after_nulls = invoices_client.get("/api/invoices/", params={"after_doc_date": "0001-01-01", "after_id": 999})
+    assert after_nulls.status_code == 200 and after_nulls.json()["items"] == []
+
+
+def test_partial_keyset_cursor_is_rejected(invoices_client):
+    """after_doc_date senza after_id (o viceversa): 422 invece di ignorare il cursore"""
+    assert invoices_client.get("/api/invoices/", params={"after_doc_date": "2024-03-01"}).status_code == 422
+    assert invoices_client.get("/api/invoices/", params={"after_id": 3}).status_code == 422
@@ -0,0 +1,48 @@
+# tests/test_api/test_transactions_search.py
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.adapters import database_adapter
+from app.api import transactions
+from app.core import database
+
+
+@pytest.fixture
+def search_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "search.db"))
+    monkeypatch.setattr(database, "_fulltext_ready", None)
+    # Pool e cache query nuovi: quelli globali possono puntare al DB dei test precedenti
+    monkeypatch.setattr(database_adapter, "_connection_pool", database_adapter.ThreadSafeConnectionPool())
+    monkeypatch.setattr(database_adapter, "_query_cache", database_adapter.IntelligentQueryCache())
+    database.create_tables()
+    conn = database.get_connection()
+    conn.executemany("""
+        INSERT INTO BankTransactions (transaction_date, amount, description, unique_hash) VALUES (?, ?, ?, ?)
+    """, [('2024-03-01', 2024.00, 'BONIFICO ACME SRL', 's1'),
+          ('2024-03-02', -75.00, 'PAGAMENTO FATTURA 2024 BETA', 's2'),
+          ('2024-03-03', 2024.00, 'VERSAMENTO', 's3'),
+          ('2024-03-04', -10.00, 'COMMISSIONI', 's4')])
+    conn.commit()
+    conn.close()
+
+    app = FastAPI()
+    app.state.limiter = transactions.limiter
+    app.include_router(transactions.router, prefix="/api/transactions")
+    return TestClient(app)
+
+
+def test_fulltext_search_keeps_amount_match(search_client):
+    """Modalità fulltext: match FTS ordinati per rank più righe con lo stesso importo, metadati coerenti"""
+    response = search_client.get("/api/transactions/search/2024", params={"search_mode": "fulltext"})
+    assert response.status_code == 200
+    data = response.json()["data"]
+
+    ids = [item["id"] for item in data["results"]]
+    assert ids[0] == 2 and set(ids) == {1, 2, 3}
+    assert data["search_metadata"]["fulltext_applied"] is True
+    assert data["search_metadata"]["has_amount_search"] is True
+
+    text_only = search_client.get("/api/transactions/search/acme", params={"search_mode": "fulltext"}).json()["data"]
+    assert [item["id"] for item in text_only["results"]] == [1]
+    assert text_only["search_metadata"]["has_amount_search"] is False
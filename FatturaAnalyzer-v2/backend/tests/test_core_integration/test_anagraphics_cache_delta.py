@@ -0,0 +1,97 @@
+# tests/test_core_integration/test_anagraphics_cache_delta.py
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core import reconciliation
+from app.core.reconciliation import AnagraphicsCacheV2
+
+
+@pytest.fixture
+def cache_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "anag.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE Anagraphics (id INTEGER PRIMARY KEY, denomination TEXT, piva TEXT, cf TEXT, updated_at TIMESTAMP);
+        INSERT INTO Anagraphics VALUES
+            (1, 'Rossi Costruzioni Srl', '01234567890', NULL, '2024-01-01 10:00:00'),
+            (2, 'Bianchi Impianti', '09876543210', NULL, '2024-01-01 10:00:00'),
+            (3, 'Verdi Trasporti', NULL, 'VRDLGU80A01H501U', '2024-01-02 10:00:00');
+    """)
+    conn.commit()
+
+    def connect():
+        db_conn = sqlite3.connect(db_path)
+        db_conn.row_factory = sqlite3.Row
+        return db_conn
+
+    monkeypatch.setattr(reconciliation, "get_connection", connect)
+    yield conn
+    conn.close()
+
+
+def _expire(cache):
+    cache._timestamp = datetime.now() - timedelta(minutes=cache._ttl_minutes + 1)
+
+
+def test_delta_refresh_patches_indexes_copy_on_write(cache_db):
+    """Solo righe modificate rilette, cancellazioni rilevate da numero/somma degli id; vecchio snapshot invariato"""
+    cache = AnagraphicsCacheV2()
+    assert cache.find_by_piva_cf('01234567890') == 1
+    assert cache.search_by_words({'bianchi'}) == {2}
+    old_piva_index, old_words = cache._piva_cf_index, cache._search_index
+
+    cache_db.execute("UPDATE Anagraphics SET piva = '11111111111', denomination = 'Rossi Edilizia', "
+                     "updated_at = '2024-02-01 09:00:00' WHERE id = 1")
+    cache_db.execute("INSERT INTO Anagraphics VALUES (4, 'Neri Logistica', NULL, NULL, '2024-02-01 09:00:00')")
+    cache_db.commit()
+    _expire(cache)
+
+    assert cache.find_by_piva_cf('11111111111') == 1
+    assert cache.find_by_piva_cf('01234567890') is None
+    assert cache.search_by_words({'logistica'}) == {4}
+    assert cache.resolve('BONIFICO NERI LOGISTICA')[0] == 4
+    assert cache.find_by_piva_cf('VRDLGU80A01H501U') == 3
+
+    assert old_piva_index['01234567890'] == 1 and old_words['bianchi'] == {2}
+    stats = cache.get_stats()
+    assert stats['delta_refreshes'] == 1 and stats['size'] == 4 and stats['watermark'] == '2024-02-01 09:00:00'
+
+    _expire(cache)
+    assert cache.search_by_words({'edilizia'}) == {1}
+    assert cache.get_stats()['delta_refreshes'] == 1  # nessuna modifica: solo watermark/timestamp
+
+    cache_db.execute("DELETE FROM Anagraphics WHERE id = 2")
+    cache_db.commit()
+    _expire(cache)
+    assert cache.search_by_words({'bianchi'}) == set()
+    assert cache.resolve('BONIFICO BIANCHI IMPIANTI')[0] is None
+    assert cache.get_stats()['delta_refreshes'] == 1 and cache.get_stats()['size'] == 3  # firma diversa: ricaricamento completo
+
+
+def test_delta_refresh_with_mixed_clocks_and_null_updated_at(cache_db):
+    """Scrittura UTC precedente al watermark locale, righe senza updated_at e id con orario vecchio: nessuna persa"""
+    cache = AnagraphicsCacheV2()
+    cache.get_data()
+    cache_db.execute("UPDATE Anagraphics SET denomination = 'Bianchi Termoidraulica', updated_at = '2024-03-01 12:00:00' WHERE id = 2")
+    cache_db.commit()
+    _expire(cache)
+    assert cache.search_by_words({'termoidraulica'}) == {2}
+    old_matcher = cache._matcher
+
+    # CURRENT_TIMESTAMP (UTC) scritto dopo, ma un'ora indietro rispetto all'orario locale del watermark
+    cache_db.execute("UPDATE Anagraphics SET denomination = 'Verdi Spedizioni', updated_at = '2024-03-01 11:30:00' WHERE id = 3")
+    cache_db.execute("INSERT INTO Anagraphics VALUES (4, 'Neri Logistica', NULL, NULL, NULL)")
+    cache_db.commit()
+    _expire(cache)
+    assert cache.search_by_words({'spedizioni'}) == {3}
+    assert cache.resolve('BONIFICO NERI LOGISTICA')[0] == 4
+    assert cache.get_stats()['delta_refreshes'] == 2
+    assert old_matcher.resolve('BONIFICO NERI LOGISTICA')[0] is None  # resolver precedente non modificato
+
+    cache_db.execute("INSERT INTO Anagraphics VALUES (5, 'Gialli Forniture', NULL, NULL, '2020-01-01 00:00:00')")
+    cache_db.commit()
+    _expire(cache)
+    assert cache.search_by_words({'forniture'}) == {5}
+    assert cache.get_stats()['delta_refreshes'] == 2  # id fuori margine: ricaricamento completo
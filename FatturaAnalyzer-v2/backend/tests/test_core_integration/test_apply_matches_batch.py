@@ -0,0 +1,64 @@
+# tests/test_core_integration/test_apply_matches_batch.py
+import sqlite3
+
+import pytest
+
+from app.core import reconciliation
+from app.core.reconciliation import apply_matches_batch
+
+
+@pytest.fixture
+def batch_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "batch.db"
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE Invoices (id INTEGER PRIMARY KEY, doc_number TEXT, total_amount REAL, paid_amount REAL DEFAULT 0.0,
+                               payment_status TEXT DEFAULT 'Aperta', due_date TEXT, updated_at TIMESTAMP);
+        CREATE TABLE BankTransactions (id INTEGER PRIMARY KEY, amount REAL, reconciled_amount REAL DEFAULT 0.0,
+                                       reconciliation_status TEXT DEFAULT 'Da Riconciliare', updated_at TIMESTAMP);
+        CREATE TABLE ReconciliationLinks (id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id INTEGER NOT NULL,
+                                          invoice_id INTEGER NOT NULL, reconciled_amount REAL NOT NULL,
+                                          reconciliation_date TIMESTAMP, UNIQUE(transaction_id, invoice_id));
+        INSERT INTO Invoices (id, doc_number, total_amount, due_date) VALUES
+            (1, 'FT1', 100.00, '2099-01-01'), (2, 'FT2', 80.00, '2099-01-01'), (3, 'FT3', 50.00, '2099-01-01');
+        INSERT INTO BankTransactions (id, amount) VALUES (1, 100.00), (2, 150.00), (3, -50.00);
+        INSERT INTO ReconciliationLinks (transaction_id, invoice_id, reconciled_amount) VALUES (2, 2, 30.00);
+        UPDATE Invoices SET paid_amount = 30.00, payment_status = 'Pagata Parz.' WHERE id = 2;
+        UPDATE BankTransactions SET reconciled_amount = 30.00, reconciliation_status = 'Riconciliato Parz.' WHERE id = 2;
+    """)
+    conn.commit()
+
+    def connect():
+        db_conn = sqlite3.connect(db_path)
+        db_conn.row_factory = sqlite3.Row
+        return db_conn
+
+    monkeypatch.setattr(reconciliation, "get_connection", connect)
+    yield conn
+    conn.close()
+
+
+def test_batch_validates_on_running_residuals_and_commits_once(batch_db):
+    """Residui scalati in memoria tra coppie, upsert dei link esistenti, errori riportati per coppia"""
+    result = apply_matches_batch([
+        {'invoice_id': 1, 'transaction_id': 1, 'amount': 100.00},
+        {'invoice_id': 2, 'transaction_id': 2, 'amount': 50.00},
+        {'invoice_id': 2, 'transaction_id': 2, 'amount': 10.00},   # supera il residuo fattura dopo la coppia precedente
+        (3, 3, 50.00),                                             # transazione negativa
+        {'invoice_id': 99, 'transaction_id': 1, 'amount': 5.00},
+        {'invoice_id': 3, 'transaction_id': 2, 'amount': -1},
+    ])
+
+    assert [r['success'] for r in result['results']] == [True, True, False, True, False, False]
+    assert (result['applied'], result['failed']) == (3, 3)
+    assert "supera residuo fattura" in result['results'][2]['message']
+    assert result['results'][4]['message'] == "Fattura o transazione non trovata."
+
+    links = dict(((row[0], row[1]), row[2]) for row in batch_db.execute(
+        "SELECT invoice_id, transaction_id, reconciled_amount FROM ReconciliationLinks"))
+    assert links == {(1, 1): 100.0, (2, 2): 80.0, (3, 3): 50.0}
+    invoices = {row[0]: tuple(row[1:]) for row in batch_db.execute("SELECT id, paid_amount, payment_status FROM Invoices")}
+    assert invoices == {1: (100.0, 'Pagata Tot.'), 2: (80.0, 'Pagata Tot.'), 3: (50.0, 'Pagata Tot.')}
+    statuses = [row[0] for row in batch_db.execute("SELECT reconciliation_status FROM BankTransactions ORDER BY id")]
+    assert statuses == ['Riconciliato Tot.', 'Riconciliato Parz.', 'Riconciliato Tot.']
@@ -0,0 +1,58 @@
+# tests/test_core_integration/test_bank_csv_profiles.py
+import io
+import sqlite3
+
+from app.core import database, importer, parser_csv
+
+HEADER = "DATA;VALUTA;DARE;AVERE;DESCRIZIONE OPERAZIONE;CAUSALE ABI"
+
+
+def _statement(day, rows=5):
+    """Estratto conto cp1252 con una riga di preambolo prima dell'intestazione."""
+    lines = [f"Estratto conto al {day}/03/2024", HEADER]
+    lines += [f"{day}/03/2024;{day}/03/2024;{n},50;;Pagamento caffè {n};43" for n in range(1, rows + 1)]
+    return ("\r\n".join(lines) + "\r\n").encode("cp1252")
+
+
+def _fail(*args, **kwargs):
+    raise AssertionError("rilevamento eseguito nonostante il profilo salvato")
+
+
+def test_second_import_reuses_stored_profile(tmp_path, monkeypatch):
+    """Primo import: profilo rilevato e salvato; import successivo della stessa banca senza alcun rilevamento"""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "profiles.db"))
+    first, second = tmp_path / "banca_01.csv", tmp_path / "banca_02.csv"
+    first.write_bytes(_statement("01"))
+    second.write_bytes(_statement("02", rows=7))
+
+    assert importer.import_from_source(str(first), workers=1)['files'][0]['status'] == 'Success (5 new)'
+    conn = sqlite3.connect(tmp_path / "profiles.db")
+    encoding, delimiter, header_row, use_count = conn.execute(
+        "SELECT encoding, delimiter, header_row, use_count FROM BankCsvProfiles").fetchone()
+    assert (delimiter, header_row, use_count) == (";", 1, 1) and encoding != "utf-8"
+
+    expected = parser_csv.parse_bank_csv(str(second))
+    monkeypatch.setattr(parser_csv, "detect_encoding", _fail)
+    monkeypatch.setattr(parser_csv, "find_column_names", _fail)
+    assert importer.import_from_source(str(second), workers=1)['files'][0]['status'] == 'Success (7 new)'
+
+    stored = conn.execute("SELECT description, amount FROM BankTransactions WHERE transaction_date LIKE '2024-03-02%' ORDER BY id").fetchall()
+    assert stored == list(zip(expected['Descrizione'], expected['Importo'])) and stored[0] == ("Pagamento caffè 1", -1.5)
+    assert conn.execute("SELECT use_count FROM BankCsvProfiles").fetchone() == (2,)
+    conn.close()
+
+
+def test_profile_separators_and_stale_encoding():
+    """Separatori del profilo nel percorso veloce; profilo con encoding non più valido: nuovo rilevamento"""
+    data = _statement("04").replace(b"5,50", b"1,234.5").replace(b",50;", b".50;")
+    profile, known = parser_csv.resolve_bank_csv_profile(io.BytesIO(data))
+    assert not known and profile['column_mapping']['ImportoDare'] == "DARE"
+
+    english = dict(profile, decimal_separator=".", thousands_separator=",")
+    parsed = parser_csv.parse_bank_csv(io.BytesIO(data), profile=english)
+    assert parsed['Importo'].tolist() == [-1.5, -2.5, -3.5, -4.5, -1234.5]
+
+    stale = dict(profile, encoding="utf-8")
+    resolved, known = parser_csv.resolve_bank_csv_profile(io.BytesIO(data), {profile['fingerprint']: stale})
+    assert not known and resolved['encoding'] == profile['encoding']
+    assert parser_csv.resolve_bank_csv_profile(io.BytesIO(data), {profile['fingerprint']: profile}) == (profile, True)
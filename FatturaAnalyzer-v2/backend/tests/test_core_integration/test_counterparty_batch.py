@@ -0,0 +1,105 @@
+# tests/test_core_integration/test_counterparty_batch.py
+import sqlite3
+
+import pytest
+
+from app.core import database, importer
+
+OWN_PIVA = "02273530226"  # P.IVA aziendale di app/config.ini -> fatture Attive
+
+INVOICE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<p:FatturaElettronica versione="FPR12" xmlns:p="http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2">
+  <FatturaElettronicaHeader>
+    <CedentePrestatore><DatiAnagrafici>
+      <IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>{own_piva}</IdCodice></IdFiscaleIVA>
+      <Anagrafica><Denominazione>Azienda Test</Denominazione></Anagrafica>
+    </DatiAnagrafici></CedentePrestatore>
+    <CessionarioCommittente><DatiAnagrafici>{ids}
+      <Anagrafica><Denominazione>{name}</Denominazione></Anagrafica>
+    </DatiAnagrafici>
+    <Sede><Indirizzo>Via Roma 1</Indirizzo><CAP>00100</CAP>{city}<Nazione>IT</Nazione></Sede>{contacts}
+    </CessionarioCommittente>
+  </FatturaElettronicaHeader>
+  <FatturaElettronicaBody>
+    <DatiGenerali><DatiGeneraliDocumento>
+      <TipoDocumento>TD01</TipoDocumento><Divisa>EUR</Divisa><Data>2024-02-01</Data>
+      <Numero>CP{number}</Numero><ImportoTotaleDocumento>61.00</ImportoTotaleDocumento>
+    </DatiGeneraliDocumento></DatiGenerali>
+    <DatiBeniServizi>
+      <DatiRiepilogo><AliquotaIVA>22.00</AliquotaIVA><ImponibileImporto>50.00</ImponibileImporto><Imposta>11.00</Imposta></DatiRiepilogo>
+    </DatiBeniServizi>
+  </FatturaElettronicaBody>
+</p:FatturaElettronica>"""
+
+PIVA = "<IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>{}</IdCodice></IdFiscaleIVA>"
+CF = "<CodiceFiscale>{}</CodiceFiscale>"
+
+COUNTERPARTIES = [
+    (PIVA.format("01234567890"), "Alfa Impianti SRL", "", ""),
+    (PIVA.format("01234567890"), "Alfa Impianti SRL", "<Comune>Trento</Comune>", "<Contatti><Telefono>0461000000</Telefono><Email>info@alfa.it</Email></Contatti>"),
+    (CF.format("RSSMRA80A01H501U"), "Mario Rossi", "", ""),
+    (PIVA.format("RSSMRA80A01H501U"), "Mario Rossi", "<Comune>Roma</Comune>", ""),
+    ("", "Bottega Artigiana Rossi", "", ""),
+    ("", "BOTTEGA ARTIGIANA ROSSI", "", ""),
+    ("", "Bottega Artigiana di Verdi", "", ""),
+    (PIVA.format("09876543210"), "Gamma SPA", "<Comune>Milano</Comune>", ""),  # già in anagrafica (due volte)
+    ("", "X", "", ""),  # denominazione non valida
+]
+
+
+@pytest.fixture
+def invoices_dir(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    for n, (ids, name, city, contacts) in enumerate(COUNTERPARTIES * 2):
+        (source / f"cp_{n:03d}.xml").write_text(INVOICE_XML.format(
+            own_piva=OWN_PIVA, ids=ids, name=name, city=city, contacts=contacts, number=n), encoding="utf-8")
+    return source
+
+
+def _seeded_db(tmp_path, monkeypatch, name):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / f"{name}.db"))
+    database.create_tables()
+    conn = database.get_connection()
+    conn.executemany("INSERT INTO Anagraphics (type, piva, denomination) VALUES ('Cliente', ?, ?)",
+                     [("09876543210", "Gamma SPA"), ("09876543210", "Gamma SPA (doppione)"), ("01234567890", "Alfa Fornitore")])
+    conn.execute("UPDATE Anagraphics SET type = 'Fornitore' WHERE denomination = 'Alfa Fornitore'")
+    conn.commit()
+    return conn
+
+
+def _snapshot(conn):
+    return {
+        'anagraphics': conn.execute("SELECT id, type, piva, cf, denomination, address, cap, city, email, phone "
+                                    "FROM Anagraphics ORDER BY id").fetchall(),
+        'invoices': conn.execute("SELECT doc_number, anagraphics_id FROM Invoices ORDER BY id").fetchall(),
+    }
+
+
+def test_batched_counterparties_match_per_invoice_resolution(tmp_path, monkeypatch, invoices_dir):
+    """Controparti risolte in blocco sull'indice in memoria: stesse anagrafiche e fatture della risoluzione per fattura, senza query per fattura"""
+    conn = _seeded_db(tmp_path, monkeypatch, "per_invoice")
+    statuses = [importer.process_file(str(path), conn, {'piva': OWN_PIVA, 'cf': None}) for path in sorted(invoices_dir.iterdir())]
+    conn.commit()
+    expected = {k: [tuple(row) for row in rows] for k, rows in _snapshot(conn).items()}
+    conn.close()
+
+    _seeded_db(tmp_path, monkeypatch, "batched").close()
+    statements = []
+    def traced_connection():
+        traced = database.get_connection()
+        traced.set_trace_callback(statements.append)
+        return traced
+    monkeypatch.setattr(importer, "get_connection", traced_connection)
+    monkeypatch.setattr(importer, "IMPORT_WRITE_BATCH_FILES", 5)
+    results = importer.import_from_source(str(invoices_dir), workers=1)
+
+    assert [f['status'] for f in results['files']] == statuses
+    assert statuses.count('Success') == 16 and statuses.count('Error - Counterparty (Cliente) Insert/Find Failed') == 2
+    conn = sqlite3.connect(tmp_path / "batched.db")
+    assert {k: [tuple(row) for row in rows] for k, rows in _snapshot(conn).items()} == expected
+    conn.close()
+
+    anagraphics_reads = [sql for sql in statements if "FROM Anagraphics" in sql]
+    assert len(anagraphics_reads) == 1  # solo il caricamento dell'indice
+    assert not any(sql.startswith("INSERT INTO Anagraphics (type") for sql in statements)
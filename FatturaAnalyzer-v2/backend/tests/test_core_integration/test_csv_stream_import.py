@@ -0,0 +1,76 @@
+# tests/test_core_integration/test_csv_stream_import.py
+import sqlite3
+
+import pytest
+
+from app.core import database, importer, parser_csv
+
+HEADER = "DATA;VALUTA;DARE;AVERE;DESCRIZIONE OPERAZIONE;CAUSALE ABI"
+
+
+def _statement(rows):
+    lines = [HEADER]
+    for n in range(rows):
+        day = f"{n % 28 + 1:02d}/{n % 12 + 1:02d}/2023"
+        dare, avere = (f"{n},{n % 100:02d}", "") if n % 3 else ("", f"{n + 1}.{n % 1000:03d},50")
+        lines.append(f"{day};{day};{dare};{avere};Movimento {n} cliente {n % 7};48")
+    lines.insert(350, lines[10])    # duplicato nel file, in un blocco successivo
+    lines.insert(20, "31/12/2023;;;;Saldo contabile;")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def statement(tmp_path):
+    path = tmp_path / "source" / "estratto.csv"
+    path.parent.mkdir()
+    path.write_text(_statement(1000), encoding="utf-8")
+    return path
+
+
+def _import(tmp_path, monkeypatch, source, name, stream_bytes):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / f"{name}.db"))
+    monkeypatch.setattr(importer, "IMPORT_CSV_STREAM_BYTES", stream_bytes)
+    database.create_tables()
+    conn = sqlite3.connect(tmp_path / f"{name}.db")
+    conn.execute("INSERT INTO BankTransactions (transaction_date, amount, description, unique_hash) VALUES ('2023-01-01', 1, 'x', ?)",
+                 (parser_csv.parse_bank_csv(str(source))['unique_hash'].iloc[5],))  # già presente nel DB
+    conn.commit(); conn.close()
+    results = importer.import_from_source(str(source), workers=1)
+    conn = sqlite3.connect(tmp_path / f"{name}.db")
+    rows = conn.execute("SELECT transaction_date, value_date, amount, description, causale_abi, unique_hash, category "
+                        "FROM BankTransactions ORDER BY id").fetchall()
+    conn.close()
+    return results, rows
+
+
+def test_streamed_csv_import_matches_full_import(tmp_path, monkeypatch, statement):
+    """Import a blocchi (lookup indicizzati + tabella TEMP per i duplicati tra blocchi): stesso esito dell'import intero"""
+    monkeypatch.setattr(parser_csv, "CSV_STREAM_CHUNK_ROWS", 128)
+    streamed_parse = iter(parser_csv.iter_bank_csv_chunks(str(statement)))
+    assert len(next(streamed_parse)) <= 128
+
+    full, full_rows = _import(tmp_path, monkeypatch, statement, "full", 1 << 40)
+    streamed, streamed_rows = _import(tmp_path, monkeypatch, statement, "streamed", 0)
+
+    assert full['files'] == streamed['files'] == [{'name': 'estratto.csv', 'status': 'Success (999 new)'}]
+    assert streamed_rows == full_rows and len(streamed_rows) == 1000
+
+
+def test_failed_chunk_is_rolled_back_alone(tmp_path, monkeypatch, statement):
+    """Errore DB in un blocco: annullato solo quel blocco tramite savepoint, gli altri restano inseriti"""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "savepoint.db"))
+    database.create_tables()
+    conn = database.get_connection()
+    conn.execute("CREATE TEMP TRIGGER fail_one BEFORE INSERT ON BankTransactions "
+                 "WHEN new.description = 'Movimento 300 cliente 6' BEGIN SELECT RAISE(ABORT, 'blocco rifiutato'); END")
+    chunks = list(parser_csv.iter_bank_csv_chunks(str(statement), chunk_rows=200))
+    failing = next(c for c in chunks if (c['Descrizione'] == 'Movimento 300 cliente 6').any())
+
+    conn.execute("BEGIN")
+    inserted, db_dup, file_dup, errors = database.add_transactions_chunked(conn.cursor(), iter(chunks))
+    conn.commit()
+
+    assert (inserted + errors, db_dup, file_dup) == (1000, 0, 1) and 0 < errors <= len(failing)
+    stored = {row[0] for row in conn.execute("SELECT description FROM BankTransactions")}
+    assert len(stored) == inserted and stored.isdisjoint(set(failing['Descrizione']) - set(chunks[0]['Descrizione']))
+    conn.close()
@@ -0,0 +1,48 @@
+# tests/test_core_integration/test_fulltext_search.py
+import sqlite3
+
+import pytest
+
+from app.core import database
+from app.core.database import ensure_fulltext_index, build_fts_match_query
+
+
+@pytest.fixture
+def fts_conn(monkeypatch):
+    monkeypatch.setattr(database, "_fulltext_ready", None)
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE Anagraphics (id INTEGER PRIMARY KEY, denomination TEXT, piva TEXT, cf TEXT);
+        CREATE TABLE Invoices (id INTEGER PRIMARY KEY, doc_number TEXT);
+        CREATE TABLE BankTransactions (id INTEGER PRIMARY KEY, description TEXT);
+        INSERT INTO BankTransactions (description) VALUES ('BONIFICO DA ACME SRL');
+    """)
+    yield conn
+    conn.close()
+
+
+def test_build_fts_match_query_sanitizes_input():
+    """Token quotati con prefisso, operatori FTS5 neutralizzati"""
+    assert build_fts_match_query('acme "srl" OR*') == '"acme"* "srl"* "OR"*'
+    assert build_fts_match_query('  ---  ') is None
+    assert build_fts_match_query(None) is None
+
+
+def test_fulltext_index_rebuild_and_triggers(fts_conn):
+    """Righe esistenti indicizzate alla creazione, modifiche propagate dai trigger"""
+    assert ensure_fulltext_index(fts_conn) is True
+
+    def match(table, text):
+        return [r[0] for r in fts_conn.execute(
+            f"SELECT rowid FROM {table} WHERE {table} MATCH ? ORDER BY rank", (build_fts_match_query(text),))]
+
+    assert match("BankTransactionsFTS", "acm") == [1]
+
+    fts_conn.execute("UPDATE BankTransactions SET description = 'PAGAMENTO BETA SPA' WHERE id = 1")
+    fts_conn.execute("INSERT INTO Anagraphics (denomination, piva) VALUES ('Beta Spa', '01234567890')")
+    assert match("BankTransactionsFTS", "acme") == []
+    assert match("BankTransactionsFTS", "beta") == [1]
+    assert match("AnagraphicsFTS", "0123") == [1]
+
+    fts_conn.execute("DELETE FROM Anagraphics WHERE id = 1")
+    assert match("AnagraphicsFTS", "beta") == []
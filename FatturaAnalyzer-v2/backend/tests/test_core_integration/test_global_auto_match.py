@@ -0,0 +1,81 @@
+# tests/test_core_integration/test_global_auto_match.py
+import sqlite3
+
+import pytest
+
+from app.core.reconciliation import GlobalAutoMatcher
+
+
+@pytest.fixture
+def match_conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE Anagraphics (id INTEGER PRIMARY KEY, denomination TEXT);
+        CREATE TABLE Invoices (id INTEGER PRIMARY KEY, type TEXT, anagraphics_id INTEGER, doc_number TEXT, doc_date TEXT,
+                               total_amount REAL, paid_amount REAL DEFAULT 0.0, payment_status TEXT DEFAULT 'Aperta',
+                               open_residual REAL GENERATED ALWAYS AS (ROUND(total_amount - paid_amount, 2)) VIRTUAL);
+        CREATE TABLE BankTransactions (id INTEGER PRIMARY KEY, amount REAL, reconciled_amount REAL DEFAULT 0.0,
+                                       description TEXT, transaction_date TEXT, inferred_anagraphics_id INTEGER,
+                                       reconciliation_status TEXT DEFAULT 'Da Riconciliare');
+        INSERT INTO Anagraphics VALUES (1, 'Rossi Costruzioni'), (2, 'Bianchi Impianti');
+        INSERT INTO Invoices (id, type, anagraphics_id, doc_number, doc_date, total_amount) VALUES
+            (10, 'Attiva', 1, 'FT12', '2024-03-01', 100.00),
+            (11, 'Attiva', 2, 'FT13', '2024-03-02', 100.00),
+            (12, 'Attiva', 1, 'FT14', '2024-03-03', 300.00),
+            (13, 'Passiva', 2, 'A7', '2024-03-04', 55.10);
+        INSERT INTO BankTransactions (id, amount, description, transaction_date, inferred_anagraphics_id) VALUES
+            (1, 100.00, 'BONIFICO DA ROSSI COSTRUZIONI FT12', '2024-03-10', 1),
+            (2, 100.00, 'BONIFICO DA BIANCHI IMPIANTI FT13', '2024-03-10', 2),
+            (3, 300.00, 'BONIFICO DA ROSSI COSTRUZIONI', '2024-03-10', 1),
+            (4, 300.00, 'BONIFICO DA ROSSI COSTRUZIONI', '2024-03-10', 1),
+            (5, -55.10, 'PAGAMENTO BIANCHI IMPIANTI A7', '2024-03-12', 2);
+    """)
+    yield conn
+    conn.close()
+
+
+def test_global_assignment_uses_counterparty_and_is_one_to_one(match_conn):
+    """Stesso importo su controparti diverse risolto per anagrafica, nessuna fattura assegnata due volte"""
+    matches = GlobalAutoMatcher(match_conn).find_matches()
+    pairs = {(m['transaction_id'], m['invoice_id']) for m in matches}
+
+    assert {(1, 10), (2, 11), (5, 13)} <= pairs
+    assert len({m['invoice_id'] for m in matches}) == len(matches)
+    assert len({m['transaction_id'] for m in matches}) == len(matches)
+
+
+def test_equivalent_alternatives_are_not_auto_matched(match_conn):
+    """Due transazioni indistinguibili per una sola fattura: nessun auto-match arbitrario"""
+    matches = GlobalAutoMatcher(match_conn).find_matches()
+    assert all(m['invoice_id'] != 12 for m in matches)
+
+
+def test_confidence_level_filters_assignments(match_conn):
+    """Livello 'Exact' esclude gli assegnamenti a score più basso, 'Medium' li mantiene"""
+    match_conn.execute("INSERT INTO Invoices (id, type, anagraphics_id, doc_number, doc_date, total_amount) "
+                       "VALUES (14, 'Attiva', 2, 'FT20', '2024-01-05', 77.00)")
+    match_conn.execute("INSERT INTO BankTransactions (id, amount, description, transaction_date, inferred_anagraphics_id) "
+                       "VALUES (6, 77.00, 'ACCREDITO BIANCHI', '2024-03-10', 2)")
+    medium = GlobalAutoMatcher(match_conn).find_matches('Medium')
+    exact = GlobalAutoMatcher(match_conn).find_matches('Exact')
+
+    assert (6, 14) in {(m['transaction_id'], m['invoice_id']) for m in medium}
+    assert all(m['confidence_score'] >= 0.9 for m in exact)
+    assert {(m['transaction_id'], m['invoice_id']) for m in exact} == {(1, 10), (2, 11), (5, 13)}
+
+
+def test_partially_reconciled_outgoing_uses_absolute_residual(match_conn):
+    """Uscita -100 con 30 già riconciliati: residuo -70, abbinata alla fattura passiva da 70 e non a quella da 130"""
+    match_conn.executescript("""
+        INSERT INTO Invoices (id, type, anagraphics_id, doc_number, doc_date, total_amount) VALUES
+            (20, 'Passiva', 1, 'B70', '2024-03-05', 70.00),
+            (21, 'Passiva', 1, 'B130', '2024-03-05', 130.00);
+        INSERT INTO BankTransactions (id, amount, reconciled_amount, description, transaction_date,
+                                      inferred_anagraphics_id, reconciliation_status)
+            VALUES (7, -100.00, 30.00, 'PAGAMENTO ROSSI COSTRUZIONI', '2024-03-12', 1, 'Riconciliato Parz.');
+    """)
+    matches = {m['transaction_id']: m for m in GlobalAutoMatcher(match_conn).find_matches()}
+
+    assert matches[7]['invoice_id'] == 20
+    assert str(matches[7]['amount']) == '70.00'
@@ -0,0 +1,45 @@
+# tests/test_core_integration/test_open_residual_index.py
+import sqlite3
+
+import pytest
+
+from app.core.database import ensure_open_residual_column, OPEN_INVOICE_FILTER
+
+
+@pytest.fixture
+def invoices_conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE Invoices (id INTEGER PRIMARY KEY, type TEXT, anagraphics_id INTEGER, due_date TEXT,
+                               total_amount REAL, paid_amount REAL DEFAULT 0.0, payment_status TEXT DEFAULT 'Aperta');
+        INSERT INTO Invoices (id, type, anagraphics_id, total_amount, paid_amount, payment_status) VALUES
+            (1, 'Attiva', 1, 100.10, 0.0, 'Aperta'),
+            (2, 'Attiva', 1, 250.00, 100.00, 'Pagata Parz.'),
+            (3, 'Attiva', 1, 80.00, 80.00, 'Pagata Tot.');
+    """)
+    yield conn
+    conn.close()
+
+
+def _plan(conn, query, params=()):
+    return " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params))
+
+
+def test_open_residual_is_generated_and_lookups_use_partial_indexes(invoices_conn):
+    """Colonna residuo calcolata da SQLite; ricerche per importo = range scan sul solo sottoinsieme aperto"""
+    ensure_open_residual_column(invoices_conn)
+    ensure_open_residual_column(invoices_conn)  # idempotente
+
+    invoices_conn.execute("UPDATE Invoices SET paid_amount = 0.05 WHERE id = 1")
+    residuals = {row['id']: row['open_residual'] for row in invoices_conn.execute("SELECT id, open_residual FROM Invoices")}
+    assert residuals == {1: 100.05, 2: 150.0, 3: 0.0}
+
+    by_anag = (f"SELECT id FROM Invoices i WHERE i.type = ? AND i.anagraphics_id = ? AND i.{OPEN_INVOICE_FILTER} "
+               "AND i.open_residual > ? AND i.open_residual <= ?")
+    assert "idx_invoices_open_anag_residual" in _plan(invoices_conn, by_anag, ('Attiva', 1, 0.005, 150))
+    assert [row[0] for row in invoices_conn.execute(by_anag, ('Attiva', 1, 0.005, 120))] == [1]
+
+    by_type = f"SELECT SUM(open_residual) FROM Invoices WHERE type = ? AND {OPEN_INVOICE_FILTER} AND open_residual > 0.01"
+    assert "idx_invoices_open_type_residual" in _plan(invoices_conn, by_type, ('Attiva',))
+    assert invoices_conn.execute(by_type, ('Attiva',)).fetchone()[0] == pytest.approx(250.05)
@@ -0,0 +1,147 @@
+# tests/test_core_integration/test_parallel_import.py
+import io
+import os
+import sqlite3
+import tempfile
+import zipfile
+
+import pytest
+
+from app.core import database, importer
+
+OWN_PIVA = "02273530226"  # P.IVA aziendale di app/config.ini -> fatture Attive
+
+INVOICE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<p:FatturaElettronica versione="FPR12" xmlns:p="http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2">
+  <FatturaElettronicaHeader>
+    <CedentePrestatore><DatiAnagrafici>
+      <IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>{own_piva}</IdCodice></IdFiscaleIVA>
+      <Anagrafica><Denominazione>Azienda Test</Denominazione></Anagrafica>
+    </DatiAnagrafici></CedentePrestatore>
+    <CessionarioCommittente><DatiAnagrafici>
+      <IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>{client_piva}</IdCodice></IdFiscaleIVA>
+      <Anagrafica><Denominazione>Cliente {client_piva} SRL</Denominazione></Anagrafica>
+    </DatiAnagrafici>
+    <Sede><Indirizzo>Via Roma 1</Indirizzo><CAP>00100</CAP><Comune>Roma</Comune><Nazione>IT</Nazione></Sede>
+    </CessionarioCommittente>
+  </FatturaElettronicaHeader>
+  <FatturaElettronicaBody>
+    <DatiGenerali><DatiGeneraliDocumento>
+      <TipoDocumento>TD01</TipoDocumento><Divisa>EUR</Divisa><Data>2024-01-15</Data>
+      <Numero>FT{number}</Numero><ImportoTotaleDocumento>122.00</ImportoTotaleDocumento>
+    </DatiGeneraliDocumento></DatiGenerali>
+    <DatiBeniServizi>
+      <DettaglioLinee><NumeroLinea>1</NumeroLinea><Descrizione>Servizio</Descrizione><Quantita>1.00</Quantita>
+        <PrezzoUnitario>100.00</PrezzoUnitario><PrezzoTotale>100.00</PrezzoTotale><AliquotaIVA>22.00</AliquotaIVA></DettaglioLinee>
+      <DatiRiepilogo><AliquotaIVA>22.00</AliquotaIVA><ImponibileImporto>100.00</ImponibileImporto><Imposta>22.00</Imposta></DatiRiepilogo>
+    </DatiBeniServizi>
+  </FatturaElettronicaBody>
+</p:FatturaElettronica>"""
+
+
+@pytest.fixture
+def import_dir(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    for n in range(24):
+        client_piva = f"{10000000000 + n % 5:011d}"  # anagrafiche condivise tra file
+        (source / f"ft_{n:03d}.xml").write_text(
+            INVOICE_XML.format(own_piva=OWN_PIVA, client_piva=client_piva, number=n), encoding="utf-8")
+    (source / "ft_900_copia.xml").write_text((source / "ft_003.xml").read_text(encoding="utf-8"), encoding="utf-8")
+    (source / "ft_901_rotta.xml").write_text("<FatturaElettronica>", encoding="utf-8")
+    (source / "note.txt").write_text("non importabile", encoding="utf-8")
+    return source
+
+
+def _run_import(tmp_path, monkeypatch, source, workers, name, force=False):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / f"{name}.db"))
+    progress = []
+    source = source if hasattr(source, 'read') else str(source)
+    results = importer.import_from_source(source, lambda done, total: progress.append((done, total)), workers=workers, force=force)
+    conn = sqlite3.connect(tmp_path / f"{name}.db")
+    snapshot = {
+        'invoices': conn.execute("SELECT i.doc_number, i.type, a.piva, i.xml_filename FROM Invoices i "
+                                 "JOIN Anagraphics a ON a.id = i.anagraphics_id ORDER BY i.id").fetchall(),
+        'lines': conn.execute("SELECT invoice_id, line_number, total_price FROM InvoiceLines ORDER BY id").fetchall(),
+        'vat': conn.execute("SELECT invoice_id, vat_rate, vat_amount FROM InvoiceVATSummary ORDER BY id").fetchall(),
+        'anagraphics': conn.execute("SELECT id, piva FROM Anagraphics ORDER BY id").fetchall(),
+    }
+    conn.close()
+    return results, progress, snapshot
+
+
+def test_parallel_import_matches_serial_outcome(tmp_path, monkeypatch, import_dir):
+    """Parsing in pool di processi + scrittura ordinata a blocchi: stessi risultati, progresso e DB dell'import seriale"""
+    monkeypatch.setattr(importer, "IMPORT_PARALLEL_MIN_FILES", 2)
+    monkeypatch.setattr(importer, "IMPORT_WRITE_BATCH_FILES", 7)
+
+    serial = _run_import(tmp_path, monkeypatch, import_dir, 1, "serial")
+    parallel = _run_import(tmp_path, monkeypatch, import_dir, 2, "parallel")
+
+    results, progress, snapshot = serial
+    assert (results['success'], results['duplicates'], results['errors'], results['unsupported']) == (24, 1, 1, 1)
+    assert progress == [(n, 27) for n in range(1, 28)]
+    assert len(snapshot['lines']) == len(snapshot['vat']) == 24
+    assert len(snapshot['anagraphics']) == 5
+    assert parallel == serial
+
+
+def _zip_bytes(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, content in entries.items():
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+def test_zip_stream_with_nested_archives_matches_directory_import(tmp_path, monkeypatch, import_dir):
+    """Upload ZIP spooled con ZIP annidato (export SDI) letto in memoria: stesso esito dell'import da directory"""
+    monkeypatch.setattr(importer, "IMPORT_PARALLEL_MIN_FILES", 2)
+    files = sorted(p for p in import_dir.iterdir())
+    inner = {p.name: p.read_bytes() for p in files[:10]}
+    outer = {f"lotto/{p.name}": p.read_bytes() for p in files[10:]}
+    outer["lotto/inner.zip"] = _zip_bytes(inner)
+    outer["__MACOSX/lotto/._ft_000.xml"] = b"metadati"
+
+    mirror = tmp_path / "mirror"
+    for name, content in [*((f"lotto/inner.zip/{n}", c) for n, c in inner.items()), *outer.items()]:
+        if name.endswith("inner.zip"):
+            continue
+        target = mirror / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+
+    expected, _, expected_db = _run_import(tmp_path, monkeypatch, mirror, 1, "mirror")
+
+    upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    upload.write(_zip_bytes(outer))
+    upload.seek(0)
+    streamed, progress, streamed_db = _run_import(tmp_path, monkeypatch, upload, 2, "stream")
+
+    assert streamed['files'] == expected['files'] and progress[-1] == (27, 27)
+    assert (streamed['success'], streamed['duplicates'], streamed['unsupported']) == (24, 1, 2)
+    assert streamed_db == expected_db
+    assert not upload.closed  # lo stream resta del chiamante
+
+
+def test_manifest_skips_already_imported_files_before_parsing(tmp_path, monkeypatch, import_dir):
+    """Reimport: i file già importati sono saltati per hash del contenuto senza parsing; force li riparsa"""
+    first, _, first_db = _run_import(tmp_path, monkeypatch, import_dir, 1, "manifest")
+    assert (first['success'], first['duplicates'], first['manifest_hits']) == (24, 1, 0)
+
+    parsed_names = []
+    original_parse = importer.parse_source_file
+    monkeypatch.setattr(importer, "parse_source_file",
+                        lambda name, *args: parsed_names.append(name) or original_parse(name, *args))
+    (import_dir / "ft_100.xml").write_text(
+        INVOICE_XML.format(own_piva=OWN_PIVA, client_piva="10000000001", number=100), encoding="utf-8")
+
+    again, progress, again_db = _run_import(tmp_path, monkeypatch, import_dir, 1, "manifest")
+    assert (again['success'], again['duplicates'], again['errors'], again['unsupported'], again['manifest_hits']) == (1, 0, 1, 1, 25)
+    assert sorted(os.path.basename(n) for n in parsed_names) == ["ft_100.xml", "ft_901_rotta.xml", "note.txt"]
+    assert progress[-1] == (28, 28) and again['processed'] == 28
+    assert again_db['invoices'][:-1] == first_db['invoices']
+
+    parsed_names.clear()
+    forced, _, _ = _run_import(tmp_path, monkeypatch, import_dir, 1, "manifest", force=True)
+    assert (forced['duplicates'], forced['manifest_hits']) == (26, 0) and len(parsed_names) == 28
@@ -0,0 +1,84 @@
+# tests/test_core_integration/test_reconciliation_status_triggers.py
+import sqlite3
+from datetime import date
+
+import pytest
+
+from app.core.database import (install_reconciliation_status_triggers, drop_reconciliation_status_triggers,
+                               is_reconciliation_triggers_active, sweep_overdue_invoices)
+from app.core.reconciliation import BatchProcessor
+
+
+@pytest.fixture
+def status_conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE Settings (key TEXT PRIMARY KEY, value TEXT, updated_at TIMESTAMP);
+        CREATE TABLE Invoices (id INTEGER PRIMARY KEY, total_amount REAL, paid_amount REAL DEFAULT 0.0,
+                               payment_status TEXT DEFAULT 'Aperta', due_date TEXT, updated_at TIMESTAMP);
+        CREATE TABLE BankTransactions (id INTEGER PRIMARY KEY, amount REAL, reconciled_amount REAL DEFAULT 0.0,
+                                       reconciliation_status TEXT DEFAULT 'Da Riconciliare', updated_at TIMESTAMP);
+        CREATE TABLE ReconciliationLinks (id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id INTEGER NOT NULL,
+                                          invoice_id INTEGER NOT NULL, reconciled_amount REAL NOT NULL,
+                                          UNIQUE(transaction_id, invoice_id));
+        INSERT INTO Invoices (id, total_amount, due_date) VALUES (1, 100.00, '2000-01-31'), (2, 80.00, '2099-01-01');
+        INSERT INTO BankTransactions (id, amount) VALUES (1, -120.00), (2, 50.00);
+        INSERT INTO ReconciliationLinks (transaction_id, invoice_id, reconciled_amount) VALUES (2, 2, 50.00);
+    """)
+    yield conn
+    conn.close()
+
+
+def _state(conn, table, key_cols):
+    return {row['id']: tuple(row[col] for col in key_cols) for row in conn.execute(f"SELECT * FROM {table}")}
+
+
+def test_link_changes_maintain_amounts_and_statuses(status_conn):
+    """Installazione riallinea le righe divergenti; insert/update/delete dei link aggiornano solo le righe coinvolte"""
+    install_reconciliation_status_triggers(status_conn)
+    assert is_reconciliation_triggers_active(status_conn)
+    assert _state(status_conn, 'Invoices', ('paid_amount', 'payment_status')) == {
+        1: (0.0, 'Scaduta'), 2: (50.0, 'Pagata Parz.')}
+
+    status_conn.execute("INSERT INTO ReconciliationLinks (transaction_id, invoice_id, reconciled_amount) VALUES (1, 1, 100.00)")
+    status_conn.execute("INSERT INTO ReconciliationLinks (transaction_id, invoice_id, reconciled_amount) VALUES (1, 2, 20.00)")
+    status_conn.execute("UPDATE ReconciliationLinks SET reconciled_amount = 30.00 WHERE transaction_id = 2")
+    assert _state(status_conn, 'Invoices', ('paid_amount', 'payment_status')) == {
+        1: (100.0, 'Pagata Tot.'), 2: (50.0, 'Pagata Parz.')}
+    assert _state(status_conn, 'BankTransactions', ('reconciled_amount', 'reconciliation_status')) == {
+        1: (120.0, 'Riconciliato Tot.'), 2: (30.0, 'Riconciliato Parz.')}
+
+    status_conn.execute("DELETE FROM ReconciliationLinks WHERE invoice_id = 1")
+    assert _state(status_conn, 'Invoices', ('paid_amount', 'payment_status'))[1] == (0.0, 'Scaduta')
+    assert _state(status_conn, 'BankTransactions', ('reconciled_amount', 'reconciliation_status'))[1] == (
+        20.0, 'Riconciliato Parz.')
+
+
+def test_direct_writes_cannot_drift_and_batch_processor_is_skipped(status_conn):
+    """Scritture dirette sugli importi riallineate ai link; 'Ignorato' preservato; BatchProcessor non ricalcola"""
+    install_reconciliation_status_triggers(status_conn)
+    status_conn.execute("UPDATE Invoices SET paid_amount = 999, payment_status = 'Pagata Tot.' WHERE id = 2")
+    assert _state(status_conn, 'Invoices', ('paid_amount', 'payment_status'))[2] == (50.0, 'Pagata Parz.')
+
+    status_conn.execute("UPDATE BankTransactions SET reconciliation_status = 'Ignorato', reconciled_amount = 0 WHERE id = 1")
+    status_conn.execute("INSERT INTO ReconciliationLinks (transaction_id, invoice_id, reconciled_amount) VALUES (1, 1, 10.00)")
+    assert _state(status_conn, 'BankTransactions', ('reconciled_amount', 'reconciliation_status'))[1] == (0.0, 'Ignorato')
+
+    processor = BatchProcessor(status_conn)
+    assert processor.update_invoice_statuses_batch([1, 2]) == 0
+
+    drop_reconciliation_status_triggers(status_conn)
+    assert not is_reconciliation_triggers_active(status_conn)
+    status_conn.execute("DELETE FROM ReconciliationLinks WHERE invoice_id = 1")
+    assert _state(status_conn, 'Invoices', ('paid_amount',))[1] == (10.0,)
+    assert BatchProcessor(status_conn).update_invoice_statuses_batch([1]) == 1
+
+
+def test_daily_sweep_moves_open_invoices_past_due(status_conn):
+    """Sweep giornaliero: 'Aperta' scaduta -> 'Scaduta', scadenza spostata -> di nuovo 'Aperta'"""
+    status_conn.execute("UPDATE Invoices SET due_date = '2030-06-30' WHERE id = 1")
+    status_conn.execute("INSERT INTO Invoices (id, total_amount, payment_status, due_date) VALUES (3, 10.0, 'Scaduta', '2031-01-01')")
+    assert sweep_overdue_invoices(status_conn, today=date(2030, 7, 1)) == 2
+    statuses = {row['id']: row['payment_status'] for row in status_conn.execute("SELECT id, payment_status FROM Invoices")}
+    assert statuses == {1: 'Scaduta', 2: 'Aperta', 3: 'Aperta'}
@@ -0,0 +1,104 @@
+# tests/test_core_integration/test_transactions_page.py
+import asyncio
+
+import pytest
+
+from app.core import database
+from app.adapters.database_adapter import db_adapter
+
+ROWS = [
+    # (data, importo, descrizione, stato, riconciliato)
+    ('2024-03-01', 100.00, 'BONIFICO ROSSI SCONTO 50% CLIENTE', 'Da Riconciliare', 0.0),
+    ('2024-03-02', -40.00, 'PAGAMENTO POS BAR', 'Da Riconciliare', 0.0),
+    ('2024-03-03', 250.00, 'BONIFICO RIF_123', 'Riconciliato Tot.', 250.00),
+    ('2024-03-04', 80.00, 'BONIFICO RIFX123', 'Riconciliato Parz.', 30.00),
+    ('2024-03-05', -15.50, 'COMMISSIONI 50 EURO', 'Da Riconciliare', 0.0),
+    ('2024-03-06', 500.00, 'VERSAMENTO CONTANTI', 'Ignorato', 0.0),
+    ('2024-03-07', -1200.00, 'PAGAMENTO FORNITORE BIANCHI', 'Da Riconciliare', 0.0),
+]
+
+
+@pytest.fixture
+def page_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "page.db"))
+    database.create_tables()
+    conn = database.get_connection()
+    conn.executemany("""
+        INSERT INTO BankTransactions (transaction_date, value_date, amount, description, unique_hash,
+                                      reconciliation_status, reconciled_amount)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(date, date, amount, desc, f"h{n}", status, rec) for n, (date, amount, desc, status, rec) in enumerate(ROWS)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _descriptions(result):
+    return result['items']['description'].tolist()
+
+
+def test_pages_follow_order_and_total(page_db):
+    """Pagine contigue in ordine data decrescente, totale sull'intero filtro (Ignorati esclusi di default)"""
+    first = database.get_transactions_page(page=1, size=4)
+    second = database.get_transactions_page(page=2, size=4)
+
+    assert first['total'] == second['total'] == 6
+    assert _descriptions(first) + _descriptions(second) == [
+        'PAGAMENTO FORNITORE BIANCHI', 'COMMISSIONI 50 EURO', 'BONIFICO RIFX123',
+        'BONIFICO RIF_123', 'PAGAMENTO POS BAR', 'BONIFICO ROSSI SCONTO 50% CLIENTE']
+    assert first['summary'] is None
+    assert first['items'].iloc[2]['remaining_amount_fmt'] == '50,00'
+    assert database.get_transactions_page(page=3, size=4)['items'].empty
+
+
+def test_filters_and_literal_search(page_db):
+    """% e _ nella ricerca sono caratteri letterali; filtri su stato, date e importo assoluto"""
+    assert _descriptions(database.get_transactions_page(search='50%')) == ['BONIFICO ROSSI SCONTO 50% CLIENTE']
+    assert _descriptions(database.get_transactions_page(search='RIF_')) == ['BONIFICO RIF_123']
+    assert database.get_transactions_page(search='%')['total'] == 1
+
+    assert database.get_transactions_page(status_filter='Ignorato')['total'] == 1
+    dated = database.get_transactions_page(start_date='2024-03-02', end_date='2024-03-04')
+    assert _descriptions(dated) == ['BONIFICO RIFX123', 'BONIFICO RIF_123', 'PAGAMENTO POS BAR']
+    ranged = database.get_transactions_page(min_amount=50, max_amount=300)
+    assert _descriptions(ranged) == ['BONIFICO RIFX123', 'BONIFICO RIF_123', 'BONIFICO ROSSI SCONTO 50% CLIENTE']
+
+
+def test_summary_covers_whole_filter(page_db):
+    """Riepilogo aggregato su tutte le righe filtrate, non solo sulla pagina"""
+    summary = database.get_transactions_page(page=1, size=2, include_summary=True)['summary']
+
+    assert summary['total_income'] == pytest.approx(430.00)
+    assert summary['total_expenses'] == pytest.approx(1255.50)
+    assert summary['total_amount'] == pytest.approx(-825.50)
+    assert summary['count_by_status'] == {'Da Riconciliare': 4, 'Riconciliato Tot.': 1, 'Riconciliato Parz.': 1}
+    assert summary['unreconciled_count'] == 4
+    assert summary['reconciliation_rate'] == pytest.approx(100 / 6)
+    assert database.get_transactions_page(search='nessuna', include_summary=True)['summary'] == {
+        "total_amount": 0.0, "total_income": 0.0, "total_expenses": 0.0}
+
+
+def test_async_adapter_returns_records(page_db):
+    """Adapter asincrono: stessa pagina in forma di record, con totale e riepilogo"""
+    result = asyncio.run(db_adapter.get_transactions_page_async(page=2, size=2, include_summary=True))
+
+    assert result['total'] == 6
+    assert [item['description'] for item in result['items']] == ['BONIFICO RIFX123', 'BONIFICO RIF_123']
+    assert result['summary']['unreconciled_count'] == 4
+
+
+def test_hide_flags_use_flag_index(page_db):
+    """Filtri POS/commissioni: righe classificate escluse, flag di default 0 mantenuti, lookup sull'indice dei flag"""
+    page_db.execute("UPDATE BankTransactions SET is_pos = 1 WHERE description LIKE '%POS%'")
+    page_db.execute("UPDATE BankTransactions SET is_bank_fee = 1 WHERE description LIKE 'COMMISSIONI%'")
+    page_db.commit()
+
+    result = database.get_transactions_page(hide_pos=True, hide_worldline=True, hide_cash=True, hide_commissions=True)
+    assert result['total'] == 4
+    assert 'PAGAMENTO POS BAR' not in _descriptions(result) and 'COMMISSIONI 50 EURO' not in _descriptions(result)
+
+    filters, params = database._build_transactions_filters(hide_pos=True, hide_worldline=True,
+                                                           hide_cash=True, hide_commissions=True)
+    plan = " ".join(row[3] for row in page_db.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM BankTransactions WHERE " + " AND ".join(filters), params))
+    assert "USING INDEX idx_transactions_flags_date" in plan
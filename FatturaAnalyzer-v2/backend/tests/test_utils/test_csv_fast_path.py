@@ -0,0 +1,73 @@
+# tests/test_utils/test_csv_fast_path.py
+import io
+
+import pandas as pd
+import pytest
+
+from app.core import parser_csv
+from app.core.utils import calculate_transaction_hash, calculate_transaction_hashes
+
+ROWS = [
+    ("02/01/2024", "02/01/2024", "1.234,56", "", "Pagamento POS  Bar Centrale", "43"),
+    ("03/01/2024", "04/01/2024", "", "12,5", "Bonifico da ROSSI S.R.L. fatt. 12/2024", "48"),
+    ("03/01/2024", "03/01/2024", "", "", "Saldo contabile", ""),
+    ("04/01/2024", "04/01/2024", "-0,50", "", "Commissioni  bonifico", "26"),
+    ("05/01/2024", "", "2.000.000,00", "3,00", "Addebito SDD ENEL", ""),
+    ("xx", "", "1,00", "", "riga senza data", ""),
+    ("05/01/2024", "05/01/2024", "", "7", "Bonifico da ROSSI S.R.L. fatt. 12/2024", "48"),
+]
+HEADER = ("DATA", "VALUTA", "DARE", "AVERE", "DESCRIZIONE OPERAZIONE", "CAUSALE ABI")
+
+
+def _csv(rows, delimiter=";", encoding="utf-8"):
+    quote = (lambda v: f'"{v}"') if delimiter == "," else (lambda v: v)
+    lines = [delimiter.join(HEADER)] + [delimiter.join(quote(v) for v in row) for row in rows]
+    return ("\n".join(lines) + "\n").encode(encoding)
+
+
+def _parse_both(monkeypatch, data):
+    results = []
+    for fast in (True, False):
+        monkeypatch.setattr(parser_csv, "CSV_FAST_PATH", fast)
+        results.append(parser_csv.parse_bank_csv(io.BytesIO(data)))
+    return results
+
+
+@pytest.mark.parametrize("delimiter,encoding", [(";", "utf-8"), (",", "utf-8"), ("\t", "cp1252")])
+def test_fast_path_matches_legacy_parser(monkeypatch, delimiter, encoding):
+    """Percorso veloce (engine C, centesimi, hash in blocco): stesso DataFrame del parsing tradizionale"""
+    data = _csv(ROWS, delimiter, encoding)
+    assert parser_csv.sniff_csv_format(io.BytesIO(data))[1] == delimiter
+    fast, legacy = _parse_both(monkeypatch, data)
+    assert fast.equals(legacy) and list(fast.dtypes) == list(legacy.dtypes)
+    assert fast['Importo'].tolist() == [-1234.56, 12.5, 0.5, -1999997.0, 7.0]
+
+
+@pytest.mark.parametrize("rows", [
+    [("02.01.2024", "02.01.2024", "10,00", "", "Pagamento", "")],  # date lette come numeri dal parsing tradizionale
+    [("02/01/2024", "02/01/2024", "1.500", "", "Pagamento", "")],  # migliaia o decimali: ambiguo
+    [("02/01/2024", "02/01/2024", "€ 10,00", "", "Pagamento", "")],
+])
+def test_ambiguous_files_fall_back_to_legacy_parser(monkeypatch, rows):
+    """File fuori dai formati del percorso veloce: ripiego sul parsing tradizionale con identico risultato"""
+    data = _csv(rows * 3)
+    with pytest.raises(parser_csv._FastPathUnavailable):
+        parser_csv._parse_bank_csv_fast(io.BytesIO(data), "test.csv")
+    fast, legacy = _parse_both(monkeypatch, data)
+    assert fast.equals(legacy)
+
+
+def test_fast_path_decodes_utf8_sample():
+    """Campione UTF-8 valido letto come UTF-8 (chardet su pochi byte può scambiarlo per altri encoding)"""
+    data = _csv([("02/01/2024", "02/01/2024", "3,20", "", "Pagamento POS caffè", "43")])
+    assert parser_csv.sniff_csv_format(io.BytesIO(data)) == ("utf-8", ";")
+    assert parser_csv.parse_bank_csv(io.BytesIO(data))['Descrizione'].tolist() == ["Pagamento POS caffè"]
+
+
+def test_batch_hashes_match_row_hash():
+    """calculate_transaction_hashes: stessi hash di calculate_transaction_hash riga per riga"""
+    dates = pd.Series(pd.to_datetime(["2024-01-02", "2024-02-29", "2023-12-31"]))
+    cents = [-123456, 5, 0]
+    descriptions = ["Pagamento POS caffè  Bar", "  bonifico/SEPA  n.12 ", "Pagamento POS caffè  Bar"]
+    expected = [calculate_transaction_hash(d, f"{c / 100:.2f}", desc) for d, c, desc in zip(dates, cents, descriptions)]
+    assert calculate_transaction_hashes(dates, cents, descriptions) == expected
@@ -0,0 +1,125 @@
+# tests/test_utils/test_invoice_residual_index.py
+import random
+import sqlite3
+
+import pytest
+
+from app.core import invoice_residual_index
+from app.core.invoice_residual_index import (InvoiceResidualIndex, ensure_invoice_residual_log,
+                                             get_invoice_residual_index, prune_invoice_residual_log)
+
+
+@pytest.fixture
+def index_conn():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.execute("""CREATE TABLE Invoices (id INTEGER PRIMARY KEY, type TEXT, anagraphics_id INTEGER,
+                                           total_amount REAL, paid_amount REAL DEFAULT 0.0,
+                                           payment_status TEXT DEFAULT 'Aperta')""")
+    ensure_invoice_residual_log(conn)
+    rng = random.Random(3)
+    conn.executemany("INSERT INTO Invoices (type, anagraphics_id, total_amount, paid_amount) VALUES (?, ?, ?, ?)",
+                     [(rng.choice(['Attiva', 'Passiva']), rng.randint(1, 4), rng.randint(100, 99999) / 100,
+                       rng.choice([0.0, 0.0, 10.0])) for _ in range(300)])
+    yield conn
+    conn.close()
+
+
+def _expected(conn, invoice_type, target_cents, anagraphics_id=None, limit=50):
+    """Ordinamento di riferimento: ORDER BY ABS(residuo - target) su tutte le fatture aperte"""
+    query = ("SELECT id, CAST(ROUND((total_amount - paid_amount) * 100) AS INTEGER) FROM Invoices "
+             "WHERE type = ? AND payment_status IN ('Aperta', 'Scaduta', 'Pagata Parz.')")
+    params = [invoice_type]
+    if anagraphics_id is not None:
+        query += " AND anagraphics_id = ?"
+        params.append(anagraphics_id)
+    rows = [(abs(abs(cents) - target_cents), inv_id) for inv_id, cents in conn.execute(query, params) if cents != 0]
+    return sorted(d for d, _ in rows)[:limit]
+
+
+def _distances(index, invoice_type, target_cents, anagraphics_id=None, limit=50):
+    return [abs(abs(cents) - target_cents) for _, cents in index.nearest(invoice_type, target_cents, anagraphics_id, limit)]
+
+
+def test_nearest_matches_full_sort(index_conn):
+    """Stesse distanze (e ordine) dell'ORDER BY ABS(...) per tipo e per anagrafica"""
+    index = InvoiceResidualIndex()
+    index.sync(index_conn)
+    for target in (0, 150, 12345, 50000, 10_000_000):
+        assert _distances(index, 'Attiva', target) == _expected(index_conn, 'Attiva', target)
+        assert _distances(index, 'Passiva', target, 2, 10) == _expected(index_conn, 'Passiva', target, 2, 10)
+    bounded = index.nearest('Attiva', 20000, limit=500, min_cents=10000, max_cents=30000)
+    assert bounded and all(10000 <= abs(cents) <= 30000 for _, cents in bounded)
+
+
+def test_incremental_sync_after_changes(index_conn):
+    """Pagamenti, nuove fatture e cancellazioni aggiornano solo le fatture cambiate"""
+    index = InvoiceResidualIndex()
+    index.sync(index_conn)
+    index_conn.execute("INSERT INTO Invoices (id, type, anagraphics_id, total_amount) VALUES (1000, 'Attiva', 9, 123.45)")
+    index.sync(index_conn)
+    assert index.nearest('Attiva', 12345, 9) == [(1000, 12345)]
+
+    index_conn.execute("UPDATE Invoices SET paid_amount = 100.00, payment_status = 'Pagata Parz.' WHERE id = 1000")
+    index.sync(index_conn)
+    assert index.nearest('Attiva', 12345, 9) == [(1000, 2345)]
+
+    index_conn.execute("UPDATE Invoices SET paid_amount = total_amount, payment_status = 'Pagata Tot.' WHERE id = 1000")
+    index_conn.execute("DELETE FROM Invoices WHERE id IN (1, 2)")
+    index.sync(index_conn)
+    assert index.nearest('Attiva', 12345, 9) == []
+    assert _distances(index, 'Attiva', 5000) == _expected(index_conn, 'Attiva', 5000)
+
+    # Log potato oltre l'ultima sequenza letta: ricostruzione completa
+    index_conn.execute("UPDATE Invoices SET total_amount = 777.77 WHERE id = 3")
+    index_conn.execute("INSERT INTO Invoices (type, anagraphics_id, total_amount) VALUES ('Passiva', 1, 1.00)")
+    prune_invoice_residual_log(index_conn, retention=0)
+    index.sync(index_conn)
+    assert index.nearest('Passiva', 100, 1, limit=1)[0][1] == 100
+    assert _distances(index, 'Passiva', 77777, 1) == _expected(index_conn, 'Passiva', 77777, 1)
+
+
+@pytest.fixture
+def file_conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(invoice_residual_index, "_indexes", {})
+    conn = sqlite3.connect(tmp_path / "residual.db")
+    conn.execute("""CREATE TABLE Invoices (id INTEGER PRIMARY KEY, type TEXT, anagraphics_id INTEGER,
+                                           total_amount REAL, paid_amount REAL DEFAULT 0.0,
+                                           payment_status TEXT DEFAULT 'Aperta')""")
+    ensure_invoice_residual_log(conn)
+    conn.executemany("INSERT INTO Invoices (type, anagraphics_id, total_amount) VALUES ('Attiva', 1, ?)",
+                     [(n * 10.0,) for n in range(1, 41)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_open_transaction_uses_overlay_not_rebuild(file_conn, monkeypatch):
+    """In transazione: indice condiviso se nulla è cambiato, altrimenti copia con le sole modifiche non confermate"""
+    shared = get_invoice_residual_index(file_conn)
+    builds = []
+    monkeypatch.setattr(InvoiceResidualIndex, "_build", lambda self, *args, **kwargs: builds.append(self))
+
+    file_conn.execute("SELECT 1 FROM Invoices").fetchall()
+    file_conn.execute("BEGIN")
+    assert get_invoice_residual_index(file_conn) is shared
+    file_conn.execute("UPDATE Invoices SET paid_amount = 5.0, payment_status = 'Pagata Parz.' WHERE id = 1")
+    view = get_invoice_residual_index(file_conn)
+    assert view is not shared and view.nearest('Attiva', 500, 1, limit=1) == [(1, 500)]
+    assert shared.nearest('Attiva', 500, 1, limit=1) == [(1, 1000)]
+    file_conn.rollback()
+
+    assert get_invoice_residual_index(file_conn) is shared
+    assert shared.nearest('Attiva', 1000, 1, limit=1) == [(1, 1000)] and builds == []
+
+
+def test_shared_sync_prunes_log(file_conn, monkeypatch):
+    """Dopo la sync dell'indice condiviso il log oltre 2 * LOG_RETENTION righe viene potato"""
+    monkeypatch.setattr(invoice_residual_index, "LOG_RETENTION", 5)
+    index = get_invoice_residual_index(file_conn)
+    assert file_conn.execute("SELECT COUNT(*) FROM InvoiceResidualLog").fetchone()[0] == 40
+
+    file_conn.execute("UPDATE Invoices SET total_amount = total_amount + 1")
+    file_conn.commit()
+    assert get_invoice_residual_index(file_conn) is index
+    assert file_conn.execute("SELECT COUNT(*) FROM InvoiceResidualLog").fetchone()[0] == 5
+    assert index.nearest('Attiva', 1100, 1, limit=1) == [(1, 1100)]
@@ -0,0 +1,55 @@
+# tests/test_utils/test_money_cents.py
+import sqlite3
+from decimal import Decimal
+
+from app.core import database
+from app.core.utils import (to_cents, cents_to_decimal, amounts_to_cents_array,
+                            cents_array_to_decimals, format_cents_array, format_currency)
+
+
+def test_to_cents_half_up():
+    """Conversione a centesimi coerente con quantize (ROUND_HALF_UP)"""
+    assert to_cents("1.234,56") == 123456
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents(Decimal("-2.505")) == -251
+    assert to_cents(None, default=-1) == -1
+
+def test_cents_array_matches_scalar_conversion():
+    values = [1.005, -1.005, 0.29, 1234.56, None]
+    assert amounts_to_cents_array(values).tolist() == [101, -101, 29, 123456, 0]
+
+def test_cents_to_decimal_edge():
+    assert cents_to_decimal(12345) == Decimal("123.45")
+    assert str(cents_to_decimal(100)) == "1.00"
+    assert cents_to_decimal(None).is_nan()
+    assert cents_array_to_decimals([1, -250]) == [Decimal("0.01"), Decimal("-2.50")]
+
+def test_format_cents_array_matches_format_currency():
+    for cents in [0, 5, -5, 123456789, -100000]:
+        expected = format_currency(cents_to_decimal(cents)).replace(" €", "")
+        assert format_cents_array([cents]) == [expected]
+
+def test_migrate_money_to_cents_in_place(monkeypatch):
+    """Migrazione idempotente e trigger di allineamento REAL -> centesimi"""
+    monkeypatch.setattr(database, "_money_cents_active", None)
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE Settings (key TEXT PRIMARY KEY, value TEXT, updated_at TIMESTAMP);
+        CREATE TABLE Invoices (id INTEGER PRIMARY KEY, total_amount REAL, paid_amount REAL DEFAULT 0.0);
+        CREATE TABLE BankTransactions (id INTEGER PRIMARY KEY, amount REAL, reconciled_amount REAL DEFAULT 0.0);
+        CREATE TABLE ReconciliationLinks (id INTEGER PRIMARY KEY, reconciled_amount REAL);
+        INSERT INTO Invoices (total_amount, paid_amount) VALUES (1220.10, 0.29);
+        INSERT INTO BankTransactions (amount) VALUES (-99.99);
+    """)
+    database.migrate_money_to_cents(conn)
+    database.migrate_money_to_cents(conn)
+
+    assert conn.execute("SELECT total_amount_cents, paid_amount_cents FROM Invoices").fetchone() == (122010, 29)
+    assert conn.execute("SELECT amount_cents FROM BankTransactions").fetchone() == (-9999,)
+
+    conn.execute("UPDATE Invoices SET paid_amount = 1220.10")
+    conn.execute("INSERT INTO ReconciliationLinks (reconciled_amount) VALUES (0.07)")
+    assert conn.execute("SELECT paid_amount_cents FROM Invoices").fetchone() == (122010,)
+    assert conn.execute("SELECT reconciled_amount_cents FROM ReconciliationLinks").fetchone() == (7,)
+    assert conn.execute("SELECT value FROM Settings WHERE key = 'money_storage'").fetchone() == ("cents",)
+    conn.close()
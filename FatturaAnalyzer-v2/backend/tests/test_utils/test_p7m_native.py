@@ -0,0 +1,75 @@
+# tests/test_utils/test_p7m_native.py
+import base64
+
+import pytest
+
+from app.core import parser_p7m
+from app.core.parser_p7m import extract_p7m_content, extract_xml_bytes_from_p7m
+
+XML = (b'<?xml version="1.0"?><p:FatturaElettronica xmlns:p="x"><FatturaElettronicaHeader/>'
+       + b'<FatturaElettronicaBody>' + b'<Descrizione>riga</Descrizione>' * 20 + b'</FatturaElettronicaBody></p:FatturaElettronica>')
+OID_SIGNED_DATA = b'\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x07\x02'
+OID_DATA = b'\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x07\x01'
+
+
+def _der(tag, content):
+    length = len(content)
+    if length < 0x80:
+        return bytes([tag, length]) + content
+    size = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([tag, 0x80 | len(size)]) + size + content
+
+
+def _ber(tag, *children):
+    return bytes([tag, 0x80]) + b''.join(children) + b'\x00\x00'
+
+
+def _signed_der(payload, detached=False):
+    encap = OID_DATA if detached else OID_DATA + _der(0xA0, _der(0x04, payload))
+    signer_infos = _der(0x31, _der(0x30, b'\x02\x01\x01'))
+    signed_data = _der(0x30, b'\x02\x01\x01' + _der(0x31, b'') + _der(0x30, encap) + signer_infos)
+    return _der(0x30, OID_SIGNED_DATA + _der(0xA0, signed_data))
+
+
+def _signed_ber_chunked(payload):
+    """Busta a lunghezza indefinita con OCTET STRING costruito a segmenti (output di 'openssl cms -stream')"""
+    chunks = [_der(0x04, payload[i:i + 40]) for i in range(0, len(payload), 40)]
+    encap = _ber(0x30, OID_DATA, _ber(0xA0, _ber(0x24, *chunks)))
+    signed_data = _ber(0x30, b'\x02\x01\x01', _der(0x31, b''), encap, _der(0x31, b''))
+    return _ber(0x30, OID_SIGNED_DATA, _ber(0xA0, signed_data))
+
+
+@pytest.mark.parametrize("envelope", [
+    _signed_der(XML),
+    _signed_ber_chunked(XML),
+    base64.encodebytes(_signed_der(XML)),
+    b'-----BEGIN PKCS7-----\n' + base64.encodebytes(_signed_der(XML)) + b'-----END PKCS7-----\n',
+    _signed_der(_signed_der(XML)),  # fattura firmata due volte
+])
+def test_native_extraction_handles_der_ber_base64_and_nesting(envelope):
+    """Contenuto XML estratto in-process da buste DER, BER indefinite, base64/PEM e annidate"""
+    assert extract_p7m_content(envelope) == XML
+
+
+def test_unrecognized_envelopes_fall_back_to_external_extraction(tmp_path, monkeypatch):
+    """Firma detached o busta troncata: nessun risultato nativo, ripiego sul percorso OpenSSL"""
+    assert extract_p7m_content(_signed_der(XML, detached=True)) is None
+    assert extract_p7m_content(_signed_der(XML)[:-10]) is None
+
+    calls = []
+
+    def fake_external(p7m_filepath, base_name, structure_info):
+        calls.append(base_name)
+        extracted = tmp_path / "estratto.xml"
+        extracted.write_bytes(XML)
+        return str(extracted)
+
+    monkeypatch.setattr(parser_p7m, "_extract_xml_from_p7m_external", fake_external)
+    p7m_file = tmp_path / "IT01234567890_ABC.xml.p7m"
+    p7m_file.write_bytes(_signed_der(XML))
+    assert extract_xml_bytes_from_p7m(str(p7m_file)) == XML and calls == []
+
+    p7m_file.write_bytes(_signed_der(XML, detached=True))
+    assert extract_xml_bytes_from_p7m(str(p7m_file)) == XML
+    assert calls == ["IT01234567890_ABC.xml.p7m"]
+    assert not (tmp_path / "estratto.xml").exists()  # file temporaneo del fallback rimosso
@@ -0,0 +1,70 @@
+# tests/test_utils/test_subset_sum.py
+import random
+import time
+from itertools import combinations
+
+import pytest
+
+from app.core import subset_sum
+from app.core.subset_sum import (find_subset_sums, find_subset_sums_parallel, find_subset_sums_up_to,
+                                 shutdown_process_pool, SubsetSumTimeout)
+
+
+def _brute_force(amounts, target, size, tolerance=1):
+    return sorted(combo for combo in combinations(range(len(amounts)), size)
+                  if abs(sum(amounts[i] for i in combo) - target) <= tolerance)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5, 6, 7, 8])
+def test_matches_brute_force(size):
+    """Stesso insieme (e ordine) di combinazioni della ricerca esaustiva"""
+    rng = random.Random(size)
+    amounts = [rng.choice([rng.randint(100, 50000), 12250, 24500, 36750]) for _ in range(18)]
+    target = sum(rng.sample(amounts, size)) + rng.choice([-1, 0, 1])
+    assert find_subset_sums(amounts, target, size) == _brute_force(amounts, target, size)
+
+
+def test_large_sizes_use_fallback_when_dp_too_large(monkeypatch):
+    """Senza DP (tabella oltre limite o importi negativi) il risultato non cambia"""
+    rng = random.Random(7)
+    amounts = [rng.randint(-5000, 90000) for _ in range(16)]
+    target = sum(amounts[:8])
+    expected = _brute_force(amounts, target, 8)
+    assert expected and find_subset_sums(amounts, target, 8) == expected
+    monkeypatch.setattr(subset_sum, "DP_MAX_BITS", 0)
+    positive = [abs(a) + 1 for a in amounts]
+    assert find_subset_sums(positive, sum(positive[:8]), 8) == _brute_force(positive, sum(positive[:8]), 8)
+
+
+def test_duplicated_amounts_return_every_combination():
+    """Importi uguali non vengono deduplicati per somma: ogni combinazione è restituita"""
+    amounts = [10000] * 6
+    assert len(find_subset_sums(amounts, 30000, 3)) == 20
+
+
+def test_deadline_reports_incomplete_search():
+    expired = time.monotonic() - 1
+    with pytest.raises(SubsetSumTimeout):
+        find_subset_sums(list(range(1, 40)), 100, 3, deadline=expired)
+    results, complete = find_subset_sums_up_to([100, 200, 300], 300, 2, 3, deadline=expired)
+    assert results == [] and complete is False
+    assert find_subset_sums_up_to([100, 200, 300], 300, 1, 3) == ([(2,), (0, 1)], True)
+
+
+@pytest.mark.parametrize("size", [3, 5, 7])
+def test_parallel_search_identical_to_serial(size):
+    """Partizionamento per primo elemento: combinazioni tra partizioni diverse incluse"""
+    rng = random.Random(100 + size)
+    amounts = [rng.choice([rng.randint(500, 90000), 10000, 20000]) for _ in range(36)]
+    target = sum(rng.sample(amounts, size))
+    try:
+        expected = find_subset_sums(amounts, target, size)
+        assert expected
+        assert find_subset_sums_parallel(amounts, target, size, max_workers=2) == expected
+    finally:
+        shutdown_process_pool()
+
+
+def test_parallel_search_deadline():
+    with pytest.raises(SubsetSumTimeout):
+        find_subset_sums_parallel(list(range(1, 80)), 150, 4, deadline=time.monotonic() - 1, max_workers=2)
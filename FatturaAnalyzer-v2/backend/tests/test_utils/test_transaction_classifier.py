@@ -0,0 +1,26 @@
+# tests/test_utils/test_transaction_classifier.py
+import re
+
+from app.core.transaction_classifier import classify_transactions_df, classify_transaction, CLASSIFIER_VERSION
+
+
+def test_flags_match_legacy_filters():
+    """I flag riproducono i vecchi filtri REGEXP/LIKE di get_transactions"""
+    legacy_pos = r'\b(POS|PAGOBANCOMAT|CIRRUS|MAESTRO|VISA|MASTERCARD|AMEX|AMERICAN EXPRESS|CARTA DI CREDITO|CREDIT CARD|ESE COMM)\b'
+    descriptions = ['PAGAMENTO POS 1234', 'pagobancomat bar', 'EXPOSITION', 'ACCREDITO Worldline',
+                    'VERSAMENTO CONTANTE', 'commissioni bonifico', 'RIF COMMISSIONI', None]
+    flags = classify_transactions_df(descriptions, [-1] * len(descriptions))
+
+    for desc, row in zip(descriptions, flags.itertuples()):
+        text = desc or ''
+        assert row.is_pos == int(bool(re.search(legacy_pos, text, re.IGNORECASE)))
+        assert row.is_worldline == int('WORLDLINE' in text.upper())
+        assert row.is_cash_deposit == int('VERSAMENTO CONTANTE' in text.upper())
+        assert row.is_bank_fee == int(text.upper().startswith('COMMISSIONI'))
+
+def test_category_uses_link_free_rules():
+    assert classify_transaction('VERSAMENTO CONTANTI', 500)['category'] == 'Incassi_Contanti'
+    assert classify_transaction('PAGAMENTO POS', -20)['category'] == 'Spese_Carte'
+    assert classify_transaction('BONIFICO ACME', 100)['category'] == 'Altri_Incassi'
+    assert classify_transaction(None, 0)['category'] == 'Altri'
+    assert classify_transaction('X', 1)['classifier_version'] == CLASSIFIER_VERSION
@@ -0,0 +1,98 @@
+# tests/test_utils/test_transaction_counterparty.py
+import sqlite3
+
+import pytest
+
+from app.core import database
+from app.core.aho_corasick import AhoCorasickAutomaton
+from app.core.database import ensure_anagraphics_inference_queue, ensure_fulltext_index
+from app.core.transaction_counterparty import (AnagraphicsMatchIndex, RESOLVER_VERSION,
+                                               backfill_inferred_anagraphics, refresh_inferred_anagraphics)
+
+
+@pytest.fixture(params=[False, True], ids=["like", "fts"])
+def inference_conn(request, monkeypatch):
+    monkeypatch.setattr(database, "_fulltext_ready", None)
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE Anagraphics (id INTEGER PRIMARY KEY, denomination TEXT, piva TEXT, cf TEXT);
+        CREATE TABLE Invoices (id INTEGER PRIMARY KEY, doc_number TEXT);
+        CREATE TABLE BankTransactions (id INTEGER PRIMARY KEY, description TEXT, inferred_anagraphics_id INTEGER,
+                                       inferred_confidence REAL, inferred_resolver_version INTEGER);
+        INSERT INTO Anagraphics (denomination, piva) VALUES ('Rossi Costruzioni Srl', '01234567890');
+        INSERT INTO BankTransactions (description) VALUES
+            ('BONIFICO DA ROSSI COSTRUZIONI SRL FT 12'),
+            ('SDD 01234567890 ADDEBITO'),
+            ('BONIFICO DA BIANCHI IMPIANTI'),
+            ('COMMISSIONI BANCARIE');
+    """)
+    if request.param:
+        ensure_fulltext_index(conn)
+    else:
+        monkeypatch.setattr(database, "_fulltext_ready", False)
+    ensure_anagraphics_inference_queue(conn)
+    conn.execute("DELETE FROM AnagraphicsInferenceQueue")
+    yield conn
+    conn.close()
+
+
+def _inferred(conn):
+    return [row[0] for row in conn.execute("SELECT inferred_anagraphics_id FROM BankTransactions ORDER BY id")]
+
+
+def test_match_index_resolve():
+    """PIVA/CF con confidenza piena, nome con score, nessun match sotto soglia"""
+    index = AnagraphicsMatchIndex([(1, 'Rossi Costruzioni Srl', '01234567890', None), (2, 'AB', None, 'RSSMRA80A01H501U')])
+    assert index.resolve('PAGAMENTO 01234567890') == (1, 1.0)
+    assert index.resolve('rid rssmra80a01h501u') == (2, 1.0)
+    anag_id, confidence = index.resolve('BONIFICO ROSSI COSTRUZIONI')
+    assert anag_id == 1 and 0.3 <= confidence <= 1.0
+    assert index.resolve('BONIFICO VERDI') == (None, None)
+    assert index.resolve(None) == (None, None)
+
+
+def test_backfill_and_incremental_refresh(inference_conn):
+    """Backfill iniziale e ricalcolo delle sole righe toccate dalle modifiche anagrafiche"""
+    assert backfill_inferred_anagraphics(inference_conn) == 4
+    assert _inferred(inference_conn) == [1, 1, None, None]
+    assert backfill_inferred_anagraphics(inference_conn) == 0
+
+    inference_conn.execute("INSERT INTO Anagraphics (denomination) VALUES ('Bianchi Impianti')")
+    inference_conn.execute("UPDATE Anagraphics SET piva = '09876543210' WHERE id = 1")
+    refresh_inferred_anagraphics(inference_conn)
+    assert _inferred(inference_conn) == [1, None, 2, None]
+    assert inference_conn.execute("SELECT COUNT(*) FROM AnagraphicsInferenceQueue").fetchone()[0] == 0
+
+    inference_conn.execute("DELETE FROM Anagraphics WHERE id = 2")
+    inference_conn.execute("UPDATE BankTransactions SET description = 'BONIFICO 09876543210' WHERE id = 4")
+    refresh_inferred_anagraphics(inference_conn)
+    assert _inferred(inference_conn) == [1, None, None, 1]
+    versions = {row[0] for row in inference_conn.execute("SELECT inferred_resolver_version FROM BankTransactions")}
+    assert versions == {RESOLVER_VERSION}
+
+
+def test_automaton_finds_every_occurrence():
+    """Tutte le occorrenze (anche sovrapposte) in una passata, pattern aggiunti/rimossi dopo la compilazione"""
+    automaton = AhoCorasickAutomaton()
+    for pattern in ('he', 'she', 'his', 'hers', 'rossi'):
+        automaton.add(pattern, pattern)
+    text = 'ushers rossi his'
+    assert sorted(automaton.iter_matches(text)) == [(1, 'she'), (2, 'he'), (2, 'hers'), (7, 'rossi'), (13, 'his')]
+    automaton.discard('he', 'he')
+    automaton.add('ers', 'ers')
+    assert sorted(p for _, p in automaton.iter_matches(text)) == ['ers', 'hers', 'his', 'rossi', 'she']
+
+
+def test_match_index_mentions_and_incremental_update():
+    """Denominazione citata tra altre parole riconosciuta; upsert/remove senza ricostruire l'indice"""
+    index = AnagraphicsMatchIndex([(1, 'Rossi Costruzioni Srl', None, None), (2, 'Bianchi Impianti', None, None)])
+    assert index.resolve('BONIFICO ROSSI COSTRUZIONI SRL SALDO BIANCHI')[0] == 1
+    assert index.resolve('ROSSICOSTRUZIONI') == (None, None)
+
+    index.upsert([(2, 'Bianchi Impianti', '09876543210', None), (3, 'Verdi Trasporti', None, None)])
+    assert index.resolve('SDD 09876543210 ROSSI COSTRUZIONI SRL') == (2, 1.0)
+    assert index.resolve('GIROCONTO VERDI TRASPORTI')[0] == 3
+    index.remove([1])
+    assert index.resolve('BONIFICO ROSSI COSTRUZIONI SRL') == (None, None)
+    verdi = index.resolve('VERDI TRASPORTI')
+    assert index.resolve_many(['VERDI TRASPORTI', None, 'VERDI TRASPORTI']) == [verdi, (None, None), verdi]
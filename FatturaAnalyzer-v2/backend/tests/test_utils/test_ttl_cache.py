@@ -0,0 +1,74 @@
+# tests/test_utils/test_ttl_cache.py
+import threading
+import time
+
+import pytest
+
+from app.core import ttl_cache
+from app.core.ttl_cache import TTLLRUCache, ttl_lru_cache
+
+
+def test_lru_eviction_and_lazy_expiry(monkeypatch):
+    """Limite LRU rispettato e voci scadute scartate alla lettura"""
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    cache = TTLLRUCache(maxsize=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1          # "a" diventa la più recente
+    cache.set("c", 3)                   # evict "b"
+    assert "b" not in cache and cache.get("c") == 3
+
+    now[0] += 11
+    assert cache.get("a", "scaduta") == "scaduta"
+    stats = cache.stats()
+    assert (stats["evictions"], stats["expirations"], stats["size"]) == (1, 1, 1)
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+
+def test_concurrent_misses_compute_once():
+    """Richieste concorrenti sulla stessa chiave: un solo calcolo, chiavi diverse in parallelo"""
+    cache = TTLLRUCache(maxsize=10)
+    calls = []
+    start = threading.Barrier(8)
+
+    def slow_compute(key):
+        calls.append(key)
+        time.sleep(0.05)
+        return key * 2
+
+    def worker(key):
+        start.wait()
+        results.append(cache.get_or_compute(key, lambda: slow_compute(key)))
+
+    results = []
+    threads = [threading.Thread(target=worker, args=(i % 2,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(calls) == [0, 1]
+    assert sorted(results) == [0] * 4 + [2] * 4
+    assert cache.info().misses == 2 and cache.info().hits == 6
+
+
+def test_decorator_does_not_cache_errors():
+    """Eccezioni propagate e non memorizzate; argomenti non hashable senza cache"""
+    calls = []
+
+    @ttl_lru_cache(maxsize=4, ttl_seconds=60)
+    def parse(value):
+        calls.append(value)
+        if value == "boom":
+            raise ValueError(value)
+        return len(value)
+
+    assert parse("abc") == parse("abc") == 3
+    with pytest.raises(ValueError):
+        parse("boom")
+    with pytest.raises(ValueError):
+        parse("boom")
+    assert parse(["x"]) == 1
+    assert calls == ["abc", "boom", "boom", ["x"]]
+    parse.cache_clear()
+    assert parse.cache_info().currsize == 0
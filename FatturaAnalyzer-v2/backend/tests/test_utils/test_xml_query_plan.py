@@ -0,0 +1,74 @@
+# tests/test_utils/test_xml_query_plan.py
+from lxml import etree
+
+import pytest
+
+from app.core import parser_xml
+from app.core.parser_xml import parse_fattura_xml, xpath_find_all, xpath_find_first, xpath_get_text_robust
+
+MY_COMPANY = {'piva': '01234567890', 'cf': None}
+
+# Namespace di default su tutti gli elementi, righe annidate fuori posizione, campi facoltativi mancanti
+INVOICE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<FatturaElettronica xmlns="http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2" versione="FPR12">
+  <FatturaElettronicaHeader>
+    <CedentePrestatore><DatiAnagrafici>
+      <IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>01234567890</IdCodice></IdFiscaleIVA>
+      <Anagrafica><Nome>Mario</Nome><Cognome>Rossi</Cognome></Anagrafica><RegimeFiscale>RF19</RegimeFiscale>
+    </DatiAnagrafici>
+    <Sede><Indirizzo>Via Verdi</Indirizzo><NumeroCivico>7</NumeroCivico><CAP>38017</CAP><Comune>Mezzolombardo</Comune></Sede>
+    <Contatti><Email>info@example.it</Email></Contatti></CedentePrestatore>
+    <CessionarioCommittente><DatiAnagrafici><CodiceFiscale>RSSMRA80A01H501U</CodiceFiscale>
+      <Anagrafica><Denominazione>Cliente  Privato</Denominazione></Anagrafica></DatiAnagrafici>
+    <Sede><Indirizzo>Piazza Duomo 1</Indirizzo><CAP>20100</CAP><Comune>Milano</Comune><Nazione>IT</Nazione></Sede>
+    </CessionarioCommittente>
+  </FatturaElettronicaHeader>
+  <FatturaElettronicaBody>
+    <DatiGenerali><DatiGeneraliDocumento><TipoDocumento>TD01</TipoDocumento><Data>2024-05-02</Data>
+      <Numero>7/A</Numero><ImportoTotaleDocumento>1.220,00</ImportoTotaleDocumento></DatiGeneraliDocumento></DatiGenerali>
+    <DatiBeniServizi>
+      <Gruppo><DettaglioLinee><Descrizione>Consulenza</Descrizione><Quantita>1.00</Quantita>
+        <PrezzoUnitario>1000.00</PrezzoUnitario><AliquotaIVA>22.00</AliquotaIVA></DettaglioLinee></Gruppo>
+      <Gruppo><DettaglioLinee><NumeroLinea>x</NumeroLinea><Descrizione></Descrizione><Descrizione>Spese</Descrizione>
+        <PrezzoTotale>-5.00</PrezzoTotale></DettaglioLinee></Gruppo>
+      <DatiRiepilogo><AliquotaIVA>22.00</AliquotaIVA><ImponibileImporto>1000.00</ImponibileImporto><Imposta>220.00</Imposta></DatiRiepilogo>
+    </DatiBeniServizi>
+    <DatiPagamento><CondizioniPagamento>TP01</CondizioniPagamento>
+      <DettaglioPagamento><ModalitaPagamento>MP01</ModalitaPagamento><ImportoPagamento>1220.00</ImportoPagamento></DettaglioPagamento>
+    </DatiPagamento>
+  </FatturaElettronicaBody>
+</FatturaElettronica>"""
+
+
+def test_query_plan_matches_xpath_slow_path(monkeypatch):
+    """Piano precompilato e query XPath originali producono lo stesso risultato del parser"""
+    fast = parse_fattura_xml(INVOICE, MY_COMPANY, source_name="ns_default.xml")
+    monkeypatch.setattr(parser_xml, "XPATH_FAST_PATH", False)
+    slow = parse_fattura_xml(INVOICE, MY_COMPANY, source_name="ns_default.xml")
+
+    assert fast == slow and fast['error'] is None
+    assert fast['type'] == 'Attiva'
+    assert fast['anagraphics']['cedente']['denomination'] == 'Rossi Mario'
+    assert fast['anagraphics']['cedente']['address'] == 'Via Verdi, 7'
+    assert [line['description'] for line in fast['body']['lines']] == ['Consulenza', 'Spese']
+    assert str(fast['body']['general_data']['total_amount']) == '1220.00'
+
+
+@pytest.mark.parametrize("query", [
+    "./*[local-name()='Gruppo']/*[local-name()='DettaglioLinee']/*[local-name()='Descrizione']/text()",
+    ".//*[local-name()='DettaglioLinee']/*[local-name()='Descrizione']/text()",
+    ".//*[local-name()='Descrizione']",
+    ".//*[local-name()='DettaglioLinee'][1]",
+    "./*[contains(local-name(), 'Riepilogo')]/*[local-name()='Imposta']/text()",
+    "./*[local-name()='Inesistente']/text()",
+])
+def test_helpers_agree_with_element_xpath(query):
+    """Helper XPath: stesso primo testo, primo nodo ed elenco nodi di element.xpath(query)"""
+    root = etree.fromstring(INVOICE, etree.XMLParser(remove_blank_text=True))
+    node = root.find('.//{*}DatiBeniServizi')
+    expected = node.xpath(query)
+    if not query.endswith('text()'):
+        assert xpath_find_all(node, query) == expected
+        assert xpath_find_first(node, query) is (expected[0] if expected else None)
+    first_text = next((r if isinstance(r, str) else r.text for r in expected[:1]), None)
+    assert xpath_get_text_robust(node, [query], default=None) == (first_text.strip() if first_text and first_text.strip() else None)